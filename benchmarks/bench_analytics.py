@@ -0,0 +1,52 @@
+"""
+Day-level reports over ``rows`` synthetic fee rows in ``partitions``
+block-range partitions of the analytics store.
+
+    python -m benchmarks.bench_analytics [rows] [partitions]
+"""
+
+import random
+import sys
+import tempfile
+import time
+
+from peniwallet_contracts.analytics import AnalyticsStore
+
+START = 1_700_006_400
+
+
+def _timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    print(f"  {label}: {(time.perf_counter() - start) * 1e3:.0f} ms, {len(result)} groups")
+
+
+def main(rows=2_000_000, partitions=20):
+    generator = random.Random(1)
+    tokens = [f"0x{index:040x}" for index in range(1, 51)]
+    senders = [f"0x{index:040x}" for index in range(1_000, 21_000)]
+    per_partition = rows // partitions
+
+    with tempfile.TemporaryDirectory() as path:
+        store = AnalyticsStore(path)
+        start = time.perf_counter()
+        for partition in range(partitions):
+            first = partition * per_partition
+            blocks = range(first, first + per_partition)
+            store.append("fees", first, first + per_partition - 1, {
+                "block": blocks,
+                "log_index": [0] * per_partition,
+                "timestamp": [START + block * 3 for block in blocks],
+                "token": [generator.choice(tokens) for _ in blocks],
+                "sender": [generator.choice(senders) for _ in blocks],
+                "amount": [generator.getrandbits(72) for _ in blocks],
+            })
+        print(f"{rows} rows in {partitions} partitions written in {time.perf_counter() - start:.1f} s")
+
+        _timed("fees per token per day", lambda: store.group("fees", ("token", "day")))
+        _timed("top 10 senders", lambda: store.top("fees", "sender", n=10))
+        _timed("one token per hour", lambda: store.group("fees", ("hour",), where={"token": tokens[0]}))
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,69 @@
+"""
+Calls encoded per second: ``FunctionEncoder`` vs ``eth_abi.encode`` and,
+when ape is installed, ape's ``encode_calldata``.
+
+    python -m benchmarks.bench_calldata [count]
+"""
+
+import sys
+import time
+
+from eth_abi import encode
+
+from peniwallet_contracts.calldata import SPRAY_TOKEN, TRANSFER, FunctionEncoder
+from peniwallet_contracts.reads import selector
+
+from benchmarks.bench_eip712 import TOKEN
+
+SENDER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+RECEIVER = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+SIGNATURE = b"\x01" * 65
+
+
+def _cases():
+    yield "transfer", TRANSFER, [TOKEN, SENDER, RECEIVER, 10**18, 7, 1700000000, SIGNATURE, 21000]
+    for count in (1, 200):
+        receivers = [f"0x{i:040x}" for i in range(1, count + 1)]
+        yield f"sprayToken[{count}]", SPRAY_TOKEN, [
+            TOKEN, SENDER, receivers, 10**18, "Spray", "NWBx76", SIGNATURE, 21000]
+
+
+def _eth_abi(signature):
+    types = signature[signature.index("(") + 1:-1].split(",")
+    function_selector = selector(signature)
+    return lambda args: function_selector + encode(types, args)
+
+
+def _ape(signature):
+    try:
+        from ape import networks
+        from ethpm_types.abi import MethodABI
+    except ImportError:
+        return None
+    abi = MethodABI.from_signature(signature)
+    ecosystem = networks.ethereum
+    function_selector = selector(signature)
+    return lambda args: function_selector + ecosystem.encode_calldata(abi, *args)
+
+
+def _rate(encode_call, args, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        encode_call(args)
+    return count / (time.perf_counter() - start)
+
+
+def main(count=5000):
+    for name, signature, args in _cases():
+        runs = count if "200" not in name else max(count // 20, 1)
+        fast = _rate(FunctionEncoder(signature).encode, args, runs)
+        generic = _rate(_eth_abi(signature), args, runs)
+        line = f"{name:>16}: eth_abi {generic:10.0f}/s   encoder {fast:10.0f}/s   x{fast / generic:.1f}"
+        ape = _ape(signature)
+        if ape is not None:
+            line += f"   ape {_rate(ape, args, runs):10.0f}/s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,68 @@
+"""
+Signatures per second: ``encode_typed_data`` vs the cached encoders.
+
+    python -m benchmarks.bench_eip712 [count]
+"""
+
+import sys
+import time
+
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+
+from peniwallet_contracts.eip712 import TransferTransaction
+
+CHAIN_ID = 1337
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+
+
+def _messages(account, count):
+    return [
+        {
+            'token': TOKEN,
+            'from': account.address,
+            'to': "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29",
+            'amount': 10**18 + i,
+            'nonce': i,
+            'deadline': 1700000000,
+        }
+        for i in range(count)
+    ]
+
+
+def _typed_data_path(account, messages, sign):
+    for message in messages:
+        encoded = encode_typed_data(
+            full_message=TransferTransaction.typed_data(message, CHAIN_ID, CONTRACT))
+        if sign:
+            account.sign_message(encoded)
+
+
+def _cached_path(account, messages, sign):
+    for message in messages:
+        encoded = TransferTransaction.signable(message, CHAIN_ID, CONTRACT)
+        if sign:
+            account.sign_message(encoded)
+
+
+def _rate(func, account, messages, sign):
+    start = time.perf_counter()
+    func(account, messages, sign)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main(count=2000):
+    account = Account.create()
+    messages = _messages(account, count)
+
+    for sign in (False, True):
+        label = "encode + sign" if sign else "encode only"
+        baseline = _rate(_typed_data_path, account, messages, sign)
+        cached = _rate(_cached_path, account, messages, sign)
+        print(f"{label:>14}: encode_typed_data {baseline:10.0f}/s   "
+              f"cached {cached:10.0f}/s   x{cached / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""
+Gas oracle quote and observe cost per call for growing call windows, and
+with a node URL the cost of a full and an incremental refresh.
+
+    python -m benchmarks.bench_gasoracle [rpc_url]
+"""
+
+import sys
+import time
+
+from peniwallet_contracts.gasoracle import SPRAY_TOKEN, GasOracle
+from peniwallet_contracts.preflight import spray_token_call
+from peniwallet_contracts.reads import BatchReader
+
+SENDER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+
+
+def _spray(count):
+    message = {'token': TOKEN, 'from': SENDER, 'receivers': [SENDER] * count, 'amount': 1, 'code': "bench"}
+    return spray_token_call(message, "Spray", b"\x01" * 65, 0).data
+
+
+def _timed(function, args):
+    start = time.perf_counter()
+    for arg in args:
+        function(*arg)
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main(rpc_url=None):
+    calls = [(_spray(1 + number % 200), 60_000 + 28_000 * (1 + number % 200)) for number in range(20_000)]
+    for window in (200, 2_000, 20_000):
+        oracle = GasOracle(BatchReader(rpc_url or "http://unused"), calls=window)
+        oracle.price = 10**9
+        observe = _timed(oracle.observe, calls)
+        quote = _timed(oracle.gas_fee, [(SPRAY_TOKEN, 1 + number % 200) for number in range(20_000)])
+        print(f"window {window:>6}: observe {observe:.2f} us, quote {quote:.2f} us")
+
+    if rpc_url:
+        oracle = GasOracle(BatchReader(rpc_url), blocks=100)
+        start = time.perf_counter()
+        head = oracle.refresh()
+        full = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        oracle.refresh(head + 1)
+        incremental = (time.perf_counter() - start) * 1e3
+        print(f"refresh: 100 blocks {full:.1f} ms, one block {incremental:.1f} ms, price {oracle.price}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,36 @@
+"""
+Per-span cost of the pipeline metrics: without metrics, timed but not
+sampled, and sampled, plus the cost of rendering the Prometheus text.
+
+    python -m benchmarks.bench_metrics [spans]
+"""
+
+import sys
+import time
+
+from peniwallet_contracts.metrics import NO_METRICS, SIGN, Metrics
+
+
+def _per_span(metrics, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        with metrics.trace():
+            with metrics.span(SIGN):
+                pass
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main(count=200_000):
+    baseline = _per_span(NO_METRICS, count)
+    print(f"no metrics:   {baseline:.2f} us/span")
+    for rate in (0.0, 0.01, 1.0):
+        metrics = Metrics(sample_rate=rate)
+        print(f"sampled {rate:>4.0%}: {_per_span(metrics, count):.2f} us/span")
+
+    start = time.perf_counter()
+    text = metrics.exposition()
+    print(f"exposition:   {(time.perf_counter() - start) * 1e3:.2f} ms, {len(text)} bytes")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
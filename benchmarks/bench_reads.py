@@ -0,0 +1,48 @@
+"""
+Wall-clock for balance reads: one eth_call per holder vs ``BatchReader``.
+
+    python -m benchmarks.bench_reads <rpc_url> <token> [count]
+"""
+
+import os
+import sys
+import time
+
+import requests
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.reads import BatchReader, call
+
+
+def per_call_loop(rpc_url, token, holders):
+    session = requests.Session()
+    balances = []
+    for i, holder in enumerate(holders):
+        c = call(token, "balanceOf(address)", [holder])
+        response = session.post(rpc_url, json={
+            "jsonrpc": "2.0",
+            "id": i,
+            "method": "eth_call",
+            "params": [{"to": token, "data": "0x" + c.data.hex()}, "latest"],
+        }).json()
+        balances.append(c.decode(bytes.fromhex(response["result"][2:])))
+    return balances
+
+
+def main(rpc_url, token, count=10000):
+    holders = [to_checksum_address(os.urandom(20)) for _ in range(int(count))]
+
+    start = time.perf_counter()
+    expected = per_call_loop(rpc_url, token, holders)
+    print(f"{'per-call loop':>28}: {time.perf_counter() - start:8.2f}s")
+
+    for chunk_size, concurrency in ((100, 1), (500, 1), (500, 4), (1000, 8)):
+        reader = BatchReader(rpc_url, chunk_size=chunk_size, concurrency=concurrency)
+        start = time.perf_counter()
+        assert reader.balances(token, holders) == expected
+        label = f"batch {chunk_size} x {concurrency} in flight"
+        print(f"{label:>28}: {time.perf_counter() - start:8.2f}s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
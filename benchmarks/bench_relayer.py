@@ -0,0 +1,66 @@
+"""
+Sustained relayed transfers per second through ``AsyncRelayer``.
+
+    python -m benchmarks.bench_relayer <rpc_url> <peniwallet> <token> <user_key> <relayer_key> [count] [window]
+
+The user account needs token balance and BNB for the approval; the local
+ganache accounts from ape-config.yaml have both.
+"""
+
+import asyncio
+import sys
+import time
+
+from eth_abi import encode
+from eth_account import Account
+
+from peniwallet_contracts.calldata import encode_transfer
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.reads import BatchReader, selector
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+
+
+async def approve(rpc_url, chain_id, user, token, peniwallet):
+    data = selector("approve(address,uint256)") + encode(["address", "uint256"], [peniwallet, 2**256 - 1])
+    async with AsyncRelayer(HTTPTransport(rpc_url), user, chain_id, token) as client:
+        await client.relay(data, timeout=60)
+
+
+async def run(rpc_url, peniwallet, token, user_key, relayer_key, count=500, window=32):
+    count, window = int(count), int(window)
+    user = Account.from_key(user_key)
+    relayer_account = Account.from_key(relayer_key)
+    reader = BatchReader(rpc_url)
+    (chain_id,) = [int(item["result"], 16) for item in reader.request([("eth_chainId", [])])]
+    await approve(rpc_url, chain_id, user, token, peniwallet)
+    (start,) = reader.nonces(peniwallet, [user.address])
+
+    payloads = []
+    for nonce in range(start, start + count):
+        message = {
+            'token': token,
+            'from': user.address,
+            'to': relayer_account.address,
+            'amount': 1,
+            'nonce': nonce,
+            'deadline': 2**40,
+        }
+        signature = user.sign_message(TransferTransaction.signable(message, chain_id, peniwallet))
+        payloads.append(encode_transfer(message, signature.signature, 21000))
+
+    async with AsyncRelayer(HTTPTransport(rpc_url), relayer_account, chain_id, peniwallet,
+                            window=window, poll_interval=0.05, keep_receipts=len(payloads)) as relayer:
+        began = time.perf_counter()
+        # intents of one user must land in nonce order, so sends are issued
+        # in order and only the receipts are awaited concurrently
+        hashes = [await relayer.send(payload) for payload in payloads]
+        receipts = await asyncio.gather(*(relayer.wait(tx_hash) for tx_hash in hashes))
+        elapsed = time.perf_counter() - began
+
+    failed = sum(1 for receipt in receipts if int(receipt["status"], 16) != 1)
+    print(f"{count} transfers in {elapsed:.2f}s: {count / elapsed:.1f} tx/s, "
+          f"window {window}, {failed} reverted")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(*sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""
+Replay cache lookups per second and memory, for a history of ``count``
+sprays of which the last ``recent`` are kept exactly.
+
+    python -m benchmarks.bench_replay [count] [recent]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from peniwallet_contracts.preflight import spray_token_call
+from peniwallet_contracts.replay import ReplayCache
+
+SENDER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+
+
+def _spray(number):
+    message = {'token': TOKEN, 'from': SENDER, 'receivers': [SENDER], 'amount': 1, 'code': str(number)}
+    return spray_token_call(message, "Spray", number.to_bytes(65, "big"), 21000).data
+
+
+def _rate(cache, calls):
+    start = time.perf_counter()
+    for data in calls:
+        cache.admit(data)
+    return (time.perf_counter() - start) / len(calls) * 1e6
+
+
+def main(count=1_000_000, recent=100_000):
+    tracemalloc.start()
+    cache = ReplayCache(expected_sprays=count, recent=recent)
+    for number in range(count):
+        cache.add_spray(number.to_bytes(65, "big"))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    replays = [_spray(number) for number in range(count - 10_000, count)]
+    fresh = [_spray(number) for number in range(count, count + 10_000)]
+    print(f"{count} sprays, {recent} exact: {memory / 2**20:.1f} MiB")
+    print(f"  replay rejected: {_rate(cache, replays):.1f} us/call")
+    print(f"  fresh admitted:  {_rate(cache, fresh):.1f} us/call")
+    print(f"  {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,41 @@
+"""
+Signatures per second: serial ``LocalAccount.sign_message`` loop vs
+``BatchSigner`` with 1, 4 and N workers.
+
+    python -m benchmarks.bench_signing [count]
+"""
+
+import os
+import sys
+import time
+
+from eth_account import Account
+
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.signing import BatchSigner
+
+from benchmarks.bench_eip712 import CHAIN_ID, CONTRACT, _messages
+
+
+def main(count=4000):
+    account = Account.create()
+    messages = _messages(account, count)
+
+    start = time.perf_counter()
+    for message in messages:
+        account.sign_message(TransferTransaction.signable(message, CHAIN_ID, CONTRACT))
+    serial = count / (time.perf_counter() - start)
+    print(f"{'serial':>10}: {serial:10.0f}/s")
+
+    for workers in sorted({1, 4, os.cpu_count() or 1}):
+        with BatchSigner([account.key], CHAIN_ID, CONTRACT, workers=workers) as signer:
+            # warm the pool up so worker start-up is not measured
+            signer.sign(TransferTransaction, messages[:workers])
+            start = time.perf_counter()
+            signer.sign(TransferTransaction, messages)
+            rate = count / (time.perf_counter() - start)
+        print(f"{workers:>3} workers: {rate:10.0f}/s   x{rate / serial:.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
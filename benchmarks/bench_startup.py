@@ -0,0 +1,65 @@
+"""
+Cold start of the CLI per subcommand, from ``python -X importtime``.
+
+    python -m benchmarks.bench_startup [budget_ms]
+
+Prints the import time of every subcommand and its three slowest
+top-level imports, and exits non-zero if a signing or verification
+command imports for longer than the budget.
+"""
+
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+RECEIVER = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+KEY = "0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8"
+SIGNATURE = "0x" + "00" * 65
+
+MESSAGE = ["transfer", "--chain-id", "56", "--contract", CONTRACT, "--token", TOKEN, "--to", RECEIVER,
+           "--amount", "100", "--nonce", "0", "--deadline", "0"]
+
+COMMANDS = {
+    "--help": ["--help"],
+    "sign": ["sign", *MESSAGE],
+    "verify-signature": ["verify-signature", *MESSAGE, "--from", RECEIVER, "--signature", SIGNATURE],
+}
+
+BUDGETED = ("sign", "verify-signature")
+
+
+def import_times(argv: List[str]) -> Tuple[float, List[Tuple[float, str]]]:
+    """
+    Total and per top-level module import time in milliseconds.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "peniwallet_contracts", *argv],
+        capture_output=True, text=True, env=dict(os.environ, PENIWALLET_KEY=KEY))
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sum(ms for ms, _ in modules), sorted(modules, reverse=True)
+
+
+def main(budget_ms=300):
+    over: Dict[str, float] = {}
+    for name, argv in COMMANDS.items():
+        total, modules = import_times(argv)
+        slowest = ", ".join(f"{module} {ms:.0f}" for ms, module in modules[:3])
+        print(f"{name:>17}: {total:6.0f} ms   ({slowest})")
+        if name in BUDGETED and total > budget_ms:
+            over[name] = total
+    for name, total in over.items():
+        print(f"{name} imports for {total:.0f} ms, over the {budget_ms} ms budget")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:])))
@@ -0,0 +1,156 @@
+"""
+Gas profiling suite: deploys Peniwallet and a mock PancakeSwap on the
+local chain, records the gas each entry point uses and compares it with
+``baseline.json``.
+
+    ape test benchmarks/gas -s                       # compare
+    ape test benchmarks/gas -s --update-gas-baseline # record a new baseline
+
+The run fails when ``baseline.json`` is missing, when an entry point
+uses more than ``--gas-threshold`` (a fraction, 0.05 by default) above
+its baseline, or when it has no baseline: record one with
+``--update-gas-baseline`` and commit it.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+from eth_account import Account
+
+from peniwallet_contracts.deploy import add_liquidity, deploy_exchange, deploy_peniwallet
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+# entry point -> gas used in this run
+MEASURED = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--update-gas-baseline", action="store_true",
+                     help="write the measured gas to benchmarks/gas/baseline.json")
+    parser.addoption("--gas-threshold", type=float, default=0.05,
+                     help="allowed relative increase over the baseline")
+
+
+def regressions(baseline, measured, threshold):
+    """
+    Returns (name, baseline, measured) for entries above ``threshold``,
+    with baseline None for entries missing from the baseline.
+    """
+    return [
+        (name, baseline.get(name), gas)
+        for name, gas in sorted(measured.items())
+        if name not in baseline or gas > baseline[name] * (1 + threshold)
+    ]
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not MEASURED:
+        return
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    terminalreporter.section("gas used")
+    for name, gas in sorted(MEASURED.items()):
+        if name in baseline:
+            change = (gas - baseline[name]) / baseline[name] * 100
+            terminalreporter.write_line(f"{name:<40} {gas:>10,} {change:+8.2f}%")
+        else:
+            terminalreporter.write_line(f"{name:<40} {gas:>10,}  missing")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not MEASURED:
+        return
+    config = session.config
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+
+    if config.getoption("--update-gas-baseline"):
+        baseline.update(MEASURED)
+        BASELINE.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + "\n")
+        return
+    if not baseline:
+        print(f"no gas baseline at {BASELINE}, record it with --update-gas-baseline")
+        session.exitstatus = 1
+        return
+
+    failed = regressions(baseline, MEASURED, config.getoption("--gas-threshold"))
+    if failed:
+        for name, before, after in failed:
+            if before is None:
+                print(f"gas baseline missing: {name} {after:,}, record it with --update-gas-baseline")
+            else:
+                print(f"gas regression: {name} {before:,} -> {after:,}")
+        session.exitstatus = 1
+
+
+@pytest.fixture(scope="session")
+def record_gas():
+    """
+    Records the gas used by a receipt (or a plain gas figure) under ``name``.
+    """
+
+    def record(name, receipt):
+        gas = receipt if isinstance(receipt, int) else receipt.gas_used
+        MEASURED[name] = gas
+        return gas
+
+    return record
+
+
+@pytest.fixture(scope="session")
+def owner(accounts):
+    return accounts[0]
+
+
+@pytest.fixture(scope="session")
+def user(accounts):
+    return accounts[1]
+
+
+@pytest.fixture(scope="session")
+def user_key(user):
+    return Account.from_key(user.private_key)
+
+
+@pytest.fixture(scope="session")
+def exchange(project, owner):
+    return deploy_exchange(project, owner)
+
+
+@pytest.fixture(scope="session")
+def token(project, owner, user):
+    """
+    XRP token, paired with WBNB and USDT.
+    """
+    token = project.BEP20XRP.deploy(sender=owner)
+    token.transfer(user.address, 10**24, sender=owner)
+    return token
+
+
+@pytest.fixture(scope="session")
+def usdt_token(project, owner, user):
+    """
+    Token only paired with USDT, for the ``_calculateMinFee`` fallback.
+    """
+    token = project.MockERC20.deploy("USD Pegged", "PEG", 18, sender=owner)
+    token.mint(owner.address, 10**27, sender=owner)
+    token.mint(user.address, 10**24, sender=owner)
+    return token
+
+
+@pytest.fixture(scope="session")
+def pairs(project, exchange, owner, token, usdt_token):
+    return {
+        "token/wbnb": add_liquidity(project, exchange, owner, token, 10**24, exchange.weth, 10 * 10**18),
+        "token/usdt": add_liquidity(project, exchange, owner, token, 10**24, exchange.usdt, 10**24),
+        "wbnb/usdt": add_liquidity(project, exchange, owner, exchange.weth, 10 * 10**18, exchange.usdt, 3_000 * 10**18),
+        "peg/usdt": add_liquidity(project, exchange, owner, usdt_token, 10**24, exchange.usdt, 10**24),
+    }
+
+
+@pytest.fixture(scope="session")
+def peniwallet(project, owner, user, exchange, pairs, token, usdt_token):
+    peniwallet = deploy_peniwallet(project, owner, exchange.router.address, exchange.usdt.address)
+    token.approve(peniwallet.address, 2**256 - 1, sender=user)
+    usdt_token.approve(peniwallet.address, 2**256 - 1, sender=user)
+    return peniwallet
@@ -0,0 +1,151 @@
+import pytest
+from ape import chain
+from eth_utils import keccak, to_checksum_address
+
+from peniwallet_contracts.eip712 import SprayTransaction, SwapTransaction, TransferTransaction
+
+AMOUNT = 10**18
+MIN_FEE = 10**14
+
+
+def recipients(count):
+    return [to_checksum_address(keccak(i.to_bytes(32, "big"))[:20]) for i in range(1, count + 1)]
+
+
+def sign(user_key, struct, message, peniwallet):
+    return user_key.sign_message(
+        struct.signable(message, chain.chain_id, peniwallet.address)).signature.hex()
+
+
+def transfer_message(token, user, to, nonce):
+    return {
+        'token': token.address,
+        'from': user.address,
+        'to': to,
+        'amount': AMOUNT,
+        'nonce': nonce,
+        'deadline': chain.pending_timestamp + 3600,
+    }
+
+
+def transfer(peniwallet, token, user, user_key, to):
+    message = transfer_message(token, user, to, peniwallet.getNonce(user.address))
+    return peniwallet.transfer(
+        message['token'], message['from'], message['to'], message['amount'], message['nonce'],
+        message['deadline'], sign(user_key, TransferTransaction, message, peniwallet), MIN_FEE,
+        sender=user)
+
+
+def test_transfer(peniwallet, token, user, user_key, owner, record_gas):
+    record_gas("transfer", transfer(peniwallet, token, user, user_key, owner.address))
+
+
+def test_transfer_usdt_paired_token(peniwallet, usdt_token, user, user_key, owner, record_gas):
+    # _calculateMinFee takes the USDT fallback: two quotes and four balanceOf calls
+    record_gas("transfer[usdt-pair]", transfer(peniwallet, usdt_token, user, user_key, owner.address))
+
+
+@pytest.mark.parametrize("count", [10, 50])
+def test_transfers_single_vs_batch(peniwallet, token, user, user_key, owner, record_gas, count):
+    # N relayed transfers against one batchTransfer bundle of N, each to
+    # fresh recipients so both pay for new balance slots
+    to = recipients(2 * count)
+    single = sum(transfer(peniwallet, token, user, user_key, to[i]).gas_used for i in range(count))
+    record_gas(f"transfer[x{count}]", single)
+
+    nonce = peniwallet.getNonce(user.address)
+    messages = [transfer_message(token, user, to[count + i], nonce + i) for i in range(count)]
+    receipt = peniwallet.batchTransfer(
+        token.address, [tuple(message.values()) for message in messages],
+        [sign(user_key, TransferTransaction, message, peniwallet) for message in messages], MIN_FEE,
+        sender=user)
+    assert peniwallet.getNonce(user.address) == nonce + count
+    record_gas(f"batchTransfer[{count}]", receipt)
+
+
+@pytest.mark.parametrize("count", [1, 50, 200])
+def test_spray_token(peniwallet, token, user, user_key, record_gas, count):
+    message = {
+        'token': token.address,
+        'from': user.address,
+        'receivers': recipients(count),
+        'amount': AMOUNT,
+        'code': f"gas-{count}",
+    }
+    receipt = peniwallet.sprayToken(
+        message['token'], message['from'], message['receivers'], message['amount'], "Gas profile",
+        message['code'], sign(user_key, SprayTransaction, message, peniwallet), MIN_FEE, sender=user)
+    record_gas(f"sprayToken[{count}]", receipt)
+
+
+def swap(peniwallet, method, path, token_b, user, user_key):
+    message = {
+        'tokenA': path[0],
+        'tokenB': token_b,
+        'from': user.address,
+        'amountA': 1_000 * AMOUNT,
+        'amountB': 1_000 * AMOUNT,
+        'nonce': peniwallet.getNonce(user.address),
+        'deadline': chain.pending_timestamp + 3600,
+    }
+    return method(
+        path, message['from'], message['amountA'], message['nonce'], message['deadline'],
+        sign(user_key, SwapTransaction, message, peniwallet), MIN_FEE, sender=user)
+
+
+def test_swap_tokens_for_bnb(peniwallet, token, exchange, user, user_key, record_gas):
+    path = [token.address, exchange.weth.address]
+    receipt = swap(peniwallet, peniwallet.swapTokensForBNB, path, exchange.weth.address, user, user_key)
+    record_gas("swapTokensForBNB", receipt)
+
+
+def test_swap_tokens_for_tokens(peniwallet, token, exchange, user, user_key, record_gas):
+    path = [token.address, exchange.usdt.address]
+    receipt = swap(peniwallet, peniwallet.swapTokensForTokens, path, exchange.usdt.address, user, user_key)
+    record_gas("swapTokensForTokens", receipt)
+
+
+def test_swap_tokens_for_tokens_two_hops(peniwallet, token, exchange, user, user_key, record_gas):
+    path = [token.address, exchange.weth.address, exchange.usdt.address]
+    receipt = swap(peniwallet, peniwallet.swapTokensForTokens, path, exchange.usdt.address, user, user_key)
+    record_gas("swapTokensForTokens[2-hop]", receipt)
+
+
+@pytest.mark.parametrize("pricing", ["native", "wbnb", "wbnb-pair", "usdt-pair"])
+def test_estimate_fees(peniwallet, token, usdt_token, exchange, record_gas, pricing):
+    # the differences between these isolate the cost of _calculateMinFee's external calls
+    fee_token = {
+        "native": "0x0000000000000000000000000000000000000000",
+        "wbnb": exchange.weth.address,
+        "wbnb-pair": token.address,
+        "usdt-pair": usdt_token.address,
+    }[pricing]
+    gas = peniwallet.estimateFees.estimate_gas_cost(fee_token, AMOUNT, 0, MIN_FEE)
+    record_gas(f"estimateFees[{pricing}]", gas)
+
+
+@pytest.mark.parametrize("pricing", ["wbnb-pair", "usdt-pair"])
+def test_estimate_fees_cached_pairs(peniwallet, token, usdt_token, owner, record_gas, pricing):
+    # against estimateFees[...] above this is what the pair cache saves per fee calculation
+    fee_token = {"wbnb-pair": token, "usdt-pair": usdt_token}[pricing]
+    receipt = peniwallet.cachePairs([fee_token.address], sender=owner)
+    record_gas(f"cachePairs[{pricing}]", receipt)
+    gas = peniwallet.estimateFees.estimate_gas_cost(fee_token.address, AMOUNT, 0, MIN_FEE)
+    record_gas(f"estimateFees[{pricing},cached]", gas)
+
+
+def test_transfer_cached_pairs(peniwallet, token, user, user_key, owner, record_gas):
+    peniwallet.cachePairs([token.address], sender=owner)
+    record_gas("transfer[cached-pairs]", transfer(peniwallet, token, user, user_key, owner.address))
+
+
+def test_withdraw_fees(peniwallet, token, owner, user, user_key, accounts, record_gas):
+    dev = accounts[2]
+    peniwallet.registerProject(token.address, dev.address, sender=owner)
+    transfer(peniwallet, token, user, user_key, owner.address)
+
+    record_gas("withdrawFees", peniwallet.withdrawFees(token.address, sender=dev))
+
+
+def test_send_gas(peniwallet, owner, user, record_gas):
+    record_gas("sendGas", peniwallet.sendGas(user.address, sender=owner, value=10**15))
@@ -0,0 +1,273 @@
+"""
+Load generator for the relay path.
+
+Creates synthetic users funded by ``funder_key``, approves Peniwallet for
+each, then generates signed transfer, spray and swap intents at a target
+rate and relays them with ``AsyncRelayer``. Reports throughput, latency
+percentiles, outcomes and gas per kind, and CPU time split between
+signing, calldata encoding and the rest (RPC and the event loop).
+
+    python -m benchmarks.loadgen <rpc_url> <peniwallet> <token> <funder_key> <relayer_key> \\
+        [--users 20] [--count 500] [--rate 50] [--mix transfer=7,spray=2,swap=1] \\
+        [--recipients 1=5,10=3,200=1] [--window 32] [--min-tps 0]
+
+The funder needs tokens and BNB; swaps need a token/WBNB pair on the
+router Peniwallet uses. With ``--min-tps`` the run exits non-zero below
+that throughput, for use as a regression gate.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from eth_account import Account
+from eth_utils import keccak
+
+from peniwallet_contracts import calldata
+from peniwallet_contracts.eip712 import SprayTransaction, SwapTransaction, TransferTransaction
+from peniwallet_contracts.reads import BatchReader, call
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+
+APPROVE = calldata.FunctionEncoder("approve(address,uint256)")
+TOKEN_TRANSFER = calldata.FunctionEncoder("transfer(address,uint256)")
+
+MIN_FEE = 21000
+USER_TOKENS = 10**24
+USER_BNB = 10**16
+
+
+class Intent(NamedTuple):
+    kind: str
+    data: bytes
+    scheduled: float
+
+
+class Outcome(NamedTuple):
+    kind: str
+    ok: bool
+    latency: float
+    gas: int
+    error: Optional[str] = None
+
+
+def parse_weights(text: str, key=str) -> Dict:
+    """
+    ``"transfer=7,spray=2"`` -> ``{"transfer": 7, "spray": 2}``.
+    """
+    weights = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        weights[key(name)] = float(weight)
+    return weights
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class CpuClock:
+    """
+    Thread CPU seconds spent per stage.
+    """
+
+    def __init__(self):
+        self.spent: Dict[str, float] = {}
+
+    def measure(self, stage: str, func, *args):
+        start = time.thread_time()
+        try:
+            return func(*args)
+        finally:
+            self.spent[stage] = self.spent.get(stage, 0.0) + time.thread_time() - start
+
+
+class LoadGenerator:
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.reader = BatchReader(args.rpc_url)
+        self.chain_id = int(self.reader.request([("eth_chainId", [])])[0]["result"], 16)
+        self.funder = Account.from_key(args.funder_key)
+        self.relayer_account = Account.from_key(args.relayer_key)
+        self.users = [
+            Account.from_key(keccak(f"peniwallet-load-{args.seed}-{i}".encode()))
+            for i in range(args.users)
+        ]
+        self.nonces: Dict[str, int] = {}
+        self.cpu = CpuClock()
+        self.sprays = 0
+        # spray codes are single use, so they are unique per run as well
+        self.run_id = int(time.time())
+
+    async def setup(self) -> None:
+        """
+        Funds every user with BNB and tokens and approves Peniwallet from each.
+        """
+        args = self.args
+        async with AsyncRelayer(HTTPTransport(args.rpc_url), self.funder, self.chain_id, args.token,
+                                window=64, poll_interval=0.05, keep_receipts=2 * len(self.users)) as funder:
+            hashes = []
+            for user in self.users:
+                hashes.append(await funder.send(b"", USER_BNB, to=user.address))
+                hashes.append(await funder.send(TOKEN_TRANSFER.encode([user.address, USER_TOKENS])))
+            await asyncio.gather(*(funder.wait(tx_hash, 120) for tx_hash in hashes))
+
+        async def approve(user):
+            async with AsyncRelayer(HTTPTransport(args.rpc_url), user, self.chain_id, args.token,
+                                    poll_interval=0.05) as client:
+                await client.relay(APPROVE.encode([args.peniwallet, 2**256 - 1]), timeout=120)
+
+        await asyncio.gather(*(approve(user) for user in self.users))
+        nonces = self.reader.nonces(args.peniwallet, [user.address for user in self.users])
+        self.nonces = {user.address: nonce for user, nonce in zip(self.users, nonces)}
+
+        if "swap" in args.mix:
+            router, = self.reader.values([call(args.peniwallet, "PancakeSwapRouterAddress()", outputs=("address",))])
+            self.weth, = self.reader.values([call(router, "WETH()", outputs=("address",))])
+
+    def _sign(self, user, struct, message) -> bytes:
+        signable = struct.signable(message, self.chain_id, self.args.peniwallet)
+        return self.cpu.measure("signing", user.sign_message, signable).signature
+
+    def intent(self, kind: str, user, scheduled: float) -> Intent:
+        args = self.args
+        deadline = int(time.time()) + 3600
+        if kind == "transfer":
+            message = {
+                'token': args.token,
+                'from': user.address,
+                'to': self.relayer_account.address,
+                'amount': 1,
+                'nonce': self.nonces[user.address],
+                'deadline': deadline,
+            }
+            self.nonces[user.address] += 1
+            signature = self._sign(user, TransferTransaction, message)
+            data = self.cpu.measure("encoding", calldata.encode_transfer, message, signature, MIN_FEE)
+        elif kind == "spray":
+            count = int(self.rng.choices(list(args.recipients), weights=list(args.recipients.values()))[0])
+            self.sprays += 1
+            message = {
+                'token': args.token,
+                'from': user.address,
+                'receivers': [self.users[(i + self.sprays) % len(self.users)].address for i in range(count)],
+                'amount': 1,
+                'code': f"load-{self.run_id}-{self.sprays}",
+            }
+            signature = self._sign(user, SprayTransaction, message)
+            data = self.cpu.measure("encoding", calldata.encode_spray_token, message, "Load", signature, MIN_FEE)
+        else:
+            message = {
+                'tokenA': args.token,
+                'tokenB': self.weth,
+                'from': user.address,
+                'amountA': 10**15,
+                'amountB': 10**15,
+                'nonce': self.nonces[user.address],
+                'deadline': deadline,
+            }
+            self.nonces[user.address] += 1
+            signature = self._sign(user, SwapTransaction, message)
+            data = self.cpu.measure(
+                "encoding", calldata.encode_swap_tokens_for_bnb, [args.token, self.weth], message, signature, MIN_FEE)
+        return Intent(kind, data, scheduled)
+
+    async def run(self) -> List[Outcome]:
+        args = self.args
+        kinds = list(args.mix)
+        weights = list(args.mix.values())
+        queue: asyncio.Queue = asyncio.Queue()
+        outcomes: List[Outcome] = []
+
+        async def produce():
+            began = time.perf_counter()
+            for i in range(args.count):
+                scheduled = began + i / args.rate
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                kind = self.rng.choices(kinds, weights=weights)[0]
+                await queue.put(self.intent(kind, self.users[i % len(self.users)], scheduled))
+            await queue.put(None)
+
+        async def settle(relayer, intent, tx_hash):
+            try:
+                receipt = await relayer.wait(tx_hash, timeout=300)
+            except Exception as error:
+                outcomes.append(Outcome(intent.kind, False, time.perf_counter() - intent.scheduled, 0, str(error)))
+                return
+            ok = int(receipt["status"], 16) == 1
+            outcomes.append(Outcome(intent.kind, ok, time.perf_counter() - intent.scheduled,
+                                    int(receipt["gasUsed"], 16), None if ok else "reverted"))
+
+        async with AsyncRelayer(HTTPTransport(args.rpc_url), self.relayer_account, self.chain_id,
+                                args.peniwallet, window=args.window, poll_interval=0.05) as relayer:
+            producer = asyncio.get_running_loop().create_task(produce())
+            settling = []
+            # one sender keeps each user's intents in nonce order
+            while (intent := await queue.get()) is not None:
+                try:
+                    tx_hash = await relayer.send(intent.data)
+                except Exception as error:
+                    outcomes.append(Outcome(intent.kind, False, time.perf_counter() - intent.scheduled, 0,
+                                            f"rejected: {error}"))
+                    continue
+                settling.append(asyncio.get_running_loop().create_task(settle(relayer, intent, tx_hash)))
+            await producer
+            await asyncio.gather(*settling)
+        return outcomes
+
+
+def report(outcomes: List[Outcome], elapsed: float, cpu: Dict[str, float], total_cpu: float) -> float:
+    tps = sum(1 for outcome in outcomes if outcome.ok) / elapsed
+    latencies = [outcome.latency * 1000 for outcome in outcomes if outcome.ok]
+    print(f"{len(outcomes)} intents in {elapsed:.2f}s, {tps:.1f} successful tx/s")
+    print(f"latency ms: p50 {percentile(latencies, 50):.0f}  p90 {percentile(latencies, 90):.0f}  "
+          f"p99 {percentile(latencies, 99):.0f}  max {max(latencies, default=0):.0f}")
+    for kind in sorted({outcome.kind for outcome in outcomes}):
+        of_kind = [outcome for outcome in outcomes if outcome.kind == kind]
+        ok = [outcome for outcome in of_kind if outcome.ok]
+        reverted = sum(1 for outcome in of_kind if outcome.error == "reverted")
+        gas = sum(outcome.gas for outcome in ok) / len(ok) if ok else 0
+        print(f"{kind:>9}: {len(ok)} ok, {reverted} reverted, {len(of_kind) - len(ok) - reverted} failed, "
+              f"{gas:,.0f} gas/tx")
+    signing, encoding = cpu.get("signing", 0.0), cpu.get("encoding", 0.0)
+    print(f"cpu s: signing {signing:.2f}  encoding {encoding:.2f}  "
+          f"rpc/other {max(total_cpu - signing - encoding, 0.0):.2f}")
+    return tps
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rpc_url")
+    parser.add_argument("peniwallet")
+    parser.add_argument("token")
+    parser.add_argument("funder_key")
+    parser.add_argument("relayer_key")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50.0, help="intents per second")
+    parser.add_argument("--mix", type=parse_weights, default="transfer=7,spray=2,swap=1")
+    parser.add_argument("--recipients", type=lambda text: parse_weights(text, int), default="1=5,10=3,200=1",
+                        help="spray recipient count=weight")
+    parser.add_argument("--window", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-tps", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    generator = LoadGenerator(args)
+    asyncio.run(generator.setup())
+    cpu_start, began = time.process_time(), time.perf_counter()
+    outcomes = asyncio.run(generator.run())
+    elapsed = time.perf_counter() - began
+    tps = report(outcomes, elapsed, generator.cpu.spent, time.process_time() - cpu_start)
+    return 0 if tps >= args.min_tps else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
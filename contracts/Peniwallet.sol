@@ -121,6 +121,34 @@ contract Peniwallet is EIP712Verifier {
 
     address public USDT;
 
+    /**
+     * @dev WBNB and the PancakeSwap factory, resolved from the router once
+     * at construction instead of on every fee calculation
+     */
+    address public WETH;
+
+    address public PancakeSwapFactoryAddress;
+
+    /**
+     * @dev the pairs _calculateMinFee prices a token with
+     */
+    struct FeePairs {
+        address bnbPair;
+        address usdtPair;
+    }
+
+    /**
+     * @dev cached fee pairs by token. A pair is only cached once it exists;
+     * a missing pair is looked up on the factory on every call, so a pair
+     * created later is picked up the same way it was without the cache
+     */
+    mapping(address => FeePairs) public feePairs;
+
+    /**
+     * @dev cached WBNB/USDT pair, used to price tokens only paired with USDT
+     */
+    address public bnbUsdtPair;
+
     /**
      * @dev stores admins
      */
@@ -173,6 +201,23 @@ contract Peniwallet is EIP712Verifier {
      */
     uint256 public constant SPRAY = 2;
 
+    /**
+     * @dev Maximum number of transfers in one batchTransfer call
+     */
+    uint256 public constant MAX_BATCH_TRANSFERS = 100;
+
+    /**
+     * @dev Reasons batchTransfer skips a transfer, reported by TransferSkipped
+     */
+    uint256 constant SKIPPED_NONCE = 1;
+    uint256 constant SKIPPED_EXPIRED = 2;
+    uint256 constant SKIPPED_SIGNATURE = 3;
+    uint256 constant SKIPPED_BALANCE = 4;
+    uint256 constant SKIPPED_ALLOWANCE = 5;
+    uint256 constant SKIPPED_TRANSFER_FAILED = 6;
+    uint256 constant SKIPPED_WRONG_TOKEN = 7;
+    uint256 constant SKIPPED_AMOUNT_TOO_LARGE = 8;
+
     /**
      * @dev Nonces for each tracsaction
      */
@@ -249,6 +294,25 @@ contract Peniwallet is EIP712Verifier {
         string code
     );
 
+    /**
+     * @dev Emitted when the fee pairs of a token are cached
+     */
+    event PairsCached(
+        address indexed token,
+        address bnbPair,
+        address usdtPair
+    );
+
+    /**
+     * @dev Emitted for each transfer batchTransfer could not execute
+     */
+    event TransferSkipped(
+        address indexed from,
+        uint256 indexed nonce,
+        uint256 index,
+        uint256 reason
+    );
+
     /**
      * @dev Constructor
      * @param _transferFee the fee charged on transfers
@@ -268,6 +332,15 @@ contract Peniwallet is EIP712Verifier {
         setFeeMultiplier(SPRAY, _sprayFee);
         PancakeSwapRouterAddress = _PancakeSwapRouterAddress;
         USDT = _USDT;
+
+        // WETH and the factory are read from the router below
+        require(
+            _PancakeSwapRouterAddress.code.length > 0,
+            "PancakeSwap router has no code"
+        );
+        IPancakeRouter router = IPancakeRouter(_PancakeSwapRouterAddress);
+        WETH = router.WETH();
+        PancakeSwapFactoryAddress = router.factory();
     }
 
     /**
@@ -335,9 +408,64 @@ contract Peniwallet is EIP712Verifier {
         projects[_token] = _dev;
         fees[_dev][_token].owner = _dev;
         fees[_dev][_token].token = _token;
+        _cachePairs(IPancakeFactory(PancakeSwapFactoryAddress), _token);
         emit ProjectRegistered(_dev, _token, msg.sender);
     }
 
+    /**
+     * @dev function to cache the fee pairs of tokens, so fee calculations
+     * read them from storage instead of the factory
+     * @param _tokens the tokens to cache the pairs of
+     * @notice run again after a missing pair is created, pairs that already
+     * exist never change
+     */
+    function cachePairs(address[] memory _tokens) public onlyAdmin {
+        IPancakeFactory factory = IPancakeFactory(PancakeSwapFactoryAddress);
+        if (bnbUsdtPair == address(0)) {
+            bnbUsdtPair = factory.getPair(WETH, USDT);
+        }
+        for (uint i = 0; i < _tokens.length; i++) {
+            _cachePairs(factory, _tokens[i]);
+        }
+    }
+
+    /**
+     * @dev function to look up and store the fee pairs of one token
+     * @param _factory the PancakeSwap factory
+     * @param _token the token to cache the pairs of
+     */
+    function _cachePairs(IPancakeFactory _factory, address _token) private {
+        FeePairs memory pairs = FeePairs({
+            bnbPair: _factory.getPair(_token, WETH),
+            usdtPair: _factory.getPair(_token, USDT)
+        });
+        FeePairs storage cached = feePairs[_token];
+        if (
+            cached.bnbPair == pairs.bnbPair && cached.usdtPair == pairs.usdtPair
+        ) {
+            return;
+        }
+        feePairs[_token] = pairs;
+        emit PairsCached(_token, pairs.bnbPair, pairs.usdtPair);
+    }
+
+    /**
+     * @dev function to get a fee pair, from the cache when it is there
+     * @param _cached the cached pair, zero when not cached
+     * @param _tokenA the first token of the pair
+     * @param _tokenB the second token of the pair
+     */
+    function _feePair(
+        address _cached,
+        address _tokenA,
+        address _tokenB
+    ) private view returns (address) {
+        if (_cached != address(0)) {
+            return _cached;
+        }
+        return IPancakeFactory(PancakeSwapFactoryAddress).getPair(_tokenA, _tokenB);
+    }
+
     /**
      * @dev function to set the fee multiplier
      * @param _type the type of transaction
@@ -389,37 +517,35 @@ contract Peniwallet is EIP712Verifier {
         address _token,
         uint256 minFee
     ) private view returns (uint256 _minFeeInToken) {
-        IPancakeRouter router = IPancakeRouter(PancakeSwapRouterAddress);
-        IPancakeFactory factory = IPancakeFactory(router.factory());
-
         if (_token == address(0)) {
             return minFee;
         }
 
-        if (_token == router.WETH()) {
+        address weth = WETH;
+        if (_token == weth) {
             return minFee;
         }
 
-        address bnbTokenPair = factory.getPair(_token, router.WETH());
-        address usdtTokenPair = factory.getPair(_token, USDT);
-        address bnbUsdtPair = factory.getPair(router.WETH(), USDT);
-
-        require(
-            bnbTokenPair != address(0) || usdtTokenPair != address(0),
-            "No Supported Pairs exists for the token"
-        );
+        IPancakeRouter router = IPancakeRouter(PancakeSwapRouterAddress);
+        address bnbTokenPair = _feePair(feePairs[_token].bnbPair, _token, weth);
 
         if (bnbTokenPair != address(0)) {
-            uint256 bnbReserve = IErc20(router.WETH()).balanceOf(bnbTokenPair);
+            uint256 bnbReserve = IErc20(weth).balanceOf(bnbTokenPair);
             uint256 tokenReserve = IErc20(_token).balanceOf(bnbTokenPair);
             _minFeeInToken = router.quote(minFee, bnbReserve, tokenReserve);
         } else {
-            
+            address usdtTokenPair = _feePair(feePairs[_token].usdtPair, _token, USDT);
+            require(
+                usdtTokenPair != address(0),
+                "No Supported Pairs exists for the token"
+            );
+            address usdtPair = _feePair(bnbUsdtPair, weth, USDT);
+
             // if the token is not paired with BNB, then it is paired with USDT
             // calculate the fee in USDT and then convert to token
-            uint256 usdtReserveInBNBPair = IErc20(USDT).balanceOf(bnbUsdtPair);
-            uint256 bnbReserveInBNBPair = IErc20(router.WETH()).balanceOf(
-                bnbUsdtPair
+            uint256 usdtReserveInBNBPair = IErc20(USDT).balanceOf(usdtPair);
+            uint256 bnbReserveInBNBPair = IErc20(weth).balanceOf(
+                usdtPair
             );
             uint256 feeInUsdt = router.quote(
                 minFee,
@@ -457,19 +583,31 @@ contract Peniwallet is EIP712Verifier {
         uint256 _type,
         uint256 _externalFee
     ) private view returns (uint256) {
+        uint256 fee = _percentageFee(_amount, feeMultiplier[_type]);
+
+        // Get the minimum fee in tokens
+        uint256 minFeeInToken = _calculateMinFee(_token, _externalFee);
+        return fee + minFeeInToken;
+    }
+
+    /**
+     * @dev function to calculate the percentage part of a fee
+     * @param _amount the amount of tokens to transfer
+     * @param _feeRatio the fee multiplier of the transaction type
+     * @return fee the percentage fee
+     */
+    function _percentageFee(
+        uint256 _amount,
+        uint256 _feeRatio
+    ) private pure returns (uint256) {
         uint256 feeDecimals = 3;
-        uint256 _feeRatio = feeMultiplier[_type];
 
         // Calculate the fee based on the transaction amount and fee ratio
         uint256 fee = ((_amount * 10 ** feeDecimals) * _feeRatio) /
             (100 * 10 ** feeDecimals);
 
         // Adjust fee to the proper decimal representation
-        fee = fee / (10 ** feeDecimals);
-
-        // Get the minimum fee in tokens
-        uint256 minFeeInToken = _calculateMinFee(_token, _externalFee);
-        return fee + minFeeInToken;
+        return fee / (10 ** feeDecimals);
     }
 
     /**
@@ -568,6 +706,195 @@ contract Peniwallet is EIP712Verifier {
         token.transferFrom(_from, address(this), fee);
     }
 
+    /**
+     * @dev function to execute many signed transfers of one token in one call.
+     * The minimum fee is quoted once for the whole batch and the collected
+     * fees are shared once at the end. A transfer that cannot go through is
+     * skipped without using its nonce, and TransferSkipped is emitted for it.
+     * @param _token the token every transfer in the batch moves
+     * @param _transactions the signed transfers, executed in order
+     * @param _signatures the signature of each transfer
+     * @param _gas the gas fee (in wie) charged for each transfer
+     * @return executed whether each transfer was executed
+     */
+    function batchTransfer(
+        address _token,
+        TransferTransaction[] calldata _transactions,
+        bytes[] calldata _signatures,
+        uint256 _gas
+    ) external returns (bool[] memory executed) {
+        require(
+            _transactions.length == _signatures.length,
+            "Signature count mismatch"
+        );
+        require(
+            _transactions.length <= MAX_BATCH_TRANSFERS,
+            "Batch is too long"
+        );
+
+        uint256 minFee = _calculateMinFee(_token, _gas);
+        uint256 feeRatio = feeMultiplier[TRANSFER];
+        uint256 collected;
+        executed = new bool[](_transactions.length);
+
+        for (uint i = 0; i < _transactions.length; i++) {
+            collected += _batchTransferItem(
+                IErc20(_token),
+                _transactions[i],
+                _signatures[i],
+                i,
+                minFee,
+                feeRatio,
+                executed
+            );
+        }
+
+        // share the fees of the whole batch
+        if (collected > 0) {
+            shareFees(_token, collected);
+        }
+    }
+
+    /**
+     * @dev function to execute one transfer of a batch, or report it with
+     * TransferSkipped. Kept out of batchTransfer's loop so neither function
+     * needs more stack slots than the legacy code generator can reach
+     * @param _token the token of the batch
+     * @param _transaction the signed transfer
+     * @param _signature the signature of the transfer
+     * @param _index the position of the transfer in the batch
+     * @param _minFee the minimum fee in tokens, quoted once per batch
+     * @param _feeRatio the transfer fee multiplier
+     * @param _executed the batch results, set at _index when executed
+     * @return fee the fee charged, zero when the transfer was skipped
+     */
+    function _batchTransferItem(
+        IErc20 _token,
+        TransferTransaction calldata _transaction,
+        bytes calldata _signature,
+        uint256 _index,
+        uint256 _minFee,
+        uint256 _feeRatio,
+        bool[] memory _executed
+    ) private returns (uint256 fee) {
+        uint256 reason;
+        (reason, fee) = _tryTransfer(_token, _transaction, _signature, _minFee, _feeRatio);
+        if (reason == 0) {
+            _executed[_index] = true;
+        } else {
+            emit TransferSkipped(_transaction.from, _transaction.nonce, _index, reason);
+        }
+    }
+
+    /**
+     * @dev function to execute one transfer of a batch without reverting
+     * @param _token the token of the batch
+     * @param _transaction the signed transfer
+     * @param _signature the signature of the transfer
+     * @param _minFee the minimum fee in tokens, quoted once per batch
+     * @param _feeRatio the transfer fee multiplier
+     * @return reason zero when the transfer was executed, else a SKIPPED_ code
+     * @return fee the fee charged
+     */
+    function _tryTransfer(
+        IErc20 _token,
+        TransferTransaction calldata _transaction,
+        bytes calldata _signature,
+        uint256 _minFee,
+        uint256 _feeRatio
+    ) private returns (uint256 reason, uint256 fee) {
+        if (_transaction.token != address(_token)) {
+            return (SKIPPED_WRONG_TOKEN, 0);
+        }
+        if (_transaction.nonce != nonces[_transaction.from]) {
+            return (SKIPPED_NONCE, 0);
+        }
+        if (block.timestamp > _transaction.deadline) {
+            return (SKIPPED_EXPIRED, 0);
+        }
+        if (!tryVerifyTransfer(_transaction, _signature)) {
+            return (SKIPPED_SIGNATURE, 0);
+        }
+        // keeps the fee arithmetic below from overflowing and reverting the batch
+        if (_transaction.amount > type(uint128).max) {
+            return (SKIPPED_AMOUNT_TOO_LARGE, 0);
+        }
+
+        fee = _percentageFee(_transaction.amount, _feeRatio) + _minFee;
+        if (_token.balanceOf(_transaction.from) < _transaction.amount + fee) {
+            return (SKIPPED_BALANCE, 0);
+        }
+        if (_token.allowance(_transaction.from, address(this)) < _transaction.amount + fee) {
+            return (SKIPPED_ALLOWANCE, 0);
+        }
+
+        // a failed leg reverts the whole call, the nonce and anything a
+        // token did by calling back into this contract included
+        try this.executeBatchedTransfer(_transaction, fee) {
+            return (0, fee);
+        } catch {
+            return (SKIPPED_TRANSFER_FAILED, 0);
+        }
+    }
+
+    /**
+     * @dev function to use the nonce of a batched transfer and move its fee
+     * and amount, reverting if either leg fails
+     * @param _transaction the signed transfer, checked by _tryTransfer
+     * @param _fee the fee charged
+     * @notice only callable by the contract itself, from batchTransfer
+     */
+    function executeBatchedTransfer(
+        TransferTransaction calldata _transaction,
+        uint256 _fee
+    ) external {
+        require(msg.sender == address(this), "Only callable by Peniwallet");
+
+        // used before the token is called, so a call back into the
+        // contract cannot execute this transfer again
+        nonces[_transaction.from]++;
+
+        require(
+            _callToken(
+                _transaction.token,
+                abi.encodeWithSelector(IErc20.transferFrom.selector, _transaction.from, address(this), _fee)
+            ),
+            "Fee transfer failed"
+        );
+        require(
+            _callToken(
+                _transaction.token,
+                abi.encodeWithSelector(
+                    IErc20.transferFrom.selector,
+                    _transaction.from,
+                    _transaction.to,
+                    _transaction.amount
+                )
+            ),
+            "Transfer failed"
+        );
+    }
+
+    /**
+     * @dev function to call a token without reverting when the call fails or
+     * returns something other than nothing or true
+     * @param _token the token to call
+     * @param _data the calldata
+     * @return success whether the call went through
+     */
+    function _callToken(
+        address _token,
+        bytes memory _data
+    ) private returns (bool success) {
+        bytes memory returned;
+        (success, returned) = _token.call(_data);
+        // some tokens return nothing, reading anything but one word as true fails
+        return success && (
+            returned.length == 0 ||
+            (returned.length == 32 && abi.decode(returned, (uint256)) == 1)
+        );
+    }
+
     /**
      * @dev function to swap BNB for tokens
      * @param _token the address of the token to receive
@@ -578,7 +905,7 @@ contract Peniwallet is EIP712Verifier {
         IPancakeRouter router = IPancakeRouter(PancakeSwapRouterAddress);
 
         address[] memory path = new address[](2);
-        path[0] = router.WETH();
+        path[0] = WETH;
         path[1] = _token;
 
         router.swapExactETHForTokensSupportingFeeOnTransferTokens{
@@ -616,7 +943,7 @@ contract Peniwallet is EIP712Verifier {
             verifySwap(
                 SwapTransaction({
                     tokenA: _path[0],
-                    tokenB: router.WETH(),
+                    tokenB: WETH,
                     from: _user,
                     amountA: _amount,
                     amountB: _amount,
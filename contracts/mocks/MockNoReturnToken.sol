@@ -0,0 +1,75 @@
+/**
+ * @title MockNoReturnToken
+ * @dev ERC20 whose transfer and transferFrom return nothing, like USDT on
+ * Ethereum, and that refuses transfers to blocked addresses. It can also
+ * call back into the spender once from transferFrom, like a malicious
+ * token would.
+ *
+ * @notice Test-only, never deploy this to a real network.
+ */
+
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.0;
+
+contract MockNoReturnToken {
+    string public name = "No Return";
+    string public symbol = "NRT";
+    uint8 public decimals = 18;
+    uint256 public totalSupply;
+
+    mapping(address => uint256) public balanceOf;
+    mapping(address => mapping(address => uint256)) public allowance;
+    mapping(address => bool) public blocked;
+
+    address public reentryTarget;
+    bytes public reentryData;
+
+    event Transfer(address indexed from, address indexed to, uint256 value);
+    event Approval(address indexed owner, address indexed spender, uint256 value);
+    event Reentered(address indexed target, bool success);
+
+    function mint(address _to, uint256 _amount) public {
+        totalSupply += _amount;
+        balanceOf[_to] += _amount;
+        emit Transfer(address(0), _to, _amount);
+    }
+
+    function setBlocked(address _account, bool _blocked) public {
+        blocked[_account] = _blocked;
+    }
+
+    function setReentry(address _target, bytes memory _data) public {
+        reentryTarget = _target;
+        reentryData = _data;
+    }
+
+    function approve(address _spender, uint256 _amount) public returns (bool) {
+        allowance[msg.sender][_spender] = _amount;
+        emit Approval(msg.sender, _spender, _amount);
+        return true;
+    }
+
+    function transfer(address _to, uint256 _amount) public {
+        _transfer(msg.sender, _to, _amount);
+    }
+
+    function transferFrom(address _from, address _to, uint256 _amount) public {
+        address target = reentryTarget;
+        if (target != address(0)) {
+            reentryTarget = address(0);
+            (bool success, ) = target.call(reentryData);
+            emit Reentered(target, success);
+        }
+        require(allowance[_from][msg.sender] >= _amount, "insufficient allowance");
+        allowance[_from][msg.sender] -= _amount;
+        _transfer(_from, _to, _amount);
+    }
+
+    function _transfer(address _from, address _to, uint256 _amount) internal {
+        require(!blocked[_to], "blocked");
+        require(balanceOf[_from] >= _amount, "insufficient balance");
+        balanceOf[_from] -= _amount;
+        balanceOf[_to] += _amount;
+        emit Transfer(_from, _to, _amount);
+    }
+}
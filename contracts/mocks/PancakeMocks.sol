@@ -0,0 +1,330 @@
+/**
+ * @title PancakeMocks
+ * @dev Minimal stand-ins for WBNB, USDT and the PancakeSwap router,
+ * factory and pairs, so Peniwallet can be deployed and exercised on a
+ * local chain. Pricing follows PancakeSwap (0.25% fee) but there is no
+ * LP accounting: liquidity is added by sending tokens to a pair and
+ * calling sync().
+ *
+ * @notice Test-only, never deploy these to a real network.
+ */
+
+// SPDX-License-Identifier: MIT
+pragma solidity 0.8.0;
+
+/**
+ * @title MockERC20
+ * @dev ERC20 token that anyone can mint
+ */
+contract MockERC20 {
+    string public name;
+    string public symbol;
+    uint8 public decimals;
+    uint256 public totalSupply;
+
+    mapping(address => uint256) public balanceOf;
+    mapping(address => mapping(address => uint256)) public allowance;
+
+    event Transfer(address indexed from, address indexed to, uint256 value);
+    event Approval(address indexed owner, address indexed spender, uint256 value);
+
+    constructor(string memory _name, string memory _symbol, uint8 _decimals) {
+        name = _name;
+        symbol = _symbol;
+        decimals = _decimals;
+    }
+
+    function mint(address _to, uint256 _amount) public {
+        totalSupply += _amount;
+        balanceOf[_to] += _amount;
+        emit Transfer(address(0), _to, _amount);
+    }
+
+    function approve(address _spender, uint256 _amount) public returns (bool) {
+        allowance[msg.sender][_spender] = _amount;
+        emit Approval(msg.sender, _spender, _amount);
+        return true;
+    }
+
+    function transfer(address _to, uint256 _amount) public returns (bool) {
+        _transfer(msg.sender, _to, _amount);
+        return true;
+    }
+
+    function transferFrom(
+        address _from,
+        address _to,
+        uint256 _amount
+    ) public returns (bool) {
+        require(allowance[_from][msg.sender] >= _amount, "insufficient allowance");
+        allowance[_from][msg.sender] -= _amount;
+        _transfer(_from, _to, _amount);
+        return true;
+    }
+
+    function _transfer(address _from, address _to, uint256 _amount) internal {
+        require(balanceOf[_from] >= _amount, "insufficient balance");
+        balanceOf[_from] -= _amount;
+        balanceOf[_to] += _amount;
+        emit Transfer(_from, _to, _amount);
+    }
+}
+
+/**
+ * @title MockWETH
+ * @dev Wrapped BNB
+ */
+contract MockWETH is MockERC20 {
+    constructor() MockERC20("Wrapped BNB", "WBNB", 18) {}
+
+    function deposit() public payable {
+        mint(msg.sender, msg.value);
+    }
+
+    function withdraw(uint256 _amount) public {
+        require(balanceOf[msg.sender] >= _amount, "insufficient balance");
+        balanceOf[msg.sender] -= _amount;
+        totalSupply -= _amount;
+        emit Transfer(msg.sender, address(0), _amount);
+        payable(msg.sender).transfer(_amount);
+    }
+
+    receive() external payable {
+        deposit();
+    }
+}
+
+/**
+ * @title MockPancakePair
+ * @dev Holds the two tokens and pays out swaps; reserves are the
+ * balances recorded at the last swap or sync
+ */
+contract MockPancakePair {
+    address public factory;
+    address public token0;
+    address public token1;
+
+    uint112 private reserve0;
+    uint112 private reserve1;
+    uint32 private blockTimestampLast;
+
+    event Sync(uint112 reserve0, uint112 reserve1);
+
+    constructor(address _token0, address _token1) {
+        factory = msg.sender;
+        token0 = _token0;
+        token1 = _token1;
+    }
+
+    function getReserves()
+        public
+        view
+        returns (uint112 _reserve0, uint112 _reserve1, uint32 _blockTimestampLast)
+    {
+        return (reserve0, reserve1, blockTimestampLast);
+    }
+
+    function sync() public {
+        reserve0 = uint112(MockERC20(token0).balanceOf(address(this)));
+        reserve1 = uint112(MockERC20(token1).balanceOf(address(this)));
+        blockTimestampLast = uint32(block.timestamp);
+        emit Sync(reserve0, reserve1);
+    }
+
+    /**
+     * @dev pays out the amounts, the caller is trusted to have sent the
+     * input first (there is no k check)
+     */
+    function swap(uint256 _amount0Out, uint256 _amount1Out, address _to) public {
+        if (_amount0Out > 0) MockERC20(token0).transfer(_to, _amount0Out);
+        if (_amount1Out > 0) MockERC20(token1).transfer(_to, _amount1Out);
+        sync();
+    }
+}
+
+/**
+ * @title MockPancakeFactory
+ */
+contract MockPancakeFactory {
+    mapping(address => mapping(address => address)) public getPair;
+    address[] public allPairs;
+
+    event PairCreated(address indexed token0, address indexed token1, address pair, uint256);
+
+    function createPair(address _tokenA, address _tokenB) public returns (address pair) {
+        require(_tokenA != _tokenB, "IDENTICAL_ADDRESSES");
+        require(getPair[_tokenA][_tokenB] == address(0), "PAIR_EXISTS");
+        (address token0, address token1) = _tokenA < _tokenB
+            ? (_tokenA, _tokenB)
+            : (_tokenB, _tokenA);
+        pair = address(new MockPancakePair(token0, token1));
+        getPair[token0][token1] = pair;
+        getPair[token1][token0] = pair;
+        allPairs.push(pair);
+        emit PairCreated(token0, token1, pair, allPairs.length);
+    }
+
+    function allPairsLength() public view returns (uint256) {
+        return allPairs.length;
+    }
+}
+
+/**
+ * @title MockPancakeRouter
+ * @dev The parts of PancakeRouter that Peniwallet uses
+ */
+contract MockPancakeRouter {
+    address public factory;
+    address public WETH;
+
+    constructor(address _factory, address _WETH) {
+        factory = _factory;
+        WETH = _WETH;
+    }
+
+    receive() external payable {}
+
+    function quote(
+        uint256 amountA,
+        uint256 reserveA,
+        uint256 reserveB
+    ) public pure returns (uint256 amountB) {
+        require(amountA > 0, "PancakeLibrary: INSUFFICIENT_AMOUNT");
+        require(reserveA > 0 && reserveB > 0, "PancakeLibrary: INSUFFICIENT_LIQUIDITY");
+        amountB = (amountA * reserveB) / reserveA;
+    }
+
+    function getAmountOut(
+        uint256 amountIn,
+        uint256 reserveIn,
+        uint256 reserveOut
+    ) public pure returns (uint256 amountOut) {
+        require(amountIn > 0, "PancakeLibrary: INSUFFICIENT_INPUT_AMOUNT");
+        require(reserveIn > 0 && reserveOut > 0, "PancakeLibrary: INSUFFICIENT_LIQUIDITY");
+        uint256 amountInWithFee = amountIn * 9975;
+        amountOut = (amountInWithFee * reserveOut) / (reserveIn * 10000 + amountInWithFee);
+    }
+
+    function getAmountIn(
+        uint256 amountOut,
+        uint256 reserveIn,
+        uint256 reserveOut
+    ) public pure returns (uint256 amountIn) {
+        require(amountOut > 0, "PancakeLibrary: INSUFFICIENT_OUTPUT_AMOUNT");
+        require(reserveIn > 0 && reserveOut > 0, "PancakeLibrary: INSUFFICIENT_LIQUIDITY");
+        amountIn = (reserveIn * amountOut * 10000) / ((reserveOut - amountOut) * 9975) + 1;
+    }
+
+    function getAmountsOut(
+        uint256 amountIn,
+        address[] memory path
+    ) public view returns (uint256[] memory amounts) {
+        require(path.length >= 2, "PancakeLibrary: INVALID_PATH");
+        amounts = new uint256[](path.length);
+        amounts[0] = amountIn;
+        for (uint256 i = 0; i < path.length - 1; i++) {
+            (uint256 reserveIn, uint256 reserveOut) = _reserves(path[i], path[i + 1]);
+            amounts[i + 1] = getAmountOut(amounts[i], reserveIn, reserveOut);
+        }
+    }
+
+    function getAmountsIn(
+        uint256 amountOut,
+        address[] memory path
+    ) public view returns (uint256[] memory amounts) {
+        require(path.length >= 2, "PancakeLibrary: INVALID_PATH");
+        amounts = new uint256[](path.length);
+        amounts[amounts.length - 1] = amountOut;
+        for (uint256 i = path.length - 1; i > 0; i--) {
+            (uint256 reserveIn, uint256 reserveOut) = _reserves(path[i - 1], path[i]);
+            amounts[i - 1] = getAmountIn(amounts[i], reserveIn, reserveOut);
+        }
+    }
+
+    function swapExactTokensForTokensSupportingFeeOnTransferTokens(
+        uint256 amountIn,
+        uint256 amountOutMin,
+        address[] calldata path,
+        address to,
+        uint256 deadline
+    ) external {
+        require(deadline >= block.timestamp, "PancakeRouter: EXPIRED");
+        MockERC20(path[0]).transferFrom(msg.sender, _pair(path[0], path[1]), amountIn);
+        uint256 balanceBefore = MockERC20(path[path.length - 1]).balanceOf(to);
+        _swap(path, to);
+        require(
+            MockERC20(path[path.length - 1]).balanceOf(to) - balanceBefore >= amountOutMin,
+            "PancakeRouter: INSUFFICIENT_OUTPUT_AMOUNT"
+        );
+    }
+
+    function swapExactETHForTokensSupportingFeeOnTransferTokens(
+        uint256 amountOutMin,
+        address[] calldata path,
+        address to,
+        uint256 deadline
+    ) external payable {
+        require(deadline >= block.timestamp, "PancakeRouter: EXPIRED");
+        require(path[0] == WETH, "PancakeRouter: INVALID_PATH");
+        MockWETH(payable(WETH)).deposit{value: msg.value}();
+        MockERC20(WETH).transfer(_pair(path[0], path[1]), msg.value);
+        uint256 balanceBefore = MockERC20(path[path.length - 1]).balanceOf(to);
+        _swap(path, to);
+        require(
+            MockERC20(path[path.length - 1]).balanceOf(to) - balanceBefore >= amountOutMin,
+            "PancakeRouter: INSUFFICIENT_OUTPUT_AMOUNT"
+        );
+    }
+
+    function swapExactTokensForETHSupportingFeeOnTransferTokens(
+        uint256 amountIn,
+        uint256 amountOutMin,
+        address[] calldata path,
+        address to,
+        uint256 deadline
+    ) external {
+        require(deadline >= block.timestamp, "PancakeRouter: EXPIRED");
+        require(path[path.length - 1] == WETH, "PancakeRouter: INVALID_PATH");
+        MockERC20(path[0]).transferFrom(msg.sender, _pair(path[0], path[1]), amountIn);
+        _swap(path, address(this));
+        uint256 amountOut = MockERC20(WETH).balanceOf(address(this));
+        require(amountOut >= amountOutMin, "PancakeRouter: INSUFFICIENT_OUTPUT_AMOUNT");
+        MockWETH(payable(WETH)).withdraw(amountOut);
+        payable(to).transfer(amountOut);
+    }
+
+    function _pair(address _tokenA, address _tokenB) internal view returns (address pair) {
+        pair = MockPancakeFactory(factory).getPair(_tokenA, _tokenB);
+        require(pair != address(0), "PancakeLibrary: PAIR_NOT_FOUND");
+    }
+
+    function _reserves(
+        address _tokenA,
+        address _tokenB
+    ) internal view returns (uint256 reserveA, uint256 reserveB) {
+        MockPancakePair pair = MockPancakePair(_pair(_tokenA, _tokenB));
+        (uint112 reserve0, uint112 reserve1, ) = pair.getReserves();
+        (reserveA, reserveB) = _tokenA == pair.token0()
+            ? (uint256(reserve0), uint256(reserve1))
+            : (uint256(reserve1), uint256(reserve0));
+    }
+
+    /**
+     * @dev like PancakeRouter._swapSupportingFeeOnTransferTokens, the input
+     * of each hop is whatever the pair received above its reserve
+     */
+    function _swap(address[] memory path, address _to) internal {
+        for (uint256 i = 0; i < path.length - 1; i++) {
+            (address input, address output) = (path[i], path[i + 1]);
+            MockPancakePair pair = MockPancakePair(_pair(input, output));
+            (uint256 reserveIn, uint256 reserveOut) = _reserves(input, output);
+            uint256 amountIn = MockERC20(input).balanceOf(address(pair)) - reserveIn;
+            uint256 amountOut = getAmountOut(amountIn, reserveIn, reserveOut);
+            (uint256 amount0Out, uint256 amount1Out) = input == pair.token0()
+                ? (uint256(0), amountOut)
+                : (amountOut, uint256(0));
+            address to = i < path.length - 2 ? _pair(output, path[i + 2]) : _to;
+            pair.swap(amount0Out, amount1Out, to);
+        }
+    }
+}
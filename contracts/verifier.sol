@@ -99,8 +99,32 @@ contract EIP712Verifier {
     ) internal view returns (bool) {
         // Extract v, r, and s from the signature
         require(signature.length == 65, "Invalid signature");
-        // Create a hash of the Transaction data using EIP-712 encoding
-        bytes32 structHash = keccak256(
+
+        address signer = _getSigner(signature, _transferHash(transaction));
+        require(signer != address(0), "Invalid signature");
+
+        return signer == transaction.from;
+    }
+
+    // Same check as verifyTransfer, but returns false instead of reverting
+    // so one bad signature does not revert a whole batch
+    function tryVerifyTransfer(
+        TransferTransaction memory transaction,
+        bytes memory signature
+    ) internal view returns (bool) {
+        if (signature.length != 65) {
+            return false;
+        }
+
+        address signer = _getSigner(signature, _transferHash(transaction));
+        return signer != address(0) && signer == transaction.from;
+    }
+
+    // Create a hash of the Transaction data using EIP-712 encoding
+    function _transferHash(
+        TransferTransaction memory transaction
+    ) private pure returns (bytes32) {
+        return keccak256(
             abi.encode(
                 TransferTransaction_TYPEHASH,
                 transaction.token,
@@ -111,11 +135,6 @@ contract EIP712Verifier {
                 transaction.deadline
             )
         );
-
-        address signer = _getSigner(signature, structHash);
-        require(signer != address(0), "Invalid signature");
-
-        return signer == transaction.from;
     }
 
     // Verify a signature and return the signer's address for swap transaction
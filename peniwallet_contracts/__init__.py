@@ -0,0 +1,132 @@
+"""
+Peniwallet helpers. Names are imported from their modules on first
+access, so ``import peniwallet_contracts`` (and the CLI) does not pay for
+aiohttp, eth_account or the indexer until they are used.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from peniwallet_contracts.addressbook import AddressBook
+    from peniwallet_contracts.analytics import AnalyticsStore
+    from peniwallet_contracts.bulk import BulkSpray
+    from peniwallet_contracts.bundler import Bundler
+    from peniwallet_contracts.eip712 import (
+        SprayTransaction,
+        SwapTransaction,
+        TransferTransaction,
+        TypedStruct,
+        domain_separator,
+        sign_typed,
+    )
+    from peniwallet_contracts.fees import FeeEngine, FeeError
+    from peniwallet_contracts.gasoracle import GasOracle
+    from peniwallet_contracts.indexer import EventIndexer
+    from peniwallet_contracts.ledger import Drift, FeeLedger
+    from peniwallet_contracts.metrics import Metrics
+    from peniwallet_contracts.nonces import NonceAllocator, NonceManager
+    from peniwallet_contracts.pairsync import PairSync
+    from peniwallet_contracts.preflight import Preflight, PreflightResult, RelayCall
+    from peniwallet_contracts.reads import BatchReader, ReadResult
+    from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport, WebSocketTransport
+    from peniwallet_contracts.replay import ReplayCache, ReplayStats
+    from peniwallet_contracts.routes import RouteError, RouteFinder
+    from peniwallet_contracts.signing import BatchSigner
+    from peniwallet_contracts.spray import SprayCheckpoint, SprayPlanner
+    from peniwallet_contracts.verify import BatchVerifier, InvalidSignature, Verification
+
+_EXPORTS = {
+    "AddressBook": "peniwallet_contracts.addressbook",
+    "AnalyticsStore": "peniwallet_contracts.analytics",
+    "AsyncRelayer": "peniwallet_contracts.relayer",
+    "BatchReader": "peniwallet_contracts.reads",
+    "BatchSigner": "peniwallet_contracts.signing",
+    "BatchVerifier": "peniwallet_contracts.verify",
+    "BulkSpray": "peniwallet_contracts.bulk",
+    "Bundler": "peniwallet_contracts.bundler",
+    "Drift": "peniwallet_contracts.ledger",
+    "EventIndexer": "peniwallet_contracts.indexer",
+    "FeeEngine": "peniwallet_contracts.fees",
+    "FeeError": "peniwallet_contracts.fees",
+    "FeeLedger": "peniwallet_contracts.ledger",
+    "GasOracle": "peniwallet_contracts.gasoracle",
+    "HTTPTransport": "peniwallet_contracts.relayer",
+    "InvalidSignature": "peniwallet_contracts.verify",
+    "Metrics": "peniwallet_contracts.metrics",
+    "NonceAllocator": "peniwallet_contracts.nonces",
+    "NonceManager": "peniwallet_contracts.nonces",
+    "PairSync": "peniwallet_contracts.pairsync",
+    "Preflight": "peniwallet_contracts.preflight",
+    "PreflightResult": "peniwallet_contracts.preflight",
+    "ReadResult": "peniwallet_contracts.reads",
+    "RelayCall": "peniwallet_contracts.preflight",
+    "ReplayCache": "peniwallet_contracts.replay",
+    "ReplayStats": "peniwallet_contracts.replay",
+    "RouteError": "peniwallet_contracts.routes",
+    "RouteFinder": "peniwallet_contracts.routes",
+    "SprayCheckpoint": "peniwallet_contracts.spray",
+    "SprayPlanner": "peniwallet_contracts.spray",
+    "SprayTransaction": "peniwallet_contracts.eip712",
+    "SwapTransaction": "peniwallet_contracts.eip712",
+    "TransferTransaction": "peniwallet_contracts.eip712",
+    "TypedStruct": "peniwallet_contracts.eip712",
+    "Verification": "peniwallet_contracts.verify",
+    "WebSocketTransport": "peniwallet_contracts.relayer",
+    "domain_separator": "peniwallet_contracts.eip712",
+    "sign_typed": "peniwallet_contracts.eip712",
+}
+
+__all__ = [
+    "AddressBook",
+    "AnalyticsStore",
+    "AsyncRelayer",
+    "BatchReader",
+    "BatchSigner",
+    "BatchVerifier",
+    "BulkSpray",
+    "Bundler",
+    "Drift",
+    "EventIndexer",
+    "FeeEngine",
+    "FeeError",
+    "FeeLedger",
+    "GasOracle",
+    "HTTPTransport",
+    "InvalidSignature",
+    "Metrics",
+    "NonceAllocator",
+    "NonceManager",
+    "PairSync",
+    "Preflight",
+    "PreflightResult",
+    "ReadResult",
+    "RelayCall",
+    "ReplayCache",
+    "ReplayStats",
+    "RouteError",
+    "RouteFinder",
+    "SprayCheckpoint",
+    "SprayPlanner",
+    "SprayTransaction",
+    "SwapTransaction",
+    "TransferTransaction",
+    "TypedStruct",
+    "Verification",
+    "WebSocketTransport",
+    "domain_separator",
+    "sign_typed",
+]
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
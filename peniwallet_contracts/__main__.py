@@ -0,0 +1,5 @@
+import sys
+
+from peniwallet_contracts.cli import main
+
+sys.exit(main())
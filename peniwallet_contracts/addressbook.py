@@ -0,0 +1,282 @@
+"""
+Memory-mapped address book.
+
+File layout (little endian)::
+
+    header   magic b"PENIADDR", version u32, reserved u32, count u64
+    records  count * 20 bytes, in the order of the source list
+    index    count * u32, record positions sorted by address bytes
+
+Records are only turned into checksummed strings when they are read, and
+membership checks binary search the sorted index without touching the
+rest of the file.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from typing import Iterable, Iterator, List, Optional, Union, overload
+
+from eth_utils import is_checksum_address, is_hex_address, to_checksum_address
+
+from peniwallet_contracts.eip712 import Address, address_bytes
+
+MAGIC = b"PENIADDR"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ")
+RECORD_SIZE = 20
+INDEX_SIZE = 4
+# records sorted in memory at once while building the index
+SORT_CHUNK = 1 << 18
+RUN_ENTRY = RECORD_SIZE + INDEX_SIZE
+
+
+def parse_address(line: str, lineno: int = 0) -> bytes:
+    """
+    Validates an address from the text format and returns its raw bytes.
+    Mixed-case addresses must carry a valid EIP-55 checksum.
+    """
+    value = line.strip()
+    if not is_hex_address(value):
+        raise ValueError(f"line {lineno}: invalid address {value!r}")
+    digits = value[2:]
+    if digits != digits.lower() and digits != digits.upper() and not is_checksum_address(value):
+        raise ValueError(f"line {lineno}: bad checksum {value!r}")
+    return bytes.fromhex(digits)
+
+
+def _write_run(entries: List[bytes], path: str) -> None:
+    entries.sort()
+    with open(path, "wb") as file:
+        file.write(b"".join(entries))
+
+
+def _read_run(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(RUN_ENTRY * 4096)
+            if not block:
+                return
+            for start in range(0, len(block), RUN_ENTRY):
+                yield block[start:start + RUN_ENTRY]
+
+
+def convert(text_path: str, book_path: str, chunk_size: int = SORT_CHUNK) -> int:
+    """
+    Converts a text file with one address per line into the binary format,
+    returns the number of records written. Blank lines are skipped.
+
+    Records are streamed to the book as they are parsed; the index is built
+    with an external merge sort over runs of ``chunk_size`` records, so
+    memory use does not grow with the size of the list.
+    """
+    if struct.calcsize("I") != INDEX_SIZE or sys.byteorder != "little":
+        raise RuntimeError("Unsupported platform for the address book format")
+
+    tmp_path = f"{book_path}.{os.getpid()}.tmp"
+    runs: List[str] = []
+    count = 0
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+            # each sort entry is the record followed by its big-endian
+            # position, so byte order sorts by address and keeps equal
+            # addresses in list order
+            chunk: List[bytes] = []
+            with open(text_path, encoding="utf8") as source:
+                for lineno, line in enumerate(source, 1):
+                    if not line.strip():
+                        continue
+                    if count == 2**32 - 1:
+                        raise ValueError("Address book is limited to 2**32 - 1 records")
+                    record = parse_address(line, lineno)
+                    file.write(record)
+                    chunk.append(record + count.to_bytes(INDEX_SIZE, "big"))
+                    count += 1
+                    if len(chunk) == chunk_size:
+                        runs.append(f"{tmp_path}.run{len(runs)}")
+                        _write_run(chunk, runs[-1])
+                        chunk = []
+
+            if runs:
+                if chunk:
+                    runs.append(f"{tmp_path}.run{len(runs)}")
+                    _write_run(chunk, runs[-1])
+                    chunk = []
+                entries: Iterable[bytes] = heapq.merge(*(_read_run(run) for run in runs))
+            else:
+                chunk.sort()
+                entries = iter(chunk)
+
+            index = bytearray()
+            for entry in entries:
+                index += struct.pack("<I", int.from_bytes(entry[RECORD_SIZE:], "big"))
+                if len(index) >= INDEX_SIZE * 65536:
+                    file.write(index)
+                    index.clear()
+            file.write(index)
+
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, VERSION, 0, count))
+        os.replace(tmp_path, book_path)
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+
+class AddressBook:
+    """
+    Read-only view over a binary address book.
+
+    Behaves like a list of checksummed addresses: ``len``, iteration,
+    indexing and slicing decode only the records they return.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} address book")
+        expected = HEADER.size + count * (RECORD_SIZE + INDEX_SIZE)
+        if len(self._mmap) != expected:
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated or corrupt")
+
+        self._count = count
+        self._view = memoryview(self._mmap)
+        self._records = self._view[HEADER.size:HEADER.size + count * RECORD_SIZE]
+        self._index = self._view[HEADER.size + count * RECORD_SIZE:].cast("I")
+
+    @classmethod
+    def from_text(cls, text_path: str, book_path: Optional[str] = None) -> "AddressBook":
+        """
+        Opens the binary book next to a text address list, converting it
+        first if it is missing or older than the text file.
+        """
+        book_path = book_path or os.path.splitext(text_path)[0] + ".bin"
+        if (
+            not os.path.exists(book_path)
+            or os.path.getmtime(book_path) < os.path.getmtime(text_path)
+        ):
+            convert(text_path, book_path)
+        return cls(book_path)
+
+    def __enter__(self) -> "AddressBook":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._index.release()
+        self._records.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def raw(self, position: int) -> bytes:
+        """
+        Returns the 20 bytes of the record at ``position``.
+        """
+        start = position * RECORD_SIZE
+        return self._records[start:start + RECORD_SIZE].tobytes()
+
+    @overload
+    def __getitem__(self, key: int) -> str: ...
+
+    @overload
+    def __getitem__(self, key: slice) -> List[str]: ...
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return list(self.iter(*key.indices(self._count)))
+        position = key + self._count if key < 0 else key
+        if not 0 <= position < self._count:
+            raise IndexError("address book index out of range")
+        return to_checksum_address(self.raw(position))
+
+    def __iter__(self) -> Iterator[str]:
+        return self.iter()
+
+    def iter(self, start: int = 0, stop: Optional[int] = None, step: int = 1) -> Iterator[str]:
+        """
+        Lazily yields checksummed addresses for ``range(start, stop, step)``.
+        """
+        for position in range(start, self._count if stop is None else stop, step):
+            yield to_checksum_address(self.raw(position))
+
+    def _lower_bound(self, target: bytes) -> int:
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(self._index[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def positions(self, address: Address) -> List[int]:
+        """
+        Returns every position holding ``address``, in ascending order.
+        """
+        target = address_bytes(address)
+        found = []
+        cursor = self._lower_bound(target)
+        while cursor < self._count and self.raw(self._index[cursor]) == target:
+            found.append(self._index[cursor])
+            cursor += 1
+        return sorted(found)
+
+    def __contains__(self, address: object) -> bool:
+        try:
+            target = address_bytes(address)  # type: ignore[arg-type]
+        except (TypeError, ValueError):
+            return False
+        cursor = self._lower_bound(target)
+        return cursor < self._count and self.raw(self._index[cursor]) == target
+
+    def index(self, address: Address) -> int:
+        positions = self.positions(address)
+        if not positions:
+            name = to_checksum_address(address_bytes(address))
+            raise ValueError(f"{name} is not in the address book")
+        return positions[0]
+
+    def count(self, address: Address) -> int:
+        return len(self.positions(address))
+
+    def unique(self) -> Iterator[str]:
+        """
+        Yields each distinct address once, at its first position.
+        """
+        # the index sort is stable, so the first entry of each run of equal
+        # records is the earliest position; mark those in a bitmap
+        first = bytearray((self._count + 7) // 8)
+        previous = None
+        for cursor in range(self._count):
+            position = self._index[cursor]
+            record = self.raw(position)
+            if record != previous:
+                first[position >> 3] |= 1 << (position & 7)
+                previous = record
+        for position in range(self._count):
+            if first[position >> 3] & (1 << (position & 7)):
+                yield to_checksum_address(self.raw(position))
+
+
+if __name__ == "__main__":
+    # python -m peniwallet_contracts.addressbook addresses.txt [addresses.bin]
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".bin"
+    print(f"{convert(source, target)} addresses written to {target}")
@@ -0,0 +1,451 @@
+"""
+Columnar copy of the spray and fee history for reports.
+
+``AnalyticsStore.export`` appends the confirmed rows of the indexer (and
+of the fee ledger) to one directory per table and block range, one
+``.npy`` file per column:
+
+- ``spray_recipients``: ``SprayExecuted`` with one row per recipient;
+- ``fee_withdrawals``: ``FeeWithdrawn``;
+- ``gas_sent``: ``GasSent``;
+- ``fees``: fee amounts the contract received, from ``FeeLedger``.
+
+Addresses are stored as int32 codes into a store-wide dictionary and
+uint256 amounts as little-endian 32-bit limbs, as many per row as the
+largest amount of the partition needs. Queries memory-map the columns
+and group with ``numpy.bincount``; limbs are split into 16-bit halves
+first, so the float sums stay exact and the totals come out to the wei.
+
+    store = AnalyticsStore("analytics")
+    store.export(indexer, ledger)
+    store.group("fees", ("token", "day"))
+    store.top("spray_recipients", "sender", n=10)
+
+Needs numpy; ``to_parquet`` also needs pyarrow.
+"""
+
+import json
+import math
+import os
+import shutil
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.indexer import EventIndexer
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    try:
+        import numpy as np
+    except ImportError:  # only the analytics store needs numpy
+        np = None
+
+INTEGER_COLUMNS = {"block": "int64", "log_index": "int32", "timestamp": "int64"}
+ADDRESS_COLUMNS = {"token", "sender", "recipient", "dev", "receiver"}
+
+TABLES = {
+    "spray_recipients": ("block", "log_index", "timestamp", "token", "sender", "recipient", "amount"),
+    "fee_withdrawals": ("block", "log_index", "timestamp", "dev", "token", "amount"),
+    "gas_sent": ("block", "log_index", "timestamp", "sender", "receiver", "amount"),
+    "fees": ("block", "log_index", "timestamp", "token", "sender", "amount"),
+}
+
+# rows of each table for blocks ``first`` to ``last``, timestamp None where
+# the event has none and the block's is read from the node
+QUERIES = {
+    "spray_recipients": (
+        "SELECT s.block, s.log_index, s.timestamp, s.token, s.sender, r.recipient, s.amount "
+        "FROM spray_recipients r JOIN sprays s ON s.block = r.block AND s.log_index = r.log_index "
+        "WHERE s.block BETWEEN ? AND ? ORDER BY s.block, s.log_index, r.position"),
+    "fee_withdrawals": (
+        "SELECT block, log_index, timestamp, dev, token, amount FROM fee_withdrawals "
+        "WHERE block BETWEEN ? AND ? ORDER BY block, log_index"),
+    "gas_sent": (
+        "SELECT block, log_index, NULL, sender, receiver, amount FROM gas_sent "
+        "WHERE block BETWEEN ? AND ? ORDER BY block, log_index"),
+    "fees": (
+        "SELECT block, log_index, NULL, token, sender, amount FROM fee_inflows "
+        "WHERE block BETWEEN ? AND ? ORDER BY block, log_index"),
+}
+
+# derived grouping columns: timestamp buckets, keyed by their first second
+TIME_BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+LIMB_BITS = 32
+MAX_LIMBS = 256 // LIMB_BITS
+
+# groups above this are renumbered densely before counting
+DENSE_GROUPS = 1 << 22
+
+
+class Group(NamedTuple):
+    key: Tuple
+    rows: int
+    amount: int
+
+
+def _limbs(amounts: Sequence[int]) -> "np.ndarray":
+    raw = b"".join(int(amount).to_bytes(32, "little") for amount in amounts)
+    limbs = np.frombuffer(raw, dtype="<u4").reshape(len(amounts), MAX_LIMBS)
+    used = np.flatnonzero(limbs.any(axis=0))
+    width = int(used[-1]) + 1 if len(used) else 1
+    return np.ascontiguousarray(limbs[:, :width])
+
+
+def _amounts(limbs: "np.ndarray") -> List[int]:
+    return [
+        int.from_bytes(row.astype("<u4").tobytes(), "little") for row in limbs
+    ]
+
+
+class AnalyticsStore:
+    """
+    :param path: directory of the store, created when missing
+    """
+
+    def __init__(self, path: str):
+        if np is None:
+            raise ImportError("the analytics store needs numpy")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._addresses: List[str] = []
+        self._codes: Dict[str, int] = {}
+        dictionary = os.path.join(path, "addresses.txt")
+        if os.path.exists(dictionary):
+            with open(dictionary) as file:
+                for line in file:
+                    self._code(line.strip())
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.path, "exported.json")
+
+    def _checkpoints(self) -> Dict[str, int]:
+        if not os.path.exists(self._checkpoint_path()):
+            return {}
+        with open(self._checkpoint_path()) as file:
+            return json.load(file)
+
+    def exported_block(self, table: Optional[str] = None) -> Optional[int]:
+        """
+        Last block exported to ``table``, or to every table when None;
+        None before the table's first export.
+        """
+        checkpoints = self._checkpoints()
+        if table is not None:
+            return checkpoints.get(table)
+        if set(checkpoints) != set(TABLES):
+            return None
+        return min(checkpoints.values())
+
+    def _set_exported_block(self, table: str, block: int) -> None:
+        checkpoints = self._checkpoints()
+        checkpoints[table] = block
+        temporary = self._checkpoint_path() + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(checkpoints, file)
+        os.replace(temporary, self._checkpoint_path())
+
+    def partitions(self, table: str) -> List[Tuple[int, int]]:
+        """
+        (first block, last block) of the table's partitions, in order.
+        """
+        if table not in TABLES:
+            raise ValueError(f"Unknown table: {table}")
+        directory = os.path.join(self.path, table)
+        if not os.path.isdir(directory):
+            return []
+        ranges = []
+        for name in os.listdir(directory):
+            first, _, last = name.partition("-")
+            if first.isdigit() and last.isdigit():
+                ranges.append((int(first), int(last)))
+        return sorted(ranges)
+
+    def _partition_path(self, table: str, first: int, last: int) -> str:
+        return os.path.join(self.path, table, f"{first:012d}-{last:012d}")
+
+    def _drop_unfinished(self) -> None:
+        # partitions written after the checkpoints by an export that did not finish
+        for table in TABLES:
+            exported = self.exported_block(table)
+            for first, last in self.partitions(table):
+                if exported is None or last > exported:
+                    shutil.rmtree(self._partition_path(table, first, last))
+            directory = os.path.join(self.path, table)
+            if os.path.isdir(directory):
+                for name in os.listdir(directory):
+                    if name.endswith(".tmp"):
+                        shutil.rmtree(os.path.join(directory, name))
+
+    def _code(self, address: str) -> int:
+        code = self._codes.get(address)
+        if code is None:
+            code = self._codes[address] = len(self._addresses)
+            self._addresses.append(address)
+        return code
+
+    def append(self, table: str, first: int, last: int, columns: Mapping[str, Sequence[Any]]) -> int:
+        """
+        Writes one partition of ``table`` for blocks ``first`` to ``last``
+        from whole columns (addresses as strings, amounts as ints) and
+        returns its row count. Blocks must follow the last partition;
+        ``export`` drops partitions past its own checkpoint, so a store is
+        filled either by ``export`` or by ``append``.
+        """
+        names = TABLES.get(table)
+        if names is None:
+            raise ValueError(f"Unknown table: {table}")
+        if set(columns) != set(names):
+            raise ValueError(f"{table} needs the columns {', '.join(names)}")
+        partitions = self.partitions(table)
+        if partitions and first <= partitions[-1][1]:
+            raise ValueError(f"{table} already holds block {first}")
+        rows = len(columns["block"])
+        if not rows:
+            return 0
+
+        known = len(self._addresses)
+        arrays = {}
+        for name in names:
+            values = columns[name]
+            if name == "amount":
+                arrays[name] = _limbs(values)
+            elif name in ADDRESS_COLUMNS:
+                arrays[name] = np.fromiter((self._code(value) for value in values), dtype="int32", count=rows)
+            else:
+                arrays[name] = np.asarray(values, dtype=INTEGER_COLUMNS[name])
+        if len(self._addresses) > known:
+            with open(os.path.join(self.path, "addresses.txt"), "a") as file:
+                file.writelines(address + "\n" for address in self._addresses[known:])
+
+        final = self._partition_path(table, first, last)
+        temporary = final + ".tmp"
+        os.makedirs(temporary)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, name + ".npy"), array)
+        os.rename(temporary, final)
+        return rows
+
+    def export(self, indexer: EventIndexer, ledger=None, partition_blocks: int = 100_000) -> Dict[str, int]:
+        """
+        Appends the rows of blocks that are past the indexer's
+        ``confirmations`` (and scanned by ``ledger``, when given) and
+        returns the rows added per table. Each table resumes from its own
+        checkpoint: without a ledger ``fees`` is not exported, and the next
+        export given one catches it up.
+        """
+        head = indexer.indexed_block() - indexer.confirmations
+        tables = list(TABLES) if ledger is not None else [table for table in TABLES if table != "fees"]
+        if ledger is not None:
+            head = min(head, ledger.scanned_block())
+        self._drop_unfinished()
+        added = dict.fromkeys(tables, 0)
+        timestamps: Dict[int, int] = {}
+
+        for table in tables:
+            exported = self.exported_block(table)
+            start = indexer.start_block if exported is None else exported + 1
+            for first in range(start, head + 1, partition_blocks):
+                last = min(first + partition_blocks - 1, head)
+                rows = indexer.db.execute(QUERIES[table], (first, last)).fetchall()
+                if rows:
+                    missing = sorted({row[0] for row in rows if row[2] is None} - set(timestamps))
+                    timestamps.update(self._block_timestamps(indexer, missing))
+                    columns = dict(zip(TABLES[table], map(list, zip(*rows))))
+                    columns["timestamp"] = [
+                        timestamps[block] if timestamp is None else timestamp
+                        for block, timestamp in zip(columns["block"], columns["timestamp"])
+                    ]
+                    columns["amount"] = [int(amount) for amount in columns["amount"]]
+                    added[table] += self.append(table, first, last, columns)
+                self._set_exported_block(table, last)
+        return added
+
+    @staticmethod
+    def _block_timestamps(indexer: EventIndexer, blocks: Sequence[int]) -> Dict[int, int]:
+        answers = indexer.reader.request(
+            [("eth_getBlockByNumber", [hex(block), False]) for block in blocks])
+        return {block: int(answer["result"]["timestamp"], 16) for block, answer in zip(blocks, answers)}
+
+    def columns(self, table: str, first: int, last: int) -> Dict[str, "np.ndarray"]:
+        """
+        The partition's columns, memory-mapped.
+        """
+        path = self._partition_path(table, first, last)
+        return {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in TABLES[table]}
+
+    def rows(self, table: str) -> int:
+        return sum(len(self.columns(table, *span)["block"]) for span in self.partitions(table))
+
+    def _key_column(self, columns: Mapping[str, "np.ndarray"], name: str) -> "np.ndarray":
+        if name in TIME_BUCKETS:
+            return columns["timestamp"] // TIME_BUCKETS[name]
+        if name not in columns or name == "amount":
+            raise ValueError(f"Cannot group by {name}")
+        return np.asarray(columns[name], dtype="int64")
+
+    def _mask(self, columns, where, since, until):
+        mask = None
+        conditions = []
+        for name, value in (where or {}).items():
+            if name not in columns or name == "amount":
+                raise ValueError(f"Cannot filter on {name}")
+            if name in ADDRESS_COLUMNS:
+                value = self._codes.get(to_checksum_address(value), -1)
+            conditions.append(columns[name] == value)
+        if since is not None:
+            conditions.append(columns["timestamp"] >= since)
+        if until is not None:
+            conditions.append(columns["timestamp"] < until)
+        for condition in conditions:
+            mask = condition if mask is None else mask & condition
+        return mask
+
+    def group(
+        self,
+        table: str,
+        by: Sequence[str],
+        where: Optional[Mapping[str, Any]] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+    ) -> List[Group]:
+        """
+        Row count and amount total per distinct value of the ``by``
+        columns, in key order. ``by`` may name ``hour``, ``day`` or
+        ``week`` to bucket the timestamps; ``where`` holds exact values
+        and ``since``/``until`` bound the timestamps (``until`` excluded).
+        """
+        by = tuple(by)
+        keys: List[List["np.ndarray"]] = [[] for _ in by]
+        limbs: List["np.ndarray"] = []
+        for span in self.partitions(table):
+            columns = self.columns(table, *span)
+            mask = self._mask(columns, where, since, until)
+            for index, name in enumerate(by):
+                column = self._key_column(columns, name)
+                keys[index].append(column if mask is None else column[mask])
+            limbs.append(columns["amount"] if mask is None else columns["amount"][mask])
+        if not limbs or not sum(len(part) for part in limbs):
+            return []
+
+        width = max(part.shape[1] for part in limbs)
+        amounts = np.zeros((sum(len(part) for part in limbs), width), dtype="uint32")
+        row = 0
+        for part in limbs:
+            amounts[row:row + len(part), :part.shape[1]] = part
+            row += len(part)
+        key_columns = [np.concatenate(parts) for parts in keys]
+
+        group_of, decode = self._group_ids(key_columns, len(amounts))
+        groups = len(decode[0]) if decode else 1
+        counts = np.bincount(group_of, minlength=groups)
+        # 16-bit halves sum exactly in float64 for up to 2**37 rows; they are
+        # put together as Python ints, as high << 16 can pass 2**64
+        lows = np.zeros((groups, width), dtype="uint64")
+        highs = np.zeros((groups, width), dtype="uint64")
+        for limb in range(width):
+            column = amounts[:, limb]
+            lows[:, limb] = np.bincount(group_of, weights=column & 0xFFFF, minlength=groups)
+            highs[:, limb] = np.bincount(group_of, weights=column >> 16, minlength=groups)
+
+        result = []
+        for group in np.flatnonzero(counts):
+            amount = self._amount(lows[group], highs[group])
+            key = tuple(self._key_value(name, values[group]) for name, values in zip(by, decode))
+            result.append(Group(key, int(counts[group]), amount))
+        return result
+
+    @staticmethod
+    def _amount(lows: "np.ndarray", highs: "np.ndarray") -> int:
+        """
+        The amount whose limbs summed to ``lows + (highs << 16)``.
+        """
+        return sum(
+            (int(low) + (int(high) << 16)) << (LIMB_BITS * limb)
+            for limb, (low, high) in enumerate(zip(lows, highs))
+        )
+
+    @staticmethod
+    def _group_ids(key_columns: Sequence["np.ndarray"], rows: int):
+        """
+        A dense group id per row and, per key column, the column's value
+        for each group id.
+        """
+        if not key_columns:
+            return np.zeros(rows, dtype="int64"), []
+        lows = [int(column.min()) for column in key_columns]
+        dims = [int(column.max()) - low + 1 for column, low in zip(key_columns, lows)]
+        if math.prod(dims) < 2**62:
+            combined = np.ravel_multi_index([column - low for column, low in zip(key_columns, lows)], dims)
+            if math.prod(dims) > DENSE_GROUPS:
+                unique, combined = np.unique(combined, return_inverse=True)
+            else:
+                unique = np.arange(math.prod(dims))
+            decoded = np.unravel_index(unique, dims)
+            return combined, [values + low for values, low in zip(decoded, lows)]
+        unique, inverse = np.unique(np.stack(key_columns, axis=1), axis=0, return_inverse=True)
+        return inverse.reshape(-1), [unique[:, index] for index in range(len(key_columns))]
+
+    def _key_value(self, name: str, value) -> Any:
+        if name in ADDRESS_COLUMNS:
+            return self._addresses[int(value)]
+        if name in TIME_BUCKETS:
+            return int(value) * TIME_BUCKETS[name]
+        return int(value)
+
+    def top(self, table: str, by: str, n: int = 10, **filters: Any) -> List[Group]:
+        """
+        The ``n`` values of ``by`` with the largest amount totals.
+        """
+        groups = self.group(table, (by,), **filters)
+        return sorted(groups, key=lambda group: group.amount, reverse=True)[:n]
+
+    def fees_per_token_per_day(self, **filters: Any) -> List[Group]:
+        return self.group("fees", ("token", "day"), **filters)
+
+    def top_spray_senders(self, n: int = 10, **filters: Any) -> List[Group]:
+        return self.top("spray_recipients", "sender", n, **filters)
+
+    def dev_withdrawals(self, **filters: Any) -> List[Group]:
+        """
+        Fee shares paid out per (token, developer).
+        """
+        return self.group("fee_withdrawals", ("token", "dev"), **filters)
+
+    def to_parquet(self, table: str, path: str) -> int:
+        """
+        Writes ``table`` to one Parquet file, one row group per partition,
+        with addresses as strings and amounts as decimal strings. Returns
+        the row count.
+        """
+        try:
+            import pyarrow as arrow
+            import pyarrow.parquet as parquet
+        except ImportError:
+            raise ImportError("writing Parquet files needs pyarrow") from None
+
+        rows = 0
+        writer = None
+        try:
+            for span in self.partitions(table):
+                columns = self.columns(table, *span)
+                data = {}
+                for name in TABLES[table]:
+                    if name == "amount":
+                        data[name] = arrow.array([str(amount) for amount in _amounts(columns[name])])
+                    elif name in ADDRESS_COLUMNS:
+                        data[name] = arrow.array([self._addresses[code] for code in columns[name].tolist()])
+                    else:
+                        data[name] = arrow.array(np.asarray(columns[name]))
+                batch = arrow.table(data)
+                if writer is None:
+                    writer = parquet.ParquetWriter(path, batch.schema)
+                writer.write_table(batch)
+                rows += batch.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+
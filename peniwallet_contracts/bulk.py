@@ -0,0 +1,398 @@
+"""
+Bulk sprays with a different amount per recipient.
+
+``sprayToken`` sends one ``_amount`` to every recipient, so an airdrop
+file of (address, amount) rows is grouped by amount and each group cut
+into batches of at most ``MAX_RECIPIENTS``; one call per
+``ceil(group size / batch size)`` is the fewest calls possible.
+
+The file is read in chunks (CSV with the standard library, Parquet with
+pyarrow when installed) and every row is validated and spilled to SQLite,
+which also drops repeated addresses. Batches are then streamed from an
+index on (amount, line), signed and written to a JSON lines plan with each
+batch's total and fee. Memory stays the same whatever the file size.
+
+Writing the plan resumes where a previous run stopped, and executing it
+goes through ``spray.execute`` with a ``SprayCheckpoint``, like any other
+spray.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+from decimal import Decimal, InvalidOperation, localcontext
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from eth_utils import is_checksum_address, to_checksum_address
+
+from peniwallet_contracts.eip712 import Address
+from peniwallet_contracts.fees import SPRAY, FeeEngine
+from peniwallet_contracts.spray import MAX_RECIPIENTS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipients (address TEXT PRIMARY KEY, amount TEXT, line INTEGER);
+CREATE INDEX IF NOT EXISTS recipients_amount ON recipients (amount, line);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+Row = Tuple[int, Any, Any]
+
+
+class BulkError(ValueError):
+    """
+    A row that cannot be sprayed; the message is the reason.
+    """
+
+
+class IngestStats(NamedTuple):
+    rows: int
+    accepted: int
+    duplicates: int
+    rejected: int
+
+
+class BulkBatch(NamedTuple):
+    number: int
+    receivers: List[str]
+    code: str
+    amount: int
+    total: int
+    fee: Optional[int] = None
+    signature: Optional[str] = None
+
+    @property
+    def digest(self) -> str:
+        """
+        Fingerprint of the batch, used to check a checkpoint against a plan.
+        """
+        content = "\n".join([self.code, str(self.amount), *self.receivers]).encode()
+        return hashlib.sha256(content).hexdigest()
+
+
+BulkSender = Callable[[BulkBatch, str], str]
+
+
+def read_csv(path: str, address_column: str = "address", amount_column: str = "amount",
+             chunk_size: int = 50_000) -> Iterator[List[Row]]:
+    """
+    Yields chunks of (line, address, amount) from a CSV file with a header.
+    """
+    with open(path, newline="", encoding="utf8") as file:
+        reader = csv.DictReader(file)
+        missing = {address_column, amount_column} - set(reader.fieldnames or ())
+        if missing:
+            raise BulkError(f"{path} has no column {', '.join(sorted(missing))}")
+        chunk: List[Row] = []
+        for row in reader:
+            chunk.append((reader.line_num, row[address_column], row[amount_column]))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def read_parquet(path: str, address_column: str = "address", amount_column: str = "amount",
+                 chunk_size: int = 50_000) -> Iterator[List[Row]]:
+    """
+    Yields chunks of (row number, address, amount) from a Parquet file.
+    """
+    try:
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise ImportError("reading Parquet files needs pyarrow") from None
+
+    line = 0
+    source = parquet.ParquetFile(path)
+    for batch in source.iter_batches(batch_size=chunk_size, columns=[address_column, amount_column]):
+        addresses = batch.column(address_column).to_pylist()
+        amounts = batch.column(amount_column).to_pylist()
+        yield [(line + offset + 1, address, amount)
+               for offset, (address, amount) in enumerate(zip(addresses, amounts))]
+        line += len(addresses)
+
+
+def read_rows(path: str, **kwargs: Any) -> Iterator[List[Row]]:
+    """
+    ``read_parquet`` for .parquet/.pq files, ``read_csv`` otherwise.
+    """
+    if path.lower().endswith((".parquet", ".pq")):
+        return read_parquet(path, **kwargs)
+    return read_csv(path, **kwargs)
+
+
+def parse_address(value: Any) -> str:
+    """
+    Checksums an address; mixed-case input must already carry a valid checksum.
+    """
+    text = str(value or "").strip()
+    if len(text) != 42 or text[:2] not in ("0x", "0X"):
+        raise BulkError("malformed address")
+    try:
+        int(text[2:], 16)
+    except ValueError:
+        raise BulkError("malformed address") from None
+    body = text[2:]
+    if body != body.lower() and body != body.upper() and not is_checksum_address(text):
+        raise BulkError("bad checksum")
+    if int(body, 16) == 0:
+        raise BulkError("zero address")
+    return to_checksum_address(text.lower())
+
+
+def parse_amount(value: Any, decimals: int = 0) -> int:
+    """
+    Token units from an integer, or from a decimal amount scaled by ``decimals``.
+    """
+    with localcontext() as context:
+        # exact for any uint256
+        context.prec = 100
+        try:
+            amount = Decimal(str(value).strip()) * 10**decimals
+        except InvalidOperation:
+            raise BulkError("malformed amount") from None
+    if amount != amount.to_integral_value():
+        raise BulkError("amount has more decimals than the token")
+    if amount <= 0 or amount >= 2**256:
+        raise BulkError("amount out of range")
+    return int(amount)
+
+
+class BulkSpray:
+    """
+    Groups an airdrop file into ``sprayToken`` batches.
+
+    :param token: the token to spray
+    :param sender: the account paying for the spray
+    :param code: run code, batch ``i`` is sprayed with code ``f"{code}-{i}"``
+    :param spill_path: SQLite file the validated rows are spilled to
+    :param batch_size: recipients per batch, at most ``MAX_RECIPIENTS``
+    :param decimals: scale for decimal amounts, 0 when the file holds token units
+    """
+
+    def __init__(self, token: Address, sender: Address, code: str, spill_path: str,
+                 batch_size: int = MAX_RECIPIENTS, decimals: int = 0):
+        if not 0 < batch_size <= MAX_RECIPIENTS:
+            raise ValueError(f"batch_size must be between 1 and {MAX_RECIPIENTS}")
+        self.token = token
+        self.sender = sender
+        self.code = code
+        self.batch_size = batch_size
+        self.decimals = decimals
+        self.db = sqlite3.connect(spill_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "BulkSpray":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _source(self, path: str, options: Dict[str, Any]) -> str:
+        """
+        Identifies an ingest: the file, its size and modification time, and
+        the options it was read with.
+        """
+        info = os.stat(path)
+        return json.dumps({
+            'path': os.path.abspath(path),
+            'size': info.st_size,
+            'mtime': info.st_mtime_ns,
+            'decimals': self.decimals,
+            'options': options,
+        }, sort_keys=True)
+
+    def ingest(self, path: str, rejects: Optional[str] = None, **kwargs: Any) -> IngestStats:
+        """
+        Validates and spills every row of ``path``; rows that cannot be
+        sprayed are written to the ``rejects`` CSV with the reason. A spill
+        completed before from the same file, unchanged and read with the
+        same options, is kept as it is; any other spill is replaced.
+
+        Keyword arguments go to ``read_rows``.
+        """
+        source = self._source(path, kwargs)
+        done = self._meta("ingested")
+        if done is not None and self._meta("source") == source:
+            return IngestStats(*json.loads(done))
+
+        with self.db:
+            self.db.execute("DELETE FROM recipients")
+            self.db.execute("DELETE FROM meta WHERE key IN ('ingested', 'source')")
+        rows = accepted = rejected = 0
+        reject_file = open(rejects, "w", newline="", encoding="utf8") if rejects else None
+        try:
+            reject_writer = csv.writer(reject_file) if reject_file else None
+            if reject_writer:
+                reject_writer.writerow(["line", "address", "amount", "reason"])
+            for chunk in read_rows(path, **kwargs):
+                valid = []
+                for line, address, amount in chunk:
+                    try:
+                        valid.append((parse_address(address), str(parse_amount(amount, self.decimals)), line))
+                    except BulkError as error:
+                        rejected += 1
+                        if reject_writer:
+                            reject_writer.writerow([line, address, amount, str(error)])
+                with self.db:
+                    before = self.db.total_changes
+                    # the first row of an address wins, later ones are counted as duplicates
+                    self.db.executemany("INSERT OR IGNORE INTO recipients VALUES (?, ?, ?)", valid)
+                    accepted += self.db.total_changes - before
+                rows += len(chunk)
+        finally:
+            if reject_file:
+                reject_file.close()
+
+        stats = IngestStats(rows, accepted, rows - accepted - rejected, rejected)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                [("ingested", json.dumps(stats)), ("source", source)])
+        return stats
+
+    def batches(self) -> Iterator[BulkBatch]:
+        """
+        Unsigned batches, grouped by amount and in file order within a group.
+        """
+        number = 0
+        receivers: List[str] = []
+        amount = ""
+        for address, row_amount in self.db.execute(
+                "SELECT address, amount FROM recipients ORDER BY amount, line"):
+            if receivers and (row_amount != amount or len(receivers) == self.batch_size):
+                yield self._batch(number, receivers, int(amount))
+                number += 1
+                receivers = []
+            amount = row_amount
+            receivers.append(address)
+        if receivers:
+            yield self._batch(number, receivers, int(amount))
+
+    def _batch(self, number: int, receivers: List[str], amount: int) -> BulkBatch:
+        return BulkBatch(number, receivers, f"{self.code}-{number}", amount, amount * len(receivers))
+
+    def message(self, batch: BulkBatch) -> Dict[str, Any]:
+        """
+        Returns the ``SprayTransaction`` message for a batch.
+        """
+        return {
+            'token': self.token,
+            'from': self.sender,
+            'receivers': batch.receivers,
+            'amount': batch.amount,
+            'code': batch.code,
+        }
+
+    def plan(self, path: str, sign: Callable[[BulkBatch], str], fees: Optional[FeeEngine] = None,
+             gas: int = 21000, **header: Any) -> Dict[str, Any]:
+        """
+        Writes the signed plan to ``path`` and returns its summary.
+
+        :param sign: returns the hex signature of a batch, e.g.
+            ``spray.account_signer(bulk, account, chain_id, peniwallet)``
+        :param fees: quotes ``_calculateFee`` for each batch, skipped when None
+        :param gas: ``_gas`` the batches will be sent with
+        :param header: extra fields for the plan header, e.g. chain id
+        """
+        head = {'token': self.token, 'from': self.sender, 'code': self.code, 'gas': gas, **header}
+        planned = self.batches()
+        written = end = 0
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                for line in file:
+                    # a run may have stopped mid-line, keep whole lines only
+                    if not line.endswith(b"\n"):
+                        break
+                    if not written:
+                        if json.loads(line) != head:
+                            raise ValueError(f"Plan {path} was written for another spray")
+                    else:
+                        # kept batches must be the ones the spill gives now
+                        batch = next(planned, None)
+                        if batch is None or BulkBatch(**json.loads(line)).digest != batch.digest:
+                            raise ValueError(f"Plan {path} was written for other recipients")
+                    end += len(line)
+                    written += 1
+            with open(path, "r+b") as file:
+                file.truncate(end)
+
+        with open(path, "a", encoding="utf8") as file:
+            if not written:
+                file.write(json.dumps(head) + "\n")
+            for batch in planned:
+                fee = None if fees is None else fees.estimate_fees(to_checksum_address(self.token), batch.total, SPRAY, gas)
+                batch = batch._replace(fee=fee, signature=sign(batch))
+                file.write(json.dumps(batch._asdict()) + "\n")
+                file.flush()
+        return summarize(path)
+
+
+def load_plan(path: str) -> Tuple[Dict[str, Any], Iterator[BulkBatch]]:
+    """
+    Returns the header of a plan and an iterator over its batches, read
+    one line at a time.
+    """
+    file = open(path, encoding="utf8")
+    header = json.loads(file.readline())
+
+    def batches() -> Iterator[BulkBatch]:
+        with file:
+            for line in file:
+                if line.strip():
+                    yield BulkBatch(**json.loads(line))
+
+    return header, batches()
+
+
+def summarize(path: str) -> Dict[str, Any]:
+    """
+    The plan header with batch, recipient, amount and fee totals.
+    """
+    header, batches = load_plan(path)
+    summary = dict(header, batches=0, recipients=0, total=0, fee=0)
+    for batch in batches:
+        summary['batches'] += 1
+        summary['recipients'] += len(batch.receivers)
+        summary['total'] += batch.total
+        summary['fee'] = None if batch.fee is None or summary['fee'] is None else summary['fee'] + batch.fee
+    return summary
+
+
+def plan_signer(batch: BulkBatch) -> str:
+    """
+    ``spray.execute`` signer for planned batches, which carry their signature.
+    """
+    if batch.signature is None:
+        raise ValueError(f"Batch {batch.number} of the plan is not signed")
+    return batch.signature
+
+
+def contract_sender(header: Dict[str, Any], peniwallet, name: str, **tx_kwargs: Any) -> BulkSender:
+    """
+    Sends planned batches through ``Peniwallet.sprayToken`` with an ape
+    contract instance, with the plan's ``_gas``.
+    """
+    def send(batch: BulkBatch, signature: str) -> str:
+        receipt = peniwallet.sprayToken(
+            header['token'],
+            header['from'],
+            batch.receivers,
+            batch.amount,
+            name,
+            batch.code,
+            signature,
+            header['gas'],
+            **tx_kwargs,
+        )
+        return receipt.txn_hash
+
+    return send
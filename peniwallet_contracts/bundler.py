@@ -0,0 +1,208 @@
+"""
+Bundling of signed transfers into ``batchTransfer`` calls.
+
+``batchTransfer`` moves one token per call. It quotes the minimum fee
+once, shares the collected fees once and skips a transfer that cannot go
+through instead of reverting, so every transfer after the first in a
+bundle saves the 21000 base cost, the router and pair lookups and the fee
+storage writes of a ``transfer`` call of its own.
+
+Bundles are executed in the order ``Bundler.bundle`` returns them. A
+sender's nonce is shared by all tokens and has to reach the contract in
+order, so a transfer never goes into an earlier bundle than the sender's
+previous transfer. A skipped transfer leaves its nonce unused, which
+strands the sender's later transfers; ``Bundler.resync`` drops those from
+the bundles still to be sent.
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from eth_abi import decode
+from eth_utils import keccak
+
+from peniwallet_contracts.calldata import encode_batch_transfer
+from peniwallet_contracts.eip712 import Address, address_bytes
+from peniwallet_contracts.preflight import (
+    AMOUNT_TOO_LARGE,
+    BAD_NONCE,
+    BAD_SIGNATURE,
+    EXPIRED,
+    INSUFFICIENT_ALLOWANCE,
+    INSUFFICIENT_BALANCE,
+    OK,
+    REVERTED,
+)
+
+# require(_transactions.length <= MAX_BATCH_TRANSFERS) in batchTransfer
+MAX_TRANSFERS = 100
+
+# rough batchTransfer costs: the call, one _calculateMinFee and one
+# shareFees, plus per transfer the signature check, the nonce write, the
+# balance and allowance reads and the call that runs the two transferFroms
+BASE_GAS = 90_000
+GAS_PER_TRANSFER = 80_000
+
+TRANSFER_SKIPPED = "0x" + keccak(text="TransferSkipped(address,uint256,uint256,uint256)").hex()
+
+# TransferSkipped reason -> preflight code
+SKIP_CODES = {
+    1: BAD_NONCE,
+    2: EXPIRED,
+    3: BAD_SIGNATURE,
+    4: INSUFFICIENT_BALANCE,
+    5: INSUFFICIENT_ALLOWANCE,
+    6: REVERTED,
+    7: REVERTED,
+    8: AMOUNT_TOO_LARGE,
+}
+
+
+class TransferIntent(NamedTuple):
+    """
+    A signed ``TransferTransaction`` message waiting to be relayed.
+    """
+
+    message: Dict[str, Any]
+    signature: Any
+
+
+class TransferBundle(NamedTuple):
+    number: int
+    token: str
+    intents: List[TransferIntent]
+    gas: int
+
+    @property
+    def amount(self) -> int:
+        return sum(intent.message['amount'] for intent in self.intents)
+
+    def data(self, gas: int) -> bytes:
+        """
+        ``batchTransfer`` calldata, charging ``gas`` (in wei) per transfer.
+        """
+        return encode_batch_transfer(
+            self.token,
+            [intent.message for intent in self.intents],
+            [intent.signature for intent in self.intents],
+            gas,
+        )
+
+
+class Bundler:
+    """
+    Groups transfer intents by token into gas-bounded ``batchTransfer``
+    bundles.
+
+    :param max_gas: gas budget of one bundle, e.g. 80% of the block gas limit
+    :param max_transfers: transfers per bundle, at most ``MAX_TRANSFERS``
+    :param base_gas: estimated gas of an empty bundle
+    :param gas_per_transfer: estimated gas of each transfer in a bundle
+    """
+
+    def __init__(
+        self,
+        max_gas: int,
+        max_transfers: int = MAX_TRANSFERS,
+        base_gas: int = BASE_GAS,
+        gas_per_transfer: int = GAS_PER_TRANSFER,
+    ):
+        if not 0 < max_transfers <= MAX_TRANSFERS:
+            raise ValueError(f"max_transfers must be between 1 and {MAX_TRANSFERS}")
+        self.size = min(max_transfers, (max_gas - base_gas) // gas_per_transfer)
+        if self.size < 1:
+            raise ValueError("Gas budget is too low for a single transfer")
+        self.base_gas = base_gas
+        self.gas_per_transfer = gas_per_transfer
+
+    def bundle(self, intents: Iterable[TransferIntent]) -> List[TransferBundle]:
+        """
+        Cuts ``intents`` into bundles, in execution order. Each sender's
+        intents must come in nonce order, e.g. the order they were signed.
+        """
+        bundles: List[List[TransferIntent]] = []
+        tokens: List[str] = []
+        open_bundles: Dict[bytes, int] = {}
+        last_bundle: Dict[bytes, int] = {}
+        for intent in intents:
+            token = address_bytes(intent.message['token'])
+            sender = address_bytes(intent.message['from'])
+            index = open_bundles.get(token)
+            if index is None or len(bundles[index]) == self.size or index < last_bundle.get(sender, -1):
+                index = len(bundles)
+                bundles.append([])
+                tokens.append(intent.message['token'])
+                open_bundles[token] = index
+            bundles[index].append(intent)
+            last_bundle[sender] = index
+        return [self._bundle(number, tokens[number], items) for number, items in enumerate(bundles)]
+
+    def _bundle(self, number: int, token: str, intents: List[TransferIntent]) -> TransferBundle:
+        return TransferBundle(number, token, intents, self.base_gas + self.gas_per_transfer * len(intents))
+
+    def resync(
+        self, bundles: Iterable[TransferBundle], nonces: Mapping[Address, int]
+    ) -> Tuple[List[TransferBundle], List[TransferIntent]]:
+        """
+        Fits bundles that are not sent yet to the ``getNonce`` of senders
+        whose transfers were skipped, e.g. ``skipped_senders`` of the last
+        bundle read with ``BatchReader.nonces``.
+
+        Intents of those senders are kept while they continue from the
+        nonce and dropped after the first one that does not; the others
+        are left as they are. Returns the renumbered bundles and the
+        dropped intents, which the senders have to sign again.
+        """
+        expected = {address_bytes(sender): nonce for sender, nonce in nonces.items()}
+        kept: List[TransferBundle] = []
+        dropped: List[TransferIntent] = []
+        for bundle in bundles:
+            intents = []
+            for intent in bundle.intents:
+                sender = address_bytes(intent.message['from'])
+                if sender in expected:
+                    if intent.message['nonce'] != expected[sender]:
+                        # a later nonce can never match again
+                        expected[sender] = -1
+                        dropped.append(intent)
+                        continue
+                    expected[sender] += 1
+                intents.append(intent)
+            if intents:
+                kept.append(self._bundle(len(kept), bundle.token, intents))
+        return kept, dropped
+
+
+def outcomes(
+    bundle: TransferBundle, logs: Sequence[Mapping[str, Any]], peniwallet: Optional[Address] = None
+) -> List[str]:
+    """
+    The preflight code of each transfer in an executed bundle, ``OK`` for
+    the ones that went through, from the ``TransferSkipped`` logs of its
+    receipt. Only logs emitted by ``peniwallet`` count when it is given.
+    """
+    codes = [OK] * len(bundle.intents)
+    emitter = address_bytes(peniwallet) if peniwallet is not None else None
+    for log in logs:
+        topics = log["topics"]
+        if not topics or _hex(topics[0]) != TRANSFER_SKIPPED:
+            continue
+        if emitter is not None and address_bytes(log["address"]) != emitter:
+            continue
+        index, reason = decode(["uint256", "uint256"], bytes.fromhex(_hex(log["data"])[2:]))
+        codes[index] = SKIP_CODES.get(reason, REVERTED)
+    return codes
+
+
+def skipped_senders(bundle: TransferBundle, codes: Sequence[str]) -> List[str]:
+    """
+    The senders of the transfers of ``bundle`` that ``outcomes`` did not
+    report as ``OK``, once each.
+    """
+    senders = [intent.message['from'] for intent, code in zip(bundle.intents, codes) if code != OK]
+    return list({address_bytes(sender): sender for sender in senders}.values())
+
+
+def _hex(value) -> str:
+    if isinstance(value, str):
+        return value.lower()
+    return "0x" + bytes(value).hex()
@@ -0,0 +1,276 @@
+"""
+Calldata for the relayed Peniwallet entry points.
+
+Each entry point gets a ``FunctionEncoder`` built once from its entry in
+``abi/Peniwallet.json``, the ABI ape compiles for the contract (refresh it
+with ``make abi`` after changing an entry point): the selector and the layout of the head are worked out up
+front, and every call is written straight into a bytearray sized for it,
+without the type lookups, conversions and checksum validation of the
+generic ABI encoders. Output is byte-identical to ``eth_abi.encode``.
+``batchTransfer`` takes an array of structs, which ``FunctionEncoder``
+does not support, and is encoded with ``eth_abi``.
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+from eth_abi import encode
+
+from peniwallet_contracts.eip712 import Address
+from peniwallet_contracts.reads import selector
+
+ABI_PATH = os.path.join(os.path.dirname(__file__), "abi", "Peniwallet.json")
+
+WORD = 32
+MAX_UINT256 = 2**256 - 1
+
+
+def _padded(length: int) -> int:
+    return (length + WORD - 1) // WORD * WORD
+
+
+def _address(value) -> bytes:
+    raw = bytes.fromhex(value[2:] if value[:2] in ("0x", "0X") else value) if isinstance(value, str) else bytes(value)
+    if len(raw) != 20:
+        raise ValueError(f"Not an address: {value!r}")
+    return raw
+
+
+def _uint(value: int) -> bytes:
+    if not 0 <= value <= MAX_UINT256:
+        raise ValueError(f"Value out of uint256 range: {value}")
+    return value.to_bytes(WORD, "big")
+
+
+def _write_address(buf: bytearray, at: int, value) -> None:
+    buf[at + 12:at + WORD] = _address(value)
+
+
+def _write_uint(buf: bytearray, at: int, value: int) -> None:
+    buf[at:at + WORD] = _uint(value)
+
+
+def _write_bool(buf: bytearray, at: int, value: bool) -> None:
+    buf[at + WORD - 1] = 1 if value else 0
+
+
+def _bytes_value(value) -> bytes:
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value[:2] in ("0x", "0X") else value)
+    return bytes(value)
+
+
+def _string_value(value: str) -> bytes:
+    return value.encode("utf-8")
+
+
+def abi_type(arg: Mapping[str, Any]) -> str:
+    """
+    The canonical type of an ABI input, with tuples written out as
+    ``(type,...)``.
+    """
+    kind = arg["type"]
+    if kind.startswith("tuple"):
+        return f"({','.join(abi_type(component) for component in arg['components'])}){kind[len('tuple'):]}"
+    return kind
+
+
+def signature_of(entry: Mapping[str, Any]) -> str:
+    """
+    The signature of a function entry of a compiled ABI, e.g.
+    ``transfer(address,address,...)``.
+    """
+    return f"{entry['name']}({','.join(abi_type(arg) for arg in entry['inputs'])})"
+
+
+def load_abi(path: str = ABI_PATH) -> List[Dict[str, Any]]:
+    """
+    Reads a compiled ABI, by default the one shipped for Peniwallet.
+    """
+    with open(path) as file:
+        return json.load(file)
+
+
+STATIC_WRITERS: Dict[str, Callable[[bytearray, int, Any], None]] = {
+    "address": _write_address,
+    "uint256": _write_uint,
+    "bool": _write_bool,
+}
+
+
+class FunctionEncoder:
+    """
+    Encodes calls to one function, e.g.
+    ``FunctionEncoder(TRANSFER).encode([token, sender, to, ...])``.
+
+    Supports the argument types Peniwallet's entry points use: address,
+    uint256, bool, bytes, string and arrays of address, uint256 or bool.
+    """
+
+    def __init__(self, signature: str):
+        self.signature = signature
+        self.selector = selector(signature)
+        self.types = [arg for arg in signature[signature.index("(") + 1:-1].split(",") if arg]
+        self.head_size = WORD * len(self.types)
+        self._plan: List[Tuple[str, Any]] = []
+        for kind in self.types:
+            if kind in STATIC_WRITERS:
+                self._plan.append(("static", STATIC_WRITERS[kind]))
+            elif kind == "bytes":
+                self._plan.append(("bytes", _bytes_value))
+            elif kind == "string":
+                self._plan.append(("bytes", _string_value))
+            elif kind.endswith("[]") and kind[:-2] in STATIC_WRITERS:
+                self._plan.append(("array", STATIC_WRITERS[kind[:-2]]))
+            else:
+                raise ValueError(f"Unsupported ABI type: {kind}")
+
+    @classmethod
+    def from_abi(cls, entry: Mapping[str, Any]) -> "FunctionEncoder":
+        """
+        Builds the encoder from a function entry of a compiled ABI.
+        """
+        return cls(signature_of(entry))
+
+    def encode(self, args: Sequence[Any]) -> bytes:
+        if len(args) != len(self._plan):
+            raise ValueError(f"{self.signature} takes {len(self._plan)} arguments, got {len(args)}")
+
+        # dynamic values are converted first so the buffer can be sized exactly
+        tails = []
+        size = 4 + self.head_size
+        for (kind, convert), value in zip(self._plan, args):
+            if kind == "bytes":
+                value = convert(value)
+                tails.append(value)
+                size += WORD + _padded(len(value))
+            elif kind == "array":
+                tails.append(value)
+                size += WORD + WORD * len(value)
+
+        buf = bytearray(size)
+        buf[:4] = self.selector
+        head = 4
+        tail = self.head_size
+        dynamic = iter(tails)
+        for (kind, write), value in zip(self._plan, args):
+            if kind == "static":
+                write(buf, head, value)
+            else:
+                value = next(dynamic)
+                buf[head:head + WORD] = tail.to_bytes(WORD, "big")
+                at = 4 + tail
+                buf[at:at + WORD] = len(value).to_bytes(WORD, "big")
+                at += WORD
+                if kind == "bytes":
+                    buf[at:at + len(value)] = value
+                    tail += WORD + _padded(len(value))
+                else:
+                    for item in value:
+                        write(buf, at, item)
+                        at += WORD
+                    tail += WORD + WORD * len(value)
+            head += WORD
+        return bytes(buf)
+
+
+def encoders_from_abi(abi: Sequence[Mapping[str, Any]]) -> Dict[str, FunctionEncoder]:
+    """
+    Encoders for every function in a compiled ABI that only uses supported
+    types, by function name (the last overload wins).
+    """
+    encoders = {}
+    for entry in abi:
+        if entry.get("type") != "function":
+            continue
+        try:
+            encoders[entry["name"]] = FunctionEncoder.from_abi(entry)
+        except ValueError:
+            continue
+    return encoders
+
+
+PENIWALLET_ABI = load_abi()
+_FUNCTIONS = {entry["name"]: entry for entry in PENIWALLET_ABI if entry.get("type") == "function"}
+
+TRANSFER = signature_of(_FUNCTIONS["transfer"])
+SWAP_TOKENS_FOR_BNB = signature_of(_FUNCTIONS["swapTokensForBNB"])
+SWAP_TOKENS_FOR_TOKENS = signature_of(_FUNCTIONS["swapTokensForTokens"])
+SPRAY_TOKEN = signature_of(_FUNCTIONS["sprayToken"])
+BATCH_TRANSFER = signature_of(_FUNCTIONS["batchTransfer"])
+
+_ENCODERS = encoders_from_abi(PENIWALLET_ABI)
+_TRANSFER = _ENCODERS["transfer"]
+_SWAP_TOKENS_FOR_BNB = _ENCODERS["swapTokensForBNB"]
+_SWAP_TOKENS_FOR_TOKENS = _ENCODERS["swapTokensForTokens"]
+_SPRAY_TOKEN = _ENCODERS["sprayToken"]
+_BATCH_TRANSFER_TYPES = [abi_type(arg) for arg in _FUNCTIONS["batchTransfer"]["inputs"]]
+
+
+def encode_transfer(message: Mapping[str, Any], signature, gas: int) -> bytes:
+    """
+    ``transfer`` calldata for a signed ``TransferTransaction`` message.
+    """
+    return _TRANSFER.encode([
+        message['token'],
+        message['from'],
+        message['to'],
+        message['amount'],
+        message['nonce'],
+        message['deadline'],
+        signature,
+        gas,
+    ])
+
+
+def encode_swap_tokens_for_bnb(
+    path: Sequence[Address], message: Mapping[str, Any], signature, gas: int
+) -> bytes:
+    """
+    ``swapTokensForBNB`` calldata for a signed ``SwapTransaction`` message.
+    """
+    return _SWAP_TOKENS_FOR_BNB.encode(
+        [path, message['from'], message['amountA'], message['nonce'], message['deadline'], signature, gas])
+
+
+def encode_swap_tokens_for_tokens(
+    path: Sequence[Address], message: Mapping[str, Any], signature, gas: int
+) -> bytes:
+    """
+    ``swapTokensForTokens`` calldata for a signed ``SwapTransaction`` message.
+    """
+    return _SWAP_TOKENS_FOR_TOKENS.encode(
+        [path, message['from'], message['amountA'], message['nonce'], message['deadline'], signature, gas])
+
+
+def encode_spray_token(message: Mapping[str, Any], name: str, signature, gas: int) -> bytes:
+    """
+    ``sprayToken`` calldata for a signed ``SprayTransaction`` message.
+    """
+    return _SPRAY_TOKEN.encode([
+        message['token'],
+        message['from'],
+        message['receivers'],
+        message['amount'],
+        name,
+        message['code'],
+        signature,
+        gas,
+    ])
+
+
+def encode_batch_transfer(
+    token: Address, messages: Sequence[Mapping[str, Any]], signatures: Sequence[Any], gas: int
+) -> bytes:
+    """
+    ``batchTransfer`` calldata for signed ``TransferTransaction`` messages
+    of one token.
+    """
+    transactions = [
+        (message['token'], message['from'], message['to'], message['amount'], message['nonce'], message['deadline'])
+        for message in messages
+    ]
+    return selector(BATCH_TRANSFER) + encode(
+        _BATCH_TRANSFER_TYPES,
+        [token, transactions, [_bytes_value(signature) for signature in signatures], gas])
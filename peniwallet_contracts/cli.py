@@ -0,0 +1,270 @@
+"""
+Command line entry point: ``peniwallet <command>``.
+
+Each subcommand imports what it needs when it runs, so signing and
+verification start without ape or eth_account, and only ``deploy`` loads
+the ape project and its plugins. Output is JSON on stdout.
+
+    peniwallet sign transfer --chain-id 56 --contract 0x.. --token 0x.. --to 0x.. \\
+        --amount 100 --nonce 0 --deadline 1700000000
+    peniwallet verify-signature transfer ... --from 0x.. --signature 0x..
+    peniwallet estimate-fees --rpc-url http://.. --contract 0x.. --token 0x.. --amount 100 --type transfer
+    peniwallet deploy --network bsc:mainnet:node --account deployer --router 0x.. --usdt 0x..
+    peniwallet sync-pairs --rpc-url http://.. --contract 0x.. --indexer-db events.db --account admin
+
+Signing keys are read from the environment variable named by
+``--key-env`` (``PENIWALLET_KEY`` by default) or from ``--key-file``,
+never from the command line.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+TX_TYPES = {"transfer": 0, "swap": 1, "spray": 2}
+
+# order of the secp256k1 group, valid private keys are 1 .. n - 1
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+
+class CLIError(Exception):
+    """
+    Reported on stderr with exit status 2.
+    """
+
+
+def _int(text: str) -> int:
+    return int(text, 0)
+
+
+def _receivers(text: str) -> List[str]:
+    if text.startswith("@"):
+        with open(text[1:]) as source:
+            return [line.strip() for line in source if line.strip()]
+    return [item.strip() for item in text.split(",") if item.strip()]
+
+
+def _add_message_arguments(parser: argparse.ArgumentParser, kind: str, sender: bool) -> None:
+    parser.add_argument("--chain-id", type=_int, required=True)
+    parser.add_argument("--contract", required=True, help="Peniwallet address, the verifying contract")
+    if sender:
+        parser.add_argument("--from", dest="sender", required=True)
+    if kind == "swap":
+        parser.add_argument("--token-a", required=True)
+        parser.add_argument("--token-b", required=True)
+        parser.add_argument("--amount-a", type=_int, required=True)
+        parser.add_argument("--amount-b", type=_int, required=True)
+    else:
+        parser.add_argument("--token", required=True)
+        parser.add_argument("--amount", type=_int, required=True)
+    if kind == "transfer":
+        parser.add_argument("--to", required=True)
+    if kind == "spray":
+        parser.add_argument("--receivers", type=_receivers, required=True,
+                            help="comma separated addresses, or @file with one per line")
+        parser.add_argument("--code", required=True)
+    else:
+        parser.add_argument("--nonce", type=_int, required=True)
+        parser.add_argument("--deadline", type=_int, required=True)
+
+
+def _message(args: argparse.Namespace, sender: str) -> Dict[str, Any]:
+    if args.kind == "transfer":
+        return {
+            'token': args.token,
+            'from': sender,
+            'to': args.to,
+            'amount': args.amount,
+            'nonce': args.nonce,
+            'deadline': args.deadline,
+        }
+    if args.kind == "swap":
+        return {
+            'tokenA': args.token_a,
+            'tokenB': args.token_b,
+            'from': sender,
+            'amountA': args.amount_a,
+            'amountB': args.amount_b,
+            'nonce': args.nonce,
+            'deadline': args.deadline,
+        }
+    return {
+        'token': args.token,
+        'from': sender,
+        'receivers': args.receivers,
+        'amount': args.amount,
+        'code': args.code,
+    }
+
+
+def _struct(kind: str):
+    from peniwallet_contracts.eip712 import SprayTransaction, SwapTransaction, TransferTransaction
+
+    return {"transfer": TransferTransaction, "swap": SwapTransaction, "spray": SprayTransaction}[kind]
+
+
+def _private_key(args: argparse.Namespace) -> bytes:
+    if args.key_file:
+        with open(args.key_file) as source:
+            key = source.read().strip()
+    else:
+        key = os.environ.get(args.key_env, "")
+        if not key:
+            raise CLIError(f"no signing key: set {args.key_env} or pass --key-file")
+    try:
+        raw = bytes.fromhex(key.removeprefix("0x"))
+    except ValueError:
+        raise CLIError("malformed signing key") from None
+    if len(raw) != 32 or not 0 < int.from_bytes(raw, "big") < SECP256K1_N:
+        raise CLIError("malformed signing key")
+    return raw
+
+
+def sign(args: argparse.Namespace) -> Dict[str, Any]:
+    # eth_keys signs the EIP-712 digest directly, which gives the same
+    # signature as LocalAccount.sign_message without importing eth_account
+    from eth_keys import keys
+
+    private_key = keys.PrivateKey(_private_key(args))
+    sender = private_key.public_key.to_checksum_address()
+    message = _message(args, sender)
+    digest = _struct(args.kind).digest(message, args.chain_id, args.contract)
+    v, r, s = private_key.sign_msg_hash(digest).vrs
+    signature = r.to_bytes(32, "big") + s.to_bytes(32, "big") + bytes([v + 27])
+    return {"message": message, "digest": "0x" + digest.hex(), "signature": "0x" + signature.hex()}
+
+
+def verify_signature(args: argparse.Namespace) -> Dict[str, Any]:
+    from peniwallet_contracts.verify import verify
+
+    message = _message(args, args.sender)
+    result = verify(_struct(args.kind), message, args.signature, args.chain_id, args.contract)
+    return {"valid": result.valid, "signer": result.signer, "reason": result.reason}
+
+
+def estimate_fees(args: argparse.Namespace) -> Dict[str, Any]:
+    from peniwallet_contracts.reads import BatchReader, RPCError, call
+
+    reader = BatchReader(args.rpc_url, block=args.block)
+    try:
+        (fee,) = reader.values([call(
+            args.contract, "estimateFees(address,uint256,uint256,uint256)",
+            [args.token, args.amount, TX_TYPES[args.type], args.gas])])
+    except RPCError as error:
+        raise CLIError(f"estimateFees failed: {error}")
+    return {"token": args.token, "amount": args.amount, "type": args.type, "gas": args.gas, "fee": fee}
+
+
+def deploy(args: argparse.Namespace) -> Dict[str, Any]:
+    from ape import accounts, networks, project
+
+    from peniwallet_contracts.deploy import deploy_peniwallet
+
+    with networks.parse_network_choice(args.network):
+        owner = accounts.test_accounts[0] if args.account is None else accounts.load(args.account)
+        try:
+            peniwallet = deploy_peniwallet(project, owner, args.router, args.usdt, tuple(args.fees))
+        except ValueError as error:
+            raise CLIError(str(error))
+    return {"network": args.network, "address": peniwallet.address, "owner": owner.address}
+
+
+def sync_pairs(args: argparse.Namespace) -> Dict[str, Any]:
+    from peniwallet_contracts.indexer import EventIndexer
+    from peniwallet_contracts.pairsync import PairSync
+    from peniwallet_contracts.reads import BatchReader, RPCError
+
+    reader = BatchReader(args.rpc_url)
+    sync = PairSync(reader, args.contract, chunk_size=args.chunk_size)
+    tokens = list(args.tokens)
+    if args.indexer_db:
+        with EventIndexer(args.indexer_db, reader, args.contract) as indexer:
+            indexer.sync()
+            tokens += sync.tokens(indexer)
+    try:
+        stale = sync.stale(dict.fromkeys(tokens))
+    except RPCError as error:
+        raise CLIError(f"pair discovery failed: {error}")
+    if args.dry_run or not stale:
+        return {"tokens": len(tokens), "stale": stale, "transactions": []}
+
+    from ape import accounts, networks, project
+
+    with networks.parse_network_choice(args.network):
+        admin = accounts.test_accounts[0] if args.account is None else accounts.load(args.account)
+        peniwallet = project.Peniwallet.at(args.contract)
+        receipts = [peniwallet.cachePairs(chunk, sender=admin) for chunk in sync.chunks(stale)]
+    return {"tokens": len(tokens), "stale": stale, "transactions": [receipt.txn_hash for receipt in receipts]}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from peniwallet_contracts.deploy import DEFAULT_FEES
+
+    parser = argparse.ArgumentParser(prog="peniwallet", description="Peniwallet deployment and signing tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    signing = commands.add_parser("sign", help="sign a meta-transaction")
+    signing_kinds = signing.add_subparsers(dest="kind", required=True)
+    verifying = commands.add_parser("verify-signature", help="check a signature the way the contract does")
+    verifying_kinds = verifying.add_subparsers(dest="kind", required=True)
+    for kind in TX_TYPES:
+        sub = signing_kinds.add_parser(kind)
+        _add_message_arguments(sub, kind, sender=False)
+        sub.add_argument("--key-env", default="PENIWALLET_KEY", help="environment variable holding the key")
+        sub.add_argument("--key-file")
+        sub.set_defaults(handler=sign)
+
+        sub = verifying_kinds.add_parser(kind)
+        _add_message_arguments(sub, kind, sender=True)
+        sub.add_argument("--signature", required=True)
+        sub.set_defaults(handler=verify_signature)
+
+    fees = commands.add_parser("estimate-fees", help="quote estimateFees on a deployment")
+    fees.add_argument("--rpc-url", required=True)
+    fees.add_argument("--contract", required=True)
+    fees.add_argument("--token", required=True)
+    fees.add_argument("--amount", type=_int, required=True)
+    fees.add_argument("--type", choices=list(TX_TYPES), default="transfer")
+    fees.add_argument("--gas", type=_int, default=21000)
+    fees.add_argument("--block", default="latest")
+    fees.set_defaults(handler=estimate_fees)
+
+    deploying = commands.add_parser("deploy", help="deploy Peniwallet with ape")
+    deploying.add_argument("--network", default="ethereum:local")
+    deploying.add_argument("--account", help="ape account alias, the first test account when omitted")
+    deploying.add_argument("--router", required=True)
+    deploying.add_argument("--usdt", required=True)
+    deploying.add_argument("--fees", type=_int, nargs=3, default=list(DEFAULT_FEES),
+                           metavar=("TRANSFER", "SWAP", "SPRAY"))
+    deploying.set_defaults(handler=deploy)
+
+    pairs = commands.add_parser("sync-pairs", help="cache the fee pairs of registered tokens")
+    pairs.add_argument("--rpc-url", required=True)
+    pairs.add_argument("--contract", required=True)
+    pairs.add_argument("--indexer-db", help="indexer database to read the registered projects from")
+    pairs.add_argument("--tokens", type=_receivers, default=[],
+                       help="extra tokens, comma separated or @file with one per line")
+    pairs.add_argument("--chunk-size", type=_int, default=50, help="tokens per cachePairs transaction")
+    pairs.add_argument("--dry-run", action="store_true", help="only report the stale tokens")
+    pairs.add_argument("--network", default="ethereum:local")
+    pairs.add_argument("--account", help="ape account alias of an admin, the first test account when omitted")
+    pairs.set_defaults(handler=sync_pairs)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        result = args.handler(args)
+    except CLIError as error:
+        print(f"peniwallet: {error}", file=sys.stderr)
+        return 2
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if result.get("valid") is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
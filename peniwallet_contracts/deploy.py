@@ -0,0 +1,61 @@
+"""
+Deployment of Peniwallet and, for local chains, a mock PancakeSwap
+(``contracts/mocks/PancakeMocks.sol``) to run it against.
+"""
+
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from ape.contracts import ContractInstance
+
+# transfer, swap and spray fee multipliers
+DEFAULT_FEES = (1700, 2000, 5000)
+
+
+class MockExchange(NamedTuple):
+    weth: "ContractInstance"
+    usdt: "ContractInstance"
+    factory: "ContractInstance"
+    router: "ContractInstance"
+
+
+def deploy_exchange(project, owner, usdt_supply: int = 10**30, weth_deposit: int = 100 * 10**18) -> MockExchange:
+    """
+    Deploys WBNB, USDT, a factory and a router. ``owner`` gets
+    ``usdt_supply`` USDT and wraps ``weth_deposit`` BNB for liquidity.
+    """
+    weth = project.MockWETH.deploy(sender=owner)
+    usdt = project.MockERC20.deploy("Tether USD", "USDT", 18, sender=owner)
+    factory = project.MockPancakeFactory.deploy(sender=owner)
+    router = project.MockPancakeRouter.deploy(factory.address, weth.address, sender=owner)
+    usdt.mint(owner.address, usdt_supply, sender=owner)
+    weth.deposit(sender=owner, value=weth_deposit)
+    return MockExchange(weth, usdt, factory, router)
+
+
+def add_liquidity(project, exchange: MockExchange, owner, token_a, amount_a: int, token_b, amount_b: int):
+    """
+    Creates the pair if needed, funds it from ``owner`` and syncs its
+    reserves. Returns the pair contract.
+    """
+    pair_address = exchange.factory.getPair(token_a.address, token_b.address)
+    if not int(pair_address, 16):
+        exchange.factory.createPair(token_a.address, token_b.address, sender=owner)
+        pair_address = exchange.factory.getPair(token_a.address, token_b.address)
+    pair = project.MockPancakePair.at(pair_address)
+    token_a.transfer(pair.address, amount_a, sender=owner)
+    token_b.transfer(pair.address, amount_b, sender=owner)
+    pair.sync(sender=owner)
+    return pair
+
+
+def deploy_peniwallet(project, owner, router: str, usdt: str, fees=DEFAULT_FEES):
+    """
+    Deploys Peniwallet with ``owner`` as the first admin. The constructor
+    reads WBNB and the factory from ``router``, so it must be deployed on
+    the chain already, e.g. with ``deploy_exchange`` on a local chain.
+    """
+    if not owner.provider.get_code(router):
+        raise ValueError(f"No PancakeSwap router deployed at {router}")
+    transfer_fee, swap_fee, spray_fee = fees
+    return project.Peniwallet.deploy(transfer_fee, swap_fee, spray_fee, router, usdt, sender=owner)
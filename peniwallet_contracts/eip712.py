@@ -0,0 +1,225 @@
+"""
+EIP-712 encoders for the structs verified by contracts/verifier.sol.
+
+The domain separator only depends on the chain id and the verifying
+contract, and the type hashes never change, so both are computed once and
+reused. Each signature then only pays for hashing its own struct fields.
+"""
+
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Mapping, Sequence, Tuple, Union
+
+from eth_utils import keccak
+
+if TYPE_CHECKING:
+    from eth_account.messages import SignableMessage
+
+DOMAIN_NAME = "Peniwallet"
+DOMAIN_VERSION = "1"
+
+EIP712_DOMAIN_TYPE = [
+    {"name": "name", "type": "string"},
+    {"name": "version", "type": "string"},
+    {"name": "chainId", "type": "uint256"},
+    {"name": "verifyingContract", "type": "address"},
+]
+
+EIP712_DOMAIN_TYPEHASH = keccak(
+    b"EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+)
+
+_ZERO_PAD = b"\x00" * 12
+_UINT256_MAX = 2**256 - 1
+
+Address = Union[str, bytes]
+
+
+def address_bytes(value: Address) -> bytes:
+    """
+    Returns the raw 20 bytes of an address given as a hex string or bytes.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        if len(value) != 20:
+            raise ValueError(f"Invalid address length: {len(value)}")
+        return bytes(value)
+    if len(value) != 42 or value[:2] not in ("0x", "0X"):
+        raise ValueError(f"Invalid address: {value!r}")
+    return bytes.fromhex(value[2:])
+
+
+def _encode_address(value: Address) -> bytes:
+    return _ZERO_PAD + address_bytes(value)
+
+
+def _encode_uint256(value: int) -> bytes:
+    if not 0 <= value <= _UINT256_MAX:
+        raise ValueError(f"Value out of uint256 range: {value}")
+    return value.to_bytes(32, "big")
+
+
+def _encode_address_array(values: Sequence[Address]) -> bytes:
+    # keccak256(abi.encodePacked(address[])) pads every element to 32 bytes
+    return keccak(b"".join(_ZERO_PAD + address_bytes(value) for value in values))
+
+
+def _encode_string(value: str) -> bytes:
+    return keccak(value.encode("utf-8"))
+
+
+_FIELD_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "address": _encode_address,
+    "uint256": _encode_uint256,
+    "address[]": _encode_address_array,
+    "string": _encode_string,
+}
+
+
+@lru_cache(maxsize=None)
+def _domain_separator(chain_id: int, verifying_contract: bytes) -> bytes:
+    return keccak(
+        EIP712_DOMAIN_TYPEHASH
+        + keccak(DOMAIN_NAME.encode())
+        + keccak(DOMAIN_VERSION.encode())
+        + _encode_uint256(chain_id)
+        + _ZERO_PAD
+        + verifying_contract
+    )
+
+
+def domain_separator(chain_id: int, verifying_contract: Address) -> bytes:
+    """
+    Returns the DOMAIN_SEPARATOR of a Peniwallet deployment, cached per
+    (chainId, verifyingContract).
+    """
+    return _domain_separator(chain_id, address_bytes(verifying_contract))
+
+
+class TypedStruct:
+    """
+    Encoder for one EIP-712 struct type.
+
+    :param name: the struct name, used as the EIP-712 primary type
+    :param fields: (name, type) pairs in declaration order
+    """
+
+    def __init__(self, name: str, fields: Sequence[Tuple[str, str]]):
+        self.name = name
+        self.fields = tuple(fields)
+        self.type_string = "{}({})".format(
+            name, ",".join(f"{_type} {field}" for field, _type in self.fields)
+        )
+        self.typehash = keccak(self.type_string.encode())
+        self._encoders = tuple(
+            (field, _FIELD_ENCODERS[_type]) for field, _type in self.fields
+        )
+
+    def __repr__(self) -> str:
+        return f"TypedStruct({self.type_string!r})"
+
+    def struct_hash(self, message: Mapping[str, Any]) -> bytes:
+        """
+        Returns hashStruct(message) as computed by verifier.sol.
+        """
+        return keccak(
+            self.typehash
+            + b"".join(encode(message[field]) for field, encode in self._encoders)
+        )
+
+    def signable(
+        self, message: Mapping[str, Any], chain_id: int, verifying_contract: Address
+    ) -> "SignableMessage":
+        """
+        Returns the message ready for ``LocalAccount.sign_message``; it is
+        equal to what ``encode_typed_data`` produces for the same input.
+        """
+        # eth_account takes most of a cold start, digest() does without it
+        from eth_account.messages import SignableMessage
+
+        return SignableMessage(
+            b"\x01",
+            domain_separator(chain_id, verifying_contract),
+            self.struct_hash(message),
+        )
+
+    def digest(
+        self, message: Mapping[str, Any], chain_id: int, verifying_contract: Address
+    ) -> bytes:
+        """
+        Returns the hash that ``_getSigner`` passes to ecrecover.
+        """
+        return keccak(
+            b"\x19\x01"
+            + domain_separator(chain_id, verifying_contract)
+            + self.struct_hash(message)
+        )
+
+    def typed_data(
+        self, message: Mapping[str, Any], chain_id: int, verifying_contract: Address
+    ) -> Dict[str, Any]:
+        """
+        Returns the full typed-data document, e.g. for wallets that sign
+        with ``eth_signTypedData_v4``.
+        """
+        return {
+            "types": {
+                "EIP712Domain": EIP712_DOMAIN_TYPE,
+                self.name: [{"name": field, "type": _type} for field, _type in self.fields],
+            },
+            "message": dict(message),
+            "primaryType": self.name,
+            "domain": {
+                "name": DOMAIN_NAME,
+                "version": DOMAIN_VERSION,
+                "chainId": chain_id,
+                "verifyingContract": verifying_contract,
+            },
+        }
+
+
+TransferTransaction = TypedStruct(
+    "TransferTransaction",
+    [
+        ("token", "address"),
+        ("from", "address"),
+        ("to", "address"),
+        ("amount", "uint256"),
+        ("nonce", "uint256"),
+        ("deadline", "uint256"),
+    ],
+)
+
+SwapTransaction = TypedStruct(
+    "SwapTransaction",
+    [
+        ("tokenA", "address"),
+        ("tokenB", "address"),
+        ("from", "address"),
+        ("amountA", "uint256"),
+        ("amountB", "uint256"),
+        ("nonce", "uint256"),
+        ("deadline", "uint256"),
+    ],
+)
+
+SprayTransaction = TypedStruct(
+    "SprayTransaction",
+    [
+        ("token", "address"),
+        ("from", "address"),
+        ("receivers", "address[]"),
+        ("amount", "uint256"),
+        ("code", "string"),
+    ],
+)
+
+STRUCTS: Dict[str, TypedStruct] = {
+    struct.name: struct
+    for struct in (TransferTransaction, SwapTransaction, SprayTransaction)
+}
+
+
+def sign_typed(account, struct: TypedStruct, message, chain_id, verifying_contract):
+    """
+    Signs a message with a ``LocalAccount`` and returns the ``SignedMessage``.
+    """
+    return account.sign_message(struct.signable(message, chain_id, verifying_contract))
@@ -0,0 +1,292 @@
+"""
+Python mirror of ``Peniwallet._calculateFee`` and ``_calculateMinFee``.
+
+The arithmetic follows the contract (and ``PancakeLibrary.quote``) with
+integer division at the same points, so quotes match ``estimateFees`` to
+the wei. Chain state is read through a ``FeeReader``; pair addresses are
+cached for good (missing pairs for ``pair_ttl`` seconds) and reserves are
+snapshotted until the next block (or a TTL), so any number of quotes
+within a block costs no extra calls.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+
+from peniwallet_contracts.metrics import FEE_ESTIMATE, NO_METRICS, Metrics
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# transaction types, see Peniwallet.TRANSFER/SWAP/SPRAY
+TRANSFER = 0
+SWAP = 1
+SPRAY = 2
+
+FEE_DECIMALS = 3
+
+
+class FeeError(ValueError):
+    """
+    Raised where the contract would revert, with the same reason string.
+    """
+
+
+def quote(amount_a: int, reserve_a: int, reserve_b: int) -> int:
+    """
+    ``PancakeLibrary.quote``, as called through ``router.quote``.
+    """
+    if amount_a <= 0:
+        raise FeeError("PancakeLibrary: INSUFFICIENT_AMOUNT")
+    if reserve_a <= 0 or reserve_b <= 0:
+        raise FeeError("PancakeLibrary: INSUFFICIENT_LIQUIDITY")
+    return amount_a * reserve_b // reserve_a
+
+
+def percentage_fee(amount: int, fee_ratio: int) -> int:
+    """
+    The amount-based part of ``_calculateFee``.
+    """
+    fee = ((amount * 10**FEE_DECIMALS) * fee_ratio) // (100 * 10**FEE_DECIMALS)
+    return fee // 10**FEE_DECIMALS
+
+
+class FeeReader(ABC):
+    """
+    Chain reads needed for fee calculation. ``ApeFeeReader`` implements
+    them with ape contract calls.
+    """
+
+    @abstractmethod
+    def router(self) -> str:
+        ...
+
+    @abstractmethod
+    def usdt(self) -> str:
+        ...
+
+    @abstractmethod
+    def weth(self, router: str) -> str:
+        ...
+
+    @abstractmethod
+    def factory(self, router: str) -> str:
+        ...
+
+    @abstractmethod
+    def get_pair(self, factory: str, token_a: str, token_b: str) -> str:
+        ...
+
+    @abstractmethod
+    def balance_of(self, token: str, holder: str) -> int:
+        ...
+
+    @abstractmethod
+    def fee_multiplier(self, tx_type: int) -> int:
+        ...
+
+
+class ApeFeeReader(FeeReader):
+    """
+    Reads through ape, using the interfaces compiled from Peniwallet.sol.
+    """
+
+    def __init__(self, peniwallet, project):
+        self.peniwallet = peniwallet
+        self.project = project
+
+    def router(self) -> str:
+        return self.peniwallet.PancakeSwapRouterAddress()
+
+    def usdt(self) -> str:
+        return self.peniwallet.USDT()
+
+    def weth(self, router: str) -> str:
+        return self.project.IPancakeRouter.at(router).WETH()
+
+    def factory(self, router: str) -> str:
+        return self.project.IPancakeRouter.at(router).factory()
+
+    def get_pair(self, factory: str, token_a: str, token_b: str) -> str:
+        return self.project.IPancakeFactory.at(factory).getPair(token_a, token_b)
+
+    def balance_of(self, token: str, holder: str) -> int:
+        return self.project.IErc20.at(token).balanceOf(holder)
+
+    def fee_multiplier(self, tx_type: int) -> int:
+        return self.peniwallet.feeMultiplier(tx_type)
+
+
+class FeeEngine:
+    """
+    Quotes fees without per-quote RPC calls.
+
+    :param reader: where chain state comes from
+    :param ttl: seconds a reserve snapshot stays valid when ``on_block``
+        is not called
+    :param pair_ttl: seconds a missing pair is remembered before
+        ``factory.getPair`` is asked again
+    :param clock: time source, for tests
+    :param gas_oracle: ``GasOracle`` that ``quote`` takes ``_gas`` from
+    :param metrics: ``Metrics`` timing every ``estimate_fees``
+    """
+
+    def __init__(
+        self,
+        reader: FeeReader,
+        ttl: float = 3.0,
+        pair_ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        gas_oracle=None,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.reader = reader
+        self.ttl = ttl
+        self.pair_ttl = pair_ttl
+        self.clock = clock
+        self.gas_oracle = gas_oracle
+        self.metrics = NO_METRICS if metrics is None else metrics
+        self._config: Optional[Tuple[str, str, str, str]] = None
+        self._pairs: Dict[Tuple[str, str], str] = {}
+        # pair key -> when getPair last returned the zero address
+        self._missing_pairs: Dict[Tuple[str, str], float] = {}
+        self._snapshot: Dict[Tuple, int] = {}
+        self._snapshot_block: Optional[int] = None
+        self._snapshot_time = clock()
+
+    def config(self) -> Tuple[str, str, str, str]:
+        """
+        Returns (router, factory, WETH, USDT), read once.
+        """
+        if self._config is None:
+            router = self.reader.router()
+            self._config = (
+                router,
+                self.reader.factory(router),
+                self.reader.weth(router),
+                self.reader.usdt(),
+            )
+        return self._config
+
+    def on_block(self, number: int) -> None:
+        """
+        Drops the reserve snapshot when a new block arrives.
+        """
+        if number != self._snapshot_block:
+            self._snapshot.clear()
+            self._snapshot_block = number
+            self._snapshot_time = self.clock()
+
+    def invalidate(self) -> None:
+        """
+        Drops everything, e.g. after the router or USDT address changed.
+        """
+        self._config = None
+        self._pairs.clear()
+        self._missing_pairs.clear()
+        self._snapshot.clear()
+
+    def _snapshot_get(self, key: Tuple, read: Callable[[], int]) -> int:
+        if self.clock() - self._snapshot_time > self.ttl:
+            self._snapshot.clear()
+            self._snapshot_time = self.clock()
+        value = self._snapshot.get(key)
+        if value is None:
+            value = self._snapshot[key] = read()
+        return value
+
+    def pair(self, token_a: str, token_b: str) -> str:
+        """
+        ``factory.getPair``, cached. Missing pairs are cached as the zero
+        address for ``pair_ttl`` seconds, so a pair created later is found.
+        """
+        key = (token_a.lower(), token_b.lower())
+        found = self._pairs.get(key)
+        if found is not None:
+            return found
+        checked = self._missing_pairs.get(key)
+        if checked is not None and self.clock() - checked <= self.pair_ttl:
+            return ZERO_ADDRESS
+        _, factory, _, _ = self.config()
+        found = self.reader.get_pair(factory, token_a, token_b)
+        if int(found, 16):
+            self._pairs[key] = found
+            self._missing_pairs.pop(key, None)
+        else:
+            self._missing_pairs[key] = self.clock()
+        return found
+
+    def forget_missing_pairs(self) -> None:
+        """
+        Looks missing pairs up again on next use, before ``pair_ttl`` ends.
+        """
+        self._missing_pairs.clear()
+
+    def reserve(self, token: str, pair: str) -> int:
+        """
+        ``IErc20(token).balanceOf(pair)`` from the current snapshot.
+        """
+        return self._snapshot_get(
+            ("balance", token.lower(), pair.lower()),
+            lambda: self.reader.balance_of(token, pair),
+        )
+
+    def fee_multiplier(self, tx_type: int) -> int:
+        return self._snapshot_get(
+            ("multiplier", tx_type), lambda: self.reader.fee_multiplier(tx_type))
+
+    def min_fee(self, token: str, min_fee: int) -> int:
+        """
+        ``_calculateMinFee``: converts a fee in BNB to tokens.
+        """
+        if int(token, 16) == 0:
+            return min_fee
+        _, _, weth, usdt = self.config()
+        if token.lower() == weth.lower():
+            return min_fee
+
+        bnb_token_pair = self.pair(token, weth)
+        usdt_token_pair = self.pair(token, usdt)
+        bnb_usdt_pair = self.pair(weth, usdt)
+
+        if not int(bnb_token_pair, 16) and not int(usdt_token_pair, 16):
+            raise FeeError("No Supported Pairs exists for the token")
+
+        if int(bnb_token_pair, 16):
+            return quote(
+                min_fee,
+                self.reserve(weth, bnb_token_pair),
+                self.reserve(token, bnb_token_pair),
+            )
+
+        # if the token is not paired with BNB, then it is paired with USDT
+        fee_in_usdt = quote(
+            min_fee,
+            self.reserve(weth, bnb_usdt_pair),
+            self.reserve(usdt, bnb_usdt_pair),
+        )
+        return quote(
+            fee_in_usdt,
+            self.reserve(usdt, usdt_token_pair),
+            self.reserve(token, usdt_token_pair),
+        )
+
+    def estimate_fees(self, token: str, amount: int, tx_type: int, gas: int) -> int:
+        """
+        Same result as ``Peniwallet.estimateFees(token, amount, type, gas)``.
+        """
+        with self.metrics.span(FEE_ESTIMATE):
+            fee = percentage_fee(amount, self.fee_multiplier(tx_type))
+            return fee + self.min_fee(token, gas)
+
+    def quote(self, token: str, amount: int, entry_point: str, size: int = 1) -> Tuple[int, int]:
+        """
+        Returns (``_gas``, fee) for a call to ``entry_point``, e.g.
+        ``quote(token, total, "sprayToken", size=len(receivers))``, with
+        ``_gas`` from the gas oracle. For ``"batchTransfer"`` both are per
+        transfer: ``amount`` is the one transfer's and ``_gas`` its share
+        of the bundle.
+        """
+        if self.gas_oracle is None:
+            raise ValueError("FeeEngine has no gas oracle")
+        gas = self.gas_oracle.gas_fee(entry_point, size)
+        return gas, self.estimate_fees(token, amount, self.gas_oracle.tx_type(entry_point), gas)
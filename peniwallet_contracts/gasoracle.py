@@ -0,0 +1,261 @@
+"""
+Gas oracle for the ``_gas`` argument of the relayed entry points.
+
+``_gas`` is the network fee of the relayed transaction in wei, which
+``_calculateMinFee`` converts to the fee token, so it should be the gas
+the call will use times the price it will pay. The oracle keeps
+
+- a rolling window of recent base fees and priority fees, read with
+  ``eth_feeHistory`` for only the blocks since the last ``refresh``;
+- a rolling window of the gas used by each entry point, fed from
+  receipts through ``observe`` (``AsyncRelayer`` does this for the calls
+  it relays), fitted as ``intercept + slope * size`` where the size is the
+  recipient count of a spray, the transfer count of a batch and the hop
+  count of a swap.
+
+Both are reduced to a few numbers when they change, so ``gas_fee`` is a
+multiplication and needs no RPC call.
+
+    oracle = GasOracle(BatchReader(rpc_url))
+    oracle.refresh()                      # on every new block
+    gas = oracle.gas_fee(SPRAY_TOKEN, size=200)
+"""
+
+import math
+from collections import deque
+from fractions import Fraction
+from typing import Deque, Optional, Tuple
+
+from peniwallet_contracts import calldata, fees
+from peniwallet_contracts.bundler import BASE_GAS as BATCH_BASE_GAS
+from peniwallet_contracts.bundler import GAS_PER_TRANSFER
+from peniwallet_contracts.reads import BatchReader, RPCError, selector
+from peniwallet_contracts.spray import BASE_GAS as SPRAY_BASE_GAS
+from peniwallet_contracts.spray import GAS_PER_RECIPIENT
+
+TRANSFER = "transfer"
+SWAP_TOKENS_FOR_BNB = "swapTokensForBNB"
+SWAP_TOKENS_FOR_TOKENS = "swapTokensForTokens"
+SPRAY_TOKEN = "sprayToken"
+BATCH_TRANSFER = "batchTransfer"
+
+# entry point -> (gas at size 0, gas per unit of size) until calls are observed
+DEFAULT_GAS = {
+    TRANSFER: (120_000, 0),
+    SWAP_TOKENS_FOR_BNB: (150_000, 100_000),
+    SWAP_TOKENS_FOR_TOKENS: (150_000, 100_000),
+    SPRAY_TOKEN: (SPRAY_BASE_GAS, GAS_PER_RECIPIENT),
+    BATCH_TRANSFER: (BATCH_BASE_GAS, GAS_PER_TRANSFER),
+}
+
+# entry point -> the transaction type estimateFees charges it as
+TX_TYPES = {
+    TRANSFER: fees.TRANSFER,
+    SWAP_TOKENS_FOR_BNB: fees.SWAP,
+    SWAP_TOKENS_FOR_TOKENS: fees.SWAP,
+    SPRAY_TOKEN: fees.SPRAY,
+    BATCH_TRANSFER: fees.TRANSFER,
+}
+
+SELECTORS = {
+    selector(calldata.TRANSFER): TRANSFER,
+    selector(calldata.SWAP_TOKENS_FOR_BNB): SWAP_TOKENS_FOR_BNB,
+    selector(calldata.SWAP_TOKENS_FOR_TOKENS): SWAP_TOKENS_FOR_TOKENS,
+    selector(calldata.SPRAY_TOKEN): SPRAY_TOKEN,
+    selector(calldata.BATCH_TRANSFER): BATCH_TRANSFER,
+}
+
+# head word holding the offset of the array that gives the size of a call
+SIZE_ARGUMENT = {
+    SWAP_TOKENS_FOR_BNB: 0,
+    SWAP_TOKENS_FOR_TOKENS: 0,
+    SPRAY_TOKEN: 2,
+    BATCH_TRANSFER: 1,
+}
+
+# entry points that charge ``_gas`` as the minimum fee of every item, so
+# each item is quoted its share of the call rather than the whole call
+PER_ITEM = {BATCH_TRANSFER}
+
+# eth_feeHistory serves at most this many blocks per request
+MAX_FEE_HISTORY = 1024
+
+
+def entry_point(data: bytes) -> Optional[Tuple[str, int]]:
+    """
+    (entry point, size) of Peniwallet calldata, None for other calls.
+    """
+    name = SELECTORS.get(bytes(data[:4]))
+    if name is None:
+        return None
+    argument = SIZE_ARGUMENT.get(name)
+    if argument is None:
+        return name, 1
+    head = 4 + 32 * argument
+    offset = int.from_bytes(data[head:head + 32], "big")
+    length = int.from_bytes(data[4 + offset:4 + offset + 32], "big")
+    # a swap path of n tokens has n - 1 hops
+    return name, length - 1 if argument == 0 else length
+
+
+def _quantile(values, q: float) -> int:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class _GasWindow:
+    """
+    Least squares fit of gas used against size over the last ``maxlen``
+    calls, kept as running sums so adding a call is O(1).
+    """
+
+    def __init__(self, maxlen: int, intercept: int, slope: int):
+        self.samples: Deque[Tuple[int, int]] = deque()
+        self.maxlen = maxlen
+        self.prior_slope = slope
+        self.intercept = float(intercept)
+        self.slope = float(slope)
+        self._n = self._x = self._y = self._xx = self._xy = 0
+
+    def add(self, size: int, gas: int) -> None:
+        if len(self.samples) == self.maxlen:
+            self._update(*self.samples.popleft(), sign=-1)
+        self.samples.append((size, gas))
+        self._update(size, gas, sign=1)
+        self._fit()
+
+    def _update(self, size: int, gas: int, sign: int) -> None:
+        self._n += sign
+        self._x += sign * size
+        self._y += sign * gas
+        self._xx += sign * size * size
+        self._xy += sign * size * gas
+
+    def _fit(self) -> None:
+        n = self._n
+        spread = n * self._xx - self._x * self._x
+        # one size only says nothing about the slope, keep the prior one
+        slope = (n * self._xy - self._x * self._y) / spread if spread else self.prior_slope
+        self.slope = max(slope, 0.0)
+        self.intercept = (self._y - self.slope * self._x) / n
+
+    def estimate(self, size: int) -> float:
+        return self.intercept + self.slope * size
+
+
+class GasOracle:
+    """
+    :param reader: ``BatchReader`` for the chain Peniwallet is on
+    :param blocks: blocks in the fee window, at most ``MAX_FEE_HISTORY``
+    :param calls: observed calls kept per entry point
+    :param percentile: priority fee percentile read per block, and the
+        percentile of the window that is quoted
+    :param margin: multiplier on gas used times price, for what the
+        window has not seen
+    """
+
+    def __init__(
+        self,
+        reader: BatchReader,
+        blocks: int = 20,
+        calls: int = 200,
+        percentile: float = 0.9,
+        margin: float = 1.1,
+    ):
+        if not 0 < blocks <= MAX_FEE_HISTORY:
+            raise ValueError(f"blocks must be between 1 and {MAX_FEE_HISTORY}")
+        self.reader = reader
+        self.blocks = blocks
+        self.percentile = percentile
+        self.margin = margin
+        # exact, so quotes do not pick up float rounding at wei precision
+        self._margin = Fraction(margin).limit_denominator(10_000)
+        self.block = -1
+        self.next_base_fee = 0
+        self.price: Optional[int] = None
+        self._fees: Deque[Tuple[int, int]] = deque(maxlen=blocks)
+        self._gas = {name: _GasWindow(calls, *prior) for name, prior in DEFAULT_GAS.items()}
+
+    def _rpc(self, method: str, params):
+        (answer,) = self.reader.request([(method, params)])
+        if "error" in answer:
+            raise RPCError(answer["error"].get("message", answer["error"]))
+        return answer["result"]
+
+    def refresh(self, head: Optional[int] = None) -> int:
+        """
+        Adds the fees of the blocks since the last refresh, up to ``head``
+        (read from the node when not given), and returns the head.
+        """
+        if head is None:
+            head = int(self._rpc("eth_blockNumber", []), 16)
+        count = min(head - self.block, self.blocks)
+        if count <= 0:
+            return self.block
+        try:
+            history = self._rpc("eth_feeHistory", [hex(count), hex(head), [self.percentile * 100]])
+        except RPCError:
+            # no EIP-1559 fee data on this node, the legacy gas price stands in
+            self._fees.append((0, int(self._rpc("eth_gasPrice", []), 16)))
+            self.next_base_fee = 0
+        else:
+            base_fees = [int(value, 16) for value in history["baseFeePerGas"]]
+            rewards = history.get("reward") or [[]] * (len(base_fees) - 1)
+            for base_fee, reward in zip(base_fees, rewards):
+                self._fees.append((base_fee, int(reward[0], 16) if reward else 0))
+            # the last entry is the base fee of the next block
+            self.next_base_fee = base_fees[-1]
+        self.block = head
+        self._reprice()
+        return head
+
+    def _reprice(self) -> None:
+        tips = [tip for _, tip in self._fees]
+        window = _quantile([base_fee + tip for base_fee, tip in self._fees], self.percentile)
+        self.price = max(window, self.next_base_fee + _quantile(tips, self.percentile))
+
+    def observe(self, data: bytes, gas_used: int) -> bool:
+        """
+        Records the gas a mined Peniwallet call used. Returns False for
+        calldata of other functions.
+        """
+        call = entry_point(data)
+        if call is None:
+            return False
+        self._gas[call[0]].add(call[1], gas_used)
+        return True
+
+    def gas_used(self, name: str, size: int = 1) -> int:
+        """
+        Expected gas of a call to ``name`` of the given size.
+        """
+        window = self._gas.get(name)
+        if window is None:
+            raise ValueError(f"Unknown entry point: {name}")
+        return math.ceil(window.estimate(size))
+
+    def gas_fee(self, name: str, size: int = 1) -> int:
+        """
+        The ``_gas`` value, in wei, for a call to ``name`` of the given size.
+        For ``batchTransfer`` that is the share of one transfer, since the
+        contract charges ``_gas`` on each of them.
+        """
+        if self.price is None:
+            raise ValueError("No fee data yet, call refresh() first")
+        fee = self.gas_used(name, size) * self.price * self._margin
+        if name in PER_ITEM:
+            fee /= max(size, 1)
+        return -(-fee.numerator // fee.denominator)
+
+    def gas_fee_for(self, data: bytes) -> int:
+        """
+        ``gas_fee`` for the entry point and size of encoded calldata.
+        """
+        call = entry_point(data)
+        if call is None:
+            raise ValueError("Not a Peniwallet entry point")
+        return self.gas_fee(*call)
+
+    @staticmethod
+    def tx_type(name: str) -> int:
+        return TX_TYPES[name]
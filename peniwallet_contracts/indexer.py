@@ -0,0 +1,377 @@
+"""
+Incremental indexer for Peniwallet events.
+
+Logs are fetched with ``eth_getLogs`` in block ranges that grow while the
+node keeps up and shrink when it refuses a range, decoded (in a process
+pool for large batches, ``SprayExecuted`` carries whole recipient lists)
+and stored in SQLite with indexes on token, sender and recipient.
+
+Every sync records block hashes as checkpoints: the ``blockHash`` carried
+by each log, and the hash of the range end read before ``eth_getLogs``,
+so a reorg while the logs are fetched leaves a stale checkpoint behind.
+When a checkpoint hash no longer matches the chain, everything after the
+newest matching checkpoint is deleted and indexed again.
+"""
+
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+
+from peniwallet_contracts.reads import BatchReader, RPCError
+
+
+class EventSpec(NamedTuple):
+    name: str
+    signature: str
+    indexed: Tuple[str, ...]
+    data: Tuple[str, ...]
+
+    @property
+    def topic(self) -> str:
+        return "0x" + keccak(self.signature.encode()).hex()
+
+
+EVENTS = [
+    EventSpec("GasSent", "GasSent(address,address,uint256)",
+              ("address",), ("address", "uint256")),
+    EventSpec("AdminAdded", "AdminAdded(address,address)",
+              ("address", "address"), ()),
+    EventSpec("AdminRemoved", "AdminRemoved(address,address)",
+              ("address", "address"), ()),
+    EventSpec("FeeMultiplierSet", "FeeMultiplierSet(uint256,uint256,address)",
+              ("uint256", "address"), ("uint256",)),
+    EventSpec("DevFeeShareSet", "DevFeeShareSet(uint256,address,uint256)",
+              ("address",), ("uint256", "uint256")),
+    EventSpec("ProjectRegistered", "ProjectRegistered(address,address,address)",
+              ("address", "address", "address"), ()),
+    EventSpec("FeeWithdrawn", "FeeWithdrawn(address,address,uint256,uint256)",
+              ("address", "address"), ("uint256", "uint256")),
+    EventSpec("SprayExecuted", "SprayExecuted(address,address,address[],uint256,uint256,string,string)",
+              ("address", "address"), ("address[]", "uint256", "uint256", "string", "string")),
+]
+
+EVENTS_BY_TOPIC = {spec.topic: spec for spec in EVENTS}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (number INTEGER PRIMARY KEY, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sprays (
+    block INTEGER, log_index INTEGER, tx TEXT, token TEXT, sender TEXT,
+    amount TEXT, recipients INTEGER, timestamp INTEGER, name TEXT, code TEXT,
+    PRIMARY KEY (block, log_index));
+CREATE INDEX IF NOT EXISTS sprays_token ON sprays (token);
+CREATE INDEX IF NOT EXISTS sprays_sender ON sprays (sender);
+CREATE TABLE IF NOT EXISTS spray_recipients (
+    block INTEGER, log_index INTEGER, position INTEGER, recipient TEXT,
+    PRIMARY KEY (block, log_index, position));
+CREATE INDEX IF NOT EXISTS spray_recipients_recipient ON spray_recipients (recipient);
+CREATE TABLE IF NOT EXISTS fee_withdrawals (
+    block INTEGER, log_index INTEGER, tx TEXT, dev TEXT, token TEXT,
+    amount TEXT, timestamp INTEGER, PRIMARY KEY (block, log_index));
+CREATE INDEX IF NOT EXISTS fee_withdrawals_token ON fee_withdrawals (token);
+CREATE INDEX IF NOT EXISTS fee_withdrawals_dev ON fee_withdrawals (dev);
+CREATE TABLE IF NOT EXISTS gas_sent (
+    block INTEGER, log_index INTEGER, tx TEXT, sender TEXT, receiver TEXT,
+    amount TEXT, PRIMARY KEY (block, log_index));
+CREATE INDEX IF NOT EXISTS gas_sent_receiver ON gas_sent (receiver);
+CREATE TABLE IF NOT EXISTS projects (
+    block INTEGER, log_index INTEGER, tx TEXT, owner TEXT, token TEXT,
+    created_by TEXT, PRIMARY KEY (block, log_index));
+CREATE INDEX IF NOT EXISTS projects_token ON projects (token);
+CREATE TABLE IF NOT EXISTS fee_multipliers (
+    block INTEGER, log_index INTEGER, tx TEXT, tx_type INTEGER,
+    multiplier TEXT, set_by TEXT, PRIMARY KEY (block, log_index));
+CREATE TABLE IF NOT EXISTS dev_fee_shares (
+    block INTEGER, log_index INTEGER, tx TEXT, share TEXT, set_by TEXT,
+    timestamp INTEGER, PRIMARY KEY (block, log_index));
+CREATE TABLE IF NOT EXISTS admin_events (
+    block INTEGER, log_index INTEGER, tx TEXT, admin TEXT, actor TEXT,
+    added INTEGER, PRIMARY KEY (block, log_index));
+"""
+
+TABLES = (
+    "sprays", "spray_recipients", "fee_withdrawals", "gas_sent", "projects",
+    "fee_multipliers", "dev_fee_shares", "admin_events",
+)
+
+
+def _value(kind: str, value: Any) -> Any:
+    return to_checksum_address(value) if kind == "address" else value
+
+
+def decode_log(log: Dict[str, Any]) -> Optional[Tuple[str, int, int, str, Tuple]]:
+    """
+    Decodes a raw log into (event, block, log_index, tx, values), values
+    in declaration order of the indexed and data fields. Returns None for
+    logs of other events.
+    """
+    spec = EVENTS_BY_TOPIC.get(log["topics"][0])
+    if spec is None:
+        return None
+    indexed = tuple(
+        _value(kind, decode([kind], bytes.fromhex(topic[2:]))[0])
+        for kind, topic in zip(spec.indexed, log["topics"][1:])
+    )
+    data = decode(list(spec.data), bytes.fromhex(log["data"][2:])) if spec.data else ()
+    data = tuple(
+        [to_checksum_address(item) for item in value] if kind == "address[]" else _value(kind, value)
+        for kind, value in zip(spec.data, data)
+    )
+    return (
+        spec.name,
+        int(log["blockNumber"], 16),
+        int(log["logIndex"], 16),
+        log["transactionHash"],
+        indexed + data,
+    )
+
+
+def _decode_chunk(logs: Sequence[Dict[str, Any]]) -> List:
+    return [decode_log(log) for log in logs]
+
+
+class EventIndexer:
+    """
+    Keeps an SQLite copy of the Peniwallet events.
+
+    :param db_path: SQLite database file
+    :param reader: ``BatchReader`` connected to the node
+    :param peniwallet: address of the Peniwallet deployment
+    :param start_block: first block to index
+    :param confirmations: depth after which blocks are not expected to reorg;
+        older checkpoints are pruned
+    :param range_size: initial ``eth_getLogs`` block range
+    :param max_range: largest block range to grow to
+    :param decode_workers: process pool size for decoding, 0 decodes inline
+    :param parallel_threshold: smallest batch of logs decoded in the pool
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        reader: BatchReader,
+        peniwallet: str,
+        start_block: int = 0,
+        confirmations: int = 12,
+        range_size: int = 2_000,
+        max_range: int = 50_000,
+        decode_workers: int = 0,
+        parallel_threshold: int = 2_000,
+    ):
+        self.reader = reader
+        self.peniwallet = to_checksum_address(peniwallet)
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.range_size = range_size
+        self.max_range = max_range
+        self.decode_workers = decode_workers
+        self.parallel_threshold = parallel_threshold
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "EventIndexer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _rpc(self, method: str, params: List[Any]) -> Any:
+        (answer,) = self.reader.request([(method, params)])
+        if "error" in answer:
+            raise RPCError(answer["error"].get("message", answer["error"]))
+        return answer["result"]
+
+    def indexed_block(self) -> int:
+        """
+        Returns the last block indexed, ``start_block - 1`` before the first sync.
+        """
+        row = self.db.execute("SELECT MAX(number) FROM checkpoints").fetchone()
+        return self.start_block - 1 if row[0] is None else row[0]
+
+    def _block_hashes(self, numbers: Sequence[int]) -> Dict[int, Optional[str]]:
+        answers = self.reader.request(
+            [("eth_getBlockByNumber", [hex(number), False]) for number in numbers])
+        return {
+            number: (answer.get("result") or {}).get("hash")
+            for number, answer in zip(numbers, answers)
+        }
+
+    def _rollback_reorg(self) -> Optional[int]:
+        """
+        Deletes rows after the newest checkpoint still on chain, returns
+        the block it rolled back to or None when nothing changed.
+        """
+        checkpoints = self.db.execute(
+            "SELECT number, hash FROM checkpoints ORDER BY number DESC").fetchall()
+        if not checkpoints:
+            return None
+        hashes = self._block_hashes([number for number, _ in checkpoints])
+        if hashes[checkpoints[0][0]] == checkpoints[0][1]:
+            return None
+
+        keep = self.start_block - 1
+        for number, block_hash in checkpoints:
+            if hashes[number] == block_hash:
+                keep = number
+                break
+        with self.db:
+            for table in TABLES:
+                self.db.execute(f"DELETE FROM {table} WHERE block > ?", (keep,))
+            self.db.execute("DELETE FROM checkpoints WHERE number > ?", (keep,))
+        return keep
+
+    def _get_logs(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        return self._rpc("eth_getLogs", [{
+            "address": self.peniwallet,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "topics": [[spec.topic for spec in EVENTS]],
+        }])
+
+    def _decode(self, logs: List[Dict[str, Any]]) -> List:
+        if self.decode_workers and len(logs) >= self.parallel_threshold:
+            size = max(1, len(logs) // (self.decode_workers * 4))
+            chunks = [logs[start:start + size] for start in range(0, len(logs), size)]
+            with ProcessPoolExecutor(max_workers=self.decode_workers) as pool:
+                return [event for chunk in pool.map(_decode_chunk, chunks) for event in chunk]
+        return _decode_chunk(logs)
+
+    def _store(self, events: Iterable) -> None:
+        for event in events:
+            if event is None:
+                continue
+            name, block, log_index, tx, values = event
+            key = (block, log_index, tx)
+            if name == "SprayExecuted":
+                token, sender, receivers, amount, timestamp, spray_name, code = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sprays VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (token, sender, str(amount), len(receivers), timestamp, spray_name, code))
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO spray_recipients VALUES (?, ?, ?, ?)",
+                    [(block, log_index, position, receiver) for position, receiver in enumerate(receivers)])
+            elif name == "FeeWithdrawn":
+                dev, token, amount, timestamp = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO fee_withdrawals VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (dev, token, str(amount), timestamp))
+            elif name == "GasSent":
+                sender, receiver, amount = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO gas_sent VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (sender, receiver, str(amount)))
+            elif name == "ProjectRegistered":
+                owner, token, created_by = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (owner, token, created_by))
+            elif name == "FeeMultiplierSet":
+                tx_type, set_by, multiplier = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO fee_multipliers VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (tx_type, str(multiplier), set_by))
+            elif name == "DevFeeShareSet":
+                set_by, share, timestamp = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO dev_fee_shares VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (str(share), set_by, timestamp))
+            else:
+                admin, actor = values
+                self.db.execute(
+                    "INSERT OR REPLACE INTO admin_events VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (admin, actor, int(name == "AdminAdded")))
+
+    def sync(self, to_block: Optional[int] = None) -> int:
+        """
+        Indexes up to ``to_block`` (the chain head by default), returns the
+        last indexed block.
+        """
+        self._rollback_reorg()
+        head = int(self._rpc("eth_blockNumber", []), 16) if to_block is None else to_block
+        cursor = self.indexed_block() + 1
+
+        while cursor <= head:
+            end = min(cursor + self.range_size - 1, head)
+            # read before the logs: a reorg in between then makes this hash
+            # stale, instead of vouching for logs of the replaced blocks
+            (end_hash,) = self._block_hashes([end]).values()
+            try:
+                logs = self._get_logs(cursor, end)
+            except (RPCError, OSError):
+                if self.range_size == 1:
+                    raise
+                # the node refused the range (too many results, timeout), split it
+                self.range_size = max(1, self.range_size // 2)
+                continue
+
+            events = self._decode(logs)
+            checkpoints = {end: end_hash}
+            checkpoints.update((int(log["blockNumber"], 16), log["blockHash"]) for log in logs)
+            with self.db:
+                self._store(events)
+                self.db.executemany("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)", checkpoints.items())
+                self.db.execute(
+                    "DELETE FROM checkpoints WHERE number < ? AND number != "
+                    "(SELECT MAX(number) FROM checkpoints WHERE number < ?)",
+                    (end - self.confirmations, end - self.confirmations))
+            cursor = end + 1
+            if len(logs) < 1_000:
+                self.range_size = min(self.range_size * 2, self.max_range)
+        return self.indexed_block()
+
+    def sprays_to(self, recipient: str) -> List[Dict[str, Any]]:
+        """
+        Sprays that paid ``recipient``, oldest first.
+        """
+        return self._rows(
+            "SELECT DISTINCT s.* FROM spray_recipients r JOIN sprays s "
+            "ON s.block = r.block AND s.log_index = r.log_index "
+            "WHERE r.recipient = ? ORDER BY s.block, s.log_index",
+            (to_checksum_address(recipient),))
+
+    def sprays_by(self, sender: str) -> List[Dict[str, Any]]:
+        return self._rows(
+            "SELECT * FROM sprays WHERE sender = ? ORDER BY block, log_index",
+            (to_checksum_address(sender),))
+
+    def sprays_of(self, token: str) -> List[Dict[str, Any]]:
+        return self._rows(
+            "SELECT * FROM sprays WHERE token = ? ORDER BY block, log_index",
+            (to_checksum_address(token),))
+
+    def spray_recipients(self, block: int, log_index: int) -> List[str]:
+        return [
+            row[0] for row in self.db.execute(
+                "SELECT recipient FROM spray_recipients WHERE block = ? AND log_index = ? "
+                "ORDER BY position", (block, log_index))
+        ]
+
+    def fee_withdrawals(self, token: Optional[str] = None, dev: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT * FROM fee_withdrawals WHERE 1 = 1"
+        params: List[Any] = []
+        if token is not None:
+            query += " AND token = ?"
+            params.append(to_checksum_address(token))
+        if dev is not None:
+            query += " AND dev = ?"
+            params.append(to_checksum_address(dev))
+        return self._rows(query + " ORDER BY block, log_index", params)
+
+    def projects(self) -> Dict[str, str]:
+        """
+        Current token -> developer mapping, as ``Peniwallet.projects``.
+        """
+        return {
+            token: owner for token, owner in self.db.execute(
+                "SELECT token, owner FROM projects ORDER BY block, log_index")
+        }
+
+    def _rows(self, query: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        cursor = self.db.execute(query, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
@@ -0,0 +1,195 @@
+"""
+Reconciliation of Peniwallet's fee ledger against its token holdings.
+
+For every token the contract has received, its ``balanceOf(peniwallet)``
+should equal the admin entry ``fees[peniwallet][token].balance`` plus
+the entries of every developer registered for it. The tokens come from
+ERC20 ``Transfer`` logs into the contract, scanned incrementally into the
+indexer database; developers come from the indexed ``ProjectRegistered``
+events. Current state is then read for all tokens in one batched pass
+pinned to a single block.
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+
+from eth_abi import decode
+from eth_utils import keccak, to_checksum_address
+
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.reads import Fee, RPCError, call
+
+TRANSFER_TOPIC = "0x" + keccak(b"Transfer(address,address,uint256)").hex()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fee_inflows (
+    token TEXT, block INTEGER, log_index INTEGER, sender TEXT, amount TEXT,
+    PRIMARY KEY (block, log_index));
+CREATE INDEX IF NOT EXISTS fee_inflows_token ON fee_inflows (token);
+CREATE TABLE IF NOT EXISTS ledger_checkpoint (id INTEGER PRIMARY KEY CHECK (id = 0), number INTEGER);
+"""
+
+
+class Drift(NamedTuple):
+    """
+    One token's reconciliation; ``drift`` is holdings minus what the
+    ledger owes, negative when the contract holds less than it owes.
+    """
+
+    token: str
+    balance: int
+    admin_fees: int
+    dev_fees: int
+    inflow: int
+    withdrawn: int
+    error: Optional[str] = None
+
+    @property
+    def drift(self) -> int:
+        return self.balance - self.admin_fees - self.dev_fees
+
+
+class FeeLedger:
+    """
+    :param indexer: ``EventIndexer`` of the Peniwallet deployment, synced
+        separately; its database also holds the ledger tables
+    :param confirmations: only blocks this deep are scanned for inflows,
+        so the ledger never needs reorg handling
+    :param range_size: initial ``eth_getLogs`` block range
+    :param max_range: largest block range to grow to
+    """
+
+    def __init__(self, indexer: EventIndexer, confirmations: int = 12, range_size: int = 2_000,
+                 max_range: int = 50_000):
+        self.indexer = indexer
+        self.reader = indexer.reader
+        self.peniwallet = indexer.peniwallet
+        self.db = indexer.db
+        self.confirmations = confirmations
+        self.range_size = range_size
+        self.max_range = max_range
+        self.db.executescript(SCHEMA)
+
+    def scanned_block(self) -> int:
+        row = self.db.execute("SELECT number FROM ledger_checkpoint").fetchone()
+        return self.indexer.start_block - 1 if row is None else row[0]
+
+    def sync(self) -> int:
+        """
+        Scans ``Transfer`` logs into the contract up to the indexer's
+        confirmed head, returns the last scanned block.
+        """
+        head = self.indexer.indexed_block() - self.confirmations
+        recipient = "0x" + "00" * 12 + self.peniwallet[2:].lower()
+        cursor = self.scanned_block() + 1
+
+        while cursor <= head:
+            end = min(cursor + self.range_size - 1, head)
+            try:
+                (answer,) = self.reader.request([("eth_getLogs", [{
+                    "fromBlock": hex(cursor),
+                    "toBlock": hex(end),
+                    "topics": [TRANSFER_TOPIC, None, recipient],
+                }])])
+                if "error" in answer:
+                    raise RPCError(answer["error"].get("message", answer["error"]))
+                logs = answer["result"]
+            except (RPCError, OSError):
+                if self.range_size == 1:
+                    raise
+                self.range_size = max(1, self.range_size // 2)
+                continue
+
+            rows = [
+                (
+                    to_checksum_address(log["address"]),
+                    int(log["blockNumber"], 16),
+                    int(log["logIndex"], 16),
+                    to_checksum_address("0x" + log["topics"][1][-40:]),
+                    str(decode(["uint256"], bytes.fromhex(log["data"][2:]))[0]),
+                )
+                # ERC721 transfers share the topic but carry the id as a fourth topic
+                for log in logs if len(log["topics"]) == 3
+            ]
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO fee_inflows VALUES (?, ?, ?, ?, ?)", rows)
+                self.db.execute("INSERT OR REPLACE INTO ledger_checkpoint VALUES (0, ?)", (end,))
+            cursor = end + 1
+            if len(logs) < 1_000:
+                self.range_size = min(self.range_size * 2, self.max_range)
+        return self.scanned_block()
+
+    def tokens(self) -> List[str]:
+        """
+        Every token that was sent to the contract or registered as a project.
+        """
+        return [
+            row[0] for row in self.db.execute(
+                "SELECT token FROM fee_inflows UNION SELECT token FROM projects ORDER BY 1")
+        ]
+
+    def _sums(self, query: str) -> Dict[str, int]:
+        # amounts are uint256 stored as text, summed in Python
+        totals: Dict[str, int] = {}
+        for token, amount in self.db.execute(query):
+            totals[token] = totals.get(token, 0) + int(amount)
+        return totals
+
+    def developers(self) -> Dict[str, List[str]]:
+        """
+        Every developer ever registered per token; a replaced developer
+        keeps the fees it earned.
+        """
+        developers: Dict[str, List[str]] = {}
+        for token, owner in self.db.execute(
+                "SELECT DISTINCT token, owner FROM projects ORDER BY block, log_index"):
+            developers.setdefault(token, []).append(owner)
+        return developers
+
+    def reconcile(self, block: Optional[int] = None) -> List[Drift]:
+        """
+        Reads holdings and fee entries for every known token at ``block``
+        (the indexer's head by default) and returns one ``Drift`` per token.
+        """
+        block = self.indexer.indexed_block() if block is None else block
+        tokens = self.tokens()
+        developers = self.developers()
+        inflows = self._sums("SELECT token, amount FROM fee_inflows")
+        withdrawn = self._sums("SELECT token, amount FROM fee_withdrawals")
+
+        def fee(owner, token):
+            return call(self.peniwallet, "fees(address,address)", [owner, token],
+                        ("address", "address", "uint256", "uint256"), Fee)
+
+        calls = []
+        for token in tokens:
+            calls.append(call(token, "balanceOf(address)", [self.peniwallet]))
+            calls.append(fee(self.peniwallet, token))
+            calls.extend(fee(dev, token) for dev in developers.get(token, ()))
+        results = iter(self.reader.execute(calls, block))
+
+        report = []
+        for token in tokens:
+            read = [next(results) for _ in range(2 + len(developers.get(token, ())))]
+            error = next((result.error for result in read if not result.success), None)
+            if error is not None:
+                report.append(Drift(token, 0, 0, 0, inflows.get(token, 0), withdrawn.get(token, 0), error))
+                continue
+            report.append(Drift(
+                token,
+                read[0].value,
+                read[1].value.balance,
+                sum(result.value.balance for result in read[2:]),
+                inflows.get(token, 0),
+                withdrawn.get(token, 0),
+            ))
+        return report
+
+    def drifted(self, tolerance: int = 0, block: Optional[int] = None) -> List[Drift]:
+        """
+        Tokens whose holdings differ from the ledger by more than ``tolerance``
+        or that could not be read.
+        """
+        return [
+            entry for entry in self.reconcile(block)
+            if entry.error is not None or abs(entry.drift) > tolerance
+        ]
@@ -0,0 +1,339 @@
+"""
+Timers, counters and sampled traces for the signing and relay pipeline.
+
+Every stage between a user's intent and its receipt gets a histogram,
+registered up front so timing a stage is a dict lookup, two clock reads
+and a bisect. Spans are kept only for sampled traces: ``trace`` decides
+once per intent, and the stages run under it (in the same thread or
+asyncio task) are recorded with its id.
+
+    metrics = Metrics(sample_rate=0.01)
+    relayer = AsyncRelayer(..., metrics=metrics)
+    with metrics.trace():
+        await relayer.transfer(message, signature, gas)
+    metrics.snapshot()["broadcast"].quantile(0.99)
+    serve(metrics, port=9100)             # Prometheus scrapes /metrics
+
+Components take ``metrics=None`` and then time nothing.
+"""
+
+import contextvars
+import itertools
+import math
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+EIP712_ENCODE = "eip712_encode"
+SIGN = "sign"
+NONCE_READ = "nonce_read"
+FEE_ESTIMATE = "fee_estimate"
+ABI_ENCODE = "abi_encode"
+SIGN_TRANSACTION = "sign_transaction"
+BROADCAST = "broadcast"
+RECEIPT_WAIT = "receipt_wait"
+
+STAGES = (EIP712_ENCODE, SIGN, NONCE_READ, FEE_ESTIMATE, ABI_ENCODE, SIGN_TRANSACTION, BROADCAST, RECEIPT_WAIT)
+
+# seconds, from in-process encoding up to receipts on a congested chain
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# id of the trace the current thread or task runs under, 0 when the
+# trace was not sampled so nested traces do not draw again
+_trace: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("peniwallet_trace", default=None)
+
+
+class Span(NamedTuple):
+    trace: int
+    stage: str
+    start: float
+    duration: float
+    error: bool
+
+
+class StageSnapshot(NamedTuple):
+    """
+    A stage's histogram at one point in time; ``buckets`` are cumulative
+    (upper bound, count) pairs ending with ``inf``.
+    """
+
+    runs: int
+    total: float
+    errors: int
+    buckets: Tuple[Tuple[float, int], ...]
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.runs if self.runs else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the ``q`` quantile.
+        """
+        rank = max(1, math.ceil(q * self.runs))
+        for bound, count in self.buckets:
+            if count >= rank:
+                return bound
+        return math.inf
+
+
+class Histogram:
+    """
+    Fixed buckets and non-cumulative counts. Updates take no lock, so a
+    thread switch mid-update can lose a count, never corrupt one.
+    """
+
+    __slots__ = ("buckets", "counts", "runs", "total", "errors")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.runs = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.runs += 1
+        self.total += value
+
+    def snapshot(self) -> StageSnapshot:
+        cumulative = list(itertools.accumulate(self.counts))
+        return StageSnapshot(self.runs, self.total, self.errors,
+                             tuple(zip(self.buckets + (math.inf,), cumulative)))
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "histogram", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str, histogram: Histogram):
+        self.metrics = metrics
+        self.stage = stage
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.start
+        self.histogram.observe(duration)
+        if exc_type is not None:
+            self.histogram.errors += 1
+        trace = _trace.get()
+        if trace:
+            self.metrics.spans.append(Span(trace, self.stage, self.start, duration, exc_type is not None))
+
+
+class _Trace:
+    __slots__ = ("metrics", "token")
+
+    def __init__(self, metrics: "Metrics"):
+        self.metrics = metrics
+        self.token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> Optional[int]:
+        trace = _trace.get()
+        if trace is None:
+            metrics = self.metrics
+            trace = 0
+            if metrics.sample_rate and metrics._random() < metrics.sample_rate:
+                trace = next(metrics._trace_ids)
+                metrics.sampled += 1
+            self.token = _trace.set(trace)
+        return trace or None
+
+    def __exit__(self, *exc) -> None:
+        if self.token is not None:
+            _trace.reset(self.token)
+
+
+class _Nothing:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOTHING = _Nothing()
+
+
+class Metrics:
+    """
+    :param stages: stage names to register, ``STAGES`` by default
+    :param buckets: histogram bucket upper bounds in seconds
+    :param sample_rate: share of traces whose spans are kept
+    :param capacity: sampled spans kept, oldest dropped first
+    :param prefix: metric name prefix for the Prometheus text
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[str] = STAGES,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        sample_rate: float = 0.0,
+        capacity: int = 4096,
+        prefix: str = "peniwallet",
+    ):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.buckets = tuple(sorted(buckets))
+        self.sample_rate = sample_rate
+        self.prefix = prefix
+        self.histograms: Dict[str, Histogram] = {stage: Histogram(self.buckets) for stage in stages}
+        self.spans: Deque[Span] = deque(maxlen=capacity)
+        self.sampled = 0
+        self._trace_ids = itertools.count(1)
+        self._random = random.random
+
+    def register(self, stage: str) -> Histogram:
+        """
+        Adds a stage (or returns the one registered under that name).
+        """
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        return histogram
+
+    def _histogram(self, stage: str) -> Histogram:
+        try:
+            return self.histograms[stage]
+        except KeyError:
+            raise ValueError(f"Unknown stage: {stage}") from None
+
+    def span(self, stage: str) -> Union[_Timer, _Nothing]:
+        """
+        Context manager timing one run of ``stage``; an exception leaving
+        it is counted as an error of the stage and passed on.
+        """
+        return _Timer(self, stage, self._histogram(stage))
+
+    def record(self, stage: str, start: float, duration: float, trace: Optional[int] = None,
+               error: bool = False) -> None:
+        """
+        Records a stage timed elsewhere, e.g. a receipt wait spanning
+        tasks; ``start`` is a ``time.perf_counter`` reading.
+        """
+        histogram = self._histogram(stage)
+        histogram.observe(duration)
+        if error:
+            histogram.errors += 1
+        if trace is not None:
+            self.spans.append(Span(trace, stage, start, duration, error))
+
+    def trace(self) -> Union[_Trace, _Nothing]:
+        """
+        Context manager that starts a trace with probability
+        ``sample_rate`` and yields its id, or None when not sampled.
+        Nested traces join the outer one.
+        """
+        return _Trace(self)
+
+    @staticmethod
+    def current_trace() -> Optional[int]:
+        return _trace.get() or None
+
+    def drain(self) -> List[Span]:
+        """
+        Returns and forgets the sampled spans, oldest first.
+        """
+        spans = []
+        while self.spans:
+            spans.append(self.spans.popleft())
+        return spans
+
+    def snapshot(self) -> Dict[str, StageSnapshot]:
+        return {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+
+    def exposition(self) -> str:
+        """
+        All stages in the Prometheus text format.
+        """
+        name = f"{self.prefix}_stage_seconds"
+        errors = f"{self.prefix}_stage_errors_total"
+        lines = [
+            f"# HELP {name} Time spent in each stage of the signing and relay pipeline.",
+            f"# TYPE {name} histogram",
+        ]
+        snapshots = self.snapshot()
+        for stage, snapshot in snapshots.items():
+            for bound, count in snapshot.buckets:
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{_number(bound)}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {_number(snapshot.total)}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {snapshot.runs}')
+        lines += [f"# HELP {errors} Stage runs that raised.", f"# TYPE {errors} counter"]
+        lines += [f'{errors}{{stage="{stage}"}} {snapshot.errors}' for stage, snapshot in snapshots.items()]
+        lines += [
+            f"# HELP {self.prefix}_traces_sampled_total Traces whose spans were kept.",
+            f"# TYPE {self.prefix}_traces_sampled_total counter",
+            f"{self.prefix}_traces_sampled_total {self.sampled}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class _NoMetrics(Metrics):
+    """
+    What components use when given no ``Metrics``: times nothing.
+    """
+
+    def __init__(self):
+        super().__init__(stages=())
+
+    def span(self, stage: str) -> _Nothing:
+        return _NOTHING
+
+    def record(self, stage: str, start: float, duration: float, trace: Optional[int] = None,
+               error: bool = False) -> None:
+        pass
+
+    def trace(self) -> _Nothing:
+        return _NOTHING
+
+
+NO_METRICS: Metrics = _NoMetrics()
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def serve(metrics: Metrics, port: int = 9100, host: str = "127.0.0.1"):
+    """
+    Serves ``metrics.exposition()`` at ``/metrics`` from a daemon thread.
+    ``shutdown()`` the returned server to stop it.
+    """
+    # imported here, the modules that time their stages should not pay for it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.exposition().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,144 @@
+"""
+Local nonce allocation for relayed calls.
+
+``checkNonce`` makes every user's meta-transactions strictly sequential, so
+once the chain nonce of a user is known, the following ones can be handed
+out locally. The allocator only goes back to the chain when a reserved
+nonce fails or an unexpected nonce is confirmed.
+
+The relayer's own transaction nonces are a different sequence and get their
+own allocator, see ``NonceManager``.
+"""
+
+import threading
+from typing import Callable, Dict, List, Set
+
+
+class _AddressState:
+    __slots__ = ("lock", "next", "outstanding", "synced")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = 0
+        self.outstanding: Set[int] = set()
+        self.synced = False
+
+
+class NonceAllocator:
+    """
+    Hands out consecutive nonces per address.
+
+    :param fetch: returns the next nonce of an address from the chain,
+        e.g. ``peniwallet.getNonce``
+    """
+
+    def __init__(self, fetch: Callable[[str], int]):
+        self.fetch = fetch
+        self.fetches = 0
+        self._states: Dict[str, _AddressState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, address: str) -> _AddressState:
+        key = address.lower()
+        state = self._states.get(key)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(key, _AddressState())
+        return state
+
+    def _sync(self, address: str, state: _AddressState) -> None:
+        self.fetches += 1
+        state.next = self.fetch(address)
+        state.outstanding.clear()
+        state.synced = True
+
+    def reserve(self, address: str) -> int:
+        """
+        Reserves the next nonce of ``address``.
+        """
+        return self.reserve_many(address, 1)[0]
+
+    def reserve_many(self, address: str, count: int) -> List[int]:
+        """
+        Reserves ``count`` consecutive nonces of ``address``.
+        """
+        state = self._state(address)
+        with state.lock:
+            if not state.synced:
+                self._sync(address, state)
+            nonces = list(range(state.next, state.next + count))
+            state.next += count
+            state.outstanding.update(nonces)
+            return nonces
+
+    def confirm(self, address: str, nonce: int) -> None:
+        """
+        Marks a reserved nonce as used on chain. Confirming a nonce that
+        was never reserved means the local view has a gap, so the next
+        reservation resyncs.
+        """
+        state = self._state(address)
+        with state.lock:
+            if nonce in state.outstanding:
+                state.outstanding.discard(nonce)
+            else:
+                state.synced = False
+
+    def fail(self, address: str, nonce: int) -> None:
+        """
+        Reports a reserved nonce whose call reverted or was never sent.
+
+        Every later nonce of the address will be rejected with "Invalid
+        nonce" as well, so the next reservation resyncs from the chain and
+        the caller has to re-sign those intents.
+        """
+        state = self._state(address)
+        with state.lock:
+            state.outstanding.discard(nonce)
+            state.synced = False
+
+    def resync(self, address: str) -> int:
+        """
+        Reads the nonce of ``address`` from the chain and returns it.
+        """
+        state = self._state(address)
+        with state.lock:
+            self._sync(address, state)
+            return state.next
+
+    def outstanding(self, address: str) -> List[int]:
+        """
+        Returns the reserved nonces that are neither confirmed nor failed.
+        """
+        state = self._state(address)
+        with state.lock:
+            return sorted(state.outstanding)
+
+
+class NonceManager:
+    """
+    Keeps the two nonce sequences a relayer deals with apart.
+
+    :param intent_nonces: reads ``Peniwallet.getNonce``, the nonces users sign
+    :param account_nonces: reads the pending transaction count of the
+        relayer accounts, the nonces of the transactions that carry the calls
+    """
+
+    def __init__(
+        self,
+        intent_nonces: Callable[[str], int],
+        account_nonces: Callable[[str], int],
+    ):
+        self.intents = NonceAllocator(intent_nonces)
+        self.transactions = NonceAllocator(account_nonces)
+
+    @classmethod
+    def for_contract(cls, peniwallet, web3) -> "NonceManager":
+        """
+        Builds the manager from an ape Peniwallet instance and a web3
+        connection to the same node.
+        """
+        return cls(
+            lambda address: peniwallet.getNonce(address),
+            lambda address: web3.eth.get_transaction_count(address, "pending"),
+        )
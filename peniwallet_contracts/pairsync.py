@@ -0,0 +1,129 @@
+"""
+Keeps Peniwallet's fee pair cache in step with the PancakeSwap factory.
+
+``_calculateMinFee`` reads a token's WBNB and USDT pairs from the
+``feePairs`` cache and only asks the factory for pairs that are not
+cached. ``registerProject`` caches the pairs that exist when a project is
+registered; pairs created later, and tokens that were never registered,
+need an admin ``cachePairs`` call. ``PairSync`` finds those tokens in one
+batched read of the factory and the cache, then sends ``cachePairs`` for
+them in chunks.
+
+    with EventIndexer("events.db", reader, peniwallet.address) as indexer:
+        indexer.sync()
+        sync = PairSync(reader, peniwallet.address)
+        sync.sync(sync.tokens(indexer), contract_sender(peniwallet, sender=admin))
+"""
+
+from typing import Callable, Iterable, List, NamedTuple, Sequence, Tuple
+
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.eip712 import Address
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.reads import BatchReader, call
+
+# sends cachePairs(tokens) and returns the transaction hash (or receipt)
+Sender = Callable[[List[str]], object]
+
+
+class PairState(NamedTuple):
+    """
+    A token's fee pairs on the factory and in Peniwallet's cache.
+    """
+
+    token: str
+    bnb_pair: str
+    usdt_pair: str
+    cached_bnb_pair: str
+    cached_usdt_pair: str
+
+    @property
+    def stale(self) -> bool:
+        """
+        True when the factory has a pair the cache does not.
+        """
+        return (self.bnb_pair, self.usdt_pair) != (self.cached_bnb_pair, self.cached_usdt_pair)
+
+
+class PairSync:
+    """
+    :param reader: ``BatchReader`` for the chain Peniwallet is on
+    :param peniwallet: address of the Peniwallet deployment
+    :param chunk_size: tokens per ``cachePairs`` transaction; each new
+        token costs roughly 60k gas (two getPair calls, two new storage
+        slots and the event)
+    """
+
+    def __init__(self, reader: BatchReader, peniwallet: Address, chunk_size: int = 50):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.reader = reader
+        self.peniwallet = to_checksum_address(peniwallet)
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def tokens(indexer: EventIndexer) -> List[str]:
+        """
+        Every token registered as a project, from the indexed
+        ``ProjectRegistered`` events.
+        """
+        return sorted(indexer.projects())
+
+    def config(self, block=None) -> Tuple[str, str, str]:
+        """
+        (factory, WBNB, USDT) as Peniwallet resolved them.
+        """
+        factory, weth, usdt = self.reader.values([
+            call(self.peniwallet, signature, [], ("address",))
+            for signature in ("PancakeSwapFactoryAddress()", "WETH()", "USDT()")
+        ], block)
+        return factory, weth, usdt
+
+    def discover(self, tokens: Iterable[Address], block=None) -> List[PairState]:
+        """
+        Reads the factory pairs and the cached pairs of ``tokens`` in one
+        batch, pinned to one block.
+        """
+        addresses = [to_checksum_address(token) for token in tokens]
+        factory, weth, usdt = self.config(block)
+        calls = []
+        for token in addresses:
+            calls.append(call(factory, "getPair(address,address)", [token, weth], ("address",)))
+            calls.append(call(factory, "getPair(address,address)", [token, usdt], ("address",)))
+            calls.append(call(self.peniwallet, "feePairs(address)", [token], ("address", "address")))
+        values = iter(self.reader.values(calls, block))
+        states = []
+        for token in addresses:
+            bnb_pair, usdt_pair, cached = next(values), next(values), next(values)
+            states.append(PairState(token, bnb_pair, usdt_pair, *cached))
+        return states
+
+    def stale(self, tokens: Iterable[Address], block=None) -> List[str]:
+        """
+        Tokens whose cached pairs are missing or behind the factory.
+        """
+        return [state.token for state in self.discover(tokens, block) if state.stale]
+
+    def chunks(self, tokens: Sequence[str]) -> List[List[str]]:
+        return [list(tokens[start:start + self.chunk_size]) for start in range(0, len(tokens), self.chunk_size)]
+
+    def sync(self, tokens: Iterable[Address], send: Sender, block=None) -> List[object]:
+        """
+        Sends ``cachePairs`` for the stale tokens, ``chunk_size`` at a
+        time, and returns what ``send`` returned for each chunk.
+        """
+        return [send(chunk) for chunk in self.chunks(self.stale(tokens, block))]
+
+
+def contract_sender(peniwallet, **tx_kwargs) -> Sender:
+    """
+    A ``Sender`` calling ``cachePairs`` on an ape contract instance,
+    e.g. ``contract_sender(peniwallet, sender=admin)``.
+    """
+
+    def send(tokens: List[str]):
+        return peniwallet.cachePairs(tokens, **tx_kwargs)
+
+    return send
+
@@ -0,0 +1,176 @@
+"""
+Dry runs of relayed calls before they are broadcast.
+
+Each call is simulated with ``eth_call`` against the pending block, from
+the relayer account, together with the ``estimateFees`` quote for it, in
+a single batch request. Reverts are mapped to error codes so callers can
+drop (or report) calls that would fail instead of paying gas for them.
+"""
+
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts import calldata
+from peniwallet_contracts.eip712 import Address
+from peniwallet_contracts.fees import SPRAY, SWAP, TRANSFER
+from peniwallet_contracts.reads import selector
+
+# error codes
+OK = "OK"
+EXPIRED = "EXPIRED"
+BAD_NONCE = "BAD_NONCE"
+BAD_SIGNATURE = "BAD_SIGNATURE"
+INSUFFICIENT_BALANCE = "INSUFFICIENT_BALANCE"
+INSUFFICIENT_ALLOWANCE = "INSUFFICIENT_ALLOWANCE"
+SPRAY_REPLAYED = "SPRAY_REPLAYED"
+TOO_MANY_RECIPIENTS = "TOO_MANY_RECIPIENTS"
+NO_FEE_PAIR = "NO_FEE_PAIR"
+SWAP_FAILED = "SWAP_FAILED"
+AMOUNT_TOO_LARGE = "AMOUNT_TOO_LARGE"
+REVERTED = "REVERTED"
+RPC_ERROR = "RPC_ERROR"
+
+# revert reason fragment -> code, matched case-insensitively in order
+REVERT_CODES = (
+    ("Transaction has expired", EXPIRED),
+    ("Invalid nonce", BAD_NONCE),
+    ("Invalid signature", BAD_SIGNATURE),
+    ("Insufficient balance", INSUFFICIENT_BALANCE),
+    ("Insufficient allowance", INSUFFICIENT_ALLOWANCE),
+    ("Spray already executed", SPRAY_REPLAYED),
+    ("Recipient list is too long", TOO_MANY_RECIPIENTS),
+    ("No Supported Pairs exists for the token", NO_FEE_PAIR),
+    ("Pancake", SWAP_FAILED),
+)
+
+REVERT_PREFIXES = (
+    "execution reverted: ",
+    "VM Exception while processing transaction: revert ",
+    "reverted with reason string ",
+)
+
+# Error(string)
+ERROR_SELECTOR = "08c379a0"
+
+
+class RelayCall(NamedTuple):
+    """
+    Calldata for a Peniwallet entry point plus what ``estimateFees``
+    needs to quote it.
+    """
+
+    data: bytes
+    token: str
+    amount: int
+    tx_type: int
+    gas: int
+
+
+class PreflightResult(NamedTuple):
+    ok: bool
+    code: str
+    reason: Optional[str]
+    fee: Optional[int]
+
+
+def transfer_call(message: Mapping[str, Any], signature, gas: int) -> RelayCall:
+    return RelayCall(
+        calldata.encode_transfer(message, signature, gas),
+        message['token'], message['amount'], TRANSFER, gas)
+
+
+def swap_tokens_for_bnb_call(path: Sequence[Address], message: Mapping[str, Any], signature, gas: int) -> RelayCall:
+    return RelayCall(
+        calldata.encode_swap_tokens_for_bnb(path, message, signature, gas),
+        to_checksum_address(path[0]), message['amountA'], SWAP, gas)
+
+
+def swap_tokens_for_tokens_call(path: Sequence[Address], message: Mapping[str, Any], signature, gas: int) -> RelayCall:
+    return RelayCall(
+        calldata.encode_swap_tokens_for_tokens(path, message, signature, gas),
+        to_checksum_address(path[0]), message['amountA'], SWAP, gas)
+
+
+def spray_token_call(message: Mapping[str, Any], name: str, signature, gas: int) -> RelayCall:
+    # the fee is charged on the whole spray
+    return RelayCall(
+        calldata.encode_spray_token(message, name, signature, gas),
+        message['token'], message['amount'] * len(message['receivers']), SPRAY, gas)
+
+
+def revert_reason(error: Dict[str, Any]) -> str:
+    """
+    The revert string from a JSON-RPC error, from the ``Error(string)``
+    payload when the node returns one, else from the message.
+    """
+    data = error.get("data")
+    if isinstance(data, dict):
+        # ganache nests the payload
+        data = data.get("data") or data.get("result") or next(
+            (item.get("return") for item in data.values() if isinstance(item, dict)), None)
+    if isinstance(data, str) and data[2:10] == ERROR_SELECTOR:
+        return decode(["string"], bytes.fromhex(data[10:]))[0]
+    message = str(error.get("message", ""))
+    for prefix in REVERT_PREFIXES:
+        if prefix in message:
+            return message.split(prefix, 1)[1].strip("'\"")
+    return message
+
+
+def classify(reason: str) -> str:
+    lowered = reason.lower()
+    for fragment, code in REVERT_CODES:
+        if fragment.lower() in lowered:
+            return code
+    return REVERTED
+
+
+def _is_revert(error: Dict[str, Any]) -> bool:
+    return error.get("code") == 3 or "revert" in str(error.get("message", "")).lower()
+
+
+class Preflight:
+    """
+    :param transport: ``HTTPTransport`` or ``WebSocketTransport``
+    :param peniwallet: address of the Peniwallet deployment
+    :param sender: the relayer address the calls will come from
+    :param block: block tag to simulate against
+    """
+
+    def __init__(self, transport, peniwallet: Address, sender: Address, block: str = "pending"):
+        self.transport = transport
+        self.peniwallet = peniwallet
+        self.sender = sender
+        self.block = block
+
+    def _fee_request(self, call: RelayCall):
+        data = selector("estimateFees(address,uint256,uint256,uint256)") + encode(
+            ["address", "uint256", "uint256", "uint256"], [call.token, call.amount, call.tx_type, call.gas])
+        return ("eth_call", [{"to": self.peniwallet, "data": "0x" + data.hex()}, self.block])
+
+    async def check(self, calls: Sequence[RelayCall]) -> List[PreflightResult]:
+        """
+        Simulates the calls and quotes their fees, one batch request for all.
+        """
+        requests = []
+        for call in calls:
+            requests.append(("eth_call", [
+                {"from": self.sender, "to": self.peniwallet, "data": "0x" + call.data.hex()}, self.block]))
+            requests.append(self._fee_request(call))
+        answers = await self.transport.batch(requests)
+
+        results = []
+        for simulated, quoted in zip(answers[::2], answers[1::2]):
+            fee = None
+            if "error" not in quoted:
+                fee = decode(["uint256"], bytes.fromhex(quoted["result"][2:]))[0]
+            if "error" not in simulated:
+                results.append(PreflightResult(True, OK, None, fee))
+                continue
+            error = simulated["error"]
+            reason = revert_reason(error)
+            code = classify(reason) if _is_revert(error) else RPC_ERROR
+            results.append(PreflightResult(False, code, reason, fee))
+        return results
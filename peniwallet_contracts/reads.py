@@ -0,0 +1,236 @@
+"""
+Batched view calls over JSON-RPC.
+
+View calls are ABI-encoded locally and sent as JSON-RPC batch requests of
+``eth_call``, ``chunk_size`` calls per HTTP request and at most
+``concurrency`` requests in flight. Results come back decoded and in the
+order the calls were given.
+"""
+
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import requests
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+
+from peniwallet_contracts.metrics import NO_METRICS, NONCE_READ, Metrics
+
+
+@lru_cache(maxsize=None)
+def selector(signature: str) -> bytes:
+    """
+    Returns the 4-byte selector of e.g. ``"balanceOf(address)"``.
+    """
+    return keccak(signature.encode())[:4]
+
+
+class Call(NamedTuple):
+    to: str
+    data: bytes
+    decode: Callable[[bytes], Any]
+
+
+class ReadResult(NamedTuple):
+    success: bool
+    value: Any
+    error: Optional[str] = None
+
+
+class Fee(NamedTuple):
+    """
+    ``Peniwallet.Fee``
+    """
+
+    owner: str
+    token: str
+    balance: int
+    last_withdrawal: int
+
+
+class RPCError(Exception):
+    """
+    Raised when a JSON-RPC request fails as a whole.
+    """
+
+
+def _argument_types(signature: str) -> List[str]:
+    inner = signature[signature.index("(") + 1:-1]
+    return [arg for arg in inner.split(",") if arg]
+
+
+def _decoder(outputs: Sequence[str], wrap: Optional[Callable] = None) -> Callable[[bytes], Any]:
+    outputs = tuple(outputs)
+
+    def _decode(data: bytes) -> Any:
+        values = decode(outputs, data)
+        values = tuple(
+            to_checksum_address(value) if kind == "address" else value
+            for kind, value in zip(outputs, values)
+        )
+        if wrap is not None:
+            return wrap(*values)
+        return values[0] if len(values) == 1 else values
+
+    return _decode
+
+
+def call(to: str, signature: str, args: Sequence[Any] = (), outputs: Sequence[str] = ("uint256",),
+         wrap: Optional[Callable] = None) -> Call:
+    """
+    Builds a view call, e.g. ``call(token, "balanceOf(address)", [holder])``.
+    """
+    data = selector(signature) + encode(_argument_types(signature), list(args))
+    return Call(to, data, _decoder(outputs, wrap))
+
+
+def _fee_from_tuple(fee: Tuple[str, str, int, int]) -> Fee:
+    return Fee(to_checksum_address(fee[0]), to_checksum_address(fee[1]), fee[2], fee[3])
+
+
+class BatchReader:
+    """
+    Sends view calls to a node as JSON-RPC batches.
+
+    :param rpc_url: HTTP endpoint of the node
+    :param chunk_size: calls per batch request
+    :param concurrency: batch requests in flight at once
+    :param block: default block tag or number for the calls
+    :param timeout: seconds per HTTP request
+    :param metrics: ``Metrics`` timing ``nonces`` reads
+    """
+
+    def __init__(
+        self,
+        rpc_url: str,
+        chunk_size: int = 500,
+        concurrency: int = 4,
+        block: Any = "latest",
+        timeout: float = 30,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.rpc_url = rpc_url
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.block = block
+        self.timeout = timeout
+        self.metrics = NO_METRICS if metrics is None else metrics
+        self._ids = itertools.count()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, payload: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        response = self._session().post(self.rpc_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if isinstance(body, dict):
+            # some nodes answer a rejected batch with a single error object
+            raise RPCError(body.get("error", body))
+        by_id = {item["id"]: item for item in body}
+        return [by_id[request["id"]] for request in payload]
+
+    def request(self, batch: Sequence[Tuple[str, List[Any]]]) -> List[Dict[str, Any]]:
+        """
+        Sends (method, params) pairs as JSON-RPC batches and returns the raw
+        response objects in request order.
+        """
+        payload = [
+            {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+            for method, params in batch
+        ]
+        chunks = [
+            payload[start:start + self.chunk_size]
+            for start in range(0, len(payload), self.chunk_size)
+        ]
+        if len(chunks) <= 1 or self.concurrency <= 1:
+            return [item for chunk in chunks for item in self._post(chunk)]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return [item for answered in pool.map(self._post, chunks) for item in answered]
+
+    def execute(self, calls: Iterable[Call], block: Any = None) -> List[ReadResult]:
+        """
+        Runs the calls and decodes their results. A reverted call gives a
+        failed ``ReadResult`` rather than failing the batch.
+        """
+        calls = list(calls)
+        tag = self.block if block is None else block
+        if isinstance(tag, int):
+            tag = hex(tag)
+        responses = self.request([
+            ("eth_call", [{"to": c.to, "data": "0x" + c.data.hex()}, tag]) for c in calls
+        ])
+
+        results = []
+        for item, c in zip(responses, calls):
+            if "error" in item:
+                results.append(ReadResult(False, None, item["error"].get("message")))
+                continue
+            data = bytes.fromhex(item["result"][2:])
+            try:
+                results.append(ReadResult(True, c.decode(data)))
+            except Exception as error:
+                results.append(ReadResult(False, None, f"undecodable result: {error}"))
+        return results
+
+    def values(self, calls: Iterable[Call], block: Any = None) -> List[Any]:
+        """
+        Like ``execute`` but returns bare values, raising on the first
+        failed call.
+        """
+        values = []
+        for result in self.execute(calls, block):
+            if not result.success:
+                raise RPCError(result.error)
+            values.append(result.value)
+        return values
+
+    def balances(self, token: str, holders: Iterable[str], block: Any = None) -> List[int]:
+        return self.values((call(token, "balanceOf(address)", [h]) for h in holders), block)
+
+    def allowances(self, token: str, pairs: Iterable[Tuple[str, str]], block: Any = None) -> List[int]:
+        return self.values(
+            (call(token, "allowance(address,address)", [owner, spender]) for owner, spender in pairs),
+            block,
+        )
+
+    def nonces(self, peniwallet: str, users: Iterable[str], block: Any = None) -> List[int]:
+        with self.metrics.span(NONCE_READ):
+            return self.values((call(peniwallet, "getNonce(address)", [u]) for u in users), block)
+
+    def admins(self, peniwallet: str, addresses: Iterable[str], block: Any = None) -> List[bool]:
+        return self.values(
+            (call(peniwallet, "admins(address)", [a], ("bool",)) for a in addresses), block)
+
+    def fees(self, peniwallet: str, pairs: Iterable[Tuple[str, str]], block: Any = None) -> List[Fee]:
+        """
+        ``fees(owner, token)`` for (owner, token) pairs.
+        """
+        return self.values(
+            (
+                call(peniwallet, "fees(address,address)", [owner, token],
+                     ("address", "address", "uint256", "uint256"), Fee)
+                for owner, token in pairs
+            ),
+            block,
+        )
+
+    def fees_by_address(self, peniwallet: str, pairs: Iterable[Tuple[str, str]], block: Any = None) -> List[Fee]:
+        """
+        ``getFeeByAddress(owner, token)`` for (owner, token) pairs.
+        """
+        return self.values(
+            (
+                call(peniwallet, "getFeeByAddress(address,address)", [owner, token],
+                     ("(address,address,uint256,uint256)",), _fee_from_tuple)
+                for owner, token in pairs
+            ),
+            block,
+        )
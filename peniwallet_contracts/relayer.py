@@ -0,0 +1,561 @@
+"""
+Asyncio client for submitting Peniwallet meta-transactions.
+
+Calls are signed locally as raw transactions by the relayer account and
+sent concurrently. A bounded window limits how many of the account's
+transactions are in flight, sends wait while the node's pending pool is
+above ``max_pending``, and one background task polls receipts for every
+pending transaction with a single batch request per tick.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import aiohttp
+from eth_account.signers.local import LocalAccount
+
+from peniwallet_contracts import calldata
+from peniwallet_contracts.bundler import TransferBundle
+from peniwallet_contracts.eip712 import Address
+from peniwallet_contracts.metrics import (
+    ABI_ENCODE,
+    BROADCAST,
+    NO_METRICS,
+    NONCE_READ,
+    RECEIPT_WAIT,
+    SIGN_TRANSACTION,
+    Metrics,
+)
+from peniwallet_contracts.nonces import NonceAllocator
+from peniwallet_contracts.preflight import Preflight, PreflightResult, RelayCall
+from peniwallet_contracts.reads import RPCError
+from peniwallet_contracts.replay import ReplayCache
+
+logger = logging.getLogger(__name__)
+
+# errors a node returns when its pool cannot take more transactions
+POOL_FULL_ERRORS = ("txpool is full", "transaction pool is full", "too many pending")
+
+# errors a node returns when it already holds this exact signed transaction
+KNOWN_ERRORS = ("already known", "known transaction")
+
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "incorrect nonce",
+    "replacement transaction underpriced",
+)
+
+
+class HTTPTransport:
+    """
+    JSON-RPC over a pooled aiohttp session.
+
+    :param url: HTTP endpoint of the node
+    :param connections: size of the connection pool
+    :param timeout: seconds per request
+    """
+
+    def __init__(self, url: str, connections: int = 32, timeout: float = 30):
+        self.url = url
+        self.connections = connections
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def batch(self, calls: Sequence[Tuple[str, List[Any]]]) -> List[Dict[str, Any]]:
+        """
+        Sends (method, params) pairs in one request, returns the raw
+        responses in request order.
+        """
+        payload = [
+            {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+            for method, params in calls
+        ]
+        async with self._client().post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json(content_type=None)
+        if isinstance(body, dict):
+            raise RPCError(body.get("error", body))
+        by_id = {item["id"]: item for item in body}
+        return [by_id[request["id"]] for request in payload]
+
+    async def request(self, method: str, params: List[Any]) -> Any:
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+        async with self._client().post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json(content_type=None)
+        if "error" in body:
+            raise RPCError(body["error"].get("message", body["error"]))
+        return body["result"]
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class WebSocketTransport:
+    """
+    JSON-RPC over one websocket, with responses matched to requests by id.
+
+    :param url: websocket endpoint of the node
+    :param timeout: seconds per request
+    """
+
+    def __init__(self, url: str, timeout: float = 30):
+        self.url = url
+        self.timeout = timeout
+        self._ids = itertools.count()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._socket: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._waiting: Dict[int, asyncio.Future] = {}
+        # created in the running loop, on Python 3.9 a lock binds to the
+        # loop that is current when it is created
+        self._connecting: Optional[asyncio.Lock] = None
+
+    async def _connect(self) -> aiohttp.ClientWebSocketResponse:
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._socket is None or self._socket.closed:
+                self._session = self._session or aiohttp.ClientSession()
+                self._socket = await self._session.ws_connect(self.url, max_msg_size=0)
+                self._reader = asyncio.get_running_loop().create_task(self._read(self._socket))
+        return self._socket
+
+    async def _read(self, socket: aiohttp.ClientWebSocketResponse) -> None:
+        async for message in socket:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            body = json.loads(message.data)
+            for item in body if isinstance(body, list) else [body]:
+                future = self._waiting.pop(item.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(item)
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(RPCError("websocket closed"))
+        self._waiting.clear()
+
+    async def batch(self, calls: Sequence[Tuple[str, List[Any]]]) -> List[Dict[str, Any]]:
+        socket = await self._connect()
+        loop = asyncio.get_running_loop()
+        payload = []
+        futures = []
+        for method, params in calls:
+            request_id = next(self._ids)
+            future = self._waiting[request_id] = loop.create_future()
+            futures.append(future)
+            payload.append({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        await socket.send_str(json.dumps(payload))
+        return list(await asyncio.wait_for(asyncio.gather(*futures), self.timeout))
+
+    async def request(self, method: str, params: List[Any]) -> Any:
+        (body,) = await self.batch([(method, params)])
+        if "error" in body:
+            raise RPCError(body["error"].get("message", body["error"]))
+        return body["result"]
+
+    async def close(self) -> None:
+        if self._socket is not None:
+            await self._socket.close()
+        if self._reader is not None:
+            await self._reader
+        if self._session is not None:
+            await self._session.close()
+        self._socket = self._reader = self._session = None
+
+
+def transport_for(url: str, **kwargs):
+    """
+    Picks the transport from the URL scheme.
+    """
+    if url.startswith(("ws://", "wss://")):
+        return WebSocketTransport(url, **kwargs)
+    return HTTPTransport(url, **kwargs)
+
+
+def _raw(signed) -> bytes:
+    # eth-account renamed rawTransaction to raw_transaction
+    return getattr(signed, "raw_transaction", None) or signed.rawTransaction
+
+
+class AsyncRelayer:
+    """
+    Sends Peniwallet calls from one relayer account.
+
+    :param transport: ``HTTPTransport`` or ``WebSocketTransport``
+    :param account: the relayer account paying for gas
+    :param chain_id: chain id used for transaction signing
+    :param peniwallet: address of the Peniwallet deployment
+    :param window: transactions of this account in flight at once
+    :param max_pending: pause sending while the node reports more pending
+        transactions than this, None to skip the check
+    :param gas_limit: gas limit of relayed transactions, unless a call
+        gives its own
+    :param gas_price: fixed gas price, read from the node when None
+    :param poll_interval: seconds between receipt polls
+    :param replay: ``ReplayCache`` that ``send_checked`` consults before
+        simulating, None to leave replays to preflight
+    :param gas_oracle: ``GasOracle`` told the gas used by every successful
+        Peniwallet call this relayer sends
+    :param metrics: ``Metrics`` timing the relayer's nonce reads,
+        transaction signing, broadcasts and receipt waits, and calldata
+        encoding in ``transfer`` and friends
+    :param keep_receipts: receipts kept for ``wait`` after they arrived,
+        the oldest are dropped beyond this
+    """
+
+    def __init__(
+        self,
+        transport,
+        account: LocalAccount,
+        chain_id: int,
+        peniwallet: Address,
+        window: int = 16,
+        max_pending: Optional[int] = None,
+        gas_limit: int = 1_500_000,
+        gas_price: Optional[int] = None,
+        poll_interval: float = 0.2,
+        replay: Optional[ReplayCache] = None,
+        gas_oracle=None,
+        metrics: Optional[Metrics] = None,
+        keep_receipts: int = 4096,
+    ):
+        self.transport = transport
+        self.account = account
+        self.chain_id = chain_id
+        self.peniwallet = peniwallet
+        self.window = window
+        self.max_pending = max_pending
+        self.gas_limit = gas_limit
+        self.gas_price = gas_price
+        self.poll_interval = poll_interval
+        self.replay = replay
+        self.gas_oracle = gas_oracle
+        self.metrics = NO_METRICS if metrics is None else metrics
+        self.keep_receipts = keep_receipts
+
+        # both are created in the running loop, see WebSocketTransport
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._nonce_lock: Optional[asyncio.Lock] = None
+        self._chain_nonce = 0
+        self._nonces = NonceAllocator(lambda address: self._chain_nonce)
+        self._nonce_stale = True
+        # tx hash -> receipt future, while the receipt is polled for
+        self._receipts: Dict[str, asyncio.Future] = {}
+        # tx hash -> resolved receipt future, until ``wait`` collects it
+        self._landed: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self._calldata: Dict[str, bytes] = {}
+        # tx hash -> calldata admitted to the replay cache by send_checked
+        self._admitted: Dict[str, bytes] = {}
+        # tx hash -> (perf_counter at broadcast, trace id)
+        self._sent: Dict[str, Tuple[float, Optional[int]]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._pool_checked = 0.0
+        self._pool_full = False
+        self._gas_price_checked = 0.0
+        self._cached_gas_price = 0
+
+    async def __aenter__(self) -> "AsyncRelayer":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        await self.transport.close()
+
+    async def _next_nonce(self) -> int:
+        if self._nonce_lock is None:
+            self._nonce_lock = asyncio.Lock()
+        async with self._nonce_lock:
+            if self._nonce_stale:
+                with self.metrics.span(NONCE_READ):
+                    self._chain_nonce = int(await self.transport.request(
+                        "eth_getTransactionCount", [self.account.address, "pending"]), 16)
+                self._nonces.resync(self.account.address)
+                self._nonce_stale = False
+            return self._nonces.reserve(self.account.address)
+
+    async def _current_gas_price(self) -> int:
+        if self.gas_price is not None:
+            return self.gas_price
+        now = time.monotonic()
+        if not self._cached_gas_price or now - self._gas_price_checked > 3:
+            self._cached_gas_price = int(await self.transport.request("eth_gasPrice", []), 16)
+            self._gas_price_checked = now
+        return self._cached_gas_price
+
+    async def _wait_for_pool(self) -> None:
+        if self.max_pending is None:
+            return
+        while True:
+            now = time.monotonic()
+            if now - self._pool_checked >= self.poll_interval:
+                self._pool_checked = now
+                try:
+                    status = await self.transport.request("txpool_status", [])
+                except RPCError:
+                    # the node does not expose its pool, rely on the window only
+                    self.max_pending = None
+                    return
+                self._pool_full = int(status.get("pending", "0x0"), 16) > self.max_pending
+            if not self._pool_full:
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    async def send(self, data: bytes, value: int = 0, to: Optional[Address] = None,
+                   gas_limit: Optional[int] = None) -> str:
+        """
+        Signs and broadcasts a call to Peniwallet (or to ``to``), returns
+        its hash. Waits for a free slot in the window first; the slot is
+        released when the receipt arrives.
+
+        :param gas_limit: gas limit of this call, ``self.gas_limit`` when None
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.window)
+        await self._slots.acquire()
+        try:
+            return await self._send(data, value, self.peniwallet if to is None else to,
+                                    self.gas_limit if gas_limit is None else gas_limit)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _send(self, data: bytes, value: int, to: Address, gas_limit: int) -> str:
+        backoff = self.poll_interval
+        nonce_retries = 5
+        while True:
+            await self._wait_for_pool()
+            nonce = await self._next_nonce()
+            transaction = {
+                "to": to,
+                "data": data,
+                "value": value,
+                "gas": gas_limit,
+                "gasPrice": await self._current_gas_price(),
+                "nonce": nonce,
+                "chainId": self.chain_id,
+            }
+            with self.metrics.span(SIGN_TRANSACTION):
+                signed = self.account.sign_transaction(transaction)
+            try:
+                with self.metrics.span(BROADCAST):
+                    tx_hash = await self.transport.request(
+                        "eth_sendRawTransaction", ["0x" + _raw(signed).hex().removeprefix("0x")])
+            except (RPCError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                tx_hash = "0x" + signed.hash.hex().removeprefix("0x")
+                if isinstance(error, RPCError):
+                    # the node has this very transaction, e.g. from a retried request
+                    if any(text in str(error).lower() for text in KNOWN_ERRORS):
+                        return self._sent_as(tx_hash, nonce, data, to)
+                elif await self._accepted(tx_hash):
+                    # the node took the transaction before the connection
+                    # failed; then it is sent, not failed
+                    return self._sent_as(tx_hash, nonce, data, to)
+                # the nonce was not used, or it is unknown whether it was;
+                # the pending nonce is read again before any is handed out
+                self._nonces.fail(self.account.address, nonce)
+                self._nonce_stale = True
+                if not isinstance(error, RPCError):
+                    raise
+                reason = str(error).lower()
+                if any(text in reason for text in NONCE_ERRORS) and nonce_retries:
+                    nonce_retries -= 1
+                    continue
+                if any(text in reason for text in POOL_FULL_ERRORS):
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 5)
+                    continue
+                raise
+            return self._sent_as(tx_hash, nonce, data, to)
+
+    async def _accepted(self, tx_hash: str) -> bool:
+        """
+        Tells whether the node knows a transaction, False when that cannot
+        be found out either.
+        """
+        try:
+            found = await self.transport.request("eth_getTransactionByHash", [tx_hash])
+        except (RPCError, aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+        return found is not None
+
+    def _sent_as(self, tx_hash: str, nonce: int, data: bytes, to: Address) -> str:
+        self._nonces.confirm(self.account.address, nonce)
+        if self.gas_oracle is not None and to == self.peniwallet:
+            self._calldata[tx_hash] = data
+        self._sent[tx_hash] = (time.perf_counter(), self.metrics.current_trace())
+        self._watch(tx_hash)
+        return tx_hash
+
+    def _watch(self, tx_hash: str) -> None:
+        self._receipts[tx_hash] = asyncio.get_running_loop().create_future()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self) -> None:
+        while self._receipts:
+            await asyncio.sleep(self.poll_interval)
+            hashes = list(self._receipts)
+            try:
+                answers = await self.transport.batch(
+                    [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in hashes])
+            except (RPCError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                # the receipts are asked for again on the next tick
+                logger.warning("Receipt poll failed: %r", error)
+                continue
+            for tx_hash, answer in zip(hashes, answers):
+                receipt = answer.get("result")
+                if receipt is None and "error" not in answer:
+                    continue
+                future = self._receipts.pop(tx_hash)
+                data = self._calldata.pop(tx_hash, None)
+                admitted = self._admitted.pop(tx_hash, None)
+                sent, trace = self._sent.pop(tx_hash)
+                self._land(tx_hash, future)
+                if self._slots is not None:
+                    self._slots.release()
+                failed = "error" in answer or receipt.get("status") != "0x1"
+                self.metrics.record(RECEIPT_WAIT, sent, time.perf_counter() - sent, trace, failed)
+                if admitted is not None and failed and self.replay is not None:
+                    # the call did not go through, its signer may submit it again
+                    self.replay.release(admitted)
+                if "error" in answer:
+                    future.set_exception(RPCError(answer["error"].get("message")))
+                    continue
+                if data is not None and receipt.get("status") == "0x1":
+                    self.gas_oracle.observe(data, int(receipt["gasUsed"], 16))
+                future.set_result(receipt)
+
+    def _land(self, tx_hash: str, future: asyncio.Future) -> None:
+        self._landed[tx_hash] = future
+        while len(self._landed) > self.keep_receipts:
+            _, dropped = self._landed.popitem(last=False)
+            if not dropped.cancelled() and dropped.done():
+                # nobody is going to ask for it, do not warn about it
+                dropped.exception()
+
+    async def wait(self, tx_hash: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Waits for the receipt of a transaction sent by this relayer. A
+        receipt that already arrived is returned until it is collected,
+        for at most ``keep_receipts`` transactions.
+        """
+        future = self._receipts.get(tx_hash) or self._landed.get(tx_hash)
+        if future is None:
+            raise KeyError(f"{tx_hash} is not a pending or uncollected transaction of this relayer")
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            if future.done():
+                self._landed.pop(tx_hash, None)
+
+    async def relay(self, data: bytes, value: int = 0, timeout: Optional[float] = None,
+                    gas_limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Sends a call and waits for its receipt.
+        """
+        tx_hash = await self.send(data, value, gas_limit=gas_limit)
+        return await self.wait(tx_hash, timeout)
+
+    async def preflight(self, calls: Sequence[RelayCall]) -> List[PreflightResult]:
+        """
+        Simulates the calls from this relayer against the pending block.
+        Each call is simulated on its own, so a user's later nonces fail
+        with ``BAD_NONCE`` until the earlier call is pending.
+        """
+        return await Preflight(self.transport, self.peniwallet, self.account.address).check(calls)
+
+    async def send_checked(self, calls: Sequence[RelayCall]) -> List[Tuple[PreflightResult, Optional[str]]]:
+        """
+        Preflights the calls and broadcasts only those that would succeed.
+        Returns each preflight result with its transaction hash, None for
+        calls that were dropped. With a ``replay`` cache, certain replays
+        are dropped without being simulated, and calls that are dropped,
+        fail to send or revert are released from it again.
+        """
+        replayed = {}
+        if self.replay is not None:
+            for index, call in enumerate(calls):
+                code = self.replay.admit(call.data)
+                if code is not None:
+                    replayed[index] = PreflightResult(False, code, "replayed", None)
+
+        sent: List[Tuple[PreflightResult, Optional[str]]] = []
+        try:
+            checked = [call for index, call in enumerate(calls) if index not in replayed]
+            results = iter(await self.preflight(checked) if checked else ())
+            for index, call in enumerate(calls):
+                result = replayed.get(index) or next(results)
+                tx_hash = await self.send(call.data) if result.ok else None
+                if index not in replayed and self.replay is not None:
+                    if tx_hash is None:
+                        self.replay.release(call.data)
+                    else:
+                        self._admitted[tx_hash] = call.data
+                sent.append((result, tx_hash))
+        except BaseException:
+            # the call that raised and the ones after it were never broadcast
+            if self.replay is not None:
+                for index in range(len(sent), len(calls)):
+                    if index not in replayed:
+                        self.replay.release(calls[index].data)
+            raise
+        return sent
+
+    async def transfer(self, message: Mapping[str, Any], signature, gas: int) -> Dict[str, Any]:
+        with self.metrics.span(ABI_ENCODE):
+            data = calldata.encode_transfer(message, signature, gas)
+        return await self.relay(data)
+
+    async def swap_tokens_for_bnb(self, path, message, signature, gas: int) -> Dict[str, Any]:
+        with self.metrics.span(ABI_ENCODE):
+            data = calldata.encode_swap_tokens_for_bnb(path, message, signature, gas)
+        return await self.relay(data)
+
+    async def swap_tokens_for_tokens(self, path, message, signature, gas: int) -> Dict[str, Any]:
+        with self.metrics.span(ABI_ENCODE):
+            data = calldata.encode_swap_tokens_for_tokens(path, message, signature, gas)
+        return await self.relay(data)
+
+    async def spray_token(self, message, name: str, signature, gas: int) -> Dict[str, Any]:
+        with self.metrics.span(ABI_ENCODE):
+            data = calldata.encode_spray_token(message, name, signature, gas)
+        return await self.relay(data)
+
+    async def batch_transfer(self, bundle: TransferBundle, gas: int) -> Dict[str, Any]:
+        """
+        Sends a ``batchTransfer`` bundle, charging ``gas`` (in wei) per
+        transfer. The gas limit covers the bundle's estimate: each transfer
+        runs in a call that only gets 63/64 of the gas left, so a short
+        limit would skip the last transfers instead of failing the bundle.
+        """
+        with self.metrics.span(ABI_ENCODE):
+            data = bundle.data(gas)
+        return await self.relay(data, gas_limit=max(self.gas_limit, bundle.gas))
@@ -0,0 +1,263 @@
+"""
+Relayer-side replay protection for sprays and nonces.
+
+``sprayToken`` marks every signature in ``spraySignatures`` and
+``checkNonce`` makes each ``(from, nonce)`` usable once, but the relayer
+only learns about a replay when the transaction reverts. ``ReplayCache``
+rejects those calls before they are simulated or sent.
+
+Spray signatures go through two tiers: a Bloom filter sized for the whole
+spray history answers "never seen" without false negatives, and an exact
+LRU of recent signatures confirms duplicates. A signature the filter
+knows but the LRU has dropped is uncertain and is left to preflight (or
+the chain) to decide, so a false positive never rejects a valid spray.
+Nonces are checked against each sender's ``getNonce`` floor plus an exact
+LRU of the ``(from, nonce)`` pairs admitted since.
+
+Both tiers have fixed sizes, so memory stays bounded however much history
+is loaded; past ``expected_sprays`` the filter only gets less selective.
+"""
+
+import hashlib
+import math
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from peniwallet_contracts import calldata
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.preflight import BAD_NONCE, SPRAY_REPLAYED
+from peniwallet_contracts.reads import selector
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spray_signatures (tx TEXT PRIMARY KEY, digest BLOB);
+"""
+
+_TRANSFER = selector(calldata.TRANSFER)
+_SWAPS = (selector(calldata.SWAP_TOKENS_FOR_BNB), selector(calldata.SWAP_TOKENS_FOR_TOKENS))
+_SPRAY_TOKEN = selector(calldata.SPRAY_TOKEN)
+
+WORD = calldata.WORD
+
+
+class ReplayStats(NamedTuple):
+    hits: int
+    misses: int
+    uncertain: int
+    evictions: int
+    sprays: int
+    senders: int
+
+
+def _word(data: bytes, index: int) -> int:
+    start = 4 + index * WORD
+    return int.from_bytes(data[start:start + WORD], "big")
+
+
+def spray_signature(data: bytes) -> Optional[bytes]:
+    """
+    The ``_signature`` argument of ``sprayToken`` calldata, None for other calls.
+    """
+    if data[:4] != _SPRAY_TOKEN:
+        return None
+    start = 4 + _word(data, 6)
+    length = int.from_bytes(data[start:start + WORD], "big")
+    return bytes(data[start + WORD:start + WORD + length])
+
+
+def intent_nonce(data: bytes) -> Optional[Tuple[str, int]]:
+    """
+    The ``(from, nonce)`` of ``transfer`` or swap calldata, None for other calls.
+    """
+    if data[:4] == _TRANSFER:
+        sender, nonce = _word(data, 1), _word(data, 4)
+    elif data[:4] in _SWAPS:
+        sender, nonce = _word(data, 1), _word(data, 3)
+    else:
+        return None
+    return f"0x{sender:040x}", nonce
+
+
+class BloomFilter:
+    """
+    :param capacity: number of keys the filter is sized for
+    :param error_rate: false positive rate at ``capacity`` keys
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        # double hashing over the two halves of a 16 byte digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        size = self.size
+        return ((first + i * second) % size for i in range(self.hashes))
+
+    def add(self, digest: bytes) -> None:
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class ReplayCache:
+    """
+    :param expected_sprays: spray signatures the filter is sized for,
+        history included
+    :param error_rate: filter false positive rate at ``expected_sprays``
+    :param recent: spray signatures and ``(from, nonce)`` pairs kept exactly
+    :param senders: senders whose ``getNonce`` floor is kept
+    """
+
+    def __init__(self, expected_sprays: int = 1_000_000, error_rate: float = 1e-3, recent: int = 100_000,
+                 senders: int = 100_000):
+        self.filter = BloomFilter(expected_sprays, error_rate)
+        self.recent = recent
+        self.senders = senders
+        self._sprays: "OrderedDict[bytes, None]" = OrderedDict()
+        self._nonces: "OrderedDict[Tuple[str, int], None]" = OrderedDict()
+        self._floors: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.uncertain = 0
+        self.evictions = 0
+
+    @staticmethod
+    def digest(signature) -> bytes:
+        if isinstance(signature, str):
+            signature = bytes.fromhex(signature.removeprefix("0x"))
+        return hashlib.blake2b(signature, digest_size=16).digest()
+
+    def _remember(self, table: OrderedDict, key, value=None, limit: int = 0) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        if len(table) > limit:
+            table.popitem(last=False)
+            self.evictions += 1
+
+    def spray_seen(self, signature) -> Optional[bool]:
+        """
+        True if the signature was seen, False if it was not, None when only
+        the filter knows it and the chain has to decide.
+        """
+        digest = self.digest(signature)
+        if digest in self._sprays:
+            self._sprays.move_to_end(digest)
+            self.hits += 1
+            return True
+        if digest in self.filter:
+            self.uncertain += 1
+            return None
+        self.misses += 1
+        return False
+
+    def add_spray(self, signature) -> None:
+        digest = self.digest(signature)
+        self.filter.add(digest)
+        self._remember(self._sprays, digest, limit=self.recent)
+
+    def set_floor(self, sender: str, nonce: int) -> None:
+        """
+        Records that every nonce of ``sender`` below ``nonce`` is used.
+        """
+        sender = sender.lower()
+        self._remember(self._floors, sender, max(nonce, self._floors.get(sender, 0)), self.senders)
+
+    def nonce_used(self, sender: str, nonce: int) -> bool:
+        sender = sender.lower()
+        if nonce < self._floors.get(sender, 0) or (sender, nonce) in self._nonces:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add_nonce(self, sender: str, nonce: int) -> None:
+        self._remember(self._nonces, (sender.lower(), nonce), limit=self.recent)
+
+    def admit(self, data: bytes) -> Optional[str]:
+        """
+        Checks a relayed call and records it. Returns ``SPRAY_REPLAYED`` or
+        ``BAD_NONCE`` for a certain replay, None when the call may go on.
+        """
+        signature = spray_signature(data)
+        if signature is not None:
+            if self.spray_seen(signature):
+                return SPRAY_REPLAYED
+            self.add_spray(signature)
+            return None
+        intent = intent_nonce(data)
+        if intent is not None:
+            if self.nonce_used(*intent):
+                return BAD_NONCE
+            self.add_nonce(*intent)
+        return None
+
+    def release(self, data: bytes) -> None:
+        """
+        Forgets an admitted call that was dropped or reverted, so its
+        signer can submit it again. The filter keeps the signature, which
+        leaves it uncertain rather than rejected.
+        """
+        signature = spray_signature(data)
+        if signature is not None:
+            self._sprays.pop(self.digest(signature), None)
+            return
+        intent = intent_nonce(data)
+        if intent is not None:
+            self._nonces.pop(intent, None)
+
+    def stats(self) -> ReplayStats:
+        return ReplayStats(self.hits, self.misses, self.uncertain, self.evictions, self.filter.count,
+                           len(self._floors))
+
+    def warm(self, indexer: EventIndexer, senders: Iterable[str] = ()) -> ReplayStats:
+        """
+        Loads the spray history of ``indexer`` and the ``getNonce`` floors
+        of ``senders``, the transfer and swap senders the relayer expects.
+
+        ``SprayExecuted`` does not carry the signature, so it is read once
+        from the input of each spray transaction and kept in the indexer
+        database; later warm starts only fetch the sprays indexed since.
+        """
+        db = indexer.db
+        db.executescript(SCHEMA)
+        missing = [row[0] for row in db.execute(
+            "SELECT DISTINCT s.tx FROM sprays s LEFT JOIN spray_signatures g ON g.tx = s.tx "
+            "WHERE g.tx IS NULL")]
+        peniwallet = indexer.peniwallet.lower()
+        for start in range(0, len(missing), indexer.reader.chunk_size):
+            hashes = missing[start:start + indexer.reader.chunk_size]
+            answers = indexer.reader.request([("eth_getTransactionByHash", [tx]) for tx in hashes])
+            rows = []
+            for tx, answer in zip(hashes, answers):
+                transaction = answer.get("result") or {}
+                signature = None
+                # sprays made through another contract have no signature in the input
+                if (transaction.get("to") or "").lower() == peniwallet:
+                    signature = spray_signature(bytes.fromhex(transaction.get("input", "0x")[2:]))
+                rows.append((tx, None if signature is None else self.digest(signature)))
+            with db:
+                db.executemany("INSERT OR REPLACE INTO spray_signatures VALUES (?, ?)", rows)
+
+        # the join leaves out sprays a reorg removed from the indexer
+        query = ("SELECT g.digest FROM sprays s JOIN spray_signatures g ON g.tx = s.tx "
+                 "WHERE g.digest IS NOT NULL ORDER BY s.block {0}, s.log_index {0}")
+        for (digest,) in db.execute(query.format("ASC")):
+            self.filter.add(digest)
+        latest = db.execute(query.format("DESC") + " LIMIT ?", (self.recent,)).fetchall()
+        for (digest,) in reversed(latest):
+            self._remember(self._sprays, digest, limit=self.recent)
+
+        # sprays are guarded by their signature, not a nonce, so only the
+        # transfer and swap senders get a floor
+        users = list(dict.fromkeys(senders))[-self.senders:]
+        for user, nonce in zip(users, indexer.reader.nonces(indexer.peniwallet, users)):
+            self.set_floor(user, nonce)
+        return self.stats()
@@ -0,0 +1,218 @@
+"""
+Best-path search for ``swapTokensForTokens``.
+
+Candidate paths go direct or through one or two hub tokens (WBNB, USDT
+and any configured extras). Pair addresses are cached for good (missing
+pairs for ``pair_ttl`` seconds, so pairs created later are found), reserves
+are read for all candidate pairs in one batched call and snapshotted
+until the next block, and amounts are computed locally with
+``PancakeLibrary.getAmountsOut``, so quoting costs no RPC calls once the
+pairs are prepared.
+"""
+
+import time
+from itertools import permutations
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.reads import BatchReader, call
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# PancakeSwap v2 charges 0.25%
+FEE_NUMERATOR = 9975
+FEE_DENOMINATOR = 10000
+
+
+class RouteError(ValueError):
+    """
+    Raised when no path connects two tokens, or with the PancakeLibrary
+    reason where the router would revert.
+    """
+
+
+def get_amount_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    """
+    ``PancakeLibrary.getAmountOut``.
+    """
+    if amount_in <= 0:
+        raise RouteError("PancakeLibrary: INSUFFICIENT_INPUT_AMOUNT")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise RouteError("PancakeLibrary: INSUFFICIENT_LIQUIDITY")
+    amount_in_with_fee = amount_in * FEE_NUMERATOR
+    return amount_in_with_fee * reserve_out // (reserve_in * FEE_DENOMINATOR + amount_in_with_fee)
+
+
+def _key(token_a: str, token_b: str) -> Tuple[str, str]:
+    a, b = token_a.lower(), token_b.lower()
+    return (a, b) if a < b else (b, a)
+
+
+class Route(NamedTuple):
+    path: Tuple[str, ...]
+    amounts: Tuple[int, ...]
+
+    @property
+    def amount_out(self) -> int:
+        return self.amounts[-1]
+
+    def message(self, sender: str, nonce: int, deadline: int) -> Dict:
+        """
+        The ``SwapTransaction`` message for swapping along this route.
+        ``Peniwallet`` checks ``amountB`` against the input amount, so both
+        amounts are the input.
+        """
+        return {
+            'tokenA': self.path[0],
+            'tokenB': self.path[-1],
+            'from': sender,
+            'amountA': self.amounts[0],
+            'amountB': self.amounts[0],
+            'nonce': nonce,
+            'deadline': deadline,
+        }
+
+
+class RouteFinder:
+    """
+    :param reader: ``BatchReader`` for pair and reserve lookups
+    :param factory: PancakeSwap factory address
+    :param hubs: intermediate tokens, e.g. WBNB and USDT
+    :param max_hops: longest path in pairs, 1 to 3
+    :param pair_ttl: seconds a missing pair is remembered before
+        ``getPair`` is asked again
+    :param clock: time source, for tests
+    """
+
+    def __init__(
+        self,
+        reader: BatchReader,
+        factory: str,
+        hubs: Sequence[str],
+        max_hops: int = 3,
+        pair_ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.reader = reader
+        self.factory = factory
+        self.hubs = [to_checksum_address(hub) for hub in hubs]
+        self.max_hops = max_hops
+        self.pair_ttl = pair_ttl
+        self.clock = clock
+        self._pairs: Dict[Tuple[str, str], str] = {}
+        # pair key -> when getPair last returned the zero address
+        self._missing_pairs: Dict[Tuple[str, str], float] = {}
+        self._reserves: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._block: Optional[int] = None
+
+    @classmethod
+    def from_peniwallet(cls, reader: BatchReader, peniwallet: str, hubs: Sequence[str] = (), max_hops: int = 3):
+        """
+        Reads the router, WBNB, USDT and factory Peniwallet uses; WBNB and
+        USDT come first in the hub list.
+        """
+        router, usdt = reader.values([
+            call(peniwallet, "PancakeSwapRouterAddress()", outputs=("address",)),
+            call(peniwallet, "USDT()", outputs=("address",)),
+        ])
+        factory, weth = reader.values([
+            call(router, "factory()", outputs=("address",)),
+            call(router, "WETH()", outputs=("address",)),
+        ])
+        extra = [hub for hub in hubs if hub.lower() not in (weth.lower(), usdt.lower())]
+        return cls(reader, factory, [weth, usdt] + extra, max_hops)
+
+    def on_block(self, number: int) -> None:
+        """
+        Drops the reserve snapshot when a new block arrives.
+        """
+        if number != self._block:
+            self._reserves.clear()
+            self._block = number
+
+    def candidates(self, token_a: str, token_b: str) -> List[Tuple[str, ...]]:
+        """
+        Paths from ``token_a`` to ``token_b`` with at most ``max_hops`` pairs.
+        """
+        token_a, token_b = to_checksum_address(token_a), to_checksum_address(token_b)
+        ends = {token_a.lower(), token_b.lower()}
+        hubs = [hub for hub in self.hubs if hub.lower() not in ends]
+        paths: List[Tuple[str, ...]] = [(token_a, token_b)]
+        if self.max_hops >= 2:
+            paths += [(token_a, hub, token_b) for hub in hubs]
+        if self.max_hops >= 3:
+            paths += [(token_a, first, second, token_b) for first, second in permutations(hubs, 2)]
+        return paths
+
+    def prepare(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """
+        Looks up every pair the candidate paths of the given (tokenA, tokenB)
+        pairs need: one batch for unknown pair addresses, one for reserves
+        missing from the snapshot. Pairs found missing are looked up again
+        once ``pair_ttl`` has passed.
+        """
+        needed: Set[Tuple[str, str]] = set()
+        for token_a, token_b in pairs:
+            for path in self.candidates(token_a, token_b):
+                needed.update(_key(a, b) for a, b in zip(path, path[1:]))
+
+        now = self.clock()
+        unknown = [key for key in needed if not self._known(key, now)]
+        if unknown:
+            found = self.reader.values(
+                call(self.factory, "getPair(address,address)", list(key), ("address",)) for key in unknown)
+            for key, pair in zip(unknown, found):
+                if int(pair, 16):
+                    self._pairs[key] = pair
+                    self._missing_pairs.pop(key, None)
+                else:
+                    self._missing_pairs[key] = now
+
+        stale = [key for key in needed if key not in self._reserves and key in self._pairs]
+        if stale:
+            reserves = self.reader.values(
+                call(self._pairs[key], "getReserves()", outputs=("uint112", "uint112", "uint32"))
+                for key in stale)
+            self._reserves.update((key, (r0, r1)) for key, (r0, r1, _) in zip(stale, reserves))
+
+    def _known(self, key: Tuple[str, str], now: float) -> bool:
+        if key in self._pairs:
+            return True
+        checked = self._missing_pairs.get(key)
+        return checked is not None and now - checked <= self.pair_ttl
+
+    def pair(self, token_a: str, token_b: str) -> str:
+        return self._pairs.get(_key(token_a, token_b), ZERO_ADDRESS)
+
+    def amounts_out(self, amount_in: int, path: Sequence[str]) -> List[int]:
+        """
+        ``PancakeRouter.getAmountsOut`` from the snapshot; ``prepare`` must
+        have covered the path.
+        """
+        amounts = [amount_in]
+        for token_in, token_out in zip(path, path[1:]):
+            key = _key(token_in, token_out)
+            reserves = self._reserves.get(key)
+            if reserves is None:
+                raise RouteError(f"No pair for {token_in}/{token_out}")
+            reserve_in, reserve_out = reserves if token_in.lower() == key[0] else reserves[::-1]
+            amounts.append(get_amount_out(amounts[-1], reserve_in, reserve_out))
+        return amounts
+
+    def best(self, token_a: str, token_b: str, amount_in: int) -> Route:
+        """
+        The candidate path giving the most ``token_b`` for ``amount_in``.
+        """
+        self.prepare([(token_a, token_b)])
+        best = None
+        for path in self.candidates(token_a, token_b):
+            try:
+                amounts = self.amounts_out(amount_in, path)
+            except RouteError:
+                continue
+            if best is None or amounts[-1] > best.amounts[-1]:
+                best = Route(tuple(path), tuple(amounts))
+        if best is None:
+            raise RouteError(f"No route from {token_a} to {token_b}")
+        return best
@@ -0,0 +1,160 @@
+"""
+Batch signing of Transfer/Swap/Spray payloads across a process pool.
+
+Keys are handed to each worker once, through the pool initializer, and
+tasks only carry the struct name and the message, so nothing secret is
+pickled per task.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from eth_account import Account
+from eth_account.datastructures import SignedMessage
+from eth_account.signers.local import LocalAccount
+
+from peniwallet_contracts.eip712 import STRUCTS, Address, TypedStruct
+from peniwallet_contracts.metrics import EIP712_ENCODE, NO_METRICS, SIGN, Metrics
+
+Payload = Tuple[TypedStruct, Mapping[str, Any]]
+
+# per-process signing state, set by _init_worker
+_accounts: Dict[str, LocalAccount] = {}
+_domain: Tuple[int, Address] = (0, "")
+
+
+def _load_accounts(keys: Iterable[str]) -> Dict[str, LocalAccount]:
+    accounts = (Account.from_key(key) for key in keys)
+    return {account.address.lower(): account for account in accounts}
+
+
+def _init_worker(keys: Sequence[str], chain_id: int, verifying_contract: Address) -> None:
+    global _accounts, _domain
+    _accounts = _load_accounts(keys)
+    _domain = (chain_id, verifying_contract)
+
+
+class _Timing(NamedTuple):
+    """
+    When (``time.perf_counter``) a worker started encoding a payload, and
+    how long encoding and signing it took, in seconds.
+    """
+
+    start: float
+    encode: float
+    sign: float
+
+
+def _account(accounts, message) -> LocalAccount:
+    try:
+        return accounts[message['from'].lower()]
+    except KeyError:
+        raise ValueError(f"No key loaded for {message['from']}") from None
+
+
+def _sign(accounts, chain_id, verifying_contract, struct, message, metrics=NO_METRICS) -> SignedMessage:
+    account = _account(accounts, message)
+    with metrics.span(EIP712_ENCODE):
+        signable = struct.signable(message, chain_id, verifying_contract)
+    with metrics.span(SIGN):
+        return account.sign_message(signable)
+
+
+def _sign_chunk(chunk: Sequence[Tuple[str, Mapping[str, Any]]]) -> List[Tuple[SignedMessage, _Timing]]:
+    # workers have no Metrics of their own, so they hand the timings back
+    chain_id, verifying_contract = _domain
+    results = []
+    for name, message in chunk:
+        account = _account(_accounts, message)
+        start = time.perf_counter()
+        signable = STRUCTS[name].signable(message, chain_id, verifying_contract)
+        encoded = time.perf_counter()
+        signed = account.sign_message(signable)
+        results.append((signed, _Timing(start, encoded - start, time.perf_counter() - encoded)))
+    return results
+
+
+class BatchSigner:
+    """
+    Signs payloads for the accounts whose keys it was given.
+
+    The signing account of each payload is picked by its ``from`` field.
+    With ``workers=0`` everything is signed in the calling process.
+
+    :param keys: private keys of the accounts to sign for
+    :param chain_id: chain id of the Peniwallet deployment
+    :param verifying_contract: address of the Peniwallet deployment
+    :param workers: size of the process pool, defaults to the cpu count
+    :param chunksize: payloads sent to a worker per task
+    :param metrics: ``Metrics`` timing encoding and signing of each
+        payload, in the workers or the calling process
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        chain_id: int,
+        verifying_contract: Address,
+        workers: Optional[int] = None,
+        chunksize: int = 64,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.chain_id = chain_id
+        self.verifying_contract = verifying_contract
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunksize = chunksize
+        self.metrics = NO_METRICS if metrics is None else metrics
+        self._accounts: Dict[str, LocalAccount] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        if self.workers:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(list(keys), chain_id, verifying_contract),
+            )
+        else:
+            self._accounts = _load_accounts(keys)
+
+    def __enter__(self) -> "BatchSigner":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def sign(self, struct: TypedStruct, messages: Iterable[Mapping[str, Any]]) -> List[SignedMessage]:
+        """
+        Signs messages of a single struct type, results in input order.
+        """
+        return self.sign_payloads((struct, message) for message in messages)
+
+    def sign_payloads(self, payloads: Iterable[Payload]) -> List[SignedMessage]:
+        """
+        Signs (struct, message) pairs, results in input order.
+        """
+        if self._pool is None:
+            return [
+                _sign(self._accounts, self.chain_id, self.verifying_contract, struct, message, self.metrics)
+                for struct, message in payloads
+            ]
+
+        tasks = [(struct.name, message) for struct, message in payloads]
+        chunks = [
+            tasks[start:start + self.chunksize]
+            for start in range(0, len(tasks), self.chunksize)
+        ]
+        results: List[SignedMessage] = []
+        trace = self.metrics.current_trace()
+        for chunk in self._pool.map(_sign_chunk, chunks):
+            for signed, timing in chunk:
+                self.metrics.record(EIP712_ENCODE, timing.start, timing.encode, trace)
+                self.metrics.record(SIGN, timing.start + timing.encode, timing.sign, trace)
+                results.append(signed)
+        return results
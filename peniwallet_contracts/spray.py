@@ -0,0 +1,288 @@
+"""
+Planning and execution of sprays larger than one ``sprayToken`` call.
+
+Recipients are streamed, deduplicated and cut into batches that respect the
+200 recipient limit of ``sprayToken`` and the block gas limit. Every batch
+gets its own code, and therefore its own signature, because
+``checkSpraySignature`` rejects a signature that was already used.
+
+Execution signs batch N+1 while batch N is in flight and records progress
+in an append-only checkpoint file, so an interrupted run can be resumed
+without paying anyone twice.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.eip712 import Address, SprayTransaction, address_bytes
+
+# require(_recipients.length <= 200) in sprayToken and sprayCoin
+MAX_RECIPIENTS = 200
+
+# distinct recipients one plan deduplicates in memory, about 100 bytes each
+DEDUPE_LIMIT = 5_000_000
+
+# sprayToken costs used by batch_size_for and the gas oracle's defaults:
+# signature check, fee calculation, spraySignatures write and event, plus
+# one cold transferFrom and log data per recipient
+BASE_GAS = 200_000
+GAS_PER_RECIPIENT = 35_000
+
+
+def batch_size_for(
+    block_gas_limit: int,
+    base_gas: int = BASE_GAS,
+    gas_per_recipient: int = GAS_PER_RECIPIENT,
+    headroom: float = 0.8,
+) -> int:
+    """
+    Returns the largest batch size that keeps a spray under
+    ``headroom * block_gas_limit``, capped at ``MAX_RECIPIENTS``.
+    """
+    size = int((block_gas_limit * headroom - base_gas) // gas_per_recipient)
+    if size < 1:
+        raise ValueError("Block gas limit is too low for a single recipient")
+    return min(size, MAX_RECIPIENTS)
+
+
+def dedupe(recipients: Iterable[Address], limit: int = DEDUPE_LIMIT) -> Iterator[str]:
+    """
+    Yields each recipient once, checksummed, in first-seen order. Raises
+    ``ValueError`` after more than ``limit`` distinct recipients.
+    """
+    seen: Set[bytes] = set()
+    for recipient in recipients:
+        raw = address_bytes(recipient)
+        if raw not in seen:
+            if len(seen) == limit:
+                raise ValueError(
+                    f"More than {limit} distinct recipients; deduplicate them first, "
+                    "e.g. with AddressBook.unique(), and plan with deduplicate=False")
+            seen.add(raw)
+            yield to_checksum_address(raw)
+
+
+def _checksummed(recipients: Iterable[Address]) -> Iterator[str]:
+    for recipient in recipients:
+        yield to_checksum_address(address_bytes(recipient))
+
+
+class SprayBatch(NamedTuple):
+    number: int
+    receivers: List[str]
+    code: str
+
+    @property
+    def digest(self) -> str:
+        """
+        Fingerprint of the batch, used to check a checkpoint against a plan.
+        """
+        content = "\n".join([self.code, *self.receivers]).encode()
+        return hashlib.sha256(content).hexdigest()
+
+
+class SprayPlanner:
+    """
+    Cuts a recipient stream into ``sprayToken`` batches.
+
+    :param token: the token to spray
+    :param sender: the account paying for the spray
+    :param amount: the amount sent to each recipient
+    :param code: run code, batch ``i`` is sprayed with code ``f"{code}-{i}"``
+    :param batch_size: recipients per batch, at most ``MAX_RECIPIENTS``
+    :param block_gas_limit: when given, batches are also kept small enough
+        for a block, see ``batch_size_for``
+    :param deduplicate: drop repeated recipients, at most ``DEDUPE_LIMIT``
+        distinct ones per plan; pass False for lists that are unique already
+    """
+
+    def __init__(
+        self,
+        token: Address,
+        sender: Address,
+        amount: int,
+        code: str,
+        batch_size: int = MAX_RECIPIENTS,
+        block_gas_limit: Optional[int] = None,
+        deduplicate: bool = True,
+    ):
+        if not 0 < batch_size <= MAX_RECIPIENTS:
+            raise ValueError(f"batch_size must be between 1 and {MAX_RECIPIENTS}")
+        if block_gas_limit is not None:
+            batch_size = min(batch_size, batch_size_for(block_gas_limit))
+        self.token = token
+        self.sender = sender
+        self.amount = amount
+        self.code = code
+        self.batch_size = batch_size
+        self.deduplicate = deduplicate
+
+    def batches(self, recipients: Iterable[Address]) -> Iterator[SprayBatch]:
+        receivers: List[str] = []
+        number = 0
+        # a fresh set per call, so planning again starts from scratch
+        stream = dedupe(recipients) if self.deduplicate else _checksummed(recipients)
+        for recipient in stream:
+            receivers.append(recipient)
+            if len(receivers) == self.batch_size:
+                yield SprayBatch(number, receivers, f"{self.code}-{number}")
+                receivers = []
+                number += 1
+        if receivers:
+            yield SprayBatch(number, receivers, f"{self.code}-{number}")
+
+    def message(self, batch: SprayBatch) -> Dict[str, Any]:
+        """
+        Returns the ``SprayTransaction`` message for a batch.
+        """
+        return {
+            'token': self.token,
+            'from': self.sender,
+            'receivers': batch.receivers,
+            'amount': self.amount,
+            'code': batch.code,
+        }
+
+
+class SprayCheckpoint:
+    """
+    Append-only JSON lines log of batch progress.
+
+    Each batch goes through ``signed`` (signature recorded before it is
+    sent), ``sent`` and ``done``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[int, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records.setdefault(record['number'], {}).update(record)
+
+    def record(self, batch: SprayBatch, state: str, **fields: Any) -> None:
+        record = {'number': batch.number, 'digest': batch.digest, 'state': state, **fields}
+        self.records.setdefault(batch.number, {}).update(record)
+        with open(self.path, "a", encoding="utf8") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def get(self, batch: SprayBatch) -> Optional[Dict[str, Any]]:
+        record = self.records.get(batch.number)
+        if record is not None and record['digest'] != batch.digest:
+            raise ValueError(
+                f"Checkpoint {self.path} does not match batch {batch.number} of this plan")
+        return record
+
+
+Signer = Callable[[SprayBatch], str]
+Sender = Callable[[SprayBatch, str], str]
+
+
+def execute(
+    batches: Iterable[SprayBatch],
+    sign: Signer,
+    send: Sender,
+    checkpoint: SprayCheckpoint,
+    is_executed: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Sends every batch that the checkpoint does not mark as done and yields
+    the checkpoint record of each batch as it completes.
+
+    :param sign: returns the hex signature of a batch
+    :param send: sends a signed batch and returns the transaction hash
+    :param checkpoint: progress log of this plan
+    :param is_executed: tells whether a signature was already used on
+        chain, e.g. ``peniwallet.spraySignatures``. Batches that were
+        in flight when a previous run stopped are only sent again when it
+        returns False.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending: Optional[Future] = None
+        pending_batch: Optional[SprayBatch] = None
+
+        def schedule(batch: SprayBatch) -> Future:
+            record = checkpoint.get(batch)
+            if record is not None and 'signature' in record:
+                future: Future = Future()
+                future.set_result(record['signature'])
+                return future
+            return pool.submit(sign, batch)
+
+        for batch in batches:
+            record = checkpoint.get(batch)
+            if record is not None and record['state'] == 'done':
+                if pending is not None:
+                    yield _complete(pending_batch, pending, send, checkpoint, is_executed)
+                    pending = None
+                yield record
+                continue
+            # start signing this batch before waiting on the previous one
+            future = schedule(batch)
+            if pending is not None:
+                yield _complete(pending_batch, pending, send, checkpoint, is_executed)
+            pending, pending_batch = future, batch
+
+        if pending is not None:
+            yield _complete(pending_batch, pending, send, checkpoint, is_executed)
+
+
+def _complete(batch, future, send, checkpoint, is_executed) -> Dict[str, Any]:
+    signature = future.result()
+    record = checkpoint.get(batch)
+    if record is None:
+        checkpoint.record(batch, 'signed', signature=signature, code=batch.code)
+    elif is_executed is not None and is_executed(signature):
+        # the previous run got this batch on chain before stopping
+        checkpoint.record(batch, 'done')
+        return checkpoint.records[batch.number]
+    elif record['state'] == 'sent' and is_executed is None:
+        raise RuntimeError(
+            f"Batch {batch.number} was sent by a previous run; pass is_executed to resume it")
+
+    checkpoint.record(batch, 'sent')
+    tx_hash = send(batch, signature)
+    checkpoint.record(batch, 'done', tx=tx_hash)
+    return checkpoint.records[batch.number]
+
+
+def account_signer(planner: SprayPlanner, account, chain_id: int, verifying_contract: Address) -> Signer:
+    """
+    Signs batches with a ``LocalAccount``.
+    """
+    def sign(batch: SprayBatch) -> str:
+        signable = SprayTransaction.signable(planner.message(batch), chain_id, verifying_contract)
+        return account.sign_message(signable).signature.hex()
+
+    return sign
+
+
+def contract_sender(planner: SprayPlanner, peniwallet, name: str, gas: int, **tx_kwargs) -> Sender:
+    """
+    Sends batches through ``Peniwallet.sprayToken`` with an ape contract
+    instance; ``tx_kwargs`` are passed on, e.g. ``sender=relayer``.
+    """
+    def send(batch: SprayBatch, signature: str) -> str:
+        receipt = peniwallet.sprayToken(
+            planner.token,
+            planner.sender,
+            batch.receivers,
+            planner.amount,
+            name,
+            batch.code,
+            signature,
+            gas,
+            **tx_kwargs,
+        )
+        return receipt.txn_hash
+
+    return send
@@ -0,0 +1,189 @@
+"""
+Offline signature checks that mirror ``EIP712Verifier._getSigner``.
+
+A relayer can run these before broadcasting and drop requests that the
+contract would revert with "Invalid signature".
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from eth_keys import keys
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.eip712 import STRUCTS, Address, SwapTransaction, TypedStruct
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# secp256k1 group order, ecrecover returns address(0) for r or s outside [1, n)
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+Signature = Union[bytes, str]
+
+
+class Verification(NamedTuple):
+    """
+    Outcome of an offline check.
+
+    ``reason`` is the revert string the contract would produce, or None
+    when the signature would be accepted.
+    """
+
+    valid: bool
+    signer: str
+    reason: Optional[str]
+
+
+class InvalidSignature(ValueError):
+    """
+    Raised by ``check`` with the revert string the contract would produce.
+    """
+
+
+def _signature_bytes(signature: Signature) -> bytes:
+    if isinstance(signature, str):
+        return bytes.fromhex(signature[2:] if signature[:2] in ("0x", "0X") else signature)
+    return bytes(signature)
+
+
+def ecrecover(digest: bytes, v: int, r: int, s: int) -> str:
+    """
+    Python equivalent of the ecrecover precompile, returns the zero
+    address where the precompile returns nothing.
+    """
+    if v not in (27, 28) or not 0 < r < SECP256K1_N or not 0 < s < SECP256K1_N:
+        return ZERO_ADDRESS
+    try:
+        public_key = keys.Signature(vrs=(v - 27, r, s)).recover_public_key_from_msg_hash(digest)
+    except Exception:
+        return ZERO_ADDRESS
+    return public_key.to_checksum_address()
+
+
+def recover_signer(
+    struct: TypedStruct,
+    message: Mapping[str, Any],
+    signature: Signature,
+    chain_id: int,
+    verifying_contract: Address,
+) -> str:
+    """
+    Returns the address ``_getSigner`` would recover for the message.
+    """
+    raw = _signature_bytes(signature)
+    if len(raw) != 65:
+        raise InvalidSignature("Invalid signature")
+    return ecrecover(
+        struct.digest(message, chain_id, verifying_contract),
+        raw[64],
+        int.from_bytes(raw[0:32], "big"),
+        int.from_bytes(raw[32:64], "big"),
+    )
+
+
+def verify(
+    struct: TypedStruct,
+    message: Mapping[str, Any],
+    signature: Signature,
+    chain_id: int,
+    verifying_contract: Address,
+) -> Verification:
+    """
+    Checks a signature the way ``verifyTransfer``/``verifySwap``/``verifySpray``
+    and their callers in Peniwallet.sol do.
+    """
+    try:
+        signer = recover_signer(struct, message, signature, chain_id, verifying_contract)
+    except InvalidSignature as error:
+        return Verification(False, ZERO_ADDRESS, str(error))
+
+    if signer == ZERO_ADDRESS:
+        return Verification(False, signer, "Invalid signature")
+    if signer != to_checksum_address(message['from']):
+        # swaps revert with the short message, transfers and sprays name the sender
+        if struct is SwapTransaction:
+            return Verification(False, signer, "Invalid signature")
+        return Verification(False, signer, "Invalid signature: Signer is not the sender")
+    return Verification(True, signer, None)
+
+
+def check(struct, message, signature, chain_id, verifying_contract) -> str:
+    """
+    Returns the signer or raises ``InvalidSignature``.
+    """
+    result = verify(struct, message, signature, chain_id, verifying_contract)
+    if not result.valid:
+        raise InvalidSignature(result.reason)
+    return result.signer
+
+
+Item = Tuple[TypedStruct, Mapping[str, Any], Signature]
+
+
+def _verify_chunk(args) -> List[Verification]:
+    chain_id, verifying_contract, chunk = args
+    return [
+        verify(STRUCTS[name], message, signature, chain_id, verifying_contract)
+        for name, message, signature in chunk
+    ]
+
+
+class BatchVerifier:
+    """
+    Checks batches of (struct, message, signature) items, results in
+    input order. With ``workers=0`` everything runs in the calling process.
+
+    :param chain_id: chain id of the Peniwallet deployment
+    :param verifying_contract: address of the Peniwallet deployment
+    :param workers: size of the process pool, defaults to the cpu count
+    :param chunksize: items sent to a worker per task
+    """
+
+    def __init__(
+        self,
+        chain_id: int,
+        verifying_contract: Address,
+        workers: Optional[int] = None,
+        chunksize: int = 256,
+    ):
+        self.chain_id = chain_id
+        self.verifying_contract = verifying_contract
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunksize = chunksize
+        self._pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+
+    def __enter__(self) -> "BatchVerifier":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def verify(self, items: Iterable[Item]) -> List[Verification]:
+        if self._pool is None:
+            return [
+                verify(struct, message, signature, self.chain_id, self.verifying_contract)
+                for struct, message, signature in items
+            ]
+
+        tasks = [(struct.name, message, signature) for struct, message, signature in items]
+        chunks: Sequence = [
+            (self.chain_id, self.verifying_contract, tasks[start:start + self.chunksize])
+            for start in range(0, len(tasks), self.chunksize)
+        ]
+        results: List[Verification] = []
+        for verified in self._pool.map(_verify_chunk, chunks):
+            results.extend(verified)
+        return results
+
+    def accepted(self, items: Sequence[Item]) -> List[Item]:
+        """
+        Returns only the items the contract would accept.
+        """
+        items = list(items)
+        return [item for item, result in zip(items, self.verify(items)) if result.valid]
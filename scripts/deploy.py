@@ -1,19 +1,25 @@
 from ape import accounts
+from ape import networks
 from ape import project
 
+from peniwallet_contracts.deploy import deploy_exchange
+from peniwallet_contracts.deploy import deploy_peniwallet as deploy
+
+PANCAKESWAP_ROUTER = "0x7D23030D967d26462966Fa8E6968EADe0F7a2361"
+USDT = "0x527A39f480dE9126d48B1B23215Bf8C0a784F447"
+
 
 # def deploy_verifier():
 #     return project.EIP712Verifier.deploy(sender=accounts[0])
 
 
 def deploy_peniwallet():
-    return project.Peniwallet.deploy(
-        1700,
-        2000,
-        5000,
-        "0x7D23030D967d26462966Fa8E6968EADe0F7a2361",
-        "0x527A39f480dE9126d48B1B23215Bf8C0a784F447",
-        sender=accounts[0])
+    # the constructor reads WETH and the factory from the router, so a
+    # local chain gets the mock PancakeSwap first
+    if networks.provider.network.name == "local":
+        exchange = deploy_exchange(project, accounts[0])
+        return deploy(project, accounts[0], exchange.router.address, exchange.usdt.address)
+    return deploy(project, accounts[0], PANCAKESWAP_ROUTER, USDT)
 
 def main():
-    deploy_peniwallet()
\ No newline at end of file
+    deploy_peniwallet()
@@ -0,0 +1,28 @@
+import json
+
+from ape import project
+
+from peniwallet_contracts.calldata import ABI_PATH, load_abi
+
+
+def main():
+    """
+    Rewrites the shipped ABI entries calldata encodes from with the ones
+    of the compiled contract, so the encoders follow the source.
+    """
+    names = {entry["name"] for entry in load_abi()}
+    abi = sorted(
+        (
+            entry.model_dump(mode="json")
+            for entry in project.Peniwallet.contract_type.abi
+            if entry.type == "function" and entry.name in names
+        ),
+        key=lambda entry: entry["name"],
+    )
+    missing = names - {entry["name"] for entry in abi}
+    if missing:
+        raise ValueError(f"Peniwallet no longer has: {', '.join(sorted(missing))}")
+
+    with open(ABI_PATH, "w") as file:
+        json.dump(abi, file, indent=2, sort_keys=True)
+        file.write("\n")
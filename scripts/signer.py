@@ -1,25 +1,23 @@
+import os
+
 from eth_account import Account
 from eth_account.datastructures import SignedMessage
-from eth_account.messages import encode_structured_data
 from eth_account.signers.local import (
     LocalAccount,
 )
-def test_verifier():
+from peniwallet_contracts.eip712 import TransferTransaction
 
-    account: LocalAccount = Account.from_key(
-        '0x110854350f206b75d3824dd19cefdde5f1e6359c3e3bab5b62f8b21541aa6fa2',
-        )
-    # Define the EIP-712 data for the permit
-    message_data = {
-        'from': account.address,
-        'to': '0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29',
-        'value': 100,  # Amount of tokens to approve
-        'nonce': 0,    # Replace with the nonce value from the contract
-        'deadline': 0,  # Replace with the expiration timestamp
-    }
+# Set PENIWALLET_LEGACY_SIGNER=1 to sign the old EIP712Verifier
+# Transaction(from,to,value,nonce,deadline) struct instead of Peniwallet's
+# TransferTransaction; the two produce different signatures.
+LEGACY = os.environ.get("PENIWALLET_LEGACY_SIGNER", "") not in ("", "0")
 
-    # Construct the EIP-712 message
-    message = {
+
+def legacy_message(message_data, chain_id, verifying_contract):
+    """
+    The typed data this script signed before it used Peniwallet's domain.
+    """
+    return {
         'types': {
             'EIP712Domain': [
                 {'name': 'name', 'type': 'string'},
@@ -40,13 +38,50 @@ def test_verifier():
         'domain': {
             'name': 'EIP712Verifier',
             'version': '1',
-            'chainId': 1337,  # Binance Smart Chain (BSC) chain ID
-            'verifyingContract': '0x6d8F2b7286777Fd28ff2A111CA1E4AF6991Db943',
+            'chainId': chain_id,
+            'verifyingContract': verifying_contract,
         }
     }
 
-    # Encode the EIP-712 message
-    encoded_message = encode_structured_data(message)
+
+def test_verifier():
+
+    account: LocalAccount = Account.from_key(
+        '0x110854350f206b75d3824dd19cefdde5f1e6359c3e3bab5b62f8b21541aa6fa2',
+        )
+    chain_id = 1337
+    verifying_contract = '0x6d8F2b7286777Fd28ff2A111CA1E4AF6991Db943'
+
+    if LEGACY:
+        from eth_account.messages import encode_structured_data
+
+        message_data = {
+            'from': account.address,
+            'to': '0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29',
+            'value': 100,  # Amount of tokens to approve
+            'nonce': 0,    # Replace with the nonce value from the contract
+            'deadline': 0,  # Replace with the expiration timestamp
+        }
+        encoded_message = encode_structured_data(
+            legacy_message(message_data, chain_id, verifying_contract)
+        )
+    else:
+        # Define the EIP-712 data for the transfer
+        message_data = {
+            'token': '0xD309CD40E0fC4c463a28bAd37b644705220cE348',
+            'from': account.address,
+            'to': '0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29',
+            'amount': 100,  # Amount of tokens to transfer
+            'nonce': 0,    # Replace with the nonce value from the contract
+            'deadline': 0,  # Replace with the expiration timestamp
+        }
+
+        # Encode the EIP-712 message
+        encoded_message = TransferTransaction.signable(
+            message_data,
+            chain_id,
+            verifying_contract,
+        )
 
     print("encoded_message",encoded_message)
 
@@ -56,5 +91,4 @@ def test_verifier():
     # Sign the encoded message
     signature: SignedMessage = account.sign_message(encoded_message)
 
-    print('Permit Signature:', signature.signature.hex())
-
+    print('Transfer Signature:', signature.signature.hex())
@@ -1,30 +1,93 @@
+from pathlib import Path
+
 import pytest
-# from ape import project, accounts
+from peniwallet_contracts.addressbook import AddressBook
+from peniwallet_contracts.deploy import add_liquidity, deploy_exchange, deploy_peniwallet
+
+# tests using any of these run against the chain and are isolated with a
+# snapshot; the rest never touch ape
+CHAIN_FIXTURES = {"accounts", "chain", "peniwallet", "token", "exchange", "rpc_url"}
+
+ADDRESSES_TXT = Path(__file__).parent / "addresses.txt"
+ADDRESSES_BIN = ADDRESSES_TXT.with_suffix(".bin")
+
+
+def pytest_configure(config):
+    # build tests/addresses.bin once, before any pytest-xdist worker starts,
+    # so workers never race on rewriting it
+    if not hasattr(config, "workerinput"):
+        AddressBook.from_text(str(ADDRESSES_TXT)).close()
 
 
 @pytest.fixture(scope="session")
-def peniwallet(project, accounts):
-    print("deployments", project.Peniwallet.deployments)
-    return project.Peniwallet.at("0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8")
-# .deploy(
-#         1700, 
-#         2000,
-#         5000,
-#         "0x7D23030D967d26462966Fa8E6968EADe0F7a2361",
-#         "0x527A39f480dE9126d48B1B23215Bf8C0a784F447",
-#         sender=accounts[0])
+def exchange(project, accounts):
+    """
+    Mock WBNB, USDT and PancakeSwap router/factory, deployed once per
+    session (once per worker under pytest-xdist).
+    """
+    return deploy_exchange(project, accounts[0])
 
-@pytest.fixture(scope="module")
-def token(project):
 
-    return project.BEP20XRP.at("0xD309CD40E0fC4c463a28bAd37b644705220cE348")
+@pytest.fixture(scope="session")
+def token(project, accounts, exchange):
+    """
+    XRP token held by accounts[0] and accounts[1], paired with WBNB and USDT.
+    """
+    token = project.BEP20XRP.deploy(sender=accounts[0])
+    token.transfer(accounts[1].address, 10_000_000 * 10**18, sender=accounts[0])
+    add_liquidity(project, exchange, accounts[0], token, 1_000_000 * 10**18, exchange.weth, 10 * 10**18)
+    add_liquidity(project, exchange, accounts[0], token, 1_000_000 * 10**18, exchange.usdt, 1_000_000 * 10**18)
+    add_liquidity(project, exchange, accounts[0], exchange.weth, 10 * 10**18, exchange.usdt, 3_000 * 10**18)
+    return token
+
+
+@pytest.fixture(scope="session")
+def peniwallet(project, accounts, exchange, token):
+    return deploy_peniwallet(project, accounts[0], exchange.router.address, exchange.usdt.address)
+
+
+@pytest.fixture(autouse=True)
+def isolation(request):
+    """
+    Reverts whatever a chain test did, so tests can run in any order and
+    session deployments are shared instead of redeployed.
+    """
+    # ape's own plugin already snapshots around every test; this only
+    # stands in for it when that is off, i.e. under plain pytest or with
+    # --disable-isolation as 'make test-parallel' runs the suite
+    ape_isolates = not request.config.getoption("disable_isolation", default=True)
+    if ape_isolates or CHAIN_FIXTURES.isdisjoint(request.fixturenames):
+        yield
+        return
+    chain = request.getfixturevalue("chain")
+    snapshot = chain.snapshot()
+    try:
+        yield
+    finally:
+        chain.restore(snapshot)
+
+
+@pytest.fixture(scope="session")
+def rpc_url(chain):
+    """
+    HTTP endpoint of the node the tests run against. Tests needing one are
+    skipped on the in-process ``test`` provider.
+    """
+    provider = chain.provider
+    try:
+        uri = getattr(provider, "http_uri", None) or provider.uri
+    except Exception:
+        uri = None
+    if not uri or not uri.startswith("http"):
+        pytest.skip("needs a node with an HTTP endpoint")
+    return uri
 
 
 @pytest.fixture(scope="module")
 def addresses():
     """
-    Fixture function that returns a list of addresses read from a file.
+    Fixture function that returns the addresses read from a file, backed by
+    the memory-mapped address book built in ``pytest_configure``.
     """
-    with open("tests/addresses.txt", encoding="utf8") as file:
-        _addresses = file.readlines()
-    return [add.strip() for add in _addresses]
+    with AddressBook(str(ADDRESSES_BIN)) as book:
+        yield book
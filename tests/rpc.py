@@ -0,0 +1,57 @@
+"""
+Minimal JSON-RPC node for tests that only need canned answers.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeNode:
+    """
+    Serves JSON-RPC over HTTP on a free local port. ``handlers`` maps
+    method names to functions of the params; a handler raising
+    ``ValueError`` produces a JSON-RPC error.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.batches = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests = body if isinstance(body, list) else [body]
+                node.batches.append(len(requests))
+                answers = [node.answer(request) for request in requests]
+                data = json.dumps(answers if isinstance(body, list) else answers[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def answer(self, request):
+        answer = {"jsonrpc": "2.0", "id": request["id"]}
+        try:
+            answer["result"] = self.handlers[request["method"]](*request["params"])
+        except ValueError as error:
+            answer["error"] = {"code": -32000, "message": str(error)}
+        return answer
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
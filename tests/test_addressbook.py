@@ -0,0 +1,74 @@
+import pytest
+
+from peniwallet_contracts.addressbook import AddressBook, convert
+from tests.conftest import ADDRESSES_TXT
+
+ADDRESSES = [
+    "0x2c9823e0E81DfEcC6E6AdD51ad4669dCd290a60b",
+    "0xE65D56CA17Ddec976f4EC36c7B1E9Eaa216Cf806",
+    "0x7e83540ACD48E6c0Ce116634101Fb606b882e4a4",
+]
+
+
+def write_lines(tmp_path, lines):
+    path = tmp_path / "addresses.txt"
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+    return str(path)
+
+
+def test_addresses_fixture_matches_text_file(addresses):
+    with open(ADDRESSES_TXT, encoding="utf8") as file:
+        expected = [add.strip() for add in file.readlines()]
+
+    assert len(addresses) == len(expected)
+    assert addresses[:200] == expected[:200]
+    assert addresses[-1] == expected[-1]
+    assert list(addresses.iter(1000, 1010)) == expected[1000:1010]
+
+
+def test_lookup_and_dedup(tmp_path):
+    lines = [ADDRESSES[0], ADDRESSES[1].lower(), "", ADDRESSES[0], ADDRESSES[2]]
+    text_path = write_lines(tmp_path, lines)
+
+    with AddressBook.from_text(text_path) as book:
+        assert list(book) == [ADDRESSES[0], ADDRESSES[1], ADDRESSES[0], ADDRESSES[2]]
+        assert ADDRESSES[1] in book
+        assert "0x" + "00" * 20 not in book
+        assert book.positions(ADDRESSES[0]) == [0, 2]
+        assert book.index(ADDRESSES[2]) == 3
+        assert book.count(ADDRESSES[1].upper().replace("0X", "0x")) == 1
+        assert list(book.unique()) == ADDRESSES
+
+
+def test_convert_with_external_sort(tmp_path):
+    lines = [ADDRESSES[2], ADDRESSES[0], ADDRESSES[1], ADDRESSES[0], ADDRESSES[2], ADDRESSES[1], ADDRESSES[0]]
+    text_path = write_lines(tmp_path, lines)
+    in_memory, chunked = str(tmp_path / "memory.bin"), str(tmp_path / "chunked.bin")
+
+    assert convert(text_path, in_memory) == convert(text_path, chunked, chunk_size=2) == len(lines)
+    with open(in_memory, "rb") as first, open(chunked, "rb") as second:
+        assert first.read() == second.read()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["addresses.txt", "chunked.bin", "memory.bin"]
+
+    with AddressBook(chunked) as book:
+        assert book.positions(ADDRESSES[0]) == [1, 3, 6]
+        assert list(book.unique()) == [ADDRESSES[2], ADDRESSES[0], ADDRESSES[1]]
+
+
+def test_convert_rejects_bad_lines(tmp_path):
+    bad_checksum = ADDRESSES[0][:-1] + "B"
+    with pytest.raises(ValueError, match="line 2: bad checksum"):
+        convert(write_lines(tmp_path, [ADDRESSES[0], bad_checksum]), str(tmp_path / "book.bin"))
+
+    with pytest.raises(ValueError, match="line 1: invalid address"):
+        convert(write_lines(tmp_path, ["0x1234"]), str(tmp_path / "book.bin"))
+
+
+def test_rejects_corrupt_file(tmp_path):
+    book_path = str(tmp_path / "book.bin")
+    convert(write_lines(tmp_path, ADDRESSES), book_path)
+    with open(book_path, "r+b") as file:
+        file.truncate(40)
+
+    with pytest.raises(ValueError, match="truncated"):
+        AddressBook(book_path)
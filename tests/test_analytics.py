@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+from peniwallet_contracts.analytics import AnalyticsStore, Group
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.ledger import FeeLedger
+from peniwallet_contracts.reads import BatchReader
+from tests.rpc import FakeNode
+
+np = pytest.importorskip("numpy")
+
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+OTHER = "0x527A39f480dE9126d48B1B23215Bf8C0a784F447"
+USER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+DEV = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+RECEIVERS = ["0x58eC9587204FceA311E32BC7674a75443eB8f653", "0xf7E22E248481eb6905Ba1e06c1d3F06f819D50df"]
+DAY = 86400
+START = 1_700_006_400  # a midnight
+HUGE = 2**200 + 12345
+
+
+def block_time(block):
+    return START + block * 3600
+
+
+def fill(indexer):
+    events = [
+        ("SprayExecuted", 10, 0, "0x01", (TOKEN, USER, RECEIVERS, HUGE, block_time(10), "a", "x")),
+        ("SprayExecuted", 30, 1, "0x02", (OTHER, DEV, RECEIVERS[:1], 7, block_time(30), "b", "y")),
+        ("FeeWithdrawn", 20, 0, "0x03", (DEV, TOKEN, 500, block_time(20))),
+        ("FeeWithdrawn", 40, 0, "0x04", (DEV, TOKEN, 250, block_time(40))),
+        ("GasSent", 25, 0, "0x05", (DEV, USER, 10**18)),
+    ]
+    with indexer.db:
+        indexer._store(events)
+        indexer.db.execute("INSERT INTO checkpoints VALUES (60, '0x00')")
+    ledger = FeeLedger(indexer, confirmations=0)
+    with indexer.db:
+        indexer.db.executemany("INSERT INTO fee_inflows VALUES (?, ?, ?, ?, ?)", [
+            (TOKEN, 10, 1, USER, str(2**64 + 1)), (TOKEN, 20, 1, USER, str(2**64 + 2)),
+            (OTHER, 30, 2, DEV, "9"), (TOKEN, 45, 1, USER, "3")])
+        indexer.db.execute("INSERT INTO ledger_checkpoint VALUES (0, 40)")
+    return ledger
+
+
+@pytest.fixture
+def node():
+    timestamps = {"eth_getBlockByNumber": lambda block, full: {"timestamp": hex(block_time(int(block, 16)))}}
+    with FakeNode(timestamps) as node:
+        yield node
+
+
+def test_export_and_group(tmp_path, node):
+    indexer = EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET, confirmations=10)
+    ledger = fill(indexer)
+    store = AnalyticsStore(str(tmp_path / "store"))
+
+    added = store.export(indexer, ledger, partition_blocks=16)
+
+    # confirmed up to block 50, the ledger scanned up to 40
+    assert added == {"spray_recipients": 3, "fee_withdrawals": 2, "gas_sent": 1, "fees": 3}
+    assert store.exported_block() == 40
+    assert store.partitions("fees") == [(0, 15), (16, 31)]
+    assert store.fees_per_token_per_day() == [
+        Group((TOKEN, START), 2, 2**65 + 3),
+        Group((OTHER, START + DAY), 1, 9),
+    ]
+    assert store.top_spray_senders() == [Group((USER,), 2, 2 * HUGE), Group((DEV,), 1, 7)]
+    assert store.dev_withdrawals() == [Group((TOKEN, DEV), 2, 750)]
+    assert store.group("gas_sent", ("receiver", "hour")) == [Group((USER, block_time(25)), 1, 10**18)]
+    assert store.group("spray_recipients", (), where={"recipient": RECEIVERS[0].lower()}) == [
+        Group((), 2, HUGE + 7)]
+    assert store.group("fee_withdrawals", ("dev",), since=block_time(30)) == [Group((DEV,), 1, 250)]
+    assert store.group("fees", ("token",), where={"token": USER}) == []
+    # only gas_sent and fees read block timestamps, in one batch per table and partition
+    assert node.batches == [1, 1, 2]
+
+
+def test_export_resumes_and_reopens(tmp_path, node):
+    indexer = EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET, confirmations=0)
+    ledger = fill(indexer)
+    path = str(tmp_path / "store")
+    store = AnalyticsStore(path)
+    store.export(indexer, ledger)
+    # a partition an interrupted export left behind
+    os.makedirs(os.path.join(path, "fees", f"{41:012d}-{60:012d}"))
+
+    with indexer.db:
+        indexer.db.execute("UPDATE ledger_checkpoint SET number = 60")
+    added = AnalyticsStore(path).export(indexer, ledger)
+
+    reopened = AnalyticsStore(path)
+    assert added == {"spray_recipients": 0, "fee_withdrawals": 0, "gas_sent": 0, "fees": 1}
+    assert reopened.partitions("fees") == [(0, 40), (41, 60)]
+    assert reopened.rows("fees") == 4
+    assert reopened.top("fees", "token", n=1) == [Group((TOKEN,), 3, 2**65 + 6)]
+
+
+def test_fees_catch_up_after_an_export_without_ledger(tmp_path, node):
+    indexer = EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET, confirmations=0)
+    ledger = fill(indexer)
+    path = str(tmp_path / "store")
+
+    first = AnalyticsStore(path).export(indexer)
+    store = AnalyticsStore(path)
+    assert "fees" not in first and store.exported_block("gas_sent") == 60
+    assert store.exported_block("fees") is None and store.exported_block() is None
+
+    added = store.export(indexer, ledger)
+
+    # the other tables are ahead of the ledger and stay where they were
+    assert added == {"spray_recipients": 0, "fee_withdrawals": 0, "gas_sent": 0, "fees": 3}
+    assert store.exported_block("fees") == store.exported_block() == 40
+    assert store.exported_block("gas_sent") == 60
+
+
+def test_append_checks_columns_and_order(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    columns = {"block": [5], "log_index": [0], "timestamp": [START], "sender": [USER], "receiver": [DEV],
+               "amount": [1]}
+    store.append("gas_sent", 0, 9, columns)
+
+    with pytest.raises(ValueError, match="already holds block 9"):
+        store.append("gas_sent", 9, 19, columns)
+    with pytest.raises(ValueError, match="needs the columns"):
+        store.append("gas_sent", 10, 19, dict(columns, token=[TOKEN]))
+    with pytest.raises(ValueError, match="Cannot group by amount"):
+        store.group("gas_sent", ("amount",))
+    assert store.columns("gas_sent", 0, 9)["amount"].dtype == np.uint32
+
+
+def test_sums_are_exact_over_many_rows(tmp_path):
+    store = AnalyticsStore(str(tmp_path))
+    rows = 200_000
+    amounts = [(2**32 - 1) * (2**32 + 1) + index for index in range(rows)]
+    senders = [USER, DEV, OTHER]
+    store.append("gas_sent", 0, rows, {
+        "block": list(range(rows)), "log_index": [0] * rows,
+        "timestamp": [START + index * 60 for index in range(rows)],
+        "sender": [senders[index % 3] for index in range(rows)], "receiver": [USER] * rows,
+        "amount": amounts})
+
+    groups = store.group("gas_sent", ("sender", "day"))
+
+    expected = {}
+    for index, amount in enumerate(amounts):
+        key = (senders[index % 3], (START + index * 60) // DAY * DAY)
+        expected[key] = expected.get(key, 0) + amount
+    assert {group.key: group.amount for group in groups} == expected
+
+
+def test_limb_halves_past_64_bits():
+    # a group of 2**33 maximal limbs: the high half sums past 2**48
+    rows = 2**33
+    lows = np.array([rows * 0xFFFF] * 2, dtype="uint64")
+    highs = np.array([rows * 0xFFFF] * 2, dtype="uint64")
+
+    assert AnalyticsStore._amount(lows, highs) == rows * (2**64 - 1)
@@ -0,0 +1,200 @@
+import csv
+import math
+import tracemalloc
+
+import pytest
+from eth_account import Account
+from web3 import Web3
+
+from peniwallet_contracts.bulk import (
+    BulkError,
+    BulkSpray,
+    contract_sender,
+    load_plan,
+    parse_address,
+    parse_amount,
+    plan_signer,
+)
+from peniwallet_contracts.eip712 import SprayTransaction
+from peniwallet_contracts.fees import FeeEngine
+from peniwallet_contracts.spray import SprayCheckpoint, account_signer, execute
+from peniwallet_contracts.verify import verify
+from tests.test_fee_engine import FakeReader, expected_fee
+from tests.test_spray_planner import SENDER, TOKEN, FakeChain
+
+KEY = "0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0"
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+
+
+def write_csv(path, rows, header=("address", "amount")):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_parse_rows():
+    address = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+    assert parse_address(address.lower()) == address
+    assert parse_address(" " + address.upper().replace("0X", "0x")) == address
+    assert parse_amount("1.5", decimals=18) == 15 * 10**17
+    assert parse_amount("42") == 42
+
+    for value, reason in [
+        (address.replace("e", "E", 1), "bad checksum"),
+        ("0x1234", "malformed address"),
+        ("0x" + "zz" * 20, "malformed address"),
+        ("0x" + "00" * 20, "zero address"),
+    ]:
+        with pytest.raises(BulkError, match=reason):
+            parse_address(value)
+    for value in ["0", "-1", "1.5", "ten", str(2**256)]:
+        with pytest.raises(BulkError):
+            parse_amount(value)
+
+
+def test_groups_by_amount_in_fewest_batches(tmp_path, addresses):
+    rows = [(addresses[i], [10, 20, 30][i % 3] if i < 450 else 99) for i in range(460)]
+    rows += [(addresses[0].lower(), 10), ("0xnope", 5), (addresses[470], "0")]
+    source = write_csv(tmp_path / "drop.csv", rows)
+
+    with BulkSpray(TOKEN, SENDER, "drop", str(tmp_path / "spill.db"), batch_size=100) as bulk:
+        stats = bulk.ingest(source, rejects=str(tmp_path / "rejects.csv"), chunk_size=64)
+        batches = list(bulk.batches())
+
+    assert stats == (463, 460, 1, 2)
+    # 150 per amount in two batches each, plus the 10 rows of 99
+    assert [(batch.amount, len(batch.receivers)) for batch in batches] == [
+        (10, 100), (10, 50), (20, 100), (20, 50), (30, 100), (30, 50), (99, 10)]
+    assert len(batches) == sum(math.ceil(count / 100) for count in (150, 150, 150, 10))
+    assert batches[0].receivers[:2] == [addresses[0], addresses[3]]
+    assert batches[1].total == 500 and batches[-1].code == "drop-6"
+    with open(tmp_path / "rejects.csv") as file:
+        assert [row["reason"] for row in csv.DictReader(file)] == ["malformed address", "amount out of range"]
+
+
+def test_ingest_is_kept_only_for_the_same_file(tmp_path, addresses, monkeypatch):
+    source = write_csv(tmp_path / "drop.csv", [(addresses[i], 10) for i in range(30)])
+    other = write_csv(tmp_path / "other.csv", [(addresses[i], 20) for i in range(5)])
+    spill = str(tmp_path / "spill.db")
+
+    with BulkSpray(TOKEN, SENDER, "drop", spill) as bulk:
+        assert bulk.ingest(source) == (30, 30, 0, 0)
+    with BulkSpray(TOKEN, SENDER, "drop", spill) as bulk:
+        read = []
+        monkeypatch.setattr("peniwallet_contracts.bulk.read_rows", lambda *args, **kwargs: read.append(args) or [])
+        assert bulk.ingest(source) == (30, 30, 0, 0)
+        assert read == []
+        monkeypatch.undo()
+
+        assert bulk.ingest(other) == (5, 5, 0, 0)
+        assert [batch.amount for batch in bulk.batches()] == [20]
+
+        write_csv(source, [(addresses[i], 10) for i in range(40)])
+        assert bulk.ingest(source) == (40, 40, 0, 0)
+        assert [len(batch.receivers) for batch in bulk.batches()] == [40]
+
+
+def test_plan_is_signed_quoted_and_resumable(tmp_path, addresses):
+    account = Account.from_key(KEY)
+    source = write_csv(tmp_path / "drop.csv", [(addresses[i], 10**18 * (1 + i % 2)) for i in range(500)])
+    path = str(tmp_path / "plan.jsonl")
+    signed = []
+
+    with BulkSpray(TOKEN, account.address, "drop", str(tmp_path / "spill.db")) as bulk:
+        bulk.ingest(source)
+        signer = account_signer(bulk, account, 1337, CONTRACT)
+
+        def sign(batch):
+            signed.append(batch.number)
+            if len(signed) == 3:
+                raise KeyboardInterrupt
+            return signer(batch)
+
+        with pytest.raises(KeyboardInterrupt):
+            bulk.plan(path, sign, FeeEngine(FakeReader()), chain_id=1337)
+        with open(path, "a") as file:
+            file.write('{"number": 2, "recei')
+
+        summary = bulk.plan(path, signer, FeeEngine(FakeReader()), chain_id=1337)
+
+    header, batches = load_plan(path)
+    batches = list(batches)
+
+    assert signed == [0, 1, 2]
+    assert header == {'token': TOKEN, 'from': account.address, 'code': "drop", 'gas': 21000, 'chain_id': 1337}
+    assert [len(batch.receivers) for batch in batches] == [200, 50, 200, 50]
+    assert summary['batches'] == 4 and summary['recipients'] == 500
+    assert summary['total'] == 250 * 10**18 + 250 * 2 * 10**18
+    fee = expected_fee(200 * 10**18, 5000, 21000 * (7_000_000 * 10**18 + 13) // (3 * 10**18))
+    assert batches[0].fee == fee
+    for batch in batches:
+        message = {'token': TOKEN, 'from': account.address, 'receivers': batch.receivers,
+                   'amount': batch.amount, 'code': batch.code}
+        assert verify(SprayTransaction, message, batch.signature, 1337, CONTRACT).valid
+
+    with BulkSpray(TOKEN, SENDER, "other", str(tmp_path / "spill.db")) as bulk:
+        with pytest.raises(ValueError, match="another spray"):
+            bulk.plan(path, signer)
+
+    # the same spray from another file cannot resume this plan
+    with BulkSpray(TOKEN, account.address, "drop", str(tmp_path / "spill.db")) as bulk:
+        bulk.ingest(write_csv(tmp_path / "other.csv", [(addresses[i], 5) for i in range(300)]))
+        with pytest.raises(ValueError, match="other recipients"):
+            bulk.plan(path, signer, FeeEngine(FakeReader()), chain_id=1337)
+
+
+def test_execute_plan_pays_once(tmp_path, addresses):
+    source = write_csv(tmp_path / "drop.csv", [(addresses[i], 1 + i % 4) for i in range(900)])
+    path = str(tmp_path / "plan.jsonl")
+    chain = FakeChain(fail_at=3)
+    with BulkSpray(TOKEN, SENDER, "drop", str(tmp_path / "spill.db")) as bulk:
+        bulk.ingest(source)
+        bulk.plan(path, chain.sign)
+
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    with pytest.raises(ConnectionError):
+        list(execute(load_plan(path)[1], plan_signer, chain.send, SprayCheckpoint(checkpoint)))
+    done = list(execute(load_plan(path)[1], plan_signer, chain.send, SprayCheckpoint(checkpoint),
+                        is_executed=chain.used.__contains__))
+
+    assert len(done) == 8
+    assert len(chain.paid) == 900 and set(chain.paid.values()) == {1}
+
+
+def test_memory_does_not_grow_with_file_size(tmp_path):
+    def peak(count):
+        source = write_csv(tmp_path / f"drop{count}.csv",
+                           (("0x" + f"{i + 1:040x}", 1 + i % 50) for i in range(count)))
+        tracemalloc.start()
+        with BulkSpray(TOKEN, SENDER, "drop", str(tmp_path / f"spill{count}.db")) as bulk:
+            bulk.ingest(source, chunk_size=1_000)
+            bulk.plan(str(tmp_path / f"plan{count}.jsonl"), lambda batch: "0x")
+        _, used = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return used
+
+    small, large = peak(5_000), peak(40_000)
+
+    assert large < small * 1.5
+
+
+def test_bulk_spray_on_chain(peniwallet, token, accounts, addresses, chain, tmp_path):
+    account = Account.from_key(KEY)
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[0])
+    amounts = [Web3.to_wei(1, 'ether'), Web3.to_wei(2, 'ether')]
+    source = write_csv(tmp_path / "drop.csv", [(addresses[i], amounts[i % 2]) for i in range(210)])
+    old_balances = {address: token.balanceOf(address) for address in addresses[:210]}
+    path = str(tmp_path / "plan.jsonl")
+
+    with BulkSpray(token.address, account.address, f"bulk{chain.blocks.height}", str(tmp_path / "spill.db")) as bulk:
+        bulk.ingest(source)
+        bulk.plan(path, account_signer(bulk, account, chain.chain_id, peniwallet.address))
+    header, batches = load_plan(path)
+    records = list(execute(batches, plan_signer, contract_sender(header, peniwallet, "bulk", sender=accounts[0]),
+                           SprayCheckpoint(str(tmp_path / "checkpoint.jsonl"))))
+
+    assert len(records) == 2
+    for i, address in enumerate(addresses[:210]):
+        assert token.balanceOf(address) == old_balances[address] + amounts[i % 2]
@@ -0,0 +1,201 @@
+import pytest
+from eth_abi import decode, encode
+from eth_account import Account
+from web3 import Web3
+
+from peniwallet_contracts.bundler import (
+    TRANSFER_SKIPPED,
+    Bundler,
+    TransferBundle,
+    TransferIntent,
+    outcomes,
+    skipped_senders,
+)
+from peniwallet_contracts.calldata import BATCH_TRANSFER
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.deploy import add_liquidity
+from peniwallet_contracts.preflight import AMOUNT_TOO_LARGE, BAD_NONCE, BAD_SIGNATURE, OK, REVERTED
+from peniwallet_contracts.reads import selector
+from tests.test_preflight import PENIWALLET, TOKEN, USER, transfer_message
+
+OTHER_TOKEN = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+OTHER_USER = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+
+
+def intent(nonce, token=TOKEN, sender=USER):
+    return TransferIntent(dict(transfer_message(nonce), token=token, **{'from': sender}), bytes([nonce]) * 65)
+
+
+def test_groups_by_token_within_gas_budget():
+    bundler = Bundler(max_gas=90_000 + 3 * 80_000)
+    intents = [intent(n, sender=f"0x{n + 1:040x}") for n in range(7)]
+    intents += [intent(0, token=OTHER_TOKEN, sender=OTHER_USER)]
+
+    bundles = bundler.bundle(intents)
+
+    assert [(bundle.token, len(bundle.intents)) for bundle in bundles] == [
+        (TOKEN, 3), (TOKEN, 3), (TOKEN, 1), (OTHER_TOKEN, 1)]
+    assert bundles[0].gas == 90_000 + 3 * 80_000
+    assert bundles[1].amount == 3 * 500
+
+
+def test_keeps_sender_nonces_in_bundle_order():
+    # USER's nonce 1 is for OTHER_TOKEN, so nonce 2 cannot join the first TOKEN bundle
+    intents = [intent(0), intent(1, token=OTHER_TOKEN), intent(2), intent(0, sender=OTHER_USER)]
+
+    bundles = Bundler(max_gas=10_000_000).bundle(intents)
+
+    assert [[item.message['nonce'] for item in bundle.intents] for bundle in bundles] == [[0], [1], [2, 0]]
+    assert [bundle.token for bundle in bundles] == [TOKEN, OTHER_TOKEN, TOKEN]
+
+
+def test_rejects_budget_below_one_transfer():
+    with pytest.raises(ValueError, match="too low"):
+        Bundler(max_gas=100_000)
+    with pytest.raises(ValueError, match="max_transfers"):
+        Bundler(max_gas=10**8, max_transfers=101)
+
+
+def test_calldata_matches_abi():
+    bundle = Bundler(max_gas=10_000_000).bundle([intent(3), intent(4)])[0]
+
+    data = bundle.data(21000)
+    token, transactions, signatures, gas = decode(
+        ["address", "(address,address,address,uint256,uint256,uint256)[]", "bytes[]", "uint256"], data[4:])
+
+    assert data[:4] == selector(BATCH_TRANSFER)
+    assert token == TOKEN.lower() and gas == 21000
+    assert [transaction[4] for transaction in transactions] == [3, 4]
+    assert list(signatures) == [bytes([3]) * 65, bytes([4]) * 65]
+
+
+def test_outcomes_from_skipped_logs():
+    bundle = TransferBundle(0, TOKEN, [intent(n) for n in range(3)], 0)
+
+    def skipped(index, reason, address=PENIWALLET):
+        return {"address": address, "topics": [TRANSFER_SKIPPED, "0x" + "00" * 32, "0x" + "00" * 32],
+                "data": "0x" + encode(["uint256", "uint256"], [index, reason]).hex()}
+
+    logs = [skipped(0, 3), {"address": TOKEN, "topics": ["0x" + "11" * 32], "data": "0x"}, skipped(2, 1),
+            skipped(1, 1, address=TOKEN)]
+
+    assert outcomes(bundle, logs, PENIWALLET) == [BAD_SIGNATURE, OK, BAD_NONCE]
+    assert outcomes(bundle, [skipped(1, 8)]) == [OK, AMOUNT_TOO_LARGE, OK]
+
+
+def test_resync_drops_intents_stranded_by_a_skip():
+    bundler = Bundler(max_gas=90_000 + 2 * 80_000)
+    # USER's nonce 1 is skipped in the first bundle, which strands nonces 2 and 3
+    intents = [intent(0), intent(1), intent(0, sender=OTHER_USER), intent(2), intent(1, sender=OTHER_USER),
+               intent(3)]
+    first, *rest = bundler.bundle(intents)
+
+    codes = [OK, BAD_SIGNATURE]
+    assert skipped_senders(first, codes) == [USER]
+    kept, dropped = bundler.resync(rest, {USER.lower(): 1})
+
+    assert [(item.message['from'], item.message['nonce']) for item in dropped] == [(USER, 2), (USER, 3)]
+    assert [[item.message['from'] for item in bundle.intents] for bundle in kept] == [[OTHER_USER], [OTHER_USER]]
+    assert [(bundle.number, bundle.gas) for bundle in kept] == [(0, 90_000 + 80_000), (1, 90_000 + 80_000)]
+
+    # once the sender signs again from the on-chain nonce, the new intents line up
+    kept, dropped = bundler.resync(bundler.bundle([intent(1), intent(2)]), {USER: 1})
+    assert dropped == [] and [len(bundle.intents) for bundle in kept] == [2]
+
+
+def test_batch_transfer(peniwallet, token, accounts, chain):
+    user = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    nonce = peniwallet.getNonce(user.address)
+    amount = Web3.to_wei(10, 'ether')
+
+    def signed(nonce):
+        message = {'token': token.address, 'from': user.address, 'to': accounts[0].address, 'amount': amount,
+                   'nonce': nonce, 'deadline': chain.pending_timestamp + 3600}
+        return TransferIntent(message, user.sign_message(
+            TransferTransaction.signable(message, chain.chain_id, peniwallet.address)).signature)
+
+    # the third reuses a nonce and is skipped without reverting the others
+    intents = [signed(nonce), signed(nonce + 1), signed(nonce + 1)]
+    (bundle,) = Bundler(max_gas=10_000_000).bundle(intents)
+    old_balance = token.balanceOf(accounts[0].address)
+
+    receipt = peniwallet.batchTransfer(
+        token.address, [tuple(item.message.values()) for item in bundle.intents],
+        [item.signature for item in bundle.intents], 21000, sender=accounts[0])
+
+    assert token.balanceOf(accounts[0].address) == old_balance + 2 * amount
+    assert peniwallet.getNonce(user.address) == nonce + 2
+    assert outcomes(bundle, receipt.logs, peniwallet.address) == [OK, OK, BAD_NONCE]
+
+
+def test_batch_transfer_skips_failed_legs(peniwallet, exchange, project, accounts, chain):
+    user = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    # returns nothing from transfer and transferFrom, and refuses transfers to accounts[2]
+    token = project.MockNoReturnToken.deploy(sender=accounts[0])
+    token.mint(accounts[0].address, 10**24, sender=accounts[0])
+    token.mint(user.address, 10**21, sender=accounts[0])
+    add_liquidity(project, exchange, accounts[0], token, 10**23, exchange.weth, 10**18)
+    token.approve(peniwallet.address, 10**21, sender=accounts[1])
+    token.setBlocked(accounts[2].address, True, sender=accounts[0])
+    nonce = peniwallet.getNonce(user.address)
+    amount = Web3.to_wei(10, 'ether')
+
+    def signed(nonce, to):
+        message = {'token': token.address, 'from': user.address, 'to': to, 'amount': amount,
+                   'nonce': nonce, 'deadline': chain.pending_timestamp + 3600}
+        return TransferIntent(message, user.sign_message(
+            TransferTransaction.signable(message, chain.chain_id, peniwallet.address)).signature)
+
+    intents = [signed(nonce, accounts[0].address), signed(nonce + 1, accounts[2].address),
+               signed(nonce + 1, accounts[3].address)]
+    (bundle,) = Bundler(max_gas=10_000_000).bundle(intents)
+    fee = peniwallet.estimateFees(token.address, amount, 0, 21000)
+    old_balance = token.balanceOf(user.address)
+
+    receipt = peniwallet.batchTransfer(
+        token.address, [tuple(item.message.values()) for item in bundle.intents],
+        [item.signature for item in bundle.intents], 21000, sender=accounts[0])
+
+    # the blocked transfer was rolled back with its fee and left its nonce for the next one
+    assert outcomes(bundle, receipt.logs, peniwallet.address) == [OK, REVERTED, OK]
+    assert token.balanceOf(user.address) == old_balance - 2 * (amount + fee)
+    assert token.balanceOf(accounts[3].address) == amount
+    assert peniwallet.getNonce(user.address) == nonce + 2
+
+
+def test_batch_transfer_rolls_back_reentrant_legs(peniwallet, exchange, project, accounts, chain):
+    user = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    token = project.MockNoReturnToken.deploy(sender=accounts[0])
+    token.mint(accounts[0].address, 10**24, sender=accounts[0])
+    token.mint(user.address, 10**21, sender=accounts[0])
+    add_liquidity(project, exchange, accounts[0], token, 10**23, exchange.weth, 10**18)
+    token.approve(peniwallet.address, 10**21, sender=accounts[1])
+    token.setBlocked(accounts[2].address, True, sender=accounts[0])
+    nonce = peniwallet.getNonce(user.address)
+    amount = Web3.to_wei(10, 'ether')
+
+    def signed(nonce, to):
+        message = {'token': token.address, 'from': user.address, 'to': to, 'amount': amount,
+                   'nonce': nonce, 'deadline': chain.pending_timestamp + 3600}
+        return TransferIntent(message, user.sign_message(
+            TransferTransaction.signable(message, chain.chain_id, peniwallet.address)).signature)
+
+    bundler = Bundler(max_gas=10_000_000)
+    # the fee pull of the blocked transfer calls back into batchTransfer with the next nonce
+    (inner,) = bundler.bundle([signed(nonce + 1, accounts[3].address)])
+    token.setReentry(peniwallet.address, inner.data(21000), sender=accounts[0])
+    (bundle,) = bundler.bundle([signed(nonce, accounts[2].address)])
+    old_balance = token.balanceOf(user.address)
+
+    receipt = peniwallet.batchTransfer(
+        token.address, [tuple(item.message.values()) for item in bundle.intents],
+        [item.signature for item in bundle.intents], 21000, sender=accounts[0])
+
+    # the inner transfer went down with the failed one, so neither nonce is used
+    assert outcomes(bundle, receipt.logs, peniwallet.address) == [REVERTED]
+    assert token.balanceOf(accounts[3].address) == 0
+    assert token.balanceOf(user.address) == old_balance
+    assert peniwallet.getNonce(user.address) == nonce
+    with pytest.raises(Exception, match="Only callable by Peniwallet"):
+        peniwallet.executeBatchedTransfer(tuple(bundle.intents[0].message.values()), 0, sender=accounts[0])
@@ -0,0 +1,138 @@
+import random
+
+import pytest
+from eth_abi import encode
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.calldata import (
+    BATCH_TRANSFER,
+    SPRAY_TOKEN,
+    SWAP_TOKENS_FOR_BNB,
+    SWAP_TOKENS_FOR_TOKENS,
+    TRANSFER,
+    FunctionEncoder,
+    encode_spray_token,
+    encode_transfer,
+    encoders_from_abi,
+    load_abi,
+    signature_of,
+)
+from peniwallet_contracts.reads import selector
+
+UINT_EDGES = [0, 1, 2**255, 2**256 - 1]
+
+
+def _reference(signature, args):
+    types = signature[signature.index("(") + 1:-1].split(",")
+    values = [bytes(value) if kind == "bytes" else value for kind, value in zip(types, args)]
+    return selector(signature) + encode(types, values)
+
+
+def _random_value(rng, kind):
+    if kind == "address":
+        address = "0x" + rng.getrandbits(160).to_bytes(20, "big").hex()
+        return to_checksum_address(address) if rng.random() < 0.5 else address
+    if kind == "uint256":
+        return rng.choice(UINT_EDGES) if rng.random() < 0.2 else rng.getrandbits(rng.choice([8, 64, 256]))
+    if kind == "bytes":
+        return rng.getrandbits(8 * 130).to_bytes(130, "big")[:rng.choice([0, 1, 31, 32, 33, 65, 130])]
+    if kind == "string":
+        return "".join(rng.choice("abcXYZ019-é漢") for _ in range(rng.randrange(0, 70)))
+    if kind == "address[]":
+        return [_random_value(rng, "address") for _ in range(rng.choice([0, 1, 2, 50, 200]))]
+    raise AssertionError(kind)
+
+
+@pytest.mark.parametrize("signature", [TRANSFER, SWAP_TOKENS_FOR_BNB, SWAP_TOKENS_FOR_TOKENS, SPRAY_TOKEN])
+def test_byte_identical_to_eth_abi(signature):
+    rng = random.Random(signature)
+    encoder = FunctionEncoder(signature)
+
+    for _ in range(300):
+        args = [_random_value(rng, kind) for kind in encoder.types]
+        assert encoder.encode(args) == _reference(signature, args)
+
+
+def test_entry_point_helpers():
+    message = {
+        'token': "0xD309CD40E0fC4c463a28bAd37b644705220cE348",
+        'from': "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43",
+        'to': "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29",
+        'receivers': ["0x58eC9587204FceA311E32BC7674a75443eB8f653"] * 200,
+        'amount': 10**18,
+        'nonce': 4,
+        'deadline': 1700000000,
+        'code': "NWBx76",
+    }
+    signature = "0x" + "ab" * 65
+
+    assert encode_transfer(message, signature, 21000) == _reference(TRANSFER, [
+        message['token'], message['from'], message['to'], message['amount'], message['nonce'],
+        message['deadline'], bytes.fromhex("ab" * 65), 21000])
+    assert encode_spray_token(message, "Spray", bytes.fromhex("ab" * 65), 21000) == _reference(SPRAY_TOKEN, [
+        message['token'], message['from'], message['receivers'], message['amount'], "Spray",
+        message['code'], bytes.fromhex("ab" * 65), 21000])
+
+
+def test_invalid_values():
+    encoder = FunctionEncoder(TRANSFER)
+    args = ["0x" + "11" * 20, "0x" + "22" * 20, "0x" + "33" * 20, 1, 2, 3, b"", 4]
+
+    with pytest.raises(ValueError, match="address"):
+        encoder.encode(["0x1234"] + args[1:])
+    with pytest.raises(ValueError, match="uint256"):
+        encoder.encode(args[:3] + [2**256] + args[4:])
+    with pytest.raises(ValueError, match="uint256"):
+        encoder.encode(args[:3] + [-1] + args[4:])
+    with pytest.raises(ValueError, match="takes 8 arguments"):
+        encoder.encode(args[:-1])
+
+
+def test_encoders_from_abi():
+    abi = [
+        {"type": "constructor", "inputs": [{"type": "uint256"}]},
+        {"type": "function", "name": "transfer", "inputs": [
+            {"name": "_token", "type": "address"}, {"name": "_from", "type": "address"},
+            {"name": "_to", "type": "address"}, {"name": "_amount", "type": "uint256"},
+            {"name": "_nonce", "type": "uint256"}, {"name": "_deadline", "type": "uint256"},
+            {"name": "_signature", "type": "bytes"}, {"name": "_gas", "type": "uint256"}]},
+        {"type": "function", "name": "fees", "inputs": [{"type": "address"}, {"type": "address"}]},
+        {"type": "function", "name": "odd", "inputs": [{"type": "bytes32[2]"}]},
+        {"type": "event", "name": "GasSent", "inputs": []},
+    ]
+
+    encoders = encoders_from_abi(abi)
+
+    assert sorted(encoders) == ["fees", "transfer"]
+    assert encoders["transfer"].signature == TRANSFER
+    assert encoders["transfer"].selector == selector(TRANSFER)
+
+
+def test_matches_ape_encoding(peniwallet, token, accounts, addresses):
+    encoders = encoders_from_abi([entry.model_dump(mode="json") for entry in peniwallet.contract_type.abi])
+    receivers = list(addresses[:200])
+    args = [token.address, accounts[0].address, receivers, 10**18, "Spray", "NWBx76", b"\x01" * 65, 21000]
+
+    assert encoders["sprayToken"].encode(args) == bytes(peniwallet.sprayToken.encode_input(*args))
+
+
+def test_defaults_come_from_the_shipped_abi():
+    signatures = {entry["name"]: signature_of(entry) for entry in load_abi()}
+
+    assert signatures == {
+        "batchTransfer": BATCH_TRANSFER,
+        "sprayToken": SPRAY_TOKEN,
+        "swapTokensForBNB": SWAP_TOKENS_FOR_BNB,
+        "swapTokensForTokens": SWAP_TOKENS_FOR_TOKENS,
+        "transfer": TRANSFER,
+    }
+    assert BATCH_TRANSFER == "batchTransfer(address,(address,address,address,uint256,uint256,uint256)[],bytes[],uint256)"
+
+
+def test_shipped_abi_matches_compiled(peniwallet):
+    compiled = {
+        entry.name: entry.model_dump(mode="json") for entry in peniwallet.contract_type.abi if entry.type == "function"
+    }
+
+    for entry in load_abi():
+        assert signature_of(entry) == signature_of(compiled[entry["name"]]), "run `make abi`"
@@ -0,0 +1,127 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.cli import main
+from peniwallet_contracts.eip712 import SprayTransaction, TransferTransaction
+from peniwallet_contracts.reads import selector
+from tests import test_pairsync as pairsync
+from tests.rpc import FakeNode
+from tests.test_signing import CHAIN_ID, CONTRACT, KEYS, TOKEN, transfer_message
+
+from benchmarks.bench_startup import COMMANDS, KEY, import_times
+
+RECEIVER = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+TRANSFER = ["transfer", "--chain-id", str(CHAIN_ID), "--contract", CONTRACT, "--token", TOKEN, "--to", RECEIVER,
+            "--amount", "500", "--nonce", "3", "--deadline", "1700000000"]
+
+
+def run(capsys, argv):
+    status = main(argv)
+    out, err = capsys.readouterr()
+    return status, json.loads(out) if out else None, err
+
+
+def test_sign_matches_eth_account_and_verifies(capsys, monkeypatch):
+    monkeypatch.setenv("PENIWALLET_KEY", KEYS[0])
+    account = Account.from_key(KEYS[0])
+
+    status, signed, _ = run(capsys, ["sign", *TRANSFER])
+    message = transfer_message(account.address, 3)
+    expected = account.sign_message(TransferTransaction.signable(message, CHAIN_ID, CONTRACT))
+
+    assert status == 0
+    assert signed["message"] == message
+    assert signed["signature"] == "0x" + bytes(expected.signature).hex()
+
+    status, result, _ = run(capsys, ["verify-signature", *TRANSFER, "--from", account.address,
+                                     "--signature", signed["signature"]])
+    assert status == 0 and result == {"valid": True, "signer": account.address, "reason": None}
+
+    status, result, _ = run(capsys, ["verify-signature", *TRANSFER, "--from", RECEIVER,
+                                     "--signature", signed["signature"]])
+    assert status == 1 and result["reason"] == "Invalid signature: Signer is not the sender"
+
+
+def test_sign_spray_from_key_file(capsys, tmp_path):
+    (tmp_path / "key").write_text(KEYS[1] + "\n")
+    (tmp_path / "receivers").write_text(f"{RECEIVER}\n{CONTRACT}\n")
+    account = Account.from_key(KEYS[1])
+
+    status, signed, _ = run(capsys, [
+        "sign", "spray", "--chain-id", str(CHAIN_ID), "--contract", CONTRACT, "--token", TOKEN,
+        "--amount", "10", "--code", "NWBx76", "--receivers", f"@{tmp_path / 'receivers'}",
+        "--key-file", str(tmp_path / "key")])
+    expected = account.sign_message(SprayTransaction.signable(signed["message"], CHAIN_ID, CONTRACT))
+
+    assert status == 0
+    assert signed["message"]["receivers"] == [RECEIVER, CONTRACT]
+    assert signed["signature"] == "0x" + bytes(expected.signature).hex()
+
+
+def test_missing_key(capsys, monkeypatch):
+    monkeypatch.delenv("PENIWALLET_KEY", raising=False)
+
+    status, _, err = run(capsys, ["sign", *TRANSFER])
+
+    assert status == 2 and "PENIWALLET_KEY" in err
+
+
+@pytest.mark.parametrize("key", ["0x1234zz", "0x" + "11" * 31, "0x" + "00" * 32, "0x" + "ff" * 32])
+def test_malformed_key(capsys, monkeypatch, key):
+    monkeypatch.setenv("PENIWALLET_KEY", key)
+
+    status, _, err = run(capsys, ["sign", *TRANSFER])
+
+    assert status == 2 and "malformed signing key" in err
+
+
+def test_estimate_fees(capsys):
+    def eth_call(transaction, block):
+        data = bytes.fromhex(transaction["data"][2:])
+        assert data[:4] == selector("estimateFees(address,uint256,uint256,uint256)")
+        _, amount, tx_type, gas = decode(["address", "uint256", "uint256", "uint256"], data[4:])
+        return "0x" + encode(["uint256"], [amount // 100 + tx_type + gas]).hex()
+
+    with FakeNode({"eth_call": eth_call}) as node:
+        status, result, _ = run(capsys, ["estimate-fees", "--rpc-url", node.url, "--contract", CONTRACT,
+                                         "--token", TOKEN, "--amount", "10000", "--type", "spray"])
+
+    assert status == 0 and result["fee"] == 100 + 2 + 21000
+
+
+def test_sync_pairs_dry_run(capsys):
+    token = "0x" + "01" * 20
+    chain = pairsync.Chain({(token, pairsync.WETH)}, {})
+
+    with FakeNode({"eth_call": chain.eth_call}) as node:
+        status, result, _ = run(capsys, ["sync-pairs", "--rpc-url", node.url, "--contract", pairsync.PENIWALLET,
+                                         "--tokens", f"{token},{TOKEN}", "--dry-run"])
+
+    assert status == 0 and result == {"tokens": 2, "stale": [to_checksum_address(token)], "transactions": []}
+
+
+def test_signing_does_not_load_heavy_dependencies():
+    script = (
+        "import sys\n"
+        "from peniwallet_contracts.cli import main\n"
+        f"main({['sign', *TRANSFER]!r})\n"
+        "print(sorted({'ape', 'eth_account', 'aiohttp', 'requests'} & set(sys.modules)))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                               env={"PENIWALLET_KEY": KEY, "PATH": ""})
+
+    assert completed.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_signing_import_time_budget():
+    # generous against a loaded CI machine; eth_account alone takes longer
+    total, modules = import_times(COMMANDS["sign"])
+
+    assert "eth_account" not in {name for _, name in modules}
+    assert total < 1_000
@@ -0,0 +1,80 @@
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+
+from peniwallet_contracts.eip712 import (
+    SprayTransaction,
+    SwapTransaction,
+    TransferTransaction,
+    domain_separator,
+)
+
+CHAIN_ID = 1337
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+ACCOUNT = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+
+TRANSFER = {
+    'token': TOKEN,
+    'from': ACCOUNT.address,
+    'to': "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29",
+    'amount': 10**23,
+    'nonce': 7,
+    'deadline': 1700000000,
+}
+
+SWAP = {
+    'tokenA': TOKEN,
+    'tokenB': "0xf7E22E248481eb6905Ba1e06c1d3F06f819D50df",
+    'from': ACCOUNT.address,
+    'amountA': 500,
+    'amountB': 500,
+    'nonce': 3,
+    'deadline': 1700000000,
+}
+
+SPRAY = {
+    'token': TOKEN,
+    'from': ACCOUNT.address,
+    'receivers': [
+        "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43",
+        "0x58eC9587204FceA311E32BC7674a75443eB8f653",
+    ],
+    'amount': 10,
+    'code': "MBASYW",
+}
+
+
+def test_matches_encode_typed_data():
+    for struct, message in (
+        (TransferTransaction, TRANSFER),
+        (SwapTransaction, SWAP),
+        (SprayTransaction, SPRAY),
+    ):
+        expected = encode_typed_data(full_message=struct.typed_data(message, CHAIN_ID, CONTRACT))
+        assert struct.signable(message, CHAIN_ID, CONTRACT) == expected
+
+
+def test_signature_matches_encode_typed_data():
+    expected = ACCOUNT.sign_message(
+        encode_typed_data(full_message=TransferTransaction.typed_data(TRANSFER, CHAIN_ID, CONTRACT)))
+    signed = ACCOUNT.sign_message(TransferTransaction.signable(TRANSFER, CHAIN_ID, CONTRACT))
+
+    assert signed.signature == expected.signature
+    assert signed.messageHash == TransferTransaction.digest(TRANSFER, CHAIN_ID, CONTRACT)
+
+
+def test_type_strings_match_verifier():
+    assert TransferTransaction.type_string == (
+        "TransferTransaction(address token,address from,address to,uint256 amount,uint256 nonce,uint256 deadline)")
+    assert SwapTransaction.type_string == (
+        "SwapTransaction(address tokenA,address tokenB,address from,uint256 amountA,uint256 amountB,"
+        "uint256 nonce,uint256 deadline)")
+    assert SprayTransaction.type_string == (
+        "SprayTransaction(address token,address from,address[] receivers,uint256 amount,string code)")
+
+
+def test_domain_separator_is_cached_per_deployment():
+    first = domain_separator(CHAIN_ID, CONTRACT)
+
+    assert domain_separator(CHAIN_ID, CONTRACT.lower()) is first
+    assert domain_separator(56, CONTRACT) != first
@@ -0,0 +1,165 @@
+import pytest
+import web3
+
+from peniwallet_contracts.fees import (
+    SPRAY,
+    SWAP,
+    TRANSFER,
+    ZERO_ADDRESS,
+    ApeFeeReader,
+    FeeEngine,
+    FeeError,
+    FeeReader,
+)
+
+ROUTER = "0x7D23030D967d26462966Fa8E6968EADe0F7a2361"
+FACTORY = "0x00000000000000000000000000000000000000fa"
+WETH = "0xf7E22E248481eb6905Ba1e06c1d3F06f819D50df"
+USDT = "0x527A39f480dE9126d48B1B23215Bf8C0a784F447"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+OTHER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+BNB_TOKEN_PAIR = "0x0000000000000000000000000000000000000001"
+BNB_USDT_PAIR = "0x0000000000000000000000000000000000000002"
+USDT_OTHER_PAIR = "0x0000000000000000000000000000000000000003"
+
+
+class FakeReader(FeeReader):
+
+    def __init__(self):
+        self.calls = 0
+        self.pairs = {
+            (TOKEN, WETH): BNB_TOKEN_PAIR,
+            (WETH, USDT): BNB_USDT_PAIR,
+            (OTHER, USDT): USDT_OTHER_PAIR,
+        }
+        self.balances = {
+            (WETH, BNB_TOKEN_PAIR): 3 * 10**18,
+            (TOKEN, BNB_TOKEN_PAIR): 7_000_000 * 10**18 + 13,
+            (WETH, BNB_USDT_PAIR): 11 * 10**18,
+            (USDT, BNB_USDT_PAIR): 2_300 * 10**18 + 7,
+            (USDT, USDT_OTHER_PAIR): 999 * 10**18,
+            (OTHER, USDT_OTHER_PAIR): 12_345 * 10**18 + 1,
+        }
+        self.multipliers = {TRANSFER: 1700, SWAP: 2000, SPRAY: 5000}
+
+    def _count(self, value):
+        self.calls += 1
+        return value
+
+    def router(self):
+        return self._count(ROUTER)
+
+    def usdt(self):
+        return self._count(USDT)
+
+    def weth(self, router):
+        return self._count(WETH)
+
+    def factory(self, router):
+        return self._count(FACTORY)
+
+    def get_pair(self, factory, token_a, token_b):
+        return self._count(self.pairs.get((token_a, token_b), ZERO_ADDRESS))
+
+    def balance_of(self, token, holder):
+        return self._count(self.balances.get((token, holder), 0))
+
+    def fee_multiplier(self, tx_type):
+        return self._count(self.multipliers.get(tx_type, 0))
+
+
+def expected_fee(amount, ratio, min_fee):
+    # _calculateFee, written out the way the contract does it
+    fee = ((amount * 10**3) * ratio) // (100 * 10**3)
+    return fee // 10**3 + min_fee
+
+
+def test_bnb_pair_path():
+    engine = FeeEngine(FakeReader())
+    amount = web3.Web3.to_wei(1000, "ether")
+    min_fee = 21000 * (7_000_000 * 10**18 + 13) // (3 * 10**18)
+
+    assert engine.estimate_fees(TOKEN, amount, TRANSFER, 21000) == expected_fee(amount, 1700, min_fee)
+    assert engine.estimate_fees(WETH, amount, SWAP, 21000) == expected_fee(amount, 2000, 21000)
+    assert engine.estimate_fees(ZERO_ADDRESS, 10, SPRAY, 0) == expected_fee(10, 5000, 0)
+
+
+def test_usdt_pair_fallback():
+    engine = FeeEngine(FakeReader())
+    fee_in_usdt = 21000 * (2_300 * 10**18 + 7) // (11 * 10**18)
+    min_fee = fee_in_usdt * (12_345 * 10**18 + 1) // (999 * 10**18)
+
+    assert engine.min_fee(OTHER, 21000) == min_fee
+
+
+def test_reverts_like_the_contract():
+    engine = FeeEngine(FakeReader())
+
+    with pytest.raises(FeeError, match="No Supported Pairs exists for the token"):
+        engine.min_fee("0x00000000000000000000000000000000000000ff", 21000)
+    with pytest.raises(FeeError, match="INSUFFICIENT_AMOUNT"):
+        engine.min_fee(TOKEN, 0)
+
+
+def test_quotes_within_a_block_are_free():
+    reader = FakeReader()
+    now = [0.0]
+    engine = FeeEngine(reader, ttl=3.0, clock=lambda: now[0])
+    engine.on_block(100)
+
+    engine.estimate_fees(TOKEN, 10**18, TRANSFER, 21000)
+    calls = reader.calls
+    for amount in range(1, 1000):
+        engine.estimate_fees(TOKEN, amount * 10**18, TRANSFER, 21000 + amount)
+    assert reader.calls == calls
+
+    # a new block refreshes reserves and multipliers, but not pairs
+    reader.balances[(TOKEN, BNB_TOKEN_PAIR)] *= 2
+    engine.on_block(101)
+    assert engine.min_fee(TOKEN, 21000) == 21000 * reader.balances[(TOKEN, BNB_TOKEN_PAIR)] // (3 * 10**18)
+    assert reader.calls == calls + 2
+
+    # without new blocks, the snapshot expires after the ttl
+    now[0] = 4.0
+    engine.min_fee(TOKEN, 21000)
+    assert reader.calls == calls + 4
+
+
+def test_missing_pairs_expire():
+    reader = FakeReader()
+    now = [0.0]
+    engine = FeeEngine(reader, pair_ttl=60.0, clock=lambda: now[0])
+    new_token = "0x00000000000000000000000000000000000000ff"
+
+    with pytest.raises(FeeError, match="No Supported Pairs"):
+        engine.min_fee(new_token, 21000)
+    calls = reader.calls
+    reader.pairs[(new_token, WETH)] = BNB_TOKEN_PAIR
+    with pytest.raises(FeeError, match="No Supported Pairs"):
+        engine.min_fee(new_token, 21000)
+    assert reader.calls == calls
+
+    # the pair created meanwhile is found once the miss expires
+    now[0] = 61.0
+    reader.balances[(new_token, BNB_TOKEN_PAIR)] = 6 * 10**18
+    assert engine.min_fee(new_token, 21000) == 21000 * 2
+    calls = reader.calls
+    now[0] = 1_000.0
+    engine.pair(new_token, WETH)
+    assert reader.calls == calls
+
+
+def test_fee_reader_is_abstract():
+    with pytest.raises(TypeError):
+        FeeReader()
+
+
+def test_estimate_fees_matches_contract(peniwallet, token, project, accounts, chain):
+    engine = FeeEngine(ApeFeeReader(peniwallet, project))
+    engine.on_block(chain.blocks.head.number)
+
+    for amount in (1, 10**6, web3.Web3.to_wei(1000, "ether"), 12345678901234567890123):
+        for tx_type in (TRANSFER, SWAP, SPRAY):
+            for gas in (1, 21000, 10**15):
+                assert engine.estimate_fees(token.address, amount, tx_type, gas) == peniwallet.estimateFees(
+                    token.address, amount, tx_type, gas, sender=accounts[0])
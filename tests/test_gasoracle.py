@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+from eth_account import Account
+
+from peniwallet_contracts.bundler import BASE_GAS, GAS_PER_TRANSFER, Bundler, TransferIntent
+from peniwallet_contracts.calldata import encode_swap_tokens_for_tokens
+from peniwallet_contracts.fees import FeeEngine
+from peniwallet_contracts.gasoracle import (
+    BATCH_TRANSFER,
+    SPRAY_TOKEN,
+    SWAP_TOKENS_FOR_TOKENS,
+    TRANSFER,
+    GasOracle,
+    entry_point,
+)
+from peniwallet_contracts.preflight import spray_token_call, transfer_call
+from peniwallet_contracts.reads import BatchReader
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+from tests.rpc import FakeNode
+from tests.test_fee_engine import FakeReader
+from tests.test_preflight import PENIWALLET, RELAYER, TOKEN, spray_message, transfer_message
+from tests.test_relayer import Mempool
+
+GWEI = 10**9
+
+
+class FeeChain:
+    """
+    ``eth_feeHistory`` over blocks whose base fee is ``block`` gwei and
+    whose priority fee is 1 gwei, or 5 gwei every tenth block.
+    """
+
+    def __init__(self, height):
+        self.height = height
+        self.requested = []
+
+    def base_fee(self, block):
+        return block * GWEI
+
+    def tip(self, block):
+        return 5 * GWEI if block % 10 == 0 else GWEI
+
+    def fee_history(self, count, newest, percentiles):
+        count, newest = int(count, 16), int(newest, 16)
+        assert newest <= self.height and percentiles == [90.0]
+        self.requested.append(count)
+        blocks = range(newest - count + 1, newest + 1)
+        return {
+            "oldestBlock": hex(blocks[0]),
+            "baseFeePerGas": [hex(self.base_fee(block)) for block in blocks] + [hex(self.base_fee(newest + 1))],
+            "reward": [[hex(self.tip(block))] for block in blocks],
+        }
+
+    def handlers(self):
+        return {"eth_blockNumber": lambda: hex(self.height), "eth_feeHistory": self.fee_history}
+
+
+def spray(count):
+    message = dict(spray_message("x"), receivers=[RELAYER.address] * count)
+    return spray_token_call(message, "Spray", b"\x01" * 65, 0).data
+
+
+def test_entry_point_sizes():
+    intents = [TransferIntent(transfer_message(nonce), b"\x01" * 65) for nonce in range(3)]
+    (bundle,) = Bundler(max_gas=10**7).bundle(intents)
+    path = [TOKEN, RELAYER.address, PENIWALLET]
+
+    assert entry_point(transfer_call(transfer_message(1), b"\x01" * 65, 0).data) == (TRANSFER, 1)
+    assert entry_point(spray(7)) == (SPRAY_TOKEN, 7)
+    assert entry_point(bundle.data(0)) == (BATCH_TRANSFER, 3)
+    assert entry_point(encode_swap_tokens_for_tokens(path, dict(transfer_message(1), amountA=1), b"", 0)) == (
+        SWAP_TOKENS_FOR_TOKENS, 2)
+    assert entry_point(b"\xa9\x05\x9c\xbb" + bytes(64)) is None
+
+
+def test_refresh_reads_only_new_blocks():
+    chain = FeeChain(height=100)
+    with FakeNode(chain.handlers()) as node:
+        oracle = GasOracle(BatchReader(node.url), blocks=20)
+        oracle.refresh()
+        first = oracle.price
+        chain.height = 103
+        oracle.refresh()
+        oracle.refresh()
+        chain.height = 104
+        oracle.refresh(head=104)
+
+    assert chain.requested == [20, 3, 1]
+    # the next block's base fee plus the 90th percentile tip tops the window
+    assert first == (101 + 1) * GWEI
+    assert oracle.price == (105 + 1) * GWEI
+    assert len(oracle._fees) == 20 and oracle.block == 104
+
+
+def test_legacy_gas_price_fallback():
+    def fee_history(*params):
+        raise ValueError("the method eth_feeHistory does not exist")
+
+    with FakeNode({"eth_feeHistory": fee_history, "eth_gasPrice": lambda: hex(3 * GWEI)}) as node:
+        oracle = GasOracle(BatchReader(node.url))
+        oracle.refresh(head=10)
+
+    assert oracle.price == 3 * GWEI
+    assert oracle.gas_fee(TRANSFER) == 120_000 * 3 * GWEI * 11 // 10
+
+
+def test_fits_gas_per_recipient():
+    oracle = GasOracle(BatchReader("http://unused"), calls=50, margin=1.0)
+    oracle.price = GWEI
+    for count in [1, 10, 50, 100, 200] * 20:
+        oracle.observe(spray(count), 60_000 + 28_000 * count)
+    oracle.observe(transfer_call(transfer_message(1), b"\x01" * 65, 0).data, 90_000)
+
+    assert oracle.gas_used(SPRAY_TOKEN, 150) == 60_000 + 28_000 * 150
+    assert len(oracle._gas[SPRAY_TOKEN].samples) == 50
+    # one transfer size: the intercept follows the calls, the prior slope of 0 stays
+    assert oracle.gas_fee(TRANSFER) == 90_000 * GWEI
+    assert not oracle.observe(b"\x00" * 36, 21_000)
+    with pytest.raises(ValueError, match="Unknown entry point"):
+        oracle.gas_used("sprayCoin")
+
+
+def test_quotes_are_constant_time():
+    oracle = GasOracle(BatchReader("http://unused"), calls=10_000)
+    oracle.price = GWEI
+    for count in range(10_000):
+        oracle.observe(spray(1 + count % 200), 60_000 + 28_000 * (1 + count % 200))
+
+    start = time.perf_counter()
+    for count in range(10_000):
+        oracle.gas_fee(SPRAY_TOKEN, 1 + count % 200)
+    per_quote = (time.perf_counter() - start) / 10_000
+
+    assert per_quote < 20e-6
+
+
+def test_fee_engine_quotes_with_oracle_gas():
+    oracle = GasOracle(BatchReader("http://unused"), margin=1.0)
+    oracle.price = 5 * GWEI
+    engine = FeeEngine(FakeReader(), gas_oracle=oracle)
+
+    gas, fee = engine.quote(TOKEN, 10**21, SPRAY_TOKEN, size=100)
+
+    assert gas == (200_000 + 35_000 * 100) * 5 * GWEI
+    assert fee == engine.estimate_fees(TOKEN, 10**21, 2, gas)
+    with pytest.raises(ValueError, match="no gas oracle"):
+        FeeEngine(FakeReader()).quote(TOKEN, 1, TRANSFER)
+
+
+def test_bundle_gas_is_quoted_per_transfer():
+    intents = [TransferIntent(transfer_message(nonce), b"\x01" * 65) for nonce in range(3)]
+    (bundle,) = Bundler(max_gas=10**7).bundle(intents)
+    oracle = GasOracle(BatchReader("http://unused"), margin=1.1)
+    oracle.price = 7 * GWEI
+    engine = FeeEngine(FakeReader(), gas_oracle=oracle)
+
+    whole = (BASE_GAS + GAS_PER_TRANSFER * 3) * 7 * GWEI * 11
+    per_transfer = -(-whole // (3 * 10))
+    # every transfer pays _gas, so together the three cover the bundle once
+    assert oracle.gas_fee_for(bundle.data(0)) == per_transfer
+    assert 3 * per_transfer - whole // 10 < 3
+    gas, fee = engine.quote(TOKEN, 10**18, BATCH_TRANSFER, size=3)
+    assert gas == per_transfer
+    assert fee == engine.estimate_fees(TOKEN, 10**18, 0, gas)
+
+
+def test_relayer_feeds_the_oracle():
+    mempool = Mempool()
+    oracle = GasOracle(BatchReader("http://unused"))
+    handlers = dict(mempool.handlers(),
+                    eth_getTransactionReceipt=lambda tx_hash: dict(mempool.receipt(tx_hash), gasUsed=hex(77_000)))
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), Account.create(), 1337, PENIWALLET, poll_interval=0.01,
+                                gas_oracle=oracle) as relayer:
+            await relayer.relay(transfer_call(transfer_message(1), b"\x01" * 65, 0).data)
+            await relayer.relay(b"\x00" * 36)
+
+    with FakeNode(handlers) as node:
+        asyncio.run(run(node.url))
+
+    assert list(oracle._gas[TRANSFER].samples) == [(1, 77_000)]
+    assert oracle.gas_used(TRANSFER) == 77_000
@@ -0,0 +1,218 @@
+from eth_abi import encode
+
+from peniwallet_contracts.indexer import EVENTS_BY_TOPIC, EventIndexer
+from peniwallet_contracts.reads import BatchReader
+from tests.rpc import FakeNode
+
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOPICS = {spec.name: topic for topic, spec in EVENTS_BY_TOPIC.items()}
+
+
+def _topic(kind, value):
+    return "0x" + encode([kind], [value]).hex()
+
+
+def spray_log(block, log_index, sender, receivers, amount=500, code="NWBx76"):
+    return {
+        "blockNumber": hex(block),
+        "logIndex": hex(log_index),
+        "transactionHash": "0x" + f"{block:032x}{log_index:032x}",
+        "topics": [TOPICS["SprayExecuted"], _topic("address", TOKEN), _topic("address", sender)],
+        "data": "0x" + encode(
+            ["address[]", "uint256", "uint256", "string", "string"],
+            [receivers, amount, 1700000000 + block, "Spray", code]).hex(),
+    }
+
+
+def withdrawal_log(block, log_index, dev, amount):
+    return {
+        "blockNumber": hex(block),
+        "logIndex": hex(log_index),
+        "transactionHash": "0x" + f"{block:032x}{log_index:032x}",
+        "topics": [TOPICS["FeeWithdrawn"], _topic("address", dev), _topic("address", TOKEN)],
+        "data": "0x" + encode(["uint256", "uint256"], [amount, 1700000000 + block]).hex(),
+    }
+
+
+class Chain:
+    """
+    Blocks, their hashes and logs, with ``eth_getLogs`` refusing ranges
+    wider than ``max_range``.
+    """
+
+    def __init__(self, height, max_range=10_000):
+        self.height = height
+        self.fork = 0
+        self.fork_point = 0
+        self.logs = []
+        self.max_range = max_range
+        self.ranges = []
+        # fork point of a reorg that happens right after the next eth_getLogs
+        self.reorg_after_logs = None
+
+    def block_hash(self, number):
+        fork = self.fork if number > self.fork_point else 0
+        return "0x" + f"{fork:032x}{number:032x}"
+
+    def reorg(self, fork_point):
+        self.fork += 1
+        self.fork_point = fork_point
+        self.logs = [log for log in self.logs if int(log["blockNumber"], 16) <= fork_point]
+
+    def handlers(self):
+        def get_logs(criteria):
+            start, end = int(criteria["fromBlock"], 16), int(criteria["toBlock"], 16)
+            if end - start + 1 > self.max_range:
+                raise ValueError("query returned more than 10000 results")
+            self.ranges.append((start, end))
+            logs = [
+                dict(log, blockHash=self.block_hash(int(log["blockNumber"], 16))) for log in self.logs
+                if start <= int(log["blockNumber"], 16) <= end and log["topics"][0] in criteria["topics"][0]
+            ]
+            if self.reorg_after_logs is not None:
+                self.reorg(self.reorg_after_logs)
+                self.reorg_after_logs = None
+            return logs
+
+        def get_block(number, full):
+            if int(number, 16) > self.height:
+                return None
+            return {"number": number, "hash": self.block_hash(int(number, 16))}
+
+        return {
+            "eth_blockNumber": lambda: hex(self.height),
+            "eth_getBlockByNumber": get_block,
+            "eth_getLogs": get_logs,
+        }
+
+
+def test_indexes_sprays_and_withdrawals(tmp_path, addresses):
+    chain = Chain(height=5_000)
+    chain.logs = [
+        spray_log(10, 0, addresses[0], addresses[:200]),
+        spray_log(4_000, 3, addresses[1], addresses[150:250], code="ABC"),
+        withdrawal_log(4_500, 1, addresses[2], 10**18),
+    ]
+
+    with FakeNode(chain.handlers()) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET, range_size=1_000) as indexer:
+        assert indexer.sync() == 5_000
+
+        assert [spray["code"] for spray in indexer.sprays_to(addresses[175])] == ["NWBx76", "ABC"]
+        assert [spray["code"] for spray in indexer.sprays_to(addresses[220])] == ["ABC"]
+        assert [spray["block"] for spray in indexer.sprays_by(addresses[1])] == [4_000]
+        assert len(indexer.sprays_of(TOKEN)) == 2
+        assert indexer.spray_recipients(10, 0) == list(addresses[:200])
+        (withdrawal,) = indexer.fee_withdrawals(token=TOKEN)
+        assert withdrawal["dev"] == addresses[2] and int(withdrawal["amount"]) == 10**18
+
+    # ranges grow while the node keeps up: 1000, 2000 and the rest
+    assert chain.ranges == [(0, 999), (1_000, 2_999), (3_000, 5_000)]
+
+
+def test_sync_is_incremental(tmp_path, addresses):
+    chain = Chain(height=100)
+    chain.logs = [spray_log(50, 0, addresses[0], addresses[:3])]
+
+    with FakeNode(chain.handlers()) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET) as indexer:
+        indexer.sync()
+        chain.height = 200
+        chain.logs.append(spray_log(150, 0, addresses[0], addresses[3:6]))
+        chain.ranges.clear()
+        assert indexer.sync() == 200
+
+        assert chain.ranges == [(101, 200)]
+        assert len(indexer.sprays_by(addresses[0])) == 2
+
+
+def test_refused_ranges_are_split(tmp_path, addresses):
+    chain = Chain(height=3_000, max_range=700)
+    chain.logs = [spray_log(2_900, 0, addresses[0], addresses[:3])]
+
+    with FakeNode(chain.handlers()) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET, range_size=2_000) as indexer:
+        assert indexer.sync() == 3_000
+        assert len(indexer.sprays_by(addresses[0])) == 1
+
+    assert all(end - start < 700 for start, end in chain.ranges)
+    assert chain.ranges[0][0] == 0 and chain.ranges[-1][1] == 3_000
+
+
+def test_reorg_rolls_back_to_last_matching_checkpoint(tmp_path, addresses):
+    chain = Chain(height=100)
+    chain.logs = [spray_log(40, 0, addresses[0], addresses[:3])]
+
+    with FakeNode(chain.handlers()) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET) as indexer:
+        indexer.sync()
+        chain.height = 110
+        chain.logs.append(spray_log(105, 0, addresses[0], addresses[3:6], code="orphaned"))
+        indexer.sync()
+        assert len(indexer.sprays_by(addresses[0])) == 2
+
+        # blocks after 100 are replaced, the spray at 105 moves to 108
+        chain.reorg(fork_point=100)
+        chain.height = 112
+        chain.logs.append(spray_log(108, 0, addresses[0], addresses[3:6], code="replayed"))
+        assert indexer.sync() == 112
+
+        assert [spray["code"] for spray in indexer.sprays_by(addresses[0])] == ["NWBx76", "replayed"]
+        assert indexer.spray_recipients(105, 0) == []
+
+
+def test_reorg_while_fetching_logs_is_caught(tmp_path, addresses):
+    chain = Chain(height=100)
+    chain.logs = [spray_log(40, 0, addresses[0], addresses[:3])]
+
+    with FakeNode(chain.handlers()) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET) as indexer:
+        indexer.sync()
+        chain.height = 110
+        chain.logs.append(spray_log(105, 0, addresses[0], addresses[3:6], code="orphaned"))
+        # the logs come from blocks that are replaced as soon as they are served
+        chain.reorg_after_logs = 100
+        indexer.sync()
+
+        chain.logs.append(spray_log(108, 0, addresses[0], addresses[3:6], code="replayed"))
+        assert indexer.sync() == 110
+        assert [spray["code"] for spray in indexer.sprays_by(addresses[0])] == ["NWBx76", "replayed"]
+
+
+def test_parallel_decode_matches_inline(tmp_path, addresses):
+    chain = Chain(height=1_000)
+    chain.logs = [spray_log(block, 0, addresses[block % 7], addresses[block:block + 20]) for block in range(300)]
+
+    results = []
+    for workers in (0, 2):
+        with FakeNode(chain.handlers()) as node, EventIndexer(
+                str(tmp_path / f"events-{workers}.db"), BatchReader(node.url), PENIWALLET,
+                range_size=1_000, decode_workers=workers, parallel_threshold=100) as indexer:
+            indexer.sync()
+            results.append([indexer.spray_recipients(block, 0) for block in range(300)])
+
+    assert results[0] == results[1]
+    assert results[0][299] == list(addresses[299:319])
+
+
+def test_indexes_spray_executed_on_chain(peniwallet, token, accounts, addresses, chain, rpc_url, tmp_path):
+    from tests.test_spray import prepare_spray_data
+
+    receivers = addresses[:5]
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[0])
+    signature, message_data = prepare_spray_data(
+        peniwallet.address, token.address, accounts, receivers, code=f"idx-{chain.blocks.height}")
+    start = chain.blocks.height
+    peniwallet.sprayToken(
+        message_data['token'], message_data['from'], message_data['receivers'], message_data['amount'],
+        "Indexer", message_data['code'], signature, 1, sender=accounts[0])
+
+    with EventIndexer(str(tmp_path / "events.db"), BatchReader(rpc_url), peniwallet.address,
+                      start_block=start) as indexer:
+        indexer.sync()
+        (spray,) = indexer.sprays_by(accounts[0].address)
+
+    assert spray["code"] == message_data['code']
+    assert spray["name"] == "Indexer"
+    assert spray["recipients"] == len(receivers)
@@ -0,0 +1,207 @@
+import time
+
+from eth_abi import decode, encode
+
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.ledger import TRANSFER_TOPIC, FeeLedger
+from peniwallet_contracts.reads import BatchReader, selector
+from tests.rpc import FakeNode
+from tests.test_indexer import TOPICS, _topic
+
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+USER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+DEV = "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29"
+NEW_DEV = "0x58eC9587204FceA311E32BC7674a75443eB8f653"
+
+
+def project_log(block, token, dev):
+    return {
+        "address": PENIWALLET,
+        "blockNumber": hex(block),
+        "blockHash": "0x" + f"{block:064x}",
+        "logIndex": "0x0",
+        "transactionHash": "0x" + f"{block:064x}",
+        "topics": [TOPICS["ProjectRegistered"], _topic("address", dev), _topic("address", token),
+                   _topic("address", DEV)],
+        "data": "0x",
+    }
+
+
+def withdrawal_log(block, token, dev, amount):
+    return {
+        "address": PENIWALLET,
+        "blockNumber": hex(block),
+        "blockHash": "0x" + f"{block:064x}",
+        "logIndex": "0x0",
+        "transactionHash": "0x" + f"{block:064x}",
+        "topics": [TOPICS["FeeWithdrawn"], _topic("address", dev), _topic("address", token)],
+        "data": "0x" + encode(["uint256", "uint256"], [amount, 1700000000]).hex(),
+    }
+
+
+def inflow_log(block, log_index, token, amount):
+    return {
+        "address": token.lower(),
+        "blockNumber": hex(block),
+        "blockHash": "0x" + f"{block:064x}",
+        "logIndex": hex(log_index),
+        "transactionHash": "0x" + f"{block:032x}{log_index:032x}",
+        "topics": [TRANSFER_TOPIC, _topic("address", USER), _topic("address", PENIWALLET)],
+        "data": "0x" + encode(["uint256"], [amount]).hex(),
+    }
+
+
+class Node:
+    """
+    Peniwallet events, token transfers into it and the state reads the
+    ledger makes. ``balances`` and ``fees`` are keyed by lower-case addresses.
+    """
+
+    def __init__(self, height, events, inflows, balances, fees, reverting=()):
+        self.height = height
+        self.events = events
+        self.inflows = inflows
+        self.balances = balances
+        self.fees = fees
+        self.reverting = {token.lower() for token in reverting}
+        self.call_blocks = set()
+
+    def get_logs(self, criteria):
+        start, end = int(criteria["fromBlock"], 16), int(criteria["toBlock"], 16)
+        logs = self.inflows if criteria["topics"][0] == TRANSFER_TOPIC else self.events
+        return [log for log in logs if start <= int(log["blockNumber"], 16) <= end]
+
+    def eth_call(self, transaction, block):
+        self.call_blocks.add(block)
+        to = transaction["to"].lower()
+        data = bytes.fromhex(transaction["data"][2:])
+        if data[:4] == selector("balanceOf(address)"):
+            if to in self.reverting:
+                raise ValueError("execution reverted")
+            return "0x" + encode(["uint256"], [self.balances.get(to, 0)]).hex()
+        if data[:4] == selector("fees(address,address)"):
+            owner, token = decode(["address", "address"], data[4:])
+            balance = self.fees.get((owner, token), 0)
+            return "0x" + encode(["address", "address", "uint256", "uint256"], [owner, token, balance, 0]).hex()
+        raise ValueError("unknown call")
+
+    def handlers(self):
+        return {
+            "eth_blockNumber": lambda: hex(self.height),
+            "eth_getBlockByNumber": lambda number, full: {"hash": "0x" + f"{int(number, 16):064x}"},
+            "eth_getLogs": self.get_logs,
+            "eth_call": self.eth_call,
+        }
+
+
+def _ledger(tmp_path, node_url, confirmations=0):
+    indexer = EventIndexer(str(tmp_path / "events.db"), BatchReader(node_url), PENIWALLET)
+    indexer.sync()
+    return indexer, FeeLedger(indexer, confirmations=confirmations)
+
+
+def test_reconcile_reports_drift_per_token(tmp_path, addresses):
+    balanced, surplus, broken = addresses[:3]
+    peniwallet = PENIWALLET.lower()
+    node = Node(
+        height=500,
+        events=[
+            project_log(10, balanced, DEV),
+            project_log(20, balanced, NEW_DEV),
+            withdrawal_log(300, balanced, DEV, 40),
+        ],
+        inflows=[
+            inflow_log(100, 0, balanced, 1_000),
+            inflow_log(101, 0, surplus, 500),
+            inflow_log(102, 0, broken, 5),
+        ],
+        balances={balanced.lower(): 960, surplus.lower(): 500},
+        fees={
+            (peniwallet, balanced.lower()): 900,
+            (DEV.lower(), balanced.lower()): 0,
+            (NEW_DEV.lower(), balanced.lower()): 60,
+            (peniwallet, surplus.lower()): 450,
+        },
+        reverting=[broken],
+    )
+
+    with FakeNode(node.handlers()) as fake:
+        indexer, ledger = _ledger(tmp_path, fake.url)
+        assert ledger.sync() == 500
+        report = {entry.token: entry for entry in ledger.reconcile()}
+        drifted = ledger.drifted()
+
+    assert report[balanced].drift == 0
+    assert (report[balanced].admin_fees, report[balanced].dev_fees) == (900, 60)
+    assert (report[balanced].inflow, report[balanced].withdrawn) == (1_000, 40)
+    assert report[surplus].drift == 50
+    assert report[broken].error == "execution reverted"
+    assert [entry.token for entry in drifted] == sorted([surplus, broken])
+    assert node.call_blocks == {hex(500)}
+    indexer.close()
+
+
+def test_sync_is_incremental_and_stays_behind_confirmations(tmp_path, addresses):
+    token = addresses[0]
+    node = Node(height=100, events=[], inflows=[inflow_log(95, 0, token, 7)], balances={}, fees={})
+
+    with FakeNode(node.handlers()) as fake:
+        indexer, ledger = _ledger(tmp_path, fake.url, confirmations=10)
+        assert ledger.sync() == 90
+        assert ledger.tokens() == []
+
+        node.height = 200
+        node.inflows.append(inflow_log(150, 0, token, 3))
+        indexer.sync()
+        assert ledger.sync() == 190
+        (entry,) = ledger.reconcile()
+
+    assert entry.inflow == 10
+    indexer.close()
+
+
+def test_reconciles_thousands_of_tokens(tmp_path, addresses):
+    tokens = list(addresses[:3_000])
+    node = Node(
+        height=10,
+        events=[],
+        inflows=[inflow_log(5, i, token, 100) for i, token in enumerate(tokens)],
+        balances={token.lower(): 100 for token in tokens},
+        fees={(PENIWALLET.lower(), token.lower()): 100 for token in tokens},
+    )
+
+    with FakeNode(node.handlers()) as fake:
+        indexer, ledger = _ledger(tmp_path, fake.url)
+        ledger.sync()
+        start = time.perf_counter()
+        report = ledger.reconcile()
+        elapsed = time.perf_counter() - start
+
+    assert len(report) == 3_000 and not [entry for entry in report if entry.drift]
+    assert elapsed < 20
+    indexer.close()
+
+
+def test_ledger_balances_on_chain(peniwallet, token, accounts, chain, rpc_url, tmp_path):
+    from tests.test_transfer import prepare_transfer_data
+
+    start = chain.blocks.height
+    peniwallet.registerProject(token.address, accounts[2].address, sender=accounts[0])
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    nonce = peniwallet.getNonce(accounts[1].address)
+    signature, message_data = prepare_transfer_data(
+        peniwallet.address, token.address, accounts, nonce, amount=10**21)
+    peniwallet.transfer(
+        message_data['token'], message_data['from'], message_data['to'], message_data['amount'],
+        message_data['nonce'], message_data['deadline'], signature, 21000, sender=accounts[1])
+
+    with EventIndexer(str(tmp_path / "events.db"), BatchReader(rpc_url), peniwallet.address,
+                      start_block=start) as indexer:
+        indexer.sync()
+        ledger = FeeLedger(indexer, confirmations=0)
+        ledger.sync()
+        (entry,) = ledger.reconcile()
+
+    assert entry.token == token.address
+    assert entry.inflow == entry.balance > 0
+    assert entry.drift == 0
@@ -0,0 +1,169 @@
+import asyncio
+import time
+import urllib.request
+
+import pytest
+from eth_account import Account
+
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.fees import TRANSFER, FeeEngine
+from peniwallet_contracts.metrics import (
+    ABI_ENCODE,
+    BROADCAST,
+    CONTENT_TYPE,
+    EIP712_ENCODE,
+    FEE_ESTIMATE,
+    NONCE_READ,
+    RECEIPT_WAIT,
+    SIGN,
+    SIGN_TRANSACTION,
+    Metrics,
+    serve,
+)
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+from peniwallet_contracts.signing import BatchSigner
+from tests.rpc import FakeNode
+from tests.test_fee_engine import TOKEN, FakeReader
+from tests.test_preflight import PENIWALLET, transfer_message
+from tests.test_relayer import Mempool
+from tests.test_signing import CHAIN_ID, CONTRACT, KEYS
+from tests.test_signing import transfer_message as signing_message
+
+
+def test_histogram_buckets_and_quantiles():
+    metrics = Metrics(stages=["step"], buckets=[0.001, 0.01, 0.1])
+    for value in [0.0005, 0.001, 0.002, 0.05, 3]:
+        metrics.record("step", 0, value)
+
+    snapshot = metrics.snapshot()["step"]
+
+    # a value on a bound falls in that bound's bucket, as Prometheus' le does
+    assert snapshot.buckets == ((0.001, 2), (0.01, 3), (0.1, 4), (float("inf"), 5))
+    assert snapshot.runs == 5 and snapshot.mean == pytest.approx(3.0535 / 5)
+    assert snapshot.quantile(0.5) == 0.01 and snapshot.quantile(1) == float("inf")
+    with pytest.raises(ValueError, match="Unknown stage"):
+        metrics.span("other")
+
+
+def test_errors_are_counted_and_raised():
+    metrics = Metrics(sample_rate=1)
+
+    with pytest.raises(RuntimeError):
+        with metrics.trace() as trace, metrics.span(SIGN):
+            raise RuntimeError("no key")
+
+    assert metrics.snapshot()[SIGN].errors == 1
+    assert [(span.trace, span.stage, span.error) for span in metrics.drain()] == [(trace, SIGN, True)]
+    assert not metrics.spans
+
+
+def test_only_sampled_traces_keep_spans():
+    metrics = Metrics(sample_rate=0.25)
+    draws = iter([0.1, 0.9, 0.2, 0.5])
+    metrics._random = lambda: next(draws)
+
+    traces = []
+    for _ in range(4):
+        with metrics.trace() as trace:
+            traces.append(trace)
+            with metrics.trace() as nested:
+                assert nested == trace
+            with metrics.span(FEE_ESTIMATE):
+                pass
+    with metrics.span(FEE_ESTIMATE):
+        pass
+
+    assert traces == [1, None, 2, None] and metrics.sampled == 2
+    assert [span.trace for span in metrics.drain()] == [1, 2]
+    assert metrics.snapshot()[FEE_ESTIMATE].runs == 5
+
+
+def test_exposition_format():
+    metrics = Metrics(stages=[SIGN, BROADCAST], buckets=[0.01, 1])
+    metrics.record(SIGN, 0, 0.005)
+    metrics.record(BROADCAST, 0, 2.5, error=True)
+
+    text = metrics.exposition()
+
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert lines[:2] == ["# HELP peniwallet_stage_seconds Time spent in each stage of the signing and relay pipeline.",
+                         "# TYPE peniwallet_stage_seconds histogram"]
+    assert 'peniwallet_stage_seconds_bucket{stage="sign",le="0.01"} 1' in lines
+    assert 'peniwallet_stage_seconds_bucket{stage="broadcast",le="1.0"} 0' in lines
+    assert 'peniwallet_stage_seconds_bucket{stage="broadcast",le="+Inf"} 1' in lines
+    assert 'peniwallet_stage_seconds_sum{stage="broadcast"} 2.5' in lines
+    assert 'peniwallet_stage_errors_total{stage="broadcast"} 1' in lines
+
+    server = serve(metrics, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert response.read().decode() == text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_signer_and_fee_engine_stages():
+    metrics = Metrics(sample_rate=1)
+    signer = BatchSigner(KEYS, CHAIN_ID, CONTRACT, workers=0, metrics=metrics)
+    engine = FeeEngine(FakeReader(), metrics=metrics)
+    sender = Account.from_key(KEYS[0]).address
+
+    with metrics.trace():
+        signer.sign(TransferTransaction, [signing_message(sender, nonce) for nonce in range(3)])
+        engine.estimate_fees(TOKEN, 10**21, TRANSFER, 21_000)
+
+    assert [span.stage for span in metrics.drain()] == [EIP712_ENCODE, SIGN] * 3 + [FEE_ESTIMATE]
+
+
+def test_signer_workers_report_their_stages():
+    metrics = Metrics()
+    sender = Account.from_key(KEYS[0]).address
+
+    with BatchSigner(KEYS, CHAIN_ID, CONTRACT, workers=2, chunksize=2, metrics=metrics) as signer:
+        signer.sign(TransferTransaction, [signing_message(sender, nonce) for nonce in range(5)])
+
+    snapshot = metrics.snapshot()
+    assert snapshot[EIP712_ENCODE].runs == snapshot[SIGN].runs == 5
+    assert snapshot[EIP712_ENCODE].total > 0 and snapshot[SIGN].total > 0
+
+
+def test_relayer_stages_share_the_trace():
+    mempool = Mempool()
+    metrics = Metrics(sample_rate=1)
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), Account.create(), 1337, PENIWALLET, poll_interval=0.01,
+                                gas_price=1, metrics=metrics) as relayer:
+            with metrics.trace() as first:
+                await relayer.transfer(transfer_message(1), b"\x01" * 65, 0)
+            with metrics.trace() as second:
+                await relayer.transfer(transfer_message(2), b"\x01" * 65, 0)
+            return first, second
+
+    with FakeNode(mempool.handlers()) as node:
+        first, second = asyncio.run(run(node.url))
+
+    spans = [(span.trace, span.stage) for span in metrics.drain()]
+    assert spans == [
+        (first, ABI_ENCODE), (first, NONCE_READ), (first, SIGN_TRANSACTION), (first, BROADCAST),
+        (first, RECEIPT_WAIT),
+        (second, ABI_ENCODE), (second, SIGN_TRANSACTION), (second, BROADCAST), (second, RECEIPT_WAIT),
+    ]
+    assert metrics.snapshot()[RECEIPT_WAIT].runs == 2
+
+
+def test_span_overhead():
+    metrics = Metrics(sample_rate=0.01)
+
+    start = time.perf_counter()
+    for _ in range(10_000):
+        with metrics.trace():
+            with metrics.span(SIGN):
+                pass
+    per_span = (time.perf_counter() - start) / 10_000
+
+    assert per_span < 20e-6
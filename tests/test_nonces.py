@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_account import Account
+
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.nonces import NonceAllocator, NonceManager
+
+
+class FakePeniwallet:
+    """
+    Applies checkNonce: a call only goes through with the current nonce.
+    """
+
+    def __init__(self):
+        self.nonces = {}
+        self.lock = threading.Lock()
+
+    def getNonce(self, address):
+        return self.nonces.get(address, 0)
+
+    def transfer(self, address, nonce):
+        with self.lock:
+            if nonce != self.getNonce(address):
+                raise ValueError("Invalid nonce")
+            self.nonces[address] = nonce + 1
+
+
+def test_concurrent_reservations_are_unique():
+    peniwallet = FakePeniwallet()
+    peniwallet.nonces["0xabc"] = 5
+    allocator = NonceAllocator(peniwallet.getNonce)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        nonces = list(pool.map(lambda _: allocator.reserve("0xabc"), range(1000)))
+
+    assert sorted(nonces) == list(range(5, 1005))
+    assert allocator.fetches == 1
+
+
+def test_resync_only_after_failure_or_gap():
+    peniwallet = FakePeniwallet()
+    allocator = NonceAllocator(peniwallet.getNonce)
+
+    for nonce in allocator.reserve_many("0xabc", 3):
+        peniwallet.transfer("0xabc", nonce)
+        allocator.confirm("0xabc", nonce)
+    assert allocator.reserve("0xabc") == 3
+    assert allocator.fetches == 1
+
+    # nonce 3 reverts, so 4 would be rejected too
+    allocator.fail("0xabc", 3)
+    assert allocator.reserve("0xabc") == 3
+    assert allocator.fetches == 2
+
+    # another relayer used nonce 3 and 4 behind our back
+    peniwallet.transfer("0xabc", 3)
+    peniwallet.transfer("0xabc", 4)
+    allocator.confirm("0xabc", 4)
+    assert allocator.reserve("0xabc") == 5
+    assert allocator.fetches == 3
+    assert allocator.outstanding("0xabc") == [5]
+
+
+def test_intent_and_account_nonces_are_separate():
+    manager = NonceManager(lambda address: 10, lambda address: 200)
+
+    assert manager.intents.reserve("0xabc") == 10
+    assert manager.transactions.reserve("0xabc") == 200
+    assert manager.intents.reserve("0xABC") == 11
+
+
+def test_nonce_stress_on_chain(peniwallet, token, accounts, chain):
+    account = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    manager = NonceManager(peniwallet.getNonce, lambda address: accounts[1].nonce)
+    start = peniwallet.getNonce(account.address)
+    deadline = chain.pending_timestamp + 3600
+
+    def sign(nonce, amount=500):
+        message = {
+            'token': token.address,
+            'from': account.address,
+            'to': accounts[0].address,
+            'amount': amount,
+            'nonce': nonce,
+            'deadline': deadline,
+        }
+        signable = TransferTransaction.signable(message, chain.chain_id, peniwallet.address)
+        return message, account.sign_message(signable).signature
+
+    # reserve and sign a burst of intents concurrently, without chain reads
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        signed = list(pool.map(lambda _: sign(manager.intents.reserve(account.address)), range(20)))
+    assert manager.intents.fetches == 1
+
+    for message, signature in sorted(signed, key=lambda item: item[0]['nonce']):
+        peniwallet.transfer(*message.values(), signature, 21000, sender=accounts[1])
+        manager.intents.confirm(account.address, message['nonce'])
+
+    assert peniwallet.getNonce(account.address) == start + 20
+    assert manager.intents.reserve(account.address) == start + 20
+    assert manager.intents.fetches == 1
@@ -0,0 +1,123 @@
+import pytest
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+from web3 import Web3
+
+from peniwallet_contracts.deploy import add_liquidity, deploy_peniwallet
+from peniwallet_contracts.pairsync import PairSync, contract_sender
+from peniwallet_contracts.reads import BatchReader, selector
+from tests.rpc import FakeNode
+
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+FACTORY = "0x" + "fa" * 20
+WETH = "0x" + "bb" * 20
+USDT = "0x" + "dd" * 20
+ZERO = "0x" + "00" * 20
+
+
+def pair(token, quote):
+    return to_checksum_address("0x" + token[2:12] + quote[2:32])
+
+
+class Chain:
+    """
+    The factory and Peniwallet's feePairs cache, as seen through eth_call.
+    """
+
+    def __init__(self, pairs, cached):
+        self.pairs = pairs
+        self.cached = cached
+
+    def eth_call(self, transaction, block):
+        data = bytes.fromhex(transaction["data"][2:])
+        to = transaction["to"].lower()
+        if to == PENIWALLET.lower():
+            getters = {selector(f"{name}()"): value for name, value in [
+                ("PancakeSwapFactoryAddress", FACTORY), ("WETH", WETH), ("USDT", USDT)]}
+            if data[:4] in getters:
+                return "0x" + encode(["address"], [getters[data[:4]]]).hex()
+            assert data[:4] == selector("feePairs(address)")
+            (token,) = decode(["address"], data[4:])
+            return "0x" + encode(["address", "address"], self.cached.get(token, (ZERO, ZERO))).hex()
+        assert to == FACTORY and data[:4] == selector("getPair(address,address)")
+        token, quote = decode(["address", "address"], data[4:])
+        found = pair(token, quote) if (token, quote) in self.pairs else ZERO
+        return "0x" + encode(["address"], [found]).hex()
+
+
+def test_only_stale_tokens_are_sent_in_chunks():
+    tokens = ["0x" + f"{i:02x}" * 20 for i in range(1, 8)]
+    pairs = {(token, WETH) for token in tokens[:5]} | {(tokens[5], USDT)}
+    cached = {token: (pair(token, WETH), ZERO) for token in tokens[:2]}
+    # a WBNB pair created after the token was cached with only its USDT pair
+    pairs.add((tokens[6], WETH))
+    pairs.add((tokens[6], USDT))
+    cached[tokens[6]] = (ZERO, pair(tokens[6], USDT))
+    chain = Chain(pairs, cached)
+    sent = []
+
+    with FakeNode({"eth_call": chain.eth_call}) as node:
+        sync = PairSync(BatchReader(node.url), PENIWALLET, chunk_size=2)
+        states = sync.discover(tokens)
+        sync.sync(tokens, sent.append)
+
+    assert states[5].usdt_pair == pair(tokens[5], USDT) and states[5].bnb_pair == ZERO
+    assert [state.stale for state in states] == [False, False, True, True, True, True, True]
+    assert sent == [
+        [to_checksum_address(tokens[2]), to_checksum_address(tokens[3])],
+        [to_checksum_address(tokens[4]), to_checksum_address(tokens[5])],
+        [to_checksum_address(tokens[6])],
+    ]
+    # one batch for the config and one for all the tokens, twice
+    assert node.batches == [3, 21, 3, 21]
+
+
+def test_cached_pairs_give_the_same_fees(peniwallet, token, exchange, accounts):
+    amount = Web3.to_wei(1000, 'ether')
+    uncached = [peniwallet.estimateFees(token.address, amount, tx_type, 21000) for tx_type in range(3)]
+
+    contract_sender(peniwallet, sender=accounts[0])([token.address])
+
+    assert peniwallet.WETH() == exchange.weth.address
+    assert peniwallet.PancakeSwapFactoryAddress() == exchange.factory.address
+    assert peniwallet.feePairs(token.address) == (
+        exchange.factory.getPair(token.address, exchange.weth.address),
+        exchange.factory.getPair(token.address, exchange.usdt.address),
+    )
+    assert [peniwallet.estimateFees(token.address, amount, tx_type, 21000) for tx_type in range(3)] == uncached
+
+
+def test_deploy_needs_a_live_router(project, exchange, accounts):
+    with pytest.raises(ValueError, match="No PancakeSwap router"):
+        deploy_peniwallet(project, accounts[0], accounts[5].address, exchange.usdt.address)
+    # the constructor refuses it too, for deployments not made through deploy_peniwallet
+    with pytest.raises(Exception, match="router has no code"):
+        project.Peniwallet.deploy(1700, 2000, 5000, accounts[5].address, exchange.usdt.address, sender=accounts[0])
+
+
+def test_register_project_caches_pairs(peniwallet, token, exchange, accounts):
+    tx = peniwallet.registerProject(token.address, accounts[1].address, sender=accounts[0])
+
+    pairs = (
+        exchange.factory.getPair(token.address, exchange.weth.address),
+        exchange.factory.getPair(token.address, exchange.usdt.address),
+    )
+    assert peniwallet.feePairs(token.address) == pairs
+    assert [(event.event_name, event.bnbPair, event.usdtPair) for event in tx.events
+            if event.event_name == "PairsCached"] == [("PairsCached", *pairs)]
+
+
+def test_register_project_without_pairs(project, peniwallet, exchange, accounts):
+    other = project.MockERC20.deploy("Other", "OTH", 18, sender=accounts[0])
+    other.mint(accounts[0].address, 10**24, sender=accounts[0])
+
+    tx = peniwallet.registerProject(other.address, accounts[1].address, sender=accounts[0])
+
+    # nothing to cache yet, the factory is asked again on every fee calculation
+    assert int(peniwallet.feePairs(other.address)[1], 16) == 0
+    assert not [event for event in tx.events if event.event_name == "PairsCached"]
+    add_liquidity(project, exchange, accounts[0], other, 10**21, exchange.usdt, 10**21)
+    uncached = peniwallet.estimateFees(other.address, 10**18, 0, 21000)
+    contract_sender(peniwallet, sender=accounts[0])([other.address])
+    assert peniwallet.feePairs(other.address)[1] == exchange.factory.getPair(other.address, exchange.usdt.address)
+    assert peniwallet.estimateFees(other.address, 10**18, 0, 21000) == uncached
@@ -0,0 +1,216 @@
+import asyncio
+
+from eth_abi import decode, encode
+from eth_account import Account
+
+from peniwallet_contracts.calldata import SPRAY_TOKEN, TRANSFER
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.fees import SPRAY
+from peniwallet_contracts.preflight import (
+    BAD_NONCE,
+    EXPIRED,
+    INSUFFICIENT_BALANCE,
+    OK,
+    REVERTED,
+    RPC_ERROR,
+    SPRAY_REPLAYED,
+    Preflight,
+    classify,
+    revert_reason,
+    spray_token_call,
+    transfer_call,
+)
+from peniwallet_contracts.reads import selector
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+from tests.rpc import FakeNode
+from tests.test_relayer import Mempool
+
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+USER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+RELAYER = Account.from_key("0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0")
+NOW = 1_700_000_000
+
+
+def transfer_message(nonce, deadline=NOW + 3600, amount=500):
+    return {
+        'token': TOKEN,
+        'from': USER,
+        'to': RELAYER.address,
+        'amount': amount,
+        'nonce': nonce,
+        'deadline': deadline,
+    }
+
+
+def spray_message(code):
+    return {'token': TOKEN, 'from': USER, 'receivers': [RELAYER.address] * 3, 'amount': 10, 'code': code}
+
+
+def error_string(reason):
+    return "0x08c379a0" + encode(["string"], [reason]).hex()
+
+
+class Contract:
+    """
+    Peniwallet as seen through eth_call: nonce 7 is next, spray code
+    "used" was executed, balances cover 1000 tokens.
+    """
+
+    def __init__(self):
+        self.blocks = []
+
+    def eth_call(self, transaction, block):
+        self.blocks.append(block)
+        data = bytes.fromhex(transaction["data"][2:])
+        if data[:4] == selector("estimateFees(address,uint256,uint256,uint256)"):
+            _, amount, tx_type, gas = decode(["address", "uint256", "uint256", "uint256"], data[4:])
+            return "0x" + encode(["uint256"], [amount * 17 // 1000 + gas]).hex()
+        if data[:4] == selector(TRANSFER):
+            _, _, _, amount, nonce, deadline, _, _ = decode(
+                ["address", "address", "address", "uint256", "uint256", "uint256", "bytes", "uint256"], data[4:])
+            if nonce != 7:
+                raise ValueError("execution reverted: Invalid nonce")
+            if deadline < NOW:
+                raise ValueError("execution reverted: Transaction has expired")
+            if amount > 1000:
+                raise ValueError("execution reverted: Insufficient balance for amount + fee")
+            return "0x"
+        if data[:4] == selector(SPRAY_TOKEN):
+            values = decode(
+                ["address", "address", "address[]", "uint256", "string", "string", "bytes", "uint256"], data[4:])
+            if values[5] == "used":
+                raise ValueError("execution reverted: Spray already executed")
+            return "0x" + encode(["bool"], [True]).hex()
+        raise ValueError("method handler crashed")
+
+
+def test_revert_reason_from_payload_and_message():
+    assert revert_reason({"code": 3, "message": "execution reverted", "data": error_string("Invalid nonce")}) == \
+        "Invalid nonce"
+    assert revert_reason({"message": "VM Exception while processing transaction: revert Transaction has expired",
+                          "data": {"0xabc": {"error": "revert", "return": error_string("Transaction has expired")}}}) == \
+        "Transaction has expired"
+    assert revert_reason({"message": "execution reverted: insufficient allowance"}) == "insufficient allowance"
+
+
+def test_classify():
+    assert classify("Insufficient balance for amount + fee") == INSUFFICIENT_BALANCE
+    # sprayToken uses lower case reasons
+    assert classify("insufficient balance") == INSUFFICIENT_BALANCE
+    assert classify("Spray already executed") == SPRAY_REPLAYED
+    assert classify("Invalid nonce") == BAD_NONCE
+    assert classify("something else") == REVERTED
+
+
+def test_check_classifies_each_call():
+    contract = Contract()
+    calls = [
+        transfer_call(transfer_message(7), b"\x01" * 65, 21000),
+        transfer_call(transfer_message(6), b"\x01" * 65, 21000),
+        transfer_call(transfer_message(7, deadline=NOW - 1), b"\x01" * 65, 21000),
+        transfer_call(transfer_message(7, amount=5000), b"\x01" * 65, 21000),
+        spray_token_call(spray_message("fresh"), "Spray", b"\x01" * 65, 21000),
+        spray_token_call(spray_message("used"), "Spray", b"\x01" * 65, 21000),
+    ]
+
+    async def run(url):
+        transport = HTTPTransport(url)
+        try:
+            return await Preflight(transport, PENIWALLET, RELAYER.address).check(calls)
+        finally:
+            await transport.close()
+
+    with FakeNode({"eth_call": contract.eth_call}) as node:
+        results = asyncio.run(run(node.url))
+
+    assert [result.code for result in results] == [OK, BAD_NONCE, EXPIRED, INSUFFICIENT_BALANCE, OK, SPRAY_REPLAYED]
+    assert results[1].reason == "Invalid nonce"
+    # fees are quoted even for failing calls, sprays on the whole amount
+    assert results[0].fee == 500 * 17 // 1000 + 21000
+    assert results[4].fee == 30 * 17 // 1000 + 21000
+    assert calls[4].tx_type == SPRAY
+    assert set(contract.blocks) == {"pending"}
+    assert node.batches == [12]
+
+
+def test_non_revert_errors_are_rpc_errors():
+    contract = Contract()
+
+    async def run(url):
+        transport = HTTPTransport(url)
+        try:
+            call = transfer_call(transfer_message(7), b"\x01" * 65, 21000)
+            return await Preflight(transport, PENIWALLET, RELAYER.address).check([call._replace(data=b"\xff" * 4)])
+        finally:
+            await transport.close()
+
+    with FakeNode({"eth_call": contract.eth_call}) as node:
+        (result,) = asyncio.run(run(node.url))
+
+    assert result.code == RPC_ERROR and not result.ok
+
+
+def test_send_checked_only_broadcasts_passing_calls():
+    contract = Contract()
+    mempool = Mempool()
+    calls = [
+        transfer_call(transfer_message(7), b"\x01" * 65, 21000),
+        transfer_call(transfer_message(7, deadline=NOW - 1), b"\x01" * 65, 21000),
+    ]
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), RELAYER, 1337, PENIWALLET, poll_interval=0.01) as relayer:
+            sent = await relayer.send_checked(calls)
+            for _, tx_hash in sent:
+                if tx_hash is not None:
+                    await relayer.wait(tx_hash, timeout=5)
+            return sent
+
+    with FakeNode(dict(mempool.handlers(), eth_call=contract.eth_call)) as node:
+        sent = asyncio.run(run(node.url))
+
+    assert [result.code for result, _ in sent] == [OK, EXPIRED]
+    assert sent[0][1] is not None and sent[1][1] is None
+    assert mempool.sent == [7]
+
+
+def test_preflight_matches_contract(peniwallet, token, accounts, chain, rpc_url):
+    user = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    nonce = peniwallet.getNonce(user.address)
+
+    def signed(message):
+        signature = user.sign_message(TransferTransaction.signable(message, chain.chain_id, peniwallet.address))
+        return transfer_call(message, signature.signature, 21000)
+
+    def message(**changes):
+        base = {
+            'token': token.address,
+            'from': user.address,
+            'to': accounts[0].address,
+            'amount': 10**18,
+            'nonce': nonce,
+            'deadline': chain.pending_timestamp + 3600,
+        }
+        base.update(changes)
+        return base
+
+    calls = [
+        signed(message()),
+        signed(message(nonce=nonce + 5)),
+        signed(message(deadline=chain.pending_timestamp - 3600)),
+        signed(message(amount=token.totalSupply())),
+    ]
+
+    async def run():
+        transport = HTTPTransport(rpc_url)
+        try:
+            return await Preflight(transport, peniwallet.address, accounts[0].address).check(calls)
+        finally:
+            await transport.close()
+
+    results = asyncio.run(run())
+
+    assert [result.code for result in results] == [OK, BAD_NONCE, EXPIRED, INSUFFICIENT_BALANCE]
+    assert results[0].fee == peniwallet.estimateFees(token.address, 10**18, 0, 21000)
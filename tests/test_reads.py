@@ -0,0 +1,60 @@
+from eth_abi import decode, encode
+
+from peniwallet_contracts.reads import BatchReader, Fee, call, selector
+from tests.rpc import FakeNode
+
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+REVERTING = "0x000000000000000000000000000000000000dEaD"
+
+
+def eth_call(transaction, block):
+    data = bytes.fromhex(transaction["data"][2:])
+    if data[:4] == selector("balanceOf(address)"):
+        (holder,) = decode(["address"], data[4:])
+        if holder == REVERTING.lower():
+            raise ValueError("execution reverted")
+        return "0x" + encode(["uint256"], [int(holder, 16) % 1000]).hex()
+    if data[:4] == selector("fees(address,address)"):
+        owner, token = decode(["address", "address"], data[4:])
+        return "0x" + encode(["address", "address", "uint256", "uint256"], [owner, token, 5, 6]).hex()
+    raise ValueError("unknown call")
+
+
+def test_balances_in_order_and_chunked(addresses):
+    holders = addresses[:1234]
+
+    with FakeNode({"eth_call": eth_call}) as node:
+        reader = BatchReader(node.url, chunk_size=100, concurrency=4)
+        balances = reader.balances(TOKEN, holders)
+
+    assert balances == [int(holder, 16) % 1000 for holder in holders]
+    assert sorted(node.batches) == [34] + [100] * 12
+
+
+def test_failed_calls_do_not_fail_the_batch(addresses):
+    with FakeNode({"eth_call": eth_call}) as node:
+        results = BatchReader(node.url).execute([
+            call(TOKEN, "balanceOf(address)", [addresses[0]]),
+            call(TOKEN, "balanceOf(address)", [REVERTING]),
+            call(PENIWALLET, "fees(address,address)", [addresses[1], TOKEN],
+                 ("address", "address", "uint256", "uint256"), Fee),
+        ])
+
+    assert results[0].success and results[0].value == int(addresses[0], 16) % 1000
+    assert not results[1].success and results[1].error == "execution reverted"
+    assert results[2].value == Fee(addresses[1], TOKEN, 5, 6)
+
+
+def test_batched_reads_match_contract(peniwallet, token, accounts, addresses, rpc_url):
+    receivers = addresses[:200]
+    reader = BatchReader(rpc_url, chunk_size=50)
+
+    assert reader.balances(token.address, receivers) == [token.balanceOf(address) for address in receivers]
+    users = [account.address for account in accounts]
+    assert reader.nonces(peniwallet.address, users) == [peniwallet.getNonce(user) for user in users]
+    assert reader.admins(peniwallet.address, users) == [peniwallet.admins(user) for user in users]
+    assert reader.allowances(token.address, [(user, peniwallet.address) for user in users]) == [
+        token.allowance(user, peniwallet.address) for user in users]
+    assert [fee.balance for fee in reader.fees_by_address(peniwallet.address, [(peniwallet.address, token.address)])] == [
+        peniwallet.getFeeByAddress(peniwallet.address, token.address).balance]
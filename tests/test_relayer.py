@@ -0,0 +1,306 @@
+import asyncio
+
+import aiohttp
+import pytest
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_utils import keccak
+
+from peniwallet_contracts.bundler import Bundler
+from peniwallet_contracts.calldata import encode_transfer
+from peniwallet_contracts.eip712 import TransferTransaction
+from peniwallet_contracts.reads import RPCError
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport, transport_for
+from tests.rpc import FakeNode
+
+PENIWALLET = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+
+
+class Mempool:
+    """
+    Node side of the relay: accepts raw transactions with the expected
+    nonce, mines them on the next receipt poll.
+    """
+
+    def __init__(self, start_nonce=7, pending=0, reject_first=None):
+        self.start = self.nonce = start_nonce
+        self.pending = pending
+        self.reject_first = reject_first
+        self.sent = []
+        self.gas_limits = []
+        self.hashes = set()
+        self.in_flight = set()
+        self.max_in_flight = 0
+
+    def handlers(self):
+        return {
+            "eth_getTransactionCount": lambda address, block: hex(self.nonce),
+            "eth_gasPrice": lambda: hex(10**9),
+            "txpool_status": self.txpool_status,
+            "eth_sendRawTransaction": self.send_raw,
+            "eth_getTransactionReceipt": self.receipt,
+            "eth_getTransactionByHash": lambda tx_hash: {"hash": tx_hash} if tx_hash in self.hashes else None,
+        }
+
+    def txpool_status(self):
+        self.pending = max(self.pending - 1, 0)
+        return {"pending": hex(self.pending), "queued": "0x0"}
+
+    def send_raw(self, raw):
+        if self.reject_first:
+            error, self.reject_first = self.reject_first, None
+            raise ValueError(error)
+        tx = Transaction.from_bytes(bytes.fromhex(raw[2:]))
+        # future nonces are queued by the node, used ones are rejected
+        if tx.nonce < self.start or tx.nonce in self.sent:
+            raise ValueError("nonce too low")
+        while self.nonce in self.sent or self.nonce == tx.nonce:
+            self.nonce += 1
+        tx_hash = "0x" + keccak(bytes.fromhex(raw[2:])).hex()
+        self.sent.append(tx.nonce)
+        self.gas_limits.append(tx.gas)
+        self.hashes.add(tx_hash)
+        self.in_flight.add(tx_hash)
+        self.max_in_flight = max(self.max_in_flight, len(self.in_flight))
+        return tx_hash
+
+    def receipt(self, tx_hash):
+        self.in_flight.discard(tx_hash)
+        return {"transactionHash": tx_hash, "status": "0x1"}
+
+
+def relay_many(mempool, count, **kwargs):
+    async def run():
+        with FakeNode(mempool.handlers()) as node:
+            async with AsyncRelayer(
+                HTTPTransport(node.url), Account.create(), 1337, PENIWALLET, poll_interval=0.01, **kwargs
+            ) as relayer:
+                return await asyncio.gather(*(relayer.relay(b"\x00" * 36) for _ in range(count)))
+
+    return asyncio.run(run())
+
+
+def test_relay_concurrently_within_window():
+    mempool = Mempool()
+    receipts = relay_many(mempool, 40, window=5)
+
+    assert len(receipts) == 40 and all(receipt["status"] == "0x1" for receipt in receipts)
+    assert sorted(mempool.sent) == list(range(7, 47))
+    assert mempool.max_in_flight <= 5
+
+
+def test_backpressure_and_retries():
+    mempool = Mempool(pending=20, reject_first="txpool is full")
+    relay_many(mempool, 10, window=4, max_pending=10)
+
+    assert sorted(mempool.sent) == list(range(7, 17))
+    assert mempool.pending <= 10
+
+
+def test_unexpected_errors_are_raised():
+    mempool = Mempool(reject_first="insufficient funds for gas * price + value")
+
+    with pytest.raises(RPCError, match="insufficient funds"):
+        relay_many(mempool, 1)
+
+
+class FlakyTransport(HTTPTransport):
+    """
+    Raises the exception given for a method (or ``"batch"``) on its first
+    call, then talks to the node as usual.
+    """
+
+    def __init__(self, url, failures):
+        super().__init__(url)
+        self.failures = dict(failures)
+
+    async def request(self, method, params):
+        if method in self.failures:
+            raise self.failures.pop(method)
+        return await super().request(method, params)
+
+    async def batch(self, calls):
+        if "batch" in self.failures:
+            raise self.failures.pop("batch")
+        return await super().batch(calls)
+
+
+@pytest.mark.parametrize("error", [aiohttp.ServerDisconnectedError(), asyncio.TimeoutError()])
+def test_network_errors_free_the_slot_and_nonce(error):
+    mempool = Mempool()
+    reads = []
+    handlers = dict(mempool.handlers(),
+                    eth_getTransactionCount=lambda address, block: reads.append(block) or hex(mempool.nonce))
+
+    async def run(url):
+        transport = FlakyTransport(url, {"eth_sendRawTransaction": error})
+        async with AsyncRelayer(transport, Account.create(), 1337, PENIWALLET, window=1,
+                                poll_interval=0.01) as relayer:
+            with pytest.raises(type(error)):
+                await relayer.relay(b"\x00" * 36)
+            return await relayer.relay(b"\x00" * 36, timeout=5)
+
+    with FakeNode(handlers) as node:
+        receipt = asyncio.run(run(node.url))
+
+    # the window of one was freed, and the nonce was read again and reused
+    assert receipt["status"] == "0x1"
+    assert mempool.sent == [7] and len(reads) == 2
+
+
+def test_network_error_after_the_node_took_the_transaction():
+    mempool = Mempool()
+
+    class LostAnswerTransport(HTTPTransport):
+        async def request(self, method, params):
+            result = await super().request(method, params)
+            if method == "eth_sendRawTransaction" and len(mempool.sent) == 1:
+                raise aiohttp.ServerDisconnectedError()
+            return result
+
+    async def run(url):
+        async with AsyncRelayer(LostAnswerTransport(url), Account.create(), 1337, PENIWALLET,
+                                poll_interval=0.01) as relayer:
+            first = await relayer.relay(b"\x00" * 36, timeout=5)
+            second = await relayer.relay(b"\x00" * 36, timeout=5)
+            return first, second
+
+    with FakeNode(mempool.handlers()) as node:
+        first, second = asyncio.run(run(node.url))
+
+    # the first send counts as sent and its nonce is not handed out again
+    assert first["transactionHash"] in mempool.hashes
+    assert mempool.sent == [7, 8] and second["status"] == "0x1"
+
+
+def test_already_known_counts_as_sent():
+    mempool = Mempool()
+
+    class RetriedTransport(HTTPTransport):
+        async def request(self, method, params):
+            result = await super().request(method, params)
+            # the node took the first send, a retry of it was told it has it
+            if method == "eth_sendRawTransaction" and len(mempool.sent) == 1:
+                raise RPCError("already known")
+            return result
+
+    async def run(url):
+        async with AsyncRelayer(RetriedTransport(url), Account.create(), 1337, PENIWALLET,
+                                poll_interval=0.01) as relayer:
+            return await relayer.relay(b"\x00" * 36, timeout=5)
+
+    with FakeNode(mempool.handlers()) as node:
+        receipt = asyncio.run(run(node.url))
+
+    # not sent again under another nonce
+    assert receipt["transactionHash"] in mempool.hashes
+    assert mempool.sent == [7]
+
+
+def test_bundles_get_their_gas_estimate():
+    # test_bundler imports this module through test_preflight
+    from tests.test_bundler import intent
+
+    mempool = Mempool()
+    bundler = Bundler(max_gas=30_000_000)
+    small, large = bundler.bundle([intent(0)]), bundler.bundle([intent(n) for n in range(20)])
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), Account.create(), 1337, PENIWALLET,
+                                poll_interval=0.01) as relayer:
+            await relayer.batch_transfer(small[0], 21000)
+            await relayer.batch_transfer(large[0], 21000)
+            await relayer.relay(b"\x00" * 36, gas_limit=60_000)
+
+    with FakeNode(mempool.handlers()) as node:
+        asyncio.run(run(node.url))
+
+    # the relayer's limit is a floor, a bundle above it gets its estimate
+    assert large[0].gas == 90_000 + 20 * 80_000
+    assert mempool.gas_limits == [1_500_000, large[0].gas, 60_000]
+
+
+def test_wait_after_the_receipt_arrived():
+    mempool = Mempool()
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), Account.create(), 1337, PENIWALLET,
+                                poll_interval=0.01, keep_receipts=2) as relayer:
+            hashes = [await relayer.send(b"\x00" * 36) for _ in range(3)]
+            while relayer._receipts:
+                await asyncio.sleep(0.01)
+            receipts = [await relayer.wait(tx_hash, 5) for tx_hash in hashes[1:]]
+            with pytest.raises(KeyError):
+                await relayer.wait(hashes[0])
+            with pytest.raises(KeyError):
+                await relayer.wait(hashes[1])
+            return hashes, receipts
+
+    with FakeNode(mempool.handlers()) as node:
+        hashes, receipts = asyncio.run(run(node.url))
+
+    assert [receipt["transactionHash"] for receipt in receipts] == hashes[1:]
+
+
+def test_relayer_built_outside_the_loop():
+    mempool = Mempool()
+
+    with FakeNode(mempool.handlers()) as node:
+        relayer = AsyncRelayer(HTTPTransport(node.url), Account.create(), 1337, PENIWALLET, poll_interval=0.01)
+
+        async def run():
+            async with relayer:
+                return await relayer.relay(b"\x00" * 36, timeout=5)
+
+        assert asyncio.run(run())["status"] == "0x1"
+
+
+def test_receipt_polls_survive_network_errors():
+    mempool = Mempool()
+
+    async def run(url):
+        transport = FlakyTransport(url, {"batch": aiohttp.ClientConnectionError("reset")})
+        async with AsyncRelayer(transport, Account.create(), 1337, PENIWALLET, poll_interval=0.01) as relayer:
+            return await asyncio.gather(*(relayer.relay(b"\x00" * 36, timeout=5) for _ in range(3)))
+
+    with FakeNode(mempool.handlers()) as node:
+        receipts = asyncio.run(run(node.url))
+
+    assert [receipt["status"] for receipt in receipts] == ["0x1"] * 3
+
+
+def test_transport_for():
+    assert isinstance(transport_for("http://127.0.0.1:8545"), HTTPTransport)
+    assert type(transport_for("ws://127.0.0.1:8545")).__name__ == "WebSocketTransport"
+
+
+def test_relay_transfers_on_chain(peniwallet, token, accounts, chain, rpc_url):
+    user = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+    relayer_account = Account.from_key("0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0")
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    start = peniwallet.getNonce(user.address)
+    old_balance = token.balanceOf(accounts[0])
+
+    def signed(nonce):
+        message = {
+            'token': token.address,
+            'from': user.address,
+            'to': accounts[0].address,
+            'amount': 500,
+            'nonce': nonce,
+            'deadline': chain.pending_timestamp + 3600,
+        }
+        signature = user.sign_message(TransferTransaction.signable(message, chain.chain_id, peniwallet.address))
+        return encode_transfer(message, signature.signature, 21000)
+
+    async def run():
+        async with AsyncRelayer(HTTPTransport(rpc_url), relayer_account, chain.chain_id, peniwallet.address,
+                                window=4) as relayer:
+            hashes = [await relayer.send(signed(start + i)) for i in range(10)]
+            return await asyncio.gather(*(relayer.wait(tx_hash, timeout=60) for tx_hash in hashes))
+
+    receipts = asyncio.run(run())
+
+    assert all(int(receipt["status"], 16) == 1 for receipt in receipts)
+    assert peniwallet.getNonce(user.address) == start + 10
+    assert token.balanceOf(accounts[0]) > old_balance
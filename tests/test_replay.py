@@ -0,0 +1,222 @@
+import asyncio
+import time
+
+from eth_abi import decode, encode
+
+from peniwallet_contracts.calldata import encode_spray_token
+from peniwallet_contracts.indexer import EventIndexer
+from peniwallet_contracts.preflight import BAD_NONCE, OK, SPRAY_REPLAYED, spray_token_call, transfer_call
+from peniwallet_contracts.reads import BatchReader, RPCError, selector
+from peniwallet_contracts.relayer import AsyncRelayer, HTTPTransport
+from peniwallet_contracts.replay import BloomFilter, ReplayCache, intent_nonce, spray_signature
+from tests.rpc import FakeNode
+from tests.test_indexer import PENIWALLET, Chain, spray_log
+from tests.test_preflight import RELAYER, USER, Contract, spray_message, transfer_message
+from tests.test_relayer import Mempool
+
+
+def signature(number):
+    return number.to_bytes(65, "big")
+
+
+def test_parses_calldata():
+    spray = spray_token_call(spray_message("x"), "Spray", signature(9), 21000)
+    transfer = transfer_call(transfer_message(7), signature(1), 21000)
+
+    assert spray_signature(spray.data) == signature(9)
+    assert intent_nonce(transfer.data) == (USER.lower(), 7)
+    assert spray_signature(transfer.data) is None and intent_nonce(spray.data) is None
+
+
+def test_duplicates_are_rejected_until_released():
+    cache = ReplayCache(expected_sprays=1_000, recent=100)
+    spray = spray_token_call(spray_message("x"), "Spray", signature(9), 21000).data
+    transfer = transfer_call(transfer_message(7), signature(1), 21000).data
+
+    assert cache.admit(spray) is None
+    assert cache.admit(spray) == SPRAY_REPLAYED
+    assert cache.admit(transfer) is None
+    assert cache.admit(transfer) == BAD_NONCE
+
+    cache.release(spray)
+    cache.release(transfer)
+    # the filter still knows the spray, the chain decides
+    assert cache.spray_seen(signature(9)) is None
+    assert cache.admit(transfer) is None
+
+
+def test_floors_reject_used_nonces():
+    cache = ReplayCache(expected_sprays=1_000, senders=2)
+    cache.set_floor(USER, 7)
+
+    assert cache.nonce_used(USER.upper().replace("0X", "0x"), 6)
+    assert not cache.nonce_used(USER, 7)
+    cache.set_floor(USER, 3)
+    assert cache.nonce_used(USER, 6)
+
+
+def test_memory_is_bounded_and_metrics_count():
+    cache = ReplayCache(expected_sprays=10_000, error_rate=1e-3, recent=100, senders=10)
+    for number in range(10_000):
+        cache.add_spray(signature(number))
+    for number in range(50):
+        cache.set_floor(f"0x{number:040x}", 1)
+    size = len(cache.filter.bits)
+
+    assert cache.spray_seen(signature(9_999)) is True
+    assert cache.spray_seen(signature(0)) is None
+    false_positives = sum(cache.spray_seen(signature(number)) is None for number in range(10_000, 30_000))
+    stats = cache.stats()
+
+    assert len(cache._sprays) == 100 and len(cache._floors) == 10
+    assert len(cache.filter.bits) == size
+    assert stats.evictions == 9_900 + 40
+    assert stats.hits == 1 and stats.sprays == 10_000 and stats.senders == 10
+    assert false_positives < 20_000 * 3e-3
+    assert stats.misses == 20_000 - false_positives
+
+
+def test_lookups_take_microseconds():
+    cache = ReplayCache(expected_sprays=100_000, recent=10_000)
+    calls = [spray_token_call(spray_message(str(n)), "Spray", signature(n), 21000).data for n in range(10_000)]
+    for data in calls:
+        cache.admit(data)
+
+    start = time.perf_counter()
+    for data in calls:
+        cache.admit(data)
+    per_call = (time.perf_counter() - start) / len(calls)
+
+    assert cache.hits == len(calls)
+    assert per_call < 100e-6
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(1_000, 1e-2)
+    digests = [ReplayCache.digest(signature(number)) for number in range(1_000)]
+    for digest in digests:
+        bloom.add(digest)
+
+    assert all(digest in bloom for digest in digests)
+
+
+def test_warm_from_indexer(tmp_path, addresses):
+    chain = Chain(height=100)
+    chain.logs = [spray_log(block, 0, addresses[block % 3], addresses[:2], code=str(block)) for block in range(1, 61)]
+    inputs = {
+        log["transactionHash"]: encode_spray_token(
+            spray_message(str(int(log["blockNumber"], 16))), "Spray", signature(int(log["blockNumber"], 16)), 21000)
+        for log in chain.logs
+    }
+    fetched = []
+
+    def get_transaction(tx_hash):
+        fetched.append(tx_hash)
+        block = int(tx_hash[2:34], 16)
+        # one spray went through another contract
+        return {"to": addresses[9] if block == 60 else PENIWALLET.lower(), "input": "0x" + inputs[tx_hash].hex()}
+
+    queried = []
+
+    def eth_call(transaction, block):
+        data = bytes.fromhex(transaction["data"][2:])
+        assert data[:4] == selector("getNonce(address)")
+        (user,) = decode(["address"], data[4:])
+        queried.append(user)
+        return "0x" + encode(["uint256"], [int(user[-2:], 16)]).hex()
+
+    handlers = dict(chain.handlers(), eth_getTransactionByHash=get_transaction, eth_call=eth_call)
+    with FakeNode(handlers) as node, \
+            EventIndexer(str(tmp_path / "events.db"), BatchReader(node.url), PENIWALLET) as indexer:
+        indexer.sync()
+        cache = ReplayCache(expected_sprays=1_000, recent=10)
+        stats = cache.warm(indexer, senders=[USER])
+
+        chain.logs.append(spray_log(110, 0, addresses[0], addresses[:2], code="110"))
+        inputs[chain.logs[-1]["transactionHash"]] = encode_spray_token(
+            spray_message("110"), "Spray", signature(110), 21000)
+        chain.height = 120
+        indexer.sync()
+        fetched.clear()
+        ReplayCache(expected_sprays=1_000).warm(indexer)
+
+    assert stats.sprays == 59 and stats.senders == 1
+    assert cache.spray_seen(signature(59)) is True
+    assert cache.spray_seen(signature(1)) is None
+    assert cache.spray_seen(signature(60)) is False
+    # spray senders are not given a nonce floor
+    assert queried == [USER.lower()]
+    assert not cache.nonce_used(addresses[0], int(addresses[0][-2:], 16) - 1)
+    assert cache.nonce_used(USER, int(USER[-2:], 16) - 1)
+    # later warm starts only read the new sprays
+    assert fetched == [chain.logs[-1]["transactionHash"]]
+
+
+def test_send_checked_skips_replays():
+    contract = Contract()
+    mempool = Mempool()
+    cache = ReplayCache(expected_sprays=1_000)
+    fresh = spray_token_call(spray_message("fresh"), "Spray", signature(1), 21000)
+    expired = transfer_call(transfer_message(7, deadline=0), signature(2), 21000)
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), RELAYER, 1337, PENIWALLET, poll_interval=0.01,
+                                replay=cache) as relayer:
+            first = await relayer.send_checked([fresh, expired])
+            second = await relayer.send_checked([fresh, expired])
+            for _, tx_hash in first:
+                if tx_hash is not None:
+                    await relayer.wait(tx_hash, timeout=5)
+            return first, second
+
+    with FakeNode(dict(mempool.handlers(), eth_call=contract.eth_call)) as node:
+        first, second = asyncio.run(run(node.url))
+
+    assert [result.code for result, _ in first][0] == OK
+    # the replayed spray is not simulated again, the failed transfer was released
+    assert second[0][0].code == SPRAY_REPLAYED and second[0][1] is None
+    assert second[1][0].code == first[1][0].code != OK
+    assert len(mempool.sent) == 1
+
+
+def send_checked_twice(mempool, calls):
+    cache = ReplayCache(expected_sprays=1_000)
+
+    async def run(url):
+        async with AsyncRelayer(HTTPTransport(url), RELAYER, 1337, PENIWALLET, poll_interval=0.01,
+                                replay=cache) as relayer:
+            try:
+                first = await relayer.send_checked(calls)
+            except RPCError as error:
+                first = error
+            else:
+                for _, tx_hash in first:
+                    await relayer.wait(tx_hash, timeout=5)
+            return first, await relayer.send_checked(calls)
+
+    with FakeNode(dict(mempool.handlers(), eth_call=Contract().eth_call)) as node:
+        return asyncio.run(run(node.url))
+
+
+def test_send_checked_releases_calls_that_fail_to_send():
+    mempool = Mempool(reject_first="insufficient funds for gas * price + value")
+    spray = spray_token_call(spray_message("fresh"), "Spray", signature(1), 21000)
+    transfer = transfer_call(transfer_message(7), signature(2), 21000)
+
+    first, second = send_checked_twice(mempool, [spray, transfer])
+
+    # the spray's send raised, neither call reached the node
+    assert isinstance(first, RPCError)
+    assert [result.code for result, _ in second] == [OK, OK]
+    assert all(tx_hash is not None for _, tx_hash in second)
+
+
+def test_send_checked_releases_reverted_calls():
+    mempool = Mempool()
+    mempool.receipt = lambda tx_hash: {"transactionHash": tx_hash, "status": "0x0"}
+    spray = spray_token_call(spray_message("fresh"), "Spray", signature(1), 21000)
+
+    first, second = send_checked_twice(mempool, [spray])
+
+    assert first[0][0].code == second[0][0].code == OK
+    assert second[0][1] is not None and len(mempool.sent) == 2
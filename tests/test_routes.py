@@ -0,0 +1,182 @@
+import time
+
+import pytest
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+
+from peniwallet_contracts.eip712 import SwapTransaction
+from peniwallet_contracts.reads import BatchReader, selector
+from peniwallet_contracts.routes import RouteError, RouteFinder, get_amount_out
+from tests.rpc import FakeNode
+
+FACTORY = to_checksum_address("0x00000000000000000000000000000000000000fa")
+WETH = to_checksum_address("0xf7e22e248481eb6905ba1e06c1d3f06f819d50df")
+USDT = to_checksum_address("0x527a39f480de9126d48b1b23215bf8c0a784f447")
+TOKEN = to_checksum_address("0xd309cd40e0fc4c463a28bad37b644705220ce348")
+OTHER = to_checksum_address("0x318e7611f411a6b61e55924e6d652ad5e5d4bf43")
+LONELY = to_checksum_address("0x00000000000000000000000000000000000000ff")
+
+
+def _pair_address(a, b):
+    a, b = sorted((a, b))
+    return "0x" + (int(a, 16) ^ int(b, 16)).to_bytes(20, "big").hex()
+
+
+class Exchange:
+    """
+    Pairs with reserves given per token, answering ``getPair`` and
+    ``getReserves`` like PancakeSwap.
+    """
+
+    def __init__(self, pools):
+        self.pairs = {}
+        self.reserves = {}
+        for (token_a, amount_a), (token_b, amount_b) in pools:
+            token_a, token_b = token_a.lower(), token_b.lower()
+            pair = _pair_address(token_a, token_b)
+            self.pairs[frozenset((token_a, token_b))] = pair
+            by_token = {token_a: amount_a, token_b: amount_b}
+            token0, token1 = sorted((token_a, token_b))
+            self.reserves[pair] = (by_token[token0], by_token[token1])
+        self.calls = 0
+
+    def eth_call(self, transaction, block):
+        self.calls += 1
+        data = bytes.fromhex(transaction["data"][2:])
+        if data[:4] == selector("getPair(address,address)"):
+            a, b = decode(["address", "address"], data[4:])
+            pair = self.pairs.get(frozenset((a.lower(), b.lower())), "0x" + "00" * 20)
+            return "0x" + encode(["address"], [pair]).hex()
+        if data[:4] == selector("getReserves()"):
+            r0, r1 = self.reserves[transaction["to"].lower()]
+            return "0x" + encode(["uint112", "uint112", "uint32"], [r0, r1, 0]).hex()
+        raise ValueError("unknown call")
+
+
+POOLS = [
+    ((TOKEN, 10**21), (OTHER, 10**21)),           # direct but shallow
+    ((TOKEN, 10**24), (WETH, 10**22)),
+    ((WETH, 10**22), (OTHER, 10**24)),
+    ((TOKEN, 10**24), (USDT, 10**24)),
+    ((USDT, 3 * 10**24), (WETH, 10**22)),
+]
+
+
+def test_get_amount_out_matches_pancake():
+    assert get_amount_out(10**18, 10**21, 2 * 10**21) == 10**18 * 9975 * 2 * 10**21 // (10**21 * 10000 + 10**18 * 9975)
+    with pytest.raises(RouteError, match="INSUFFICIENT_INPUT_AMOUNT"):
+        get_amount_out(0, 1, 1)
+    with pytest.raises(RouteError, match="INSUFFICIENT_LIQUIDITY"):
+        get_amount_out(1, 0, 1)
+
+
+def test_candidates_through_hubs():
+    finder = RouteFinder(None, FACTORY, [WETH, USDT])
+
+    assert finder.candidates(TOKEN, OTHER) == [
+        (TOKEN, OTHER), (TOKEN, WETH, OTHER), (TOKEN, USDT, OTHER),
+        (TOKEN, WETH, USDT, OTHER), (TOKEN, USDT, WETH, OTHER),
+    ]
+    # a hub at either end is not used as an intermediate
+    assert finder.candidates(TOKEN, WETH) == [(TOKEN, WETH), (TOKEN, USDT, WETH)]
+
+
+def test_best_route_avoids_shallow_direct_pair():
+    exchange = Exchange(POOLS)
+
+    with FakeNode({"eth_call": exchange.eth_call}) as node:
+        finder = RouteFinder(BatchReader(node.url), FACTORY, [WETH, USDT])
+        small = finder.best(TOKEN, OTHER, 10**15)
+        large = finder.best(TOKEN, OTHER, 10**20)
+
+    # a tiny trade takes the direct pair, a large one goes around it
+    assert small.path == (TOKEN, OTHER)
+    assert large.path == (TOKEN, WETH, OTHER)
+    assert large.amounts == tuple(finder.amounts_out(10**20, [TOKEN, WETH, OTHER]))
+    assert large.amount_out > finder.amounts_out(10**20, [TOKEN, OTHER])[-1]
+    # pairs, then reserves, once
+    assert len(node.batches) == 2
+
+
+def test_no_route():
+    exchange = Exchange(POOLS)
+
+    with FakeNode({"eth_call": exchange.eth_call}) as node:
+        finder = RouteFinder(BatchReader(node.url), FACTORY, [WETH, USDT])
+        with pytest.raises(RouteError, match="No route"):
+            finder.best(TOKEN, LONELY, 10**18)
+
+
+def test_missing_pairs_are_looked_up_again_after_ttl():
+    exchange = Exchange(POOLS)
+    now = [0.0]
+
+    with FakeNode({"eth_call": exchange.eth_call}) as node:
+        finder = RouteFinder(BatchReader(node.url), FACTORY, [WETH, USDT], pair_ttl=60.0, clock=lambda: now[0])
+        with pytest.raises(RouteError, match="No route"):
+            finder.best(TOKEN, LONELY, 10**18)
+        calls = exchange.calls
+
+        # the pair is created, but the miss is remembered for a while
+        created = Exchange([((TOKEN, 10**24), (LONELY, 10**24))])
+        exchange.pairs.update(created.pairs)
+        exchange.reserves.update(created.reserves)
+        with pytest.raises(RouteError, match="No route"):
+            finder.best(TOKEN, LONELY, 10**18)
+        assert exchange.calls == calls
+
+        now[0] = 61.0
+        assert finder.best(TOKEN, LONELY, 10**18).path == (TOKEN, LONELY)
+
+
+def test_quotes_need_no_calls_after_prepare(addresses):
+    tokens = list(addresses[:100])
+    pools = [((token, 10**24), (WETH, 10**22)) for token in tokens] + [((USDT, 3 * 10**24), (WETH, 10**22))]
+    exchange = Exchange(pools)
+
+    with FakeNode({"eth_call": exchange.eth_call}) as node:
+        finder = RouteFinder(BatchReader(node.url), FACTORY, [WETH, USDT])
+        pairs = [(a, b) for a in tokens[:20] for b in tokens[20:40]]
+        finder.prepare(pairs)
+        batches = len(node.batches)
+
+        start = time.perf_counter()
+        routes = [finder.best(a, b, 10**18) for a, b in pairs]
+        elapsed = time.perf_counter() - start
+
+    assert len(node.batches) == batches
+    assert all(route.path == (a, WETH, b) for route, (a, b) in zip(routes, pairs))
+    assert len(pairs) / elapsed > 200
+
+
+def test_route_message_signs_as_swap():
+    exchange = Exchange(POOLS)
+
+    with FakeNode({"eth_call": exchange.eth_call}) as node:
+        route = RouteFinder(BatchReader(node.url), FACTORY, [WETH, USDT]).best(TOKEN, OTHER, 10**20)
+
+    message = route.message("0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29", 3, 1700000000)
+    assert message['tokenA'] == TOKEN and message['tokenB'] == OTHER
+    assert message['amountA'] == message['amountB'] == 10**20
+    assert len(SwapTransaction.struct_hash(message)) == 32
+
+
+def test_best_route_matches_router(peniwallet, token, exchange, accounts, chain, rpc_url):
+    from tests.test_swap import prepare_swap_data
+
+    finder = RouteFinder.from_peniwallet(BatchReader(rpc_url), peniwallet.address)
+    amount = 10**21
+    route = finder.best(token.address, exchange.usdt.address, amount)
+
+    assert list(route.amounts) == exchange.router.getAmountsOut(amount, list(route.path))
+
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[0])
+    nonce = peniwallet.getNonce(accounts[0].address)
+    signature, message_data = prepare_swap_data(
+        peniwallet.address, route.path[0], route.path[-1], accounts, nonce, amount=amount)
+    old_balance = exchange.usdt.balanceOf(accounts[0])
+    peniwallet.swapTokensForTokens(
+        list(route.path), message_data['from'], message_data['amountA'], message_data['nonce'],
+        message_data['deadline'], signature, 21000, sender=accounts[0])
+
+    assert exchange.usdt.balanceOf(accounts[0]) - old_balance == route.amount_out
@@ -0,0 +1,56 @@
+import pytest
+from eth_account import Account
+
+from peniwallet_contracts.eip712 import SprayTransaction, TransferTransaction
+from peniwallet_contracts.signing import BatchSigner
+
+CHAIN_ID = 1337
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+KEYS = [
+    "0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8",
+    "0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0",
+]
+
+
+def transfer_message(sender, nonce):
+    return {
+        'token': TOKEN,
+        'from': sender,
+        'to': "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29",
+        'amount': 500,
+        'nonce': nonce,
+        'deadline': 1700000000,
+    }
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_sign_batch_in_input_order(workers):
+    accounts = [Account.from_key(key) for key in KEYS]
+    payloads = [
+        (TransferTransaction, transfer_message(accounts[i % 2].address, i)) for i in range(10)
+    ]
+    payloads.append((SprayTransaction, {
+        'token': TOKEN,
+        'from': accounts[1].address,
+        'receivers': ["0x58eC9587204FceA311E32BC7674a75443eB8f653"],
+        'amount': 10,
+        'code': "NWBx76",
+    }))
+
+    with BatchSigner(KEYS, CHAIN_ID, CONTRACT, workers=workers, chunksize=3) as signer:
+        signed = signer.sign_payloads(payloads)
+
+    by_address = {account.address: account for account in accounts}
+    expected = [
+        by_address[message['from']].sign_message(struct.signable(message, CHAIN_ID, CONTRACT))
+        for struct, message in payloads
+    ]
+    assert [s.signature for s in signed] == [e.signature for e in expected]
+
+
+def test_sign_unknown_sender():
+    signer = BatchSigner(KEYS[:1], CHAIN_ID, CONTRACT, workers=0)
+
+    with pytest.raises(ValueError, match="No key loaded"):
+        signer.sign(TransferTransaction, [transfer_message(Account.create().address, 0)])
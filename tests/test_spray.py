@@ -1,10 +1,8 @@
-import pytest
-from web3 import Web3
 from ape import chain
 from eth_account import Account
 from eth_account.datastructures import SignedMessage
-from eth_account.messages import encode_typed_data
 from eth_account.signers.local import LocalAccount
+from peniwallet_contracts.eip712 import SprayTransaction
 
 
 def prepare_spray_data(contract, token, accounts, receivers, amount=500, code="NWBx76"):
@@ -16,35 +14,9 @@ def prepare_spray_data(contract, token, accounts, receivers, amount=500, code="N
         'amount': amount,
         'code': code
     }
-    message = {
-        'types': {
-            'EIP712Domain': [
-                {'name': 'name', 'type': 'string'},
-                {'name': 'version', 'type': 'string'},
-                {'name': 'chainId', 'type': 'uint256'},
-                {'name': 'verifyingContract', 'type': 'address'},
-            ],
-            'SprayTransaction': [
-                {'name': 'token', 'type': 'address'},
-                {'name': 'from', 'type': 'address'},
-                {'name': 'receivers', 'type': 'address[]'},
-                {'name': 'amount', 'type': 'uint256'},
-                {'name': 'code', 'type': 'string'},
-            ],
-        },
-        'message': message_data,
-        'primaryType': 'SprayTransaction',
-        'domain': {
-            'name': 'Peniwallet',
-            'version': '1',
-            'chainId': chain.chain_id,  # Binance Smart Chain (BSC) chain ID
-            'verifyingContract': contract,
-        }
-    }
-
     account: LocalAccount = Account.from_key("0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0")
-    encoded_message = encode_typed_data(full_message=message)
-    signature: SignedMessage = account.sign_message(encoded_message)
+    signature: SignedMessage = account.sign_message(
+        SprayTransaction.signable(message_data, chain.chain_id, contract))
     return signature.signature.hex(), message_data
 
 
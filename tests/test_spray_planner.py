@@ -0,0 +1,141 @@
+import pytest
+from eth_account import Account
+from web3 import Web3
+
+from peniwallet_contracts.spray import (
+    MAX_RECIPIENTS,
+    SprayCheckpoint,
+    SprayPlanner,
+    account_signer,
+    batch_size_for,
+    contract_sender,
+    dedupe,
+    execute,
+)
+
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+SENDER = "0x318e7611f411a6b61E55924E6D652ad5e5D4BF43"
+
+
+class FakeChain:
+    """
+    Records sprays by signature and pays each receiver, like sprayToken does.
+    """
+
+    def __init__(self, fail_at=None):
+        self.used = set()
+        self.paid = {}
+        self.fail_at = fail_at
+
+    def sign(self, batch):
+        return f"sig-{batch.code}"
+
+    def send(self, batch, signature):
+        if batch.number == self.fail_at:
+            self.fail_at = None
+            raise ConnectionError("relayer crashed")
+        assert signature not in self.used, "Spray already executed"
+        self.used.add(signature)
+        for receiver in batch.receivers:
+            self.paid[receiver] = self.paid.get(receiver, 0) + 1
+        return f"0x{batch.number:064x}"
+
+
+def test_batches_dedupe_and_respect_limit(addresses):
+    recipients = list(addresses.iter(0, 450)) + [a.lower() for a in addresses.iter(0, 50)]
+    planner = SprayPlanner(TOKEN, SENDER, 10, "NWBx76")
+
+    batches = list(planner.batches(iter(recipients)))
+
+    assert [len(batch.receivers) for batch in batches] == [200, 200, 50]
+    assert [batch.code for batch in batches] == ["NWBx76-0", "NWBx76-1", "NWBx76-2"]
+    assert sum((batch.receivers for batch in batches), []) == addresses[:450]
+    assert planner.message(batches[1])['receivers'] == addresses[200:400]
+
+
+def test_batch_size_for_gas_limit():
+    assert batch_size_for(140_000_000) == MAX_RECIPIENTS
+    assert batch_size_for(3_000_000, base_gas=200_000, gas_per_recipient=20_000, headroom=1) == 140
+    with pytest.raises(ValueError):
+        batch_size_for(100_000)
+    with pytest.raises(ValueError):
+        SprayPlanner(TOKEN, SENDER, 10, "x", batch_size=201)
+
+    assert SprayPlanner(TOKEN, SENDER, 10, "x", block_gas_limit=140_000_000).batch_size == MAX_RECIPIENTS
+    assert SprayPlanner(TOKEN, SENDER, 10, "x", block_gas_limit=3_000_000).batch_size == batch_size_for(3_000_000)
+    assert SprayPlanner(TOKEN, SENDER, 10, "x", batch_size=20, block_gas_limit=3_000_000).batch_size == 20
+
+
+def test_dedupe_is_bounded(addresses):
+    assert list(dedupe(addresses.iter(0, 10), limit=10)) == addresses[:10]
+    with pytest.raises(ValueError, match="More than 10 distinct recipients"):
+        list(dedupe(addresses.iter(0, 11), limit=10))
+
+    recipients = [address.lower() for address in addresses.iter(0, 5)] * 2
+    planner = SprayPlanner(TOKEN, SENDER, 10, "x", deduplicate=False)
+    assert [batch.receivers for batch in planner.batches(recipients)] == [addresses[:5] * 2]
+
+
+def test_resume_after_crash_pays_once(addresses, tmp_path):
+    planner = SprayPlanner(TOKEN, SENDER, 10, "run1", batch_size=100)
+    chain = FakeChain(fail_at=2)
+    path = str(tmp_path / "spray.jsonl")
+
+    with pytest.raises(ConnectionError):
+        list(execute(planner.batches(addresses.iter(0, 450)), chain.sign, chain.send, SprayCheckpoint(path)))
+
+    done = list(execute(
+        planner.batches(addresses.iter(0, 450)),
+        chain.sign,
+        chain.send,
+        SprayCheckpoint(path),
+        is_executed=chain.used.__contains__,
+    ))
+
+    assert [record['number'] for record in done] == [0, 1, 2, 3, 4]
+    assert all(record['state'] == 'done' for record in done)
+    assert len(chain.paid) == 450 and set(chain.paid.values()) == {1}
+
+
+def test_resume_skips_batches_already_on_chain(addresses, tmp_path):
+    planner = SprayPlanner(TOKEN, SENDER, 10, "run2")
+    chain = FakeChain()
+    path = str(tmp_path / "spray.jsonl")
+    batches = list(planner.batches(addresses.iter(0, 300)))
+    checkpoint = SprayCheckpoint(path)
+
+    # the first batch was broadcast but the run stopped before recording it
+    checkpoint.record(batches[0], 'signed', signature=chain.sign(batches[0]), code=batches[0].code)
+    checkpoint.record(batches[0], 'sent')
+    chain.send(batches[0], chain.sign(batches[0]))
+
+    with pytest.raises(RuntimeError, match="pass is_executed"):
+        list(execute(batches, chain.sign, chain.send, SprayCheckpoint(path)))
+
+    list(execute(batches, chain.sign, chain.send, SprayCheckpoint(path), is_executed=chain.used.__contains__))
+    assert len(chain.paid) == 300 and set(chain.paid.values()) == {1}
+
+    changed = SprayPlanner(TOKEN, SENDER, 10, "run2", batch_size=100)
+    with pytest.raises(ValueError, match="does not match"):
+        list(execute(changed.batches(addresses.iter(0, 300)), chain.sign, chain.send, SprayCheckpoint(path)))
+
+
+def test_spray_planner_on_chain(peniwallet, token, accounts, addresses, chain, tmp_path):
+    account = Account.from_key("0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0")
+    amount = Web3.to_wei(1, 'ether')
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[0])
+    planner = SprayPlanner(token.address, account.address, amount, f"plan{chain.blocks.height}")
+    recipients = addresses[:250] + addresses[:10]
+    old_balances = {address: token.balanceOf(address) for address in addresses[:250]}
+
+    records = list(execute(
+        planner.batches(recipients),
+        account_signer(planner, account, chain.chain_id, peniwallet.address),
+        contract_sender(planner, peniwallet, "mega spray", 21000, sender=accounts[0]),
+        SprayCheckpoint(str(tmp_path / "spray.jsonl")),
+        is_executed=peniwallet.spraySignatures,
+    ))
+
+    assert len(records) == 2
+    assert all(
+        token.balanceOf(address) == old_balance + amount for address, old_balance in old_balances.items())
@@ -2,8 +2,8 @@ from web3 import Web3
 from eth_account import Account
 from ape import chain
 from eth_account.datastructures import SignedMessage
-from eth_account.messages import encode_typed_data
 from eth_account.signers.local import LocalAccount
+from peniwallet_contracts.eip712 import SwapTransaction
 
 
 def prepare_swap_data(contract, token_a, token_b, accounts, nonce, amount=500):
@@ -16,40 +16,12 @@ def prepare_swap_data(contract, token_a, token_b, accounts, nonce, amount=500):
         'nonce': nonce,
         'deadline': chain.pending_timestamp + 3600
     }
-    message = {
-        'types': {
-            'EIP712Domain': [
-                {'name': 'name', 'type': 'string'},
-                {'name': 'version', 'type': 'string'},
-                {'name': 'chainId', 'type': 'uint256'},
-                {'name': 'verifyingContract', 'type': 'address'},
-            ],
-            'SwapTransaction': [
-                {'name': 'tokenA', 'type': 'address'},
-                {'name': 'tokenB', 'type': 'address'},
-                {'name': 'from', 'type': 'address'},
-                {'name': 'amountA', 'type': 'uint256'},
-                {'name': 'amountB', 'type': 'uint256'},
-                {'name': 'nonce', 'type': 'uint256'},
-                {'name': 'deadline', 'type': 'uint256'},
-            ],
-        },
-        'message': message_data,
-        'primaryType': 'SwapTransaction',
-        'domain': {
-            'name': 'Peniwallet',
-            'version': '1',
-            'chainId': chain.chain_id,  # Binance Smart Chain (BSC) chain ID
-            'verifyingContract': contract,
-        }
-    }
-
     # account: LocalAccount = Account.from_key(accounts[0].private_key)
     account: LocalAccount = Account.from_key(
         "0x77f9759818d266f09c7f96dac8d7e6af15f66858180f06f11caaea2ee627efc0")
 
-    encoded_message = encode_typed_data(full_message=message)
-    signature: SignedMessage = account.sign_message(encoded_message)
+    signature: SignedMessage = account.sign_message(
+        SwapTransaction.signable(message_data, chain.chain_id, contract))
     return signature.signature.hex(), message_data
 
 
@@ -71,7 +43,7 @@ def test_swapBNBForTokens(peniwallet, token, accounts):
     assert token.balanceOf(accounts[0]) > old_token_balance
 
 
-def test_swapTokensForBNB(peniwallet, token, accounts):
+def test_swapTokensForBNB(peniwallet, token, exchange, accounts):
     # Approve the Peniwallet contract to spend the sender's tokens
     amount = Web3.to_wei(1000000, 'ether')
 
@@ -86,7 +58,7 @@ def test_swapTokensForBNB(peniwallet, token, accounts):
     signature, message_data = prepare_swap_data(
         peniwallet.address,
         token.address,
-        "0xf7e22e248481eb6905ba1e06c1d3f06f819d50df",
+        exchange.weth.address,
         accounts,
         nonce,
         amount=amount,
@@ -96,7 +68,7 @@ def test_swapTokensForBNB(peniwallet, token, accounts):
     old_bnb_balance = accounts[0].balance
     # Perform the swap
     peniwallet.swapTokensForBNB(
-        [message_data['tokenA'], "0xf7E22E248481eb6905Ba1e06c1d3F06f819D50df"],
+        [message_data['tokenA'], exchange.weth.address],
         message_data['from'],
         message_data['amountA'],
         message_data['nonce'],
@@ -117,15 +89,15 @@ def test_swapTokensForBNB(peniwallet, token, accounts):
     assert accounts[0].balance != old_bnb_balance
 
 
-def test_swapTokensForTokens(peniwallet, token, accounts):
+def test_swapTokensForTokens(peniwallet, token, exchange, accounts):
     # Approve the Peniwallet contract to spend the sender's tokens
     amount = Web3.to_wei(1000000, 'ether')
     
     # Approve the Peniwallet contract to spend the sender's tokens
     token.approve(peniwallet.address, token.totalSupply(), sender = accounts[0])
 
-    token_out = "0x527A39f480dE9126d48B1B23215Bf8C0a784F447"
-    bnb = "0xf7E22E248481eb6905Ba1e06c1d3F06f819D50df"
+    token_out = exchange.usdt.address
+    bnb = exchange.weth.address
 
     # get nonce
     nonce = peniwallet.getNonce(accounts[0].address)
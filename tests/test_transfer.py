@@ -4,8 +4,8 @@ import pytest
 from ape import chain
 from web3 import Web3
 from eth_account.datastructures import SignedMessage
-from eth_account.messages import encode_typed_data
 from eth_account.signers.local import LocalAccount
+from peniwallet_contracts.eip712 import TransferTransaction
 
 
 def prepare_transfer_data(contract, token, accounts, nonce, amount = 500):
@@ -17,36 +17,9 @@ def prepare_transfer_data(contract, token, accounts, nonce, amount = 500):
         'nonce': nonce,
         'deadline': chain.pending_timestamp + 3600
     }
-    message = {
-        'types': {
-            'EIP712Domain': [
-                {'name': 'name', 'type': 'string'},
-                {'name': 'version', 'type': 'string'},
-                {'name': 'chainId', 'type': 'uint256'},
-                {'name': 'verifyingContract', 'type': 'address'},
-            ],
-            'TransferTransaction': [
-                {'name': 'token', 'type': 'address'},
-                {'name': 'from', 'type': 'address'},
-                {'name': 'to', 'type': 'address'},
-                {'name': 'amount', 'type': 'uint256'},
-                {'name': 'nonce', 'type': 'uint256'},
-                {'name': 'deadline', 'type': 'uint256'},
-            ],
-        },
-        'message': message_data,
-        'primaryType': 'TransferTransaction',
-        'domain': {
-            'name': 'Peniwallet',
-            'version': '1',
-            'chainId': chain.chain_id,  # Binance Smart Chain (BSC) chain ID
-            'verifyingContract': contract,
-        }
-    }
-
     account: LocalAccount = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
-    encoded_message = encode_typed_data(full_message=message)
-    signature: SignedMessage = account.sign_message(encoded_message)
+    signature: SignedMessage = account.sign_message(
+        TransferTransaction.signable(message_data, chain.chain_id, contract))
     return signature.signature.hex(), message_data
 
 
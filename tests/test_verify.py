@@ -0,0 +1,141 @@
+import pytest
+from eth_account import Account
+
+from peniwallet_contracts.eip712 import (
+    SprayTransaction,
+    SwapTransaction,
+    TransferTransaction,
+    domain_separator,
+)
+from peniwallet_contracts.verify import (
+    ZERO_ADDRESS,
+    BatchVerifier,
+    InvalidSignature,
+    check,
+    verify,
+)
+
+CHAIN_ID = 1337
+CONTRACT = "0x6A91E1CCB510B6559ddE852EBcC9c8A2406373b8"
+TOKEN = "0xD309CD40E0fC4c463a28bAd37b644705220cE348"
+ACCOUNT = Account.from_key("0x4417c04ddfd88b3fdaaffba80ce8e071da0e0137c55efb81c2beb1c0cc1d33b8")
+
+
+def transfer_message(nonce=0, sender=ACCOUNT.address):
+    return {
+        'token': TOKEN,
+        'from': sender,
+        'to': "0xFf9AF912c35273A7d84ba9271e016d57a0AA1B29",
+        'amount': 500,
+        'nonce': nonce,
+        'deadline': 1700000000,
+    }
+
+
+def sign(struct, message, chain_id=CHAIN_ID, contract=CONTRACT):
+    return ACCOUNT.sign_message(struct.signable(message, chain_id, contract)).signature
+
+
+def tampered(signature):
+    """
+    The same tampering tests/test_transfer.py uses: last hex digit set to 0
+    """
+    return signature[:-1] + bytes([signature[-1] & 0xF0])
+
+
+def test_verify_valid_signature():
+    message = transfer_message()
+    result = verify(TransferTransaction, message, sign(TransferTransaction, message), CHAIN_ID, CONTRACT)
+
+    assert result.valid
+    assert result.signer == ACCOUNT.address
+    assert result.reason is None
+
+
+def test_verify_rejects_like_the_contract():
+    message = transfer_message()
+    signature = sign(TransferTransaction, message)
+
+    # v = 0x10 makes ecrecover return address(0)
+    assert verify(TransferTransaction, message, tampered(signature), CHAIN_ID, CONTRACT).reason == "Invalid signature"
+    assert verify(TransferTransaction, message, signature[:64], CHAIN_ID, CONTRACT).reason == "Invalid signature"
+
+    other = transfer_message(sender=Account.create().address)
+    assert verify(TransferTransaction, other, signature, CHAIN_ID, CONTRACT).reason == (
+        "Invalid signature: Signer is not the sender")
+
+    swap = {
+        'tokenA': TOKEN, 'tokenB': TOKEN, 'from': ACCOUNT.address,
+        'amountA': 1, 'amountB': 1, 'nonce': 0, 'deadline': 0,
+    }
+    wrong_chain = sign(SwapTransaction, swap, chain_id=56)
+    assert verify(SwapTransaction, swap, wrong_chain, CHAIN_ID, CONTRACT).reason == "Invalid signature"
+
+    with pytest.raises(InvalidSignature, match="Invalid signature"):
+        check(TransferTransaction, message, tampered(signature).hex(), CHAIN_ID, CONTRACT)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_batch_verifier(workers):
+    spray = {
+        'token': TOKEN,
+        'from': ACCOUNT.address,
+        'receivers': ["0x58eC9587204FceA311E32BC7674a75443eB8f653"],
+        'amount': 10,
+        'code': "NWBx76",
+    }
+    items = []
+    for nonce in range(5):
+        message = transfer_message(nonce)
+        signature = sign(TransferTransaction, message)
+        items.append((TransferTransaction, message, signature if nonce % 2 else tampered(signature)))
+    items.append((SprayTransaction, spray, sign(SprayTransaction, spray)))
+
+    with BatchVerifier(CHAIN_ID, CONTRACT, workers=workers, chunksize=2) as verifier:
+        results = verifier.verify(items)
+        accepted = verifier.accepted(items)
+
+    assert [result.valid for result in results] == [False, True, False, True, False, True]
+    assert results[0].signer == ZERO_ADDRESS
+    assert accepted == [items[1], items[3], items[5]]
+
+
+def test_differential_against_contract(peniwallet, token, accounts, chain):
+    # the same key signs for accounts[1] in tests/test_transfer.py
+    assert ACCOUNT.address == accounts[1].address
+    assert peniwallet.DOMAIN_SEPARATOR() == domain_separator(chain.chain_id, peniwallet.address)
+
+    token.approve(peniwallet.address, token.totalSupply(), sender=accounts[1])
+    message = transfer_message(peniwallet.getNonce(accounts[1].address))
+    message['token'] = token.address
+    message['deadline'] = chain.pending_timestamp + 3600
+    signature = sign(TransferTransaction, message, chain.chain_id, peniwallet.address)
+
+    candidates = [
+        signature,
+        tampered(signature),
+        signature[:32] + signature[32:64][::-1] + signature[64:],
+        sign(TransferTransaction, dict(message, amount=1), chain.chain_id, peniwallet.address),
+    ]
+    for candidate in candidates:
+        local = verify(TransferTransaction, message, candidate, chain.chain_id, peniwallet.address)
+        try:
+            peniwallet.transfer.call(
+                message['token'],
+                message['from'],
+                message['to'],
+                message['amount'],
+                message['nonce'],
+                message['deadline'],
+                candidate,
+                21000,
+                sender=accounts[1],
+            )
+            on_chain = None
+        except Exception as error:
+            on_chain = str(error)
+
+        if local.valid:
+            assert on_chain is None or "Invalid signature" not in on_chain
+        else:
+            assert on_chain is not None and local.reason in on_chain